@@ -142,10 +142,28 @@ trove_classifiers=[
     ]
 
 srcs = ['src/pycryptopp/_pycryptoppmodule.cpp',
+        'src/pycryptopp/parallel.cpp',
+        'src/pycryptopp/fileio.cpp',
+        'src/pycryptopp/many.cpp',
+        'src/pycryptopp/simd.cpp',
         'src/pycryptopp/publickey/rsamodule.cpp',
+        'src/pycryptopp/hash/sha256core.cpp',
         'src/pycryptopp/hash/sha256module.cpp',
+        'src/pycryptopp/hash/hashobject.cpp',
+        'src/pycryptopp/hash/sha512module.cpp',
+        'src/pycryptopp/hash/blake2module.cpp',
+        'src/pycryptopp/hash/merklemodule.cpp',
+        'src/pycryptopp/hash/treehashmodule.cpp',
         'src/pycryptopp/cipher/aesmodule.cpp',
+        'src/pycryptopp/cipher/aesni.cpp',
+        'src/pycryptopp/cipher/aesgcmmodule.cpp',
+        'src/pycryptopp/cipher/salsa.cpp',
         'src/pycryptopp/cipher/xsalsa20module.cpp',
+        'src/pycryptopp/cipher/poly1305.cpp',
+        'src/pycryptopp/cipher/secretboxmodule.cpp',
+        'src/pycryptopp/cipher/chacha.cpp',
+        'src/pycryptopp/cipher/chacha20module.cpp',
+        'src/pycryptopp/pipelinemodule.cpp',
         ]
 if ECDSA:
     srcs.append('src/pycryptopp/publickey/ecdsamodule.cpp')
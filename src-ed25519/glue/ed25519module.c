@@ -45,7 +45,9 @@ ed25519_publickey(PyObject *self, PyObject *args)
     Py_ssize_t seed_len;
     if (!PyArg_ParseTuple(args, "s#", &seed, &seed_len))
         return NULL;
+    Py_BEGIN_ALLOW_THREADS
     crypto_sign_publickey(verfkey, signkey, seed);
+    Py_END_ALLOW_THREADS
     return Py_BuildValue("(s#s#)",
                          verfkey, PUBLICKEYBYTES,
                          signkey, SECRETKEYBYTES);
@@ -83,7 +85,11 @@ ed25519_sign(PyObject *self, PyObject *args)
     sig_and_msg = PyMem_Malloc(msg_len + SIGNATUREBYTES);
     if (!sig_and_msg)
         return PyErr_NoMemory();
+    // the reference implementation takes milliseconds per call, so let
+    // other threads run meanwhile. The arguments are immutable strings.
+    Py_BEGIN_ALLOW_THREADS
     crypto_sign(sig_and_msg, &sig_and_msg_len1, msg, msg_len, signkey);
+    Py_END_ALLOW_THREADS
     sig_and_msg_len2 = sig_and_msg_len1;
     ret = Py_BuildValue("s#", sig_and_msg, sig_and_msg_len2);
     PyMem_Free(sig_and_msg);
@@ -126,8 +132,10 @@ ed25519_open(PyObject *self, PyObject *args)
     msg = PyMem_Malloc(sig_and_msg_len);
     if (!msg)
         return PyErr_NoMemory();
+    Py_BEGIN_ALLOW_THREADS
     result = crypto_sign_open(msg, &msg_len1, sig_and_msg, sig_and_msg_len,
                               verfkey);
+    Py_END_ALLOW_THREADS
     // be faithful to the NaCl interface and return the message, even though
     // it's a waste.
     if (result == 0) {
@@ -3,8 +3,16 @@
 #include "publickey/ecdsamodule.hpp"
 #include "publickey/rsamodule.hpp"
 #include "hash/sha256module.hpp"
+#include "hash/sha512module.hpp"
+#include "hash/blake2module.hpp"
+#include "hash/merklemodule.hpp"
+#include "hash/treehashmodule.hpp"
 #include "cipher/aesmodule.hpp"
+#include "cipher/aesgcmmodule.hpp"
 #include "cipher/xsalsa20module.hpp"
+#include "cipher/secretboxmodule.hpp"
+#include "cipher/chacha20module.hpp"
+#include "pipelinemodule.hpp"
 
 /* from Crypto++ */
 #ifdef DISABLE_EMBEDDED_CRYPTOPP
@@ -21,14 +29,47 @@ from pycryptopp.publickey import ecdsa\n\
 from pycryptopp.publickey import rsa\n\
 from pycryptopp import cipher\n\
 from pycryptopp.cipher import aes\n\
+from pycryptopp.cipher import aesgcm\n\
 from pycryptopp.cipher import xsalsa20\n\
+from pycryptopp.cipher import secretbox\n\
+from pycryptopp.cipher import chacha20\n\
 from pycryptopp import hash\n\
-from pycryptopp.hash import sha256");
+from pycryptopp.hash import sha256\n\
+from pycryptopp.hash import sha512\n\
+from pycryptopp.hash import blake2\n\
+from pycryptopp.hash import merkle\n\
+from pycryptopp.hash import treehash\n\
+from pycryptopp import pipeline");
 
 static PyMethodDef _pycryptopp_functions[] = {
     {"rsa_generate", reinterpret_cast<PyCFunction>(rsa_generate), METH_KEYWORDS, const_cast<char*>(rsa_generate__doc__)},
     {"rsa_create_verifying_key_from_string", reinterpret_cast<PyCFunction>(rsa_create_verifying_key_from_string), METH_KEYWORDS, const_cast<char*>(rsa_create_verifying_key_from_string__doc__)},
     {"rsa_create_signing_key_from_string", reinterpret_cast<PyCFunction>(rsa_create_signing_key_from_string), METH_KEYWORDS, const_cast<char*>(rsa_create_signing_key_from_string__doc__)},
+    {"sha256_hash_many", reinterpret_cast<PyCFunction>(sha256_hash_many), METH_KEYWORDS, const_cast<char*>(sha256_hash_many__doc__)},
+    {"sha256_hash_file", reinterpret_cast<PyCFunction>(sha256_hash_file), METH_KEYWORDS, const_cast<char*>(sha256_hash_file__doc__)},
+    {"sha256_simd_width", reinterpret_cast<PyCFunction>(sha256_simd_width), METH_NOARGS, const_cast<char*>(sha256_simd_width__doc__)},
+    {"sha256__set_simd_width", reinterpret_cast<PyCFunction>(sha256__set_simd_width), METH_VARARGS, const_cast<char*>(sha256__set_simd_width__doc__)},
+    {"sha256_implementations", reinterpret_cast<PyCFunction>(sha256_implementations), METH_NOARGS, const_cast<char*>(sha256_implementations__doc__)},
+    {"sha256__set_implementation", reinterpret_cast<PyCFunction>(sha256__set_implementation), METH_VARARGS, const_cast<char*>(sha256__set_implementation__doc__)},
+    {"merkle_build", reinterpret_cast<PyCFunction>(merkle_build), METH_KEYWORDS, const_cast<char*>(merkle_build__doc__)},
+    {"merkle_auth_path", reinterpret_cast<PyCFunction>(merkle_auth_path), METH_VARARGS, const_cast<char*>(merkle_auth_path__doc__)},
+    {"merkle_verify_many", reinterpret_cast<PyCFunction>(merkle_verify_many), METH_KEYWORDS, const_cast<char*>(merkle_verify_many__doc__)},
+    {"treehash_hash", reinterpret_cast<PyCFunction>(treehash_hash), METH_KEYWORDS, const_cast<char*>(treehash_hash__doc__)},
+    {"treehash_hash_file", reinterpret_cast<PyCFunction>(treehash_hash_file), METH_KEYWORDS, const_cast<char*>(treehash_hash_file__doc__)},
+    {"aes_encrypt_blocks", reinterpret_cast<PyCFunction>(aes_encrypt_blocks), METH_KEYWORDS, const_cast<char*>(aes_encrypt_blocks__doc__)},
+    {"aes_crypt_file", reinterpret_cast<PyCFunction>(aes_crypt_file), METH_KEYWORDS, const_cast<char*>(aes_crypt_file__doc__)},
+    {"aes_process_many", reinterpret_cast<PyCFunction>(aes_process_many), METH_KEYWORDS, const_cast<char*>(aes_process_many__doc__)},
+    {"aes_has_aesni", reinterpret_cast<PyCFunction>(aes_has_aesni), METH_NOARGS, const_cast<char*>(aes_has_aesni__doc__)},
+    {"aes__set_use_aesni", reinterpret_cast<PyCFunction>(aes__set_use_aesni), METH_VARARGS, const_cast<char*>(aes__set_use_aesni__doc__)},
+    {"xsalsa20_crypt_file", reinterpret_cast<PyCFunction>(xsalsa20_crypt_file), METH_KEYWORDS, const_cast<char*>(xsalsa20_crypt_file__doc__)},
+    {"xsalsa20_process_many", reinterpret_cast<PyCFunction>(xsalsa20_process_many), METH_KEYWORDS, const_cast<char*>(xsalsa20_process_many__doc__)},
+    {"xsalsa20_simd_width", reinterpret_cast<PyCFunction>(xsalsa20_simd_width), METH_NOARGS, const_cast<char*>(xsalsa20_simd_width__doc__)},
+    {"xsalsa20__set_simd_width", reinterpret_cast<PyCFunction>(xsalsa20__set_simd_width), METH_VARARGS, const_cast<char*>(xsalsa20__set_simd_width__doc__)},
+    {"secretbox_secretbox", reinterpret_cast<PyCFunction>(secretbox_secretbox), METH_KEYWORDS, const_cast<char*>(secretbox_secretbox__doc__)},
+    {"secretbox_secretbox_open", reinterpret_cast<PyCFunction>(secretbox_secretbox_open), METH_KEYWORDS, const_cast<char*>(secretbox_secretbox_open__doc__)},
+    {"chacha20_simd_width", reinterpret_cast<PyCFunction>(chacha20_simd_width), METH_NOARGS, const_cast<char*>(chacha20_simd_width__doc__)},
+    {"chacha20__set_simd_width", reinterpret_cast<PyCFunction>(chacha20__set_simd_width), METH_VARARGS, const_cast<char*>(chacha20__set_simd_width__doc__)},
+    {"pipeline_crypt_and_hash", reinterpret_cast<PyCFunction>(pipeline_crypt_and_hash), METH_KEYWORDS, const_cast<char*>(pipeline_crypt_and_hash__doc__)},
     {NULL, NULL, 0, NULL}  /* sentinel */
 };
 
@@ -67,6 +108,14 @@ init_pycryptopp(void) {
     init_ecdsa(module);
     init_rsa(module);
     init_sha256(module);
+    init_sha512(module);
+    init_blake2(module);
+    init_merkle(module);
+    init_treehash(module);
     init_aes(module);
+    init_aesgcm(module);
     init_xsalsa20(module);
+    init_secretbox(module);
+    init_chacha20(module);
+    init_pipeline(module);
 }
@@ -1,4 +1,4 @@
-from pycryptopp.cipher import aes, xsalsa20
+from pycryptopp.cipher import aes, aesgcm, xsalsa20, chacha20
 
 from common import insecurerandstr, rep_bench
 
@@ -19,12 +19,61 @@ class BenchCrypt(object):
     def crypt(self, N):
         cryptor = self.klass(self.key)
         cryptor.process(self.msg)
-        
+
+class BenchGCM(object):
+    def __init__(self, keysize, tablesize):
+        self.keysize = keysize
+        self.tablesize = tablesize
+
+    def __repr__(self):
+        return "<AES-GCM-%d, %d B tables>" % (self.keysize*8, self.tablesize)
+
+    def crypt_init(self, N):
+        self.msg = insecurerandstr(N)
+        self.key = insecurerandstr(self.keysize)
+        self.iv = insecurerandstr(12)
+
+    def crypt(self, N):
+        encryptor = aesgcm.Encryptor(self.key, self.iv, tablesize=self.tablesize)
+        encryptor.update(self.msg)
+        encryptor.finalize()
+
+class BenchXSalsa20Small(object):
+    """ Many short messages under one key, each with its own nonce, either
+    with a new XSalsa20 object per message or with one xsalsa20.Context. """
+    def __init__(self, msgsize, use_context):
+        self.msgsize = msgsize
+        self.use_context = use_context
+
+    def __repr__(self):
+        if self.use_context:
+            return "<XSalsa20 Context, %d B messages>" % (self.msgsize,)
+        return "<XSalsa20 per message, %d B messages>" % (self.msgsize,)
+
+    def crypt_init(self, N):
+        self.key = insecurerandstr(32)
+        n = N // self.msgsize
+        self.msgs = [insecurerandstr(self.msgsize) for i in xrange(n)]
+        self.nonces = [insecurerandstr(24) for i in xrange(n)]
+
+    def crypt(self, N):
+        if self.use_context:
+            process = xsalsa20.Context(self.key).process
+            for (nonce, msg) in zip(self.nonces, self.msgs):
+                process(nonce, msg)
+        else:
+            XSalsa20 = xsalsa20.XSalsa20
+            key = self.key
+            for (nonce, msg) in zip(self.nonces, self.msgs):
+                XSalsa20(key, nonce).process(msg)
+
 def bench_ciphers(MAXTIME):
     for (klass, keysize) in [
         (aes.AES, 16),
         (aes.AES, 32),
         (xsalsa20.XSalsa20, 32),
+        (chacha20.ChaCha20, 32),
+        (chacha20.XChaCha20, 32),
         ]:
         ob = BenchCrypt(klass, keysize)
         print ob
@@ -35,6 +84,25 @@ def bench_ciphers(MAXTIME):
             rep_bench(ob.crypt, size, UNITS_PER_SECOND=UNITS_PER_SECOND, MAXTIME=MAXTIME, MAXREPS=100, initfunc=ob.crypt_init)
             print
 
+    for msgsize in [64, 1024]:
+        for use_context in [False, True]:
+            ob = BenchXSalsa20Small(msgsize, use_context)
+            print ob
+            size = 10**6
+            print "small (%d B in all)" % size
+            rep_bench(ob.crypt, size, UNITS_PER_SECOND=UNITS_PER_SECOND, MAXTIME=MAXTIME, MAXREPS=100, initfunc=ob.crypt_init)
+            print
+
+    for tablesize in [2048, 65536]:
+        ob = BenchGCM(16, tablesize)
+        print ob
+        for (legend, size) in [
+            ("large (%d B)",  10**7),
+            ]:
+            print legend % size
+            rep_bench(ob.crypt, size, UNITS_PER_SECOND=UNITS_PER_SECOND, MAXTIME=MAXTIME, MAXREPS=100, initfunc=ob.crypt_init)
+            print
+
     print "nanoseconds per byte crypted"
     print
 
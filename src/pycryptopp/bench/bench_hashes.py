@@ -1,4 +1,4 @@
-from pycryptopp.hash import sha256
+from pycryptopp.hash import sha256, sha512, blake2, treehash
 
 from common import insecurerandstr, rep_bench
 
@@ -13,11 +13,39 @@ class SHA256(object):
         h.update(self.msg)
         h.digest()
 
+class SHA512(object):
+    def proc_init(self, N):
+        self.msg = insecurerandstr(N)
+
+    def proc(self, N):
+        h = sha512.SHA512()
+        h.update(self.msg)
+        h.digest()
+
+class BLAKE2b(object):
+    def proc_init(self, N):
+        self.msg = insecurerandstr(N)
+
+    def proc(self, N):
+        h = blake2.BLAKE2b()
+        h.update(self.msg)
+        h.digest()
+
+class BLAKE2s(object):
+    def proc_init(self, N):
+        self.msg = insecurerandstr(N)
+
+    def proc(self, N):
+        h = blake2.BLAKE2s()
+        h.update(self.msg)
+        h.digest()
+
 def generate_hash_benchers():
+    ours = [SHA256, SHA512, BLAKE2b, BLAKE2s]
     try:
         import hashlib
     except ImportError:
-        return [SHA256]
+        return ours
     else:
         class hashlibSHA256(object):
             def proc_init(self, N):
@@ -28,8 +56,72 @@ def generate_hash_benchers():
                 h.update(self.msg)
                 h.digest()
                 
-        return [SHA256, hashlibSHA256]
+        return ours + [hashlibSHA256]
     
+class Leaves(object):
+    """ Many short messages, such as the leaves of a hash tree, hashed with
+    a SHA256 object each or all at once with hash_many(). """
+    def __init__(self, leafsize, use_hash_many):
+        self.leafsize = leafsize
+        self.use_hash_many = use_hash_many
+
+    def __repr__(self):
+        if self.use_hash_many:
+            return "<sha256.hash_many, %d B leaves>" % (self.leafsize,)
+        return "<SHA256 per leaf, %d B leaves>" % (self.leafsize,)
+
+    def proc_init(self, N):
+        self.packed = insecurerandstr(N - N % self.leafsize)
+        self.leaves = [self.packed[i:i+self.leafsize] for i in xrange(0, len(self.packed), self.leafsize)]
+
+    def proc(self, N):
+        if self.use_hash_many:
+            sha256.hash_many(self.packed, self.leafsize)
+        else:
+            SHA256 = sha256.SHA256
+            "".join([SHA256(leaf).digest() for leaf in self.leaves])
+
+class Tagged(object):
+    """ Tahoe-style tagged hashes, SHA256d(netstring(tag) + data), of short
+    messages: with the tag hashed again for each message, or once by a
+    TaggedHasher. """
+    TAG = "allmydata_crypttext_segment_v1"
+
+    def __init__(self, use_tagged_hasher):
+        self.use_tagged_hasher = use_tagged_hasher
+
+    def __repr__(self):
+        if self.use_tagged_hasher:
+            return "<sha256.TaggedHasher, 32 B messages>"
+        return "<SHA256d per message, 32 B messages>"
+
+    def proc_init(self, N):
+        self.msgs = [insecurerandstr(32) for i in xrange(N // 32)]
+        self.hasher = sha256.TaggedHasher(self.TAG, sha256d=True)
+
+    def proc(self, N):
+        if self.use_tagged_hasher:
+            self.hasher.hash_many(self.msgs)
+        else:
+            SHA256 = sha256.SHA256
+            prefix = "%d:%s," % (len(self.TAG), self.TAG)
+            "".join([SHA256(SHA256(prefix + msg).digest()).digest() for msg in self.msgs])
+
+class TreeHash(object):
+    """ A tree hash of one large message, with its chunks hashed on one or
+    more threads. """
+    def __init__(self, threads):
+        self.threads = threads
+
+    def __repr__(self):
+        return "<treehash.hash, %d threads>" % (self.threads,)
+
+    def proc_init(self, N):
+        self.msg = insecurerandstr(N)
+
+    def proc(self, N):
+        treehash.hash(self.msg, self.threads)
+
 def bench_hashes(MAXTIME):
     for klass in generate_hash_benchers():
         print klass
@@ -41,6 +133,31 @@ def bench_hashes(MAXTIME):
             rep_bench(ob.proc, size, UNITS_PER_SECOND=UNITS_PER_SECOND, MAXTIME=MAXTIME, MAXREPS=100, initfunc=ob.proc_init)
             print
 
+    for leafsize in [32, 1024]:
+        for use_hash_many in [False, True]:
+            ob = Leaves(leafsize, use_hash_many)
+            print ob
+            size = 10**6
+            print "leaves (%d B in all)" % size
+            rep_bench(ob.proc, size, UNITS_PER_SECOND=UNITS_PER_SECOND, MAXTIME=MAXTIME, MAXREPS=100, initfunc=ob.proc_init)
+            print
+
+    for use_tagged_hasher in [False, True]:
+        ob = Tagged(use_tagged_hasher)
+        print ob
+        size = 10**6
+        print "messages (%d B in all)" % size
+        rep_bench(ob.proc, size, UNITS_PER_SECOND=UNITS_PER_SECOND, MAXTIME=MAXTIME, MAXREPS=100, initfunc=ob.proc_init)
+        print
+
+    for threads in [1, 2, 4]:
+        ob = TreeHash(threads)
+        print ob
+        size = 10**7
+        print "large (%d B)" % size
+        rep_bench(ob.proc, size, UNITS_PER_SECOND=UNITS_PER_SECOND, MAXTIME=MAXTIME, MAXREPS=100, initfunc=ob.proc_init)
+        print
+
     print "nanoseconds per byte hashed"
     print
 
@@ -0,0 +1,127 @@
+#ifndef __INCL_BUFFERS_HPP
+#define __INCL_BUFFERS_HPP
+
+/**
+ * buffers.hpp -- helpers for accepting any object that exposes its bytes
+ * through a buffer protocol (str, bytearray, memoryview, array, mmap, ...)
+ * without copying it.
+ *
+ * Objects implementing the new-style (Python 2.6+) buffer protocol, such as
+ * str, bytearray and memoryview, keep their memory in place until the view
+ * is released, so their bytes may be used with the GIL released. Objects
+ * implementing only the old-style protocol, such as array.array and
+ * mmap.mmap in Python 2, make no such promise, so their bytes must only be
+ * used while holding the GIL. PYCRYPTOPP_BUFFER_PINNED() tells them apart.
+ */
+
+/* True if the memory behind view stays put while the GIL is released. */
+#define PYCRYPTOPP_BUFFER_PINNED(view) ((view).obj != NULL)
+
+static inline void
+pycryptopp_fill_unpinned_buffer(Py_buffer* view, void* buf, Py_ssize_t len, int readonly) {
+    /* view->obj stays NULL: the caller's reference keeps the object alive,
+       and PyBuffer_Release() is then a no-op. */
+    PyBuffer_FillInfo(view, NULL, buf, len, readonly, PyBUF_SIMPLE);
+}
+
+/**
+ * Get a read-only, contiguous view of obj's bytes. On failure raises error
+ * (with a message naming the type that was passed) and returns -1. Unicode
+ * objects are refused, since their buffer is the internal representation
+ * rather than any particular encoding. Release the view with
+ * PyBuffer_Release().
+ */
+static inline int
+pycryptopp_get_read_buffer(PyObject* obj, Py_buffer* view, PyObject* error) {
+    if (!PyUnicode_Check(obj)) {
+        if (PyObject_CheckBuffer(obj)) {
+            if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) == 0)
+                return 0;
+            return -1;
+        }
+        const void* buf;
+        Py_ssize_t len;
+        if (PyObject_AsReadBuffer(obj, &buf, &len) == 0) {
+            pycryptopp_fill_unpinned_buffer(view, const_cast<void*>(buf), len, 1);
+            return 0;
+        }
+        PyErr_Clear();
+    }
+    PyErr_Format(error, "Precondition violation: you are required to pass an object supporting the buffer protocol, such as a str, bytearray or memoryview (not a unicode), but you passed %.200s.", Py_TYPE(obj)->tp_name);
+    return -1;
+}
+
+/**
+ * Get a writable, contiguous view of obj's bytes. On failure raises error
+ * and returns -1. Release the view with PyBuffer_Release().
+ */
+static inline int
+pycryptopp_get_write_buffer(PyObject* obj, Py_buffer* view, PyObject* error) {
+    if (PyObject_CheckBuffer(obj)) {
+        if (PyObject_GetBuffer(obj, view, PyBUF_WRITABLE) == 0)
+            return 0;
+        PyErr_Clear();
+    } else {
+        void* buf;
+        Py_ssize_t len;
+        if (PyObject_AsWriteBuffer(obj, &buf, &len) == 0) {
+            pycryptopp_fill_unpinned_buffer(view, buf, len, 0);
+            return 0;
+        }
+        PyErr_Clear();
+    }
+    PyErr_Format(error, "Precondition violation: you are required to pass a writable object supporting the buffer protocol, such as a bytearray or a memoryview of one, but you passed %.200s.", Py_TYPE(obj)->tp_name);
+    return -1;
+}
+
+/* Take in the bytes of one message. This is called with the GIL held, and
+   may release it while it works if PYCRYPTOPP_BUFFER_PINNED(*view). Returns
+   -1 with an exception set on failure, which passes no further messages. */
+typedef int (*pycryptopp_message_func)(void* context, Py_buffer* view);
+
+static inline int
+pycryptopp_pass_message(PyObject* msgobj, pycryptopp_message_func func, void* context) {
+    Py_buffer msg;
+    if (PyUnicode_Check(msgobj)) {
+        /* Pass the default encoding, as the hash objects always have. */
+        char* s;
+        Py_ssize_t len;
+        if (PyString_AsStringAndSize(msgobj, &s, &len))
+            return -1;
+        pycryptopp_fill_unpinned_buffer(&msg, s, len, 1);
+    } else if (pycryptopp_get_read_buffer(msgobj, &msg, PyExc_TypeError))
+        return -1;
+    const int result = func(context, &msg);
+    PyBuffer_Release(&msg);
+    return result;
+}
+
+/**
+ * Pass the bytes of msgobj to func: msgobj is either one message or a list
+ * or tuple of them, which are passed in turn. A message is any object
+ * supporting the buffer protocol, or a unicode, whose default encoding is
+ * passed. On failure raises an exception and returns -1.
+ *
+ * The items of a list are taken from a snapshot of it, since another thread
+ * may change the list while func has the GIL released. Each item is a
+ * separate call to func, so anything func locks is unlocked between items.
+ */
+static inline int
+pycryptopp_pass_messages(PyObject* msgobj, pycryptopp_message_func func, void* context) {
+    if (!PyList_Check(msgobj) && !PyTuple_Check(msgobj))
+        return pycryptopp_pass_message(msgobj, func, context);
+    PyObject* items = PySequence_Tuple(msgobj);
+    if (!items)
+        return -1;
+    const Py_ssize_t n = PyTuple_GET_SIZE(items);
+    for (Py_ssize_t i = 0; i < n; i++) {
+        if (pycryptopp_pass_message(PyTuple_GET_ITEM(items, i), func, context)) {
+            Py_DECREF(items);
+            return -1;
+        }
+    }
+    Py_DECREF(items);
+    return 0;
+}
+
+#endif /* #ifndef __INCL_BUFFERS_HPP */
@@ -1,4 +1,7 @@
 import aes
+import aesgcm
 import xsalsa20
+import secretbox
+import chacha20
 
-quiet_pyflakes=[aes, xsalsa20]
+quiet_pyflakes=[aes, aesgcm, xsalsa20, secretbox, chacha20]
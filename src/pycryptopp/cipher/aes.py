@@ -6,6 +6,11 @@ from pycryptopp import _import_my_names
 # below in _import_my_names() in order to get sensible namespaces.
 AES=None
 Error=None
+encrypt_blocks=None
+crypt_file=None
+process_many=None
+has_aesni=None
+_set_use_aesni=None
 
 _import_my_names(globals(), "aes_")
 
@@ -19,7 +24,19 @@ def start_up_self_test():
     This idea was suggested to me by the second edition of "Practical
     Cryptography" by Ferguson, Schneier, and Kohno.
     These tests were copied from pycryptopp/test/test_aes.py on 2009-10-30.
+
+    If this processor has AES-NI then both the AES-NI code and the portable
+    code are tested, since either may end up being used.
     """
+    if has_aesni():
+        previous = _set_use_aesni(False)
+        try:
+            _self_test()
+        finally:
+            _set_use_aesni(previous)
+    _self_test()
+
+def _self_test():
     enc0 = "dc95c078a2408989ad48a21492842087530f8afbc74536b9a963b4f1c4cb738b"
     from binascii import a2b_hex, b2a_hex
 
@@ -50,17 +67,17 @@ def start_up_self_test():
         def fake_ecb_using_ctr(k, p):
             return AES(key=k, iv=p).process('\x00'*16)
 
-        E = fake_ecb_using_ctr
-        b = 16
-        k = keysize
-        S = '\x00' * (k+b)
-        for i in range(1000):
-            K = S[-k:]
-            P = S[-k-b:-k]
-            S += E(K, E(K, P))
-
-        if S[-b:] != a2b_hex(result):
-            raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+        for E in [fake_ecb_using_ctr, encrypt_blocks]:
+            b = 16
+            k = keysize
+            S = '\x00' * (k+b)
+            for i in range(1000):
+                K = S[-k:]
+                P = S[-k-b:-k]
+                S += E(K, E(K, P))
+
+            if S[-b:] != a2b_hex(result):
+                raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
 
     _test_from_Niels_AES(16, 'bd883f01035e58f42f9d812f2dacbcd8')
     _test_from_Niels_AES(32, 'c84b0f3a2c76dd9871900b07f09bdd3e')
@@ -0,0 +1,81 @@
+from pycryptopp import _import_my_names
+
+# These initializations to None are just to pacify pyflakes, which
+# doesn't understand that we have to do some funky import trickery
+# below in _import_my_names() in order to get sensible namespaces.
+Encryptor=None
+Decryptor=None
+Error=None
+AuthenticationError=None
+
+_import_my_names(globals(), "aesgcm_")
+
+del _import_my_names
+
+def encrypt(key, iv, plaintext, associated_data="", tablesize=2048):
+    """
+    Encrypt plaintext in one go, returning (ciphertext, tag).
+    """
+    e = Encryptor(key, iv, tablesize=tablesize)
+    e.add_associated_data(associated_data)
+    ciphertext = e.update(plaintext)
+    return ciphertext, e.finalize()
+
+def decrypt(key, iv, ciphertext, tag, associated_data="", tablesize=2048):
+    """
+    Decrypt ciphertext in one go, returning the plaintext, or raising
+    AuthenticationError if it is not authentic.
+    """
+    d = Decryptor(key, iv, tablesize=tablesize)
+    d.add_associated_data(associated_data)
+    plaintext = d.update(ciphertext)
+    d.finalize(tag)
+    return plaintext
+
+def start_up_self_test():
+    """
+    This is a quick test intended to detect major errors such as the library
+    being miscompiled and segfaulting or returning incorrect answers. The test
+    vectors are test cases 2 and 4 from "The Galois/Counter Mode of Operation
+    (GCM)" by McGrew and Viega, run with each table size and, if this
+    processor has AES-NI, with both implementations of AES.
+    """
+    from pycryptopp.cipher import aes
+    if aes.has_aesni():
+        previous = aes._set_use_aesni(False)
+        try:
+            _self_test()
+        finally:
+            aes._set_use_aesni(previous)
+    _self_test()
+
+def _self_test():
+    from binascii import a2b_hex
+
+    def check(key, iv, p, a, c, t):
+        key, iv, p, a, c, t = map(a2b_hex, (key, iv, p, a, c, t))
+        for tablesize in [2048, 65536]:
+            if encrypt(key, iv, p, a, tablesize) != (c, t):
+                raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+            try:
+                if decrypt(key, iv, c, t, a, tablesize) != p:
+                    raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+            except AuthenticationError:
+                raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+    check("00000000000000000000000000000000",
+          "000000000000000000000000",
+          "00000000000000000000000000000000",
+          "",
+          "0388dace60b6a392f328c2b971b2fe78",
+          "ab6e47d42cec13bdf53a67b21257bddf")
+    check("feffe9928665731c6d6a8f9467308308",
+          "cafebabefacedbaddecaf888",
+          "d9313225f88406e5a55909c5aff5269a86a7a9531534f7da2e4c303d8a318a72"
+          "1c3c0c95956809532fcf0e2449a6b525b16aedf5aa0de657ba637b39",
+          "feedfacedeadbeeffeedfacedeadbeefabaddad2",
+          "42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e"
+          "21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091",
+          "5bc94fbc3221a5db94fae95ae7121a47")
+
+start_up_self_test()
@@ -0,0 +1,727 @@
+/**
+ * aesgcmmodule.cpp -- AES in Galois/Counter Mode (NIST SP 800-38D)
+ *
+ * The copy of Crypto++ embedded in pycryptopp has gcm.h but not the
+ * implementation behind it, so the mode is implemented here on top of
+ * Crypto++'s AES (or the AES-NI code in aesni.cpp, when the processor has
+ * it).
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "aesgcmmodule.hpp"
+#include "aesni.hpp"
+#include "../buffers.hpp"
+#include "../objectlock.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/aes.h>
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/aes.h>
+#include <src-cryptopp/misc.h>
+#endif
+
+using CryptoPP::word32;
+using CryptoPP::word64;
+
+static const char*const aesgcm___doc__ = "_aesgcm authenticated cipher\n\
+You are advised to run aesgcm.start_up_self_test() after importing this module.";
+
+static PyObject *aesgcm_error;
+static PyObject *aesgcm_authentication_error;
+
+/* The GHASH multiplication tables. The small ones hold H*x^i for each of the
+   128 bits of a block, and a block is multiplied by H by adding up the
+   entries for the bits that are set, in constant time. The large ones hold
+   b*x^(8i)*H for every value b of each of the 16 bytes of a block, so that
+   multiplying takes 16 lookups instead; they are faster, but which entries
+   are read depends on the data. */
+static const int TABLESIZE_SMALL = 2048;
+static const int TABLESIZE_LARGE = 65536;
+
+/* the most plaintext that can be processed under one IV: 2^39 - 256 bits */
+static const word64 MAX_TEXT_LENGTH = (W64LIT(1) << 36) - 32;
+
+/* how many counter blocks to encrypt at a time */
+static const size_t CTR_BATCH = 64;
+
+enum {
+    STATE_ASSOCIATED_DATA,  /* more associated data may be added */
+    STATE_TEXT,             /* data is being encrypted or decrypted */
+    STATE_FINALIZED         /* the tag has been made or checked */
+};
+
+typedef struct {
+    PyObject_HEAD
+
+    /* internal */
+    PyThread_type_lock lock;
+    bool decrypting;
+    int state;
+
+    /* the block cipher: ks if use_aesni is set, else aes */
+    bool use_aesni;
+    pycryptopp_aesni_key ks;
+    CryptoPP::AES::Encryption* aes;
+
+    /* GHASH: the tables for multiplying by H, the running hash x and a
+       partial block waiting to be added to it */
+    int tablesize;
+    word64* table;
+    word64 xhi, xlo;
+    byte partial[16];
+    size_t npartial;
+    word64 adlen, textlen;
+
+    /* CTR: the pre-counter block, the counter of the next keystream block
+       and what is left of the current one */
+    byte j0[16];
+    word32 ctr;
+    byte keystream[16];
+    size_t keystreampos;
+} AESGCM;
+
+static void
+AESGCM_encrypt_blocks(const AESGCM* self, byte* out, const byte* in, size_t nblocks) {
+    if (self->use_aesni)
+        pycryptopp_aesni_encrypt_blocks(&self->ks, out, in, nblocks);
+    else
+        self->aes->AdvancedProcessBlocks(in, NULL, out, nblocks * 16, 0);
+}
+
+/* Multiply (hi, lo) by x in GCM's bit-reflected representation. */
+static inline void
+gf_mulx(word64& hi, word64& lo) {
+    const word64 carry = lo & 1;
+    lo = (lo >> 1) | (hi << 63);
+    hi = (hi >> 1) ^ ((0 - carry) & W64LIT(0xe100000000000000));
+}
+
+static void
+AESGCM_make_table(AESGCM* self, word64 hhi, word64 hlo) {
+    word64 bits[256];
+    for (int i = 0; i < 128; i++) {
+        bits[2*i] = hhi;
+        bits[2*i+1] = hlo;
+        gf_mulx(hhi, hlo);
+    }
+    if (self->tablesize == TABLESIZE_SMALL) {
+        memcpy(self->table, bits, sizeof(bits));
+    } else {
+        for (int j = 0; j < 16; j++) {
+            word64* t = self->table + 512*j;
+            t[0] = t[1] = 0;
+            for (int v = 1; v < 256; v++) {
+                const int low = v & -v;
+                if (v == low) {
+                    /* bit 7 of the byte is the lowest power of x */
+                    int k = 0;
+                    while ((0x80 >> k) != v)
+                        k++;
+                    t[2*v] = bits[2*(8*j + k)];
+                    t[2*v+1] = bits[2*(8*j + k) + 1];
+                } else {
+                    t[2*v] = t[2*(v ^ low)] ^ t[2*low];
+                    t[2*v+1] = t[2*(v ^ low) + 1] ^ t[2*low + 1];
+                }
+            }
+        }
+    }
+    CryptoPP::SecureWipeArray(bits, 256);
+}
+
+/* x = (x + block) * H */
+static inline void
+AESGCM_ghash_block(AESGCM* self, const byte* block) {
+    const word64 xhi = self->xhi ^ CryptoPP::GetWord<word64>(false, CryptoPP::BIG_ENDIAN_ORDER, block);
+    const word64 xlo = self->xlo ^ CryptoPP::GetWord<word64>(false, CryptoPP::BIG_ENDIAN_ORDER, block + 8);
+    const word64* t = self->table;
+    word64 zhi = 0, zlo = 0;
+    if (self->tablesize == TABLESIZE_SMALL) {
+        for (int i = 0; i < 64; i++) {
+            const word64 m = 0 - ((xhi >> (63 - i)) & 1);
+            zhi ^= t[2*i] & m;
+            zlo ^= t[2*i+1] & m;
+        }
+        for (int i = 0; i < 64; i++) {
+            const word64 m = 0 - ((xlo >> (63 - i)) & 1);
+            zhi ^= t[128 + 2*i] & m;
+            zlo ^= t[128 + 2*i+1] & m;
+        }
+    } else {
+        for (int j = 0; j < 8; j++) {
+            const word64* e = t + 512*j + 2*((xhi >> (56 - 8*j)) & 0xff);
+            zhi ^= e[0];
+            zlo ^= e[1];
+        }
+        for (int j = 0; j < 8; j++) {
+            const word64* e = t + 512*(8 + j) + 2*((xlo >> (56 - 8*j)) & 0xff);
+            zhi ^= e[0];
+            zlo ^= e[1];
+        }
+    }
+    self->xhi = zhi;
+    self->xlo = zlo;
+}
+
+static void
+AESGCM_ghash_update(AESGCM* self, const byte* data, size_t len) {
+    if (self->npartial) {
+        const size_t n = CryptoPP::STDMIN(len, 16 - self->npartial);
+        memcpy(self->partial + self->npartial, data, n);
+        self->npartial += n;
+        data += n;
+        len -= n;
+        if (self->npartial < 16)
+            return;
+        AESGCM_ghash_block(self, self->partial);
+        self->npartial = 0;
+    }
+    for (; len >= 16; data += 16, len -= 16)
+        AESGCM_ghash_block(self, data);
+    memcpy(self->partial, data, len);
+    self->npartial = len;
+}
+
+/* Pad any partial block with zeroes and add it to the hash. */
+static void
+AESGCM_ghash_flush(AESGCM* self) {
+    if (self->npartial) {
+        memset(self->partial + self->npartial, 0, 16 - self->npartial);
+        AESGCM_ghash_block(self, self->partial);
+        self->npartial = 0;
+    }
+}
+
+static void
+AESGCM_ghash_lengths(AESGCM* self, word64 a, word64 b) {
+    byte block[16];
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, block, a * 8);
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, block + 8, b * 8);
+    AESGCM_ghash_block(self, block);
+}
+
+/* XOR the next len bytes of keystream into in, writing the result to out.
+   The counter is only the last 32 bits of the counter block, which wrap
+   around without carrying into the rest. */
+static void
+AESGCM_ctr(AESGCM* self, byte* out, const byte* in, size_t len) {
+    while (len && self->keystreampos < 16) {
+        *out++ = *in++ ^ self->keystream[self->keystreampos++];
+        len--;
+    }
+
+    byte counters[16*CTR_BATCH];
+    byte keystream[16*CTR_BATCH];
+    while (len) {
+        const size_t nblocks = CryptoPP::STDMIN(CTR_BATCH, (len + 15) / 16);
+        for (size_t i = 0; i < nblocks; i++) {
+            memcpy(counters + 16*i, self->j0, 12);
+            CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, counters + 16*i + 12, self->ctr++);
+        }
+        AESGCM_encrypt_blocks(self, keystream, counters, nblocks);
+        const size_t n = CryptoPP::STDMIN(len, 16*nblocks);
+        CryptoPP::xorbuf(out, in, keystream, n);
+        out += n;
+        in += n;
+        len -= n;
+        if (n % 16) {
+            /* keep the rest of the last block for next time */
+            memcpy(self->keystream, keystream + n - n % 16, 16);
+            self->keystreampos = n % 16;
+        }
+    }
+    CryptoPP::SecureWipeArray(keystream, sizeof(keystream));
+}
+
+/** Encrypt or decrypt the next len bytes. The caller must hold self's lock,
+ * if it has one, but need not hold the GIL. */
+static void
+AESGCM_crypt(AESGCM* self, byte* out, const byte* in, size_t len) {
+    /* The hash is of the ciphertext, which is the input when decrypting.
+       Hash it before decrypting so that in and out may be the same. */
+    if (self->decrypting)
+        AESGCM_ghash_update(self, in, len);
+    AESGCM_ctr(self, out, in, len);
+    if (!self->decrypting)
+        AESGCM_ghash_update(self, out, len);
+    self->textlen += len;
+}
+
+/* the reasons an object may be unable to do what it is asked */
+enum {
+    PROBLEM_NONE,
+    PROBLEM_UNINITIALIZED,
+    PROBLEM_FINALIZED,
+    PROBLEM_TEXT_STARTED,
+    PROBLEM_TOO_LONG
+};
+
+/* What stops self from processing len more bytes of text, or (if text_done
+   is true) from adding associated data, if anything. This touches no Python
+   objects, so that it can be checked again once self's lock is held: waiting
+   for the lock releases the GIL, and another thread may have used self in
+   the meantime. */
+static int
+AESGCM_problem(const AESGCM* self, bool text_done, word64 len) {
+    if (!self->table)
+        return PROBLEM_UNINITIALIZED;
+    if (self->state == STATE_FINALIZED)
+        return PROBLEM_FINALIZED;
+    if (text_done && self->state == STATE_TEXT)
+        return PROBLEM_TEXT_STARTED;
+    if (len > MAX_TEXT_LENGTH - self->textlen)
+        return PROBLEM_TOO_LONG;
+    return PROBLEM_NONE;
+}
+
+/* Raise aesgcm.Error and return -1 if there is a problem. */
+static int
+AESGCM_raise(int problem) {
+    switch (problem) {
+    case PROBLEM_NONE:
+        return 0;
+    case PROBLEM_UNINITIALIZED:
+        PyErr_SetString(aesgcm_error, "Precondition violation: this object has not been initialized.");
+        break;
+    case PROBLEM_FINALIZED:
+        PyErr_SetString(aesgcm_error, "Precondition violation: this object has already been finalized; use a new one (with a new IV) for the next message.");
+        break;
+    case PROBLEM_TEXT_STARTED:
+        PyErr_SetString(aesgcm_error, "Precondition violation: associated data is required to be added before any data is encrypted or decrypted.");
+        break;
+    default:
+        PyErr_Format(aesgcm_error, "Precondition violation: at most %llu bytes may be processed under one IV.", static_cast<unsigned long long>(MAX_TEXT_LENGTH));
+        break;
+    }
+    return -1;
+}
+
+static int
+AESGCM_check_state(const AESGCM* self, bool text_done, word64 len) {
+    return AESGCM_raise(AESGCM_problem(self, text_done, len));
+}
+
+static PyObject *
+AESGCM_add_associated_data(AESGCM* self, PyObject* dataobj) {
+    if (AESGCM_check_state(self, true, 0))
+        return NULL;
+    Py_buffer data;
+    if (pycryptopp_get_read_buffer(dataobj, &data, aesgcm_error))
+        return NULL;
+    assert (data.len >= 0);
+
+    int problem;
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(data), data.len,
+        problem = AESGCM_problem(self, true, 0);
+        if (!problem) {
+            AESGCM_ghash_update(self, reinterpret_cast<const byte*>(data.buf), data.len);
+            self->adlen += data.len;
+        });
+    PyBuffer_Release(&data);
+    if (AESGCM_raise(problem))
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(AESGCM_add_associated_data__doc__,
+"add_associated_data(data)\n\
+\n\
+Authenticate data without encrypting it, such as a header which has to be\n\
+sent in the clear. Associated data may be added in any number of pieces, but\n\
+all of it must come before the first call to .update(), and the other side\n\
+must add exactly the same bytes.");
+
+static PyObject *
+AESGCM_update(AESGCM* self, PyObject* msgobj) {
+    if (AESGCM_check_state(self, false, 0))
+        return NULL;
+    Py_buffer msg;
+    if (pycryptopp_get_read_buffer(msgobj, &msg, aesgcm_error))
+        return NULL;
+    assert (msg.len >= 0);
+
+    if (AESGCM_check_state(self, false, msg.len)) {
+        PyBuffer_Release(&msg);
+        return NULL;
+    }
+
+    PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msg.len));
+    if (!result) {
+        PyBuffer_Release(&msg);
+        return NULL;
+    }
+
+    byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    int problem;
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(msg), msg.len,
+        problem = AESGCM_problem(self, false, msg.len);
+        if (!problem) {
+            if (self->state == STATE_ASSOCIATED_DATA) {
+                AESGCM_ghash_flush(self);
+                self->state = STATE_TEXT;
+            }
+            AESGCM_crypt(self, out, reinterpret_cast<const byte*>(msg.buf), msg.len);
+        });
+    PyBuffer_Release(&msg);
+    if (AESGCM_raise(problem)) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    return reinterpret_cast<PyObject*>(result);
+}
+
+PyDoc_STRVAR(AESGCM_update__doc__,
+"Encrypt or decrypt the next bytes, returning the result.\n\
+\n\
+The argument may be any object supporting the buffer protocol. Large inputs\n\
+are processed with the GIL released.");
+
+/* Finish the hash and compute the full 16-byte tag. The caller must hold
+   self's lock, if it has one. */
+static void
+AESGCM_tag(AESGCM* self, byte* tag) {
+    AESGCM_ghash_flush(self);
+    AESGCM_ghash_lengths(self, self->adlen, self->textlen);
+    AESGCM_encrypt_blocks(self, tag, self->j0, 1);
+    byte s[16];
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, s, self->xhi);
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, s + 8, self->xlo);
+    CryptoPP::xorbuf(tag, s, 16);
+    self->state = STATE_FINALIZED;
+}
+
+static PyObject *
+AESGCM_finalize_encryption(AESGCM* self, PyObject* dummy) {
+    if (AESGCM_check_state(self, false, 0))
+        return NULL;
+    byte tag[16];
+    ENTER_OBJECTLOCK(self);
+    const int problem = AESGCM_problem(self, false, 0);
+    if (!problem)
+        AESGCM_tag(self, tag);
+    LEAVE_OBJECTLOCK(self);
+    if (AESGCM_raise(problem))
+        return NULL;
+    return PyString_FromStringAndSize(reinterpret_cast<const char*>(tag), sizeof(tag));
+}
+
+PyDoc_STRVAR(AESGCM_finalize_encryption__doc__,
+"Finish encrypting and return the 16-byte authentication tag, which must be\n\
+sent along with the ciphertext. Nothing more can be done with this object\n\
+afterwards.");
+
+static PyObject *
+AESGCM_finalize_decryption(AESGCM* self, PyObject* tagobj) {
+    if (AESGCM_check_state(self, false, 0))
+        return NULL;
+    Py_buffer expected;
+    if (pycryptopp_get_read_buffer(tagobj, &expected, aesgcm_error))
+        return NULL;
+    if (expected.len < 12 || expected.len > 16) {
+        PyErr_Format(aesgcm_error, "Precondition violation: the tag is required to be between 12 and 16 bytes long, but it was %zd bytes.", expected.len);
+        PyBuffer_Release(&expected);
+        return NULL;
+    }
+
+    byte tag[16];
+    ENTER_OBJECTLOCK(self);
+    const int problem = AESGCM_problem(self, false, 0);
+    if (!problem)
+        AESGCM_tag(self, tag);
+    LEAVE_OBJECTLOCK(self);
+    if (AESGCM_raise(problem)) {
+        PyBuffer_Release(&expected);
+        return NULL;
+    }
+    /* VerifyBufsEqual takes the same time wherever the tags differ. */
+    const bool ok = CryptoPP::VerifyBufsEqual(tag, reinterpret_cast<const byte*>(expected.buf), expected.len);
+    PyBuffer_Release(&expected);
+    if (!ok) {
+        PyErr_SetString(aesgcm_authentication_error, "The ciphertext, associated data or tag has been corrupted or tampered with.");
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(AESGCM_finalize_decryption__doc__,
+"finalize(tag)\n\
+\n\
+Finish decrypting and check tag, which may be truncated to as few as 12\n\
+bytes, raising aesgcm.AuthenticationError if it does not match. Until this\n\
+returns, the plaintext from .update() must not be trusted or acted upon.\n\
+Nothing more can be done with this object afterwards.");
+
+static PyMethodDef Encryptor_methods[] = {
+    {"add_associated_data", reinterpret_cast<PyCFunction>(AESGCM_add_associated_data), METH_O, AESGCM_add_associated_data__doc__},
+    {"update", reinterpret_cast<PyCFunction>(AESGCM_update), METH_O, AESGCM_update__doc__},
+    {"finalize", reinterpret_cast<PyCFunction>(AESGCM_finalize_encryption), METH_NOARGS, AESGCM_finalize_encryption__doc__},
+    {NULL},
+};
+
+static PyMethodDef Decryptor_methods[] = {
+    {"add_associated_data", reinterpret_cast<PyCFunction>(AESGCM_add_associated_data), METH_O, AESGCM_add_associated_data__doc__},
+    {"update", reinterpret_cast<PyCFunction>(AESGCM_update), METH_O, AESGCM_update__doc__},
+    {"finalize", reinterpret_cast<PyCFunction>(AESGCM_finalize_decryption), METH_O, AESGCM_finalize_decryption__doc__},
+    {NULL},
+};
+
+static PyObject *
+AESGCM_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+    AESGCM* self = reinterpret_cast<AESGCM*>(type->tp_alloc(type, 0));
+    if (!self)
+        return NULL;
+    self->lock = NULL;
+    self->aes = NULL;
+    self->table = NULL;
+    self->use_aesni = false;
+    self->tablesize = 0;
+    return reinterpret_cast<PyObject*>(self);
+}
+
+static void
+AESGCM_clear(AESGCM* self) {
+    if (self->aes) {
+        delete self->aes;
+        self->aes = NULL;
+    }
+    if (self->table) {
+        CryptoPP::SecureWipeArray(self->table, self->tablesize / sizeof(word64));
+        delete [] self->table;
+        self->table = NULL;
+    }
+    CryptoPP::SecureWipeArray(self->ks.rk, sizeof(self->ks.rk));
+    CryptoPP::SecureWipeArray(self->keystream, sizeof(self->keystream));
+    CryptoPP::SecureWipeArray(self->partial, sizeof(self->partial));
+}
+
+static void
+AESGCM_dealloc(PyObject* self) {
+    AESGCM_clear(reinterpret_cast<AESGCM*>(self));
+    FREE_OBJECTLOCK(reinterpret_cast<AESGCM*>(self));
+    self->ob_type->tp_free(self);
+}
+
+static int
+AESGCM_init(AESGCM* self, PyObject *args, PyObject *kwdict, bool decrypting) {
+    static const char *kwlist[] = { "key", "iv", "tablesize", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *iv = NULL;
+    Py_ssize_t ivsize = 0;
+    int tablesize = TABLESIZE_SMALL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#t#|i:__init__", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize, &tablesize))
+        return -1;
+    assert (keysize >= 0);
+    assert (ivsize >= 0);
+
+    if (keysize != 16 && keysize != 24 && keysize != 32) {
+        PyErr_Format(aesgcm_error, "Precondition violation: the key is required to be 16, 24 or 32 bytes long, but it was %zd bytes.", keysize);
+        return -1;
+    }
+    if (ivsize < 1) {
+        PyErr_SetString(aesgcm_error, "Precondition violation: the IV is required to be at least 1 byte long (12 bytes is recommended).");
+        return -1;
+    }
+    if (tablesize != TABLESIZE_SMALL && tablesize != TABLESIZE_LARGE) {
+        PyErr_Format(aesgcm_error, "Precondition violation: tablesize is required to be %d or %d, but it was %d.", TABLESIZE_SMALL, TABLESIZE_LARGE, tablesize);
+        return -1;
+    }
+
+    ENTER_OBJECTLOCK(self);
+    AESGCM_clear(self);
+    self->decrypting = decrypting;
+    self->state = STATE_ASSOCIATED_DATA;
+    self->tablesize = tablesize;
+    self->use_aesni = pycryptopp_use_aesni;
+    try {
+        if (self->use_aesni)
+            pycryptopp_aesni_set_key(&self->ks, reinterpret_cast<const byte*>(key), keysize);
+        else
+            self->aes = new CryptoPP::AES::Encryption(reinterpret_cast<const byte*>(key), keysize);
+        self->table = new word64[tablesize / sizeof(word64)];
+    } catch (std::bad_alloc&) {
+        AESGCM_clear(self);
+        LEAVE_OBJECTLOCK(self);
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    /* H is the encryption of the zero block */
+    byte h[16] = {0};
+    AESGCM_encrypt_blocks(self, h, h, 1);
+    AESGCM_make_table(self, CryptoPP::GetWord<word64>(false, CryptoPP::BIG_ENDIAN_ORDER, h), CryptoPP::GetWord<word64>(false, CryptoPP::BIG_ENDIAN_ORDER, h + 8));
+    CryptoPP::SecureWipeArray(h, sizeof(h));
+
+    self->xhi = self->xlo = 0;
+    self->npartial = 0;
+    self->adlen = self->textlen = 0;
+    if (ivsize == 12) {
+        memcpy(self->j0, iv, 12);
+        CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, self->j0 + 12, static_cast<word32>(1));
+    } else {
+        /* J0 is the GHASH of the IV and its length */
+        AESGCM_ghash_update(self, reinterpret_cast<const byte*>(iv), ivsize);
+        AESGCM_ghash_flush(self);
+        AESGCM_ghash_lengths(self, 0, ivsize);
+        CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, self->j0, self->xhi);
+        CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, self->j0 + 8, self->xlo);
+        self->xhi = self->xlo = 0;
+    }
+    self->ctr = CryptoPP::GetWord<word32>(false, CryptoPP::BIG_ENDIAN_ORDER, self->j0 + 12) + 1;
+    self->keystreampos = 16;
+    LEAVE_OBJECTLOCK(self);
+    return 0;
+}
+
+static int
+Encryptor_init(PyObject* self, PyObject *args, PyObject *kwdict) {
+    return AESGCM_init(reinterpret_cast<AESGCM*>(self), args, kwdict, false);
+}
+
+static int
+Decryptor_init(PyObject* self, PyObject *args, PyObject *kwdict) {
+    return AESGCM_init(reinterpret_cast<AESGCM*>(self), args, kwdict, true);
+}
+
+PyDoc_STRVAR(Encryptor__doc__,
+"An AES-GCM encryptor for one message.\n\
+\n\
+Add any associated data with .add_associated_data(), then encrypt the\n\
+message in as many pieces as you like with .update(), then call .finalize()\n\
+to get the authentication tag. The tag is kept apart from the ciphertext;\n\
+send both.\n\
+\n\
+Never encrypt two messages with the same key and IV: doing so gives away the\n\
+XOR of the messages and lets an attacker forge tags.\n\
+\n\
+@param key: the symmetric key; a string of exactly 16, 24 or 32 bytes\n\
+@param iv: the initialization vector; a string of any non-zero length, but\n\
+    12 bytes is strongly recommended\n\
+@param tablesize: the size in bytes of the table used for authentication,\n\
+    either 2048 (the default; runs in constant time) or 65536 (several times\n\
+    faster, but the memory it reads depends on the data, which can leak\n\
+    information through the cache to other processes on the same machine)\
+");
+
+PyDoc_STRVAR(Decryptor__doc__,
+"An AES-GCM decryptor for one message.\n\
+\n\
+Add the same associated data as the sender with .add_associated_data(), then\n\
+decrypt the ciphertext in as many pieces as you like with .update(), then\n\
+call .finalize() with the tag, which raises aesgcm.AuthenticationError\n\
+unless everything is authentic. Do not use the plaintext before then.\n\
+\n\
+The parameters are the same as for Encryptor.\
+");
+
+static PyTypeObject Encryptor_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_aesgcm.Encryptor", /*tp_name*/
+    sizeof(AESGCM),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    AESGCM_dealloc, /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    Encryptor__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    Encryptor_methods,      /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    Encryptor_init,               /* tp_init */
+    0,                         /* tp_alloc */
+    AESGCM_new,                /* tp_new */
+};
+
+static PyTypeObject Decryptor_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_aesgcm.Decryptor", /*tp_name*/
+    sizeof(AESGCM),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    AESGCM_dealloc, /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    Decryptor__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    Decryptor_methods,      /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    Decryptor_init,               /* tp_init */
+    0,                         /* tp_alloc */
+    AESGCM_new,                /* tp_new */
+};
+
+void
+init_aesgcm(PyObject*const module) {
+    if (PyType_Ready(&Encryptor_type) < 0)
+        return;
+    Py_INCREF(&Encryptor_type);
+    PyModule_AddObject(module, "aesgcm_Encryptor", (PyObject *)&Encryptor_type);
+
+    if (PyType_Ready(&Decryptor_type) < 0)
+        return;
+    Py_INCREF(&Decryptor_type);
+    PyModule_AddObject(module, "aesgcm_Decryptor", (PyObject *)&Decryptor_type);
+
+    aesgcm_error = PyErr_NewException(const_cast<char*>("_aesgcm.Error"), NULL, NULL);
+    PyModule_AddObject(module, "aesgcm_Error", aesgcm_error);
+
+    aesgcm_authentication_error = PyErr_NewException(const_cast<char*>("_aesgcm.AuthenticationError"), aesgcm_error, NULL);
+    PyModule_AddObject(module, "aesgcm_AuthenticationError", aesgcm_authentication_error);
+
+    PyModule_AddStringConstant(module, "aesgcm___doc__", const_cast<char*>(aesgcm___doc__));
+}
@@ -0,0 +1,7 @@
+#ifndef __INCL_AESGCMMODULE_HPP
+#define __INCL_AESGCMMODULE_HPP
+
+extern void
+init_aesgcm(PyObject* module);
+
+#endif /* #ifndef __INCL_AESGCMMODULE_HPP */
@@ -9,6 +9,12 @@ typedef int Py_ssize_t;
 #endif
 
 #include "aesmodule.hpp"
+#include "aesni.hpp"
+#include "../buffers.hpp"
+#include "../fileio.hpp"
+#include "../many.hpp"
+#include "../objectlock.hpp"
+#include "../parallel.hpp"
 
 
 /* from Crypto++ */
@@ -30,8 +36,27 @@ typedef struct {
 
     /* internal */
     CryptoPP::CTR_Mode<CryptoPP::AES>::Encryption * e;
+    PyThread_type_lock lock;
+    /* the offset into the keystream of the next byte to be processed */
+    CryptoPP::lword pos;
+
+    /* what is needed to set up more cipher objects for the same keystream,
+       for parallel processing */
+    int threads;
+    byte key[CryptoPP::AES::MAX_KEYLENGTH];
+    size_t keysize;
+    byte iv[CryptoPP::AES::BLOCKSIZE];
+
+    /* If use_aesni is set then e is not used: the keystream is computed
+       from ks, iv and pos by the AES-NI code instead. */
+    bool use_aesni;
+    pycryptopp_aesni_key ks;
 } AES;
 
+/* Inputs are split into pieces of at least this many bytes for processing
+   in parallel. Anything smaller is not worth handing to another thread. */
+static const size_t PARALLEL_MINCHUNK = 64*1024;
+
 PyDoc_STRVAR(AES__doc__,
 "An AES cipher object.\n\
 \n\
@@ -50,40 +75,341 @@ this:\n\
 Where 'masterkey' is a secret key used only for generating onetimekeys this\
 way, and 'nonce' is a value that is guaranteed to never repeat.\
 \n\
-@param key: the symmetric encryption key; a string of exactly 16 or 32 bytes\
+@param key: the symmetric encryption key; a string of exactly 16 or 32 bytes\n\
+@param iv: the initial counter block; a string of exactly 16 bytes\n\
+@param threads: how many threads to use for inputs of 128 KiB or more;\n\
+    CTR mode lets the keystream for different parts of an input be computed\n\
+    independently, so such inputs are split into pieces of at least 64 KiB,\n\
+    which are processed on up to this many native threads at once. The\n\
+    output is exactly the same whatever the number of threads.\
 ");
 
+typedef struct {
+    const AES* self;
+    const byte* in;
+    byte* out;
+    size_t len;
+    size_t ntasks;
+} AES_ParallelJob;
+
+/** The offset into job's input where task i starts. The pieces are chosen to
+ * start on block boundaries of the keystream, except for the first. */
+static size_t
+AES_ParallelJob_start(const AES_ParallelJob* job, size_t i) {
+    if (i == 0)
+        return 0;
+    if (i >= job->ntasks)
+        return job->len;
+    const CryptoPP::lword pos = job->self->pos;
+    CryptoPP::lword start = pos + (job->len / job->ntasks) * i;
+    start += (CryptoPP::AES::BLOCKSIZE - start % CryptoPP::AES::BLOCKSIZE) % CryptoPP::AES::BLOCKSIZE;
+    return static_cast<size_t>(CryptoPP::STDMIN(start - pos, static_cast<CryptoPP::lword>(job->len)));
+}
+
+static void
+AES_ParallelJob_task(void* context, Py_ssize_t i) {
+    const AES_ParallelJob* job = reinterpret_cast<const AES_ParallelJob*>(context);
+    const size_t start = AES_ParallelJob_start(job, i);
+    const size_t end = AES_ParallelJob_start(job, i+1);
+    if (job->self->use_aesni) {
+        pycryptopp_aesni_ctr(&job->self->ks, job->self->iv, job->self->pos + start, job->out + start, job->in + start, end - start);
+        return;
+    }
+    CryptoPP::CTR_Mode<CryptoPP::AES>::Encryption e(job->self->key, job->self->keysize, job->self->iv);
+    e.Seek(job->self->pos + start);
+    e.ProcessData(job->out + start, job->in + start, end - start);
+}
+
+/** Process the next len bytes. The caller must hold self's lock, if it has
+ * one, but need not hold the GIL. */
+static void
+AES_crypt(AES* self, byte* out, const byte* in, size_t len) {
+    const size_t ntasks = CryptoPP::STDMIN(len / PARALLEL_MINCHUNK, static_cast<size_t>(self->threads) * 4);
+    if (self->threads > 1 && ntasks > 1) {
+        AES_ParallelJob job = { self, in, out, len, ntasks };
+        pycryptopp_run_parallel(AES_ParallelJob_task, &job, ntasks, self->threads);
+        if (!self->use_aesni)
+            self->e->Seek(self->pos + len);
+    } else if (self->use_aesni)
+        pycryptopp_aesni_ctr(&self->ks, self->iv, self->pos, out, in, len);
+    else
+        self->e->ProcessData(out, in, len);
+    self->pos += len;
+}
+
 static PyObject *
 AES_process(AES* self, PyObject* msgobj) {
-    if (!PyString_CheckExact(msgobj)) {
-        PyStringObject* typerepr = reinterpret_cast<PyStringObject*>(PyObject_Repr(reinterpret_cast<PyObject*>(msgobj->ob_type)));
-        if (typerepr) {
-            PyErr_Format(aes_error, "Precondition violation: you are required to pass a Python string object (not a unicode, a subclass of string, or anything else), but you passed %s.", PyString_AS_STRING(reinterpret_cast<PyObject*>(typerepr)));
-            Py_DECREF(typerepr);
-        } else
-            PyErr_Format(aes_error, "Precondition violation: you are required to pass a Python string object (not a unicode, a subclass of string, or anything else).");
+    Py_buffer msg;
+    if (pycryptopp_get_read_buffer(msgobj, &msg, aes_error))
+        return NULL;
+    assert (msg.len >= 0);
+
+    PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msg.len));
+    if (!result) {
+        PyBuffer_Release(&msg);
         return NULL;
     }
 
-    const char *msg;
-    Py_ssize_t msgsize;
-    if (PyString_AsStringAndSize(msgobj, const_cast<char**>(&msg), &msgsize))
+    byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(msg), msg.len,
+        AES_crypt(self, out, reinterpret_cast<const byte*>(msg.buf), msg.len));
+    PyBuffer_Release(&msg);
+    return reinterpret_cast<PyObject*>(result);
+}
+
+PyDoc_STRVAR(AES_process__doc__,
+"Encrypt or decrypt the next bytes, returning the result.\n\
+\n\
+The argument may be any object supporting the buffer protocol, such as a\n\
+str, bytearray, memoryview, array or mmap.\n\
+\n\
+Large inputs are processed with the GIL released, so other Python threads\n\
+can run meanwhile. Concurrent calls on the same AES object are serialized.");
+
+static PyObject *
+AES_process_into(AES* self, PyObject* args) {
+    PyObject* srcobj;
+    PyObject* dstobj;
+    if (!PyArg_ParseTuple(args, "OO:process_into", &srcobj, &dstobj))
+        return NULL;
+
+    Py_buffer src;
+    if (pycryptopp_get_read_buffer(srcobj, &src, aes_error))
+        return NULL;
+    Py_buffer dst;
+    if (pycryptopp_get_write_buffer(dstobj, &dst, aes_error)) {
+        PyBuffer_Release(&src);
+        return NULL;
+    }
+    if (dst.len < src.len) {
+        PyErr_Format(aes_error, "Precondition violation: dst is required to be at least as long as src (%zd bytes), but it was %zd bytes.", src.len, dst.len);
+        PyBuffer_Release(&dst);
+        PyBuffer_Release(&src);
+        return NULL;
+    }
+
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(src) && PYCRYPTOPP_BUFFER_PINNED(dst), src.len,
+        AES_crypt(self, reinterpret_cast<byte*>(dst.buf), reinterpret_cast<const byte*>(src.buf), src.len));
+    PyBuffer_Release(&dst);
+    PyBuffer_Release(&src);
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(AES_process_into__doc__,
+"process_into(src, dst)\n\
+\n\
+Encrypt or decrypt the next len(src) bytes of src, writing the result into\n\
+the first len(src) bytes of dst instead of returning a new string.\n\
+\n\
+src may be any object supporting the buffer protocol; dst must be a writable\n\
+one, such as a bytearray. src and dst may be the same buffer, to process it\n\
+in place, but must not otherwise overlap.");
+
+static PyObject *
+AES_seek(AES* self, PyObject* args) {
+    PY_LONG_LONG offset;
+    if (!PyArg_ParseTuple(args, "L:seek", &offset))
         return NULL;
-    assert (msgsize >= 0);
+    if (offset < 0)
+        return PyErr_Format(aes_error, "Precondition violation: offset is required to be non-negative, but it was %lld.", offset);
+
+    ENTER_OBJECTLOCK(self);
+    if (!self->use_aesni)
+        self->e->Seek(static_cast<CryptoPP::lword>(offset));
+    self->pos = static_cast<CryptoPP::lword>(offset);
+    LEAVE_OBJECTLOCK(self);
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(AES_seek__doc__,
+"seek(offset)\n\
+\n\
+Position the cipher so that the next call to .process() will use the\n\
+keystream starting offset bytes after the beginning, as though exactly\n\
+offset bytes had been processed since the object was created. offset need\n\
+not be a multiple of the block size. This takes the same (small) time for\n\
+any offset, and may move backwards as well as forwards.");
+
+static PyObject *
+AES_tell(AES* self, PyObject* dummy) {
+    ENTER_OBJECTLOCK(self);
+    CryptoPP::lword pos = self->pos;
+    LEAVE_OBJECTLOCK(self);
+    return PyLong_FromUnsignedLongLong(pos);
+}
+
+PyDoc_STRVAR(AES_tell__doc__,
+"Return the offset into the keystream of the next byte to be processed, which\n\
+is the number of bytes processed since the object was created or since the\n\
+last .seek(), plus the offset passed to that .seek().");
 
-    PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msgsize));
+/** Start a new keystream from key and iv, reusing self's Crypto++ object if
+ * it has one. Raises aes.Error and returns -1, leaving self unchanged, if
+ * the key is not a valid size. The caller must hold self's lock, if it has
+ * one. */
+static int
+AES_set_key(AES* self, const byte* key, Py_ssize_t keysize, const byte* iv) {
+    if (keysize < 0 || CryptoPP::AES::StaticGetValidKeyLength(keysize) != static_cast<size_t>(keysize)) {
+        PyErr_Format(aes_error, "Precondition violation: you are required to pass a valid key size (16, 24 or 32 bytes), but it was %zd bytes.", keysize);
+        return -1;
+    }
+    if (self->use_aesni)
+        pycryptopp_aesni_set_key(&self->ks, key, keysize);
+    else if (self->e)
+        self->e->SetKeyWithIV(key, keysize, iv);
+    else {
+        self->e = new CryptoPP::CTR_Mode<CryptoPP::AES>::Encryption(key, keysize, iv);
+        if (!self->e) {
+            PyErr_NoMemory();
+            return -1;
+        }
+    }
+    memcpy(self->key, key, keysize);
+    self->keysize = keysize;
+    memcpy(self->iv, iv, sizeof(self->iv));
+    self->pos = 0;
+    return 0;
+}
+
+static PyObject *
+AES_rekey(AES* self, PyObject* args, PyObject* kwdict) {
+    static const char *kwlist[] = { "key", "iv", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *iv = NULL;
+    const char defaultiv[CryptoPP::AES::BLOCKSIZE] = {0};
+    Py_ssize_t ivsize = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#|t#:rekey", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize))
+        return NULL;
+
+    if (!iv)
+        iv = defaultiv;
+    else if (ivsize != 16)
+        return PyErr_Format(aes_error, "Precondition violation: if an IV is passed, it must be exactly 16 bytes, not %zd", ivsize);
+
+    ENTER_OBJECTLOCK(self);
+    const int result = AES_set_key(self, reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv));
+    LEAVE_OBJECTLOCK(self);
+    if (result)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(AES_rekey__doc__,
+"rekey(key, iv=None)\n\
+\n\
+Start again with a new key and initial counter block, exactly as though this\n\
+were a new AES object made with AES(key, iv), but without allocating a new\n\
+object. The number of threads is kept.");
+
+static PyObject *
+AES_reset(AES* self, PyObject* args) {
+    const char *iv = NULL;
+    Py_ssize_t ivsize = 0;
+    if (!PyArg_ParseTuple(args, "t#:reset", &iv, &ivsize))
+        return NULL;
+    if (ivsize != 16)
+        return PyErr_Format(aes_error, "Precondition violation: the IV is required to be exactly 16 bytes, not %zd", ivsize);
+
+    ENTER_OBJECTLOCK(self);
+    if (!self->use_aesni)
+        self->e->Resynchronize(reinterpret_cast<const byte*>(iv));
+    memcpy(self->iv, iv, sizeof(self->iv));
+    self->pos = 0;
+    LEAVE_OBJECTLOCK(self);
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(AES_reset__doc__,
+"reset(iv)\n\
+\n\
+Start again with the same key and a new initial counter block, exactly as\n\
+though this were a new AES object made with AES(key, iv). The key schedule\n\
+is kept, so this is cheaper than .rekey().");
+
+/* The state returned by .getstate(): a version byte, the initial counter
+   block, and the position in the keystream as a 64-bit big-endian number. */
+static const byte STATE_VERSION = 1;
+static const Py_ssize_t STATE_SIZE = 1 + CryptoPP::AES::BLOCKSIZE + 8;
+
+static PyObject *
+AES_getstate(AES* self, PyObject* dummy) {
+    PyObject* result = PyString_FromStringAndSize(NULL, STATE_SIZE);
     if (!result)
         return NULL;
+    byte* state = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    ENTER_OBJECTLOCK(self);
+    state[0] = STATE_VERSION;
+    memcpy(state + 1, self->iv, sizeof(self->iv));
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, state + 1 + sizeof(self->iv), static_cast<CryptoPP::word64>(self->pos));
+    LEAVE_OBJECTLOCK(self);
+    return result;
+}
 
-    self->e->ProcessData(reinterpret_cast<byte*>(PyString_AS_STRING(result)), reinterpret_cast<const byte*>(msg), msgsize);
-    return reinterpret_cast<PyObject*>(result);
+PyDoc_STRVAR(AES_getstate__doc__,
+"getstate()\n\
+\n\
+Return the position of the cipher in its keystream as a short string: the\n\
+initial counter block and the offset that .tell() returns. Passing it to\n\
+.setstate() of an AES object with the same key carries on with the keystream\n\
+from exactly the same place, even part-way through a block, so an\n\
+interrupted encryption can be resumed, perhaps by another process, without\n\
+processing the data before that point again. The state does not include the\n\
+key.");
+
+static PyObject *
+AES_setstate(AES* self, PyObject* args) {
+    const char *state = NULL;
+    Py_ssize_t statesize = 0;
+    if (!PyArg_ParseTuple(args, "t#:setstate", &state, &statesize))
+        return NULL;
+    if (statesize != STATE_SIZE || static_cast<byte>(state[0]) != STATE_VERSION)
+        return PyErr_Format(aes_error, "Precondition violation: state is required to be a string returned by .getstate().");
+
+    const byte* iv = reinterpret_cast<const byte*>(state + 1);
+    const CryptoPP::lword pos = CryptoPP::GetWord<CryptoPP::word64>(false, CryptoPP::BIG_ENDIAN_ORDER, iv + CryptoPP::AES::BLOCKSIZE);
+    ENTER_OBJECTLOCK(self);
+    if (!self->use_aesni) {
+        self->e->Resynchronize(iv);
+        self->e->Seek(pos);
+    }
+    memcpy(self->iv, iv, sizeof(self->iv));
+    self->pos = pos;
+    LEAVE_OBJECTLOCK(self);
+    Py_RETURN_NONE;
 }
 
-PyDoc_STRVAR(AES_process__doc__,
-"Encrypt or decrypt the next bytes, returning the result.");
+PyDoc_STRVAR(AES_setstate__doc__,
+"setstate(state)\n\
+\n\
+Carry on from the position saved by .getstate(), keeping the key of this\n\
+object.");
+
+static PyObject *
+AES_reduce(AES* self, PyObject* dummy) {
+    PyObject* state = AES_getstate(self, NULL);
+    if (!state)
+        return NULL;
+    ENTER_OBJECTLOCK(self);
+    PyObject* result = Py_BuildValue("O(s#s#i)N", Py_TYPE(self), self->key, static_cast<Py_ssize_t>(self->keysize), self->iv, static_cast<Py_ssize_t>(sizeof(self->iv)), self->threads, state);
+    LEAVE_OBJECTLOCK(self);
+    return result;
+}
+
+PyDoc_STRVAR(AES_reduce__doc__,
+"Support for pickling. Note that the pickle includes the key.");
 
 static PyMethodDef AES_methods[] = {
     {"process", reinterpret_cast<PyCFunction>(AES_process), METH_O, AES_process__doc__},
+    {"process_into", reinterpret_cast<PyCFunction>(AES_process_into), METH_VARARGS, AES_process_into__doc__},
+    {"seek", reinterpret_cast<PyCFunction>(AES_seek), METH_VARARGS, AES_seek__doc__},
+    {"tell", reinterpret_cast<PyCFunction>(AES_tell), METH_NOARGS, AES_tell__doc__},
+    {"rekey", reinterpret_cast<PyCFunction>(AES_rekey), METH_KEYWORDS, AES_rekey__doc__},
+    {"reset", reinterpret_cast<PyCFunction>(AES_reset), METH_VARARGS, AES_reset__doc__},
+    {"getstate", reinterpret_cast<PyCFunction>(AES_getstate), METH_NOARGS, AES_getstate__doc__},
+    {"setstate", reinterpret_cast<PyCFunction>(AES_setstate), METH_VARARGS, AES_setstate__doc__},
+    {"__setstate__", reinterpret_cast<PyCFunction>(AES_setstate), METH_VARARGS, AES_setstate__doc__},
+    {"__reduce__", reinterpret_cast<PyCFunction>(AES_reduce), METH_NOARGS, AES_reduce__doc__},
     {NULL},
 };
 
@@ -93,6 +419,11 @@ AES_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
     if (!self)
         return NULL;
     self->e = NULL;
+    self->lock = NULL;
+    self->pos = 0;
+    self->threads = 1;
+    self->keysize = 0;
+    self->use_aesni = false;
     return reinterpret_cast<PyObject*>(self);
 }
 
@@ -100,45 +431,52 @@ static void
 AES_dealloc(PyObject* self) {
     if (reinterpret_cast<AES*>(self)->e)
         delete reinterpret_cast<AES*>(self)->e;
+    FREE_OBJECTLOCK(reinterpret_cast<AES*>(self));
+    CryptoPP::SecureWipeArray(reinterpret_cast<AES*>(self)->key, sizeof(reinterpret_cast<AES*>(self)->key));
+    CryptoPP::SecureWipeArray(reinterpret_cast<AES*>(self)->ks.rk, sizeof(reinterpret_cast<AES*>(self)->ks.rk));
     self->ob_type->tp_free(self);
 }
 
 static int
 AES_init(PyObject* self, PyObject *args, PyObject *kwdict) {
-    static const char *kwlist[] = { "key", "iv", NULL };
+    static const char *kwlist[] = { "key", "iv", "threads", NULL };
     const char *key = NULL;
     Py_ssize_t keysize = 0;
     const char *iv = NULL;
     const char defaultiv[CryptoPP::AES::BLOCKSIZE] = {0};
     Py_ssize_t ivsize = 0;
-    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#|t#:AES.__init__", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize))
+    int threads = 1;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#|t#i:AES.__init__", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize, &threads))
         return -1;
     assert (keysize >= 0);
     assert (ivsize >= 0);
 
+    if (threads < 1) {
+        PyErr_Format(aes_error, "Precondition violation: threads is required to be at least 1, but it was %d", threads);
+        return -1;
+    }
+
     if (!iv)
         iv = defaultiv;
     else if (ivsize != 16) {
         PyErr_Format(aes_error, "Precondition violation: if an IV is passed, it must be exactly 16 bytes, not %d", ivsize);
         return -1;
     }
-    try {
-        reinterpret_cast<AES*>(self)->e = new CryptoPP::CTR_Mode<CryptoPP::AES>::Encryption(reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv));
-    } catch (CryptoPP::InvalidKeyLength le) {
-        PyErr_Format(aes_error, "Precondition violation: you are required to pass a valid key size.  Crypto++ gave this exception: %s", le.what());
-        return -1;
-    }
-    if (!reinterpret_cast<AES*>(self)->e) {
-        PyErr_NoMemory();
-        return -1;
-    }
-    return 0;
+
+    AES* mself = reinterpret_cast<AES*>(self);
+    ENTER_OBJECTLOCK(mself);
+    mself->use_aesni = pycryptopp_use_aesni;
+    const int result = AES_set_key(mself, reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv));
+    if (!result)
+        mself->threads = threads;
+    LEAVE_OBJECTLOCK(mself);
+    return result;
 }
 
 static PyTypeObject AES_type = {
     PyObject_HEAD_INIT(NULL)
     0,                         /*ob_size*/
-    "_aes.AES", /*tp_name*/
+    "pycryptopp.cipher.aes.AES", /*tp_name: the module it is found in, for pickle */
     sizeof(AES),             /*tp_basicsize*/
     0,                         /*tp_itemsize*/
     AES_dealloc, /*tp_dealloc*/
@@ -177,8 +515,354 @@ static PyTypeObject AES_type = {
     AES_new,                /* tp_new */
 };
 
+PyObject *
+aes_encrypt_blocks(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "key", "blocks", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    PyObject* blocksobj;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#O:encrypt_blocks", const_cast<char**>(kwlist), &key, &keysize, &blocksobj))
+        return NULL;
+    assert (keysize >= 0);
+
+    if (keysize != 16 && keysize != 24 && keysize != 32)
+        return PyErr_Format(aes_error, "Precondition violation: the key is required to be 16, 24 or 32 bytes long, but it was %zd bytes.", keysize);
+
+    Py_buffer blocks;
+    if (pycryptopp_get_read_buffer(blocksobj, &blocks, aes_error))
+        return NULL;
+    assert (blocks.len >= 0);
+    if (blocks.len % CryptoPP::AES::BLOCKSIZE) {
+        PyErr_Format(aes_error, "Precondition violation: blocks is required to be a whole number of %d-byte blocks, but it was %zd bytes.", CryptoPP::AES::BLOCKSIZE, blocks.len);
+        PyBuffer_Release(&blocks);
+        return NULL;
+    }
+
+    PyObject* result = PyString_FromStringAndSize(NULL, blocks.len);
+    if (!result) {
+        PyBuffer_Release(&blocks);
+        return NULL;
+    }
+
+    byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    const byte* in = reinterpret_cast<const byte*>(blocks.buf);
+    const size_t nblocks = blocks.len / CryptoPP::AES::BLOCKSIZE;
+    const bool release_gil = PYCRYPTOPP_BUFFER_PINNED(blocks) && blocks.len >= PYCRYPTOPP_GIL_MINSIZE;
+    if (pycryptopp_use_aesni) {
+        pycryptopp_aesni_key ks;
+        pycryptopp_aesni_set_key(&ks, reinterpret_cast<const byte*>(key), keysize);
+        if (release_gil) {
+            Py_BEGIN_ALLOW_THREADS
+            pycryptopp_aesni_encrypt_blocks(&ks, out, in, nblocks);
+            Py_END_ALLOW_THREADS
+        } else
+            pycryptopp_aesni_encrypt_blocks(&ks, out, in, nblocks);
+        CryptoPP::SecureWipeArray(ks.rk, sizeof(ks.rk));
+    } else {
+        CryptoPP::AES::Encryption e(reinterpret_cast<const byte*>(key), keysize);
+        if (release_gil) {
+            Py_BEGIN_ALLOW_THREADS
+            e.AdvancedProcessBlocks(in, NULL, out, blocks.len, 0);
+            Py_END_ALLOW_THREADS
+        } else
+            e.AdvancedProcessBlocks(in, NULL, out, blocks.len, 0);
+    }
+    PyBuffer_Release(&blocks);
+    return result;
+}
+
+const char*const aes_encrypt_blocks__doc__ = "\
+encrypt_blocks(key, blocks)\n\
+\n\
+Encrypt each 16-byte block of blocks separately with AES under key (that\n\
+is, in ECB mode), returning the encrypted blocks as one string. The key\n\
+schedule is computed once for all of the blocks, which makes this much\n\
+cheaper than making an AES object per block when, for instance, deriving\n\
+many one-time keys from one master key.\n\
+\n\
+ECB mode reveals which blocks are equal, so it is only suitable for\n\
+encrypting values that never repeat, such as nonces or counters.\n\
+\n\
+@param key: a string of exactly 16, 24 or 32 bytes\n\
+@param blocks: any object supporting the buffer protocol whose length is a\n\
+    multiple of 16";
+
+typedef struct {
+    bool use_aesni;
+    pycryptopp_aesni_key ks;
+    const byte* iv;
+    CryptoPP::lword pos;
+    CryptoPP::CTR_Mode<CryptoPP::AES>::Encryption* e;
+} AES_FileJob;
+
+static void
+AES_FileJob_process(void* context, byte* out, const byte* in, size_t len) {
+    AES_FileJob* job = reinterpret_cast<AES_FileJob*>(context);
+    if (job->use_aesni)
+        pycryptopp_aesni_ctr(&job->ks, job->iv, job->pos, out, in, len);
+    else
+        job->e->ProcessData(out, in, len);
+    job->pos += len;
+}
+
+PyObject *
+aes_crypt_file(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "key", "iv", "src_path", "dst_path", "offset", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *iv = NULL;
+    const char defaultiv[CryptoPP::AES::BLOCKSIZE] = {0};
+    Py_ssize_t ivsize = 0;
+    char* src_path = NULL;
+    char* dst_path = NULL;
+    PY_LONG_LONG offset = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#z#etet|L:crypt_file", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize, Py_FileSystemDefaultEncoding, &src_path, Py_FileSystemDefaultEncoding, &dst_path, &offset))
+        return NULL;
+
+    PyObject* result = NULL;
+    AES_FileJob job;
+    job.e = NULL;
+    if (keysize != 16 && keysize != 24 && keysize != 32)
+        PyErr_Format(aes_error, "Precondition violation: the key is required to be 16, 24 or 32 bytes long, but it was %zd bytes.", keysize);
+    else if (iv && ivsize != 16)
+        PyErr_Format(aes_error, "Precondition violation: if an IV is passed, it must be exactly 16 bytes, not %zd", ivsize);
+    else if (offset < 0)
+        PyErr_Format(aes_error, "Precondition violation: offset is required to be non-negative, but it was %lld.", offset);
+    else {
+        job.use_aesni = pycryptopp_use_aesni;
+        job.iv = reinterpret_cast<const byte*>(iv ? iv : defaultiv);
+        job.pos = static_cast<CryptoPP::lword>(offset);
+        if (job.use_aesni)
+            pycryptopp_aesni_set_key(&job.ks, reinterpret_cast<const byte*>(key), keysize);
+        else {
+            job.e = new CryptoPP::CTR_Mode<CryptoPP::AES>::Encryption(reinterpret_cast<const byte*>(key), keysize, job.iv);
+            job.e->Seek(job.pos);
+        }
+
+        PY_LONG_LONG processed;
+        if (pycryptopp_process_file(src_path, dst_path, offset, AES_FileJob_process, &job, &processed) == 0)
+            result = PyLong_FromLongLong(processed);
+
+        if (job.use_aesni)
+            CryptoPP::SecureWipeArray(job.ks.rk, sizeof(job.ks.rk));
+        delete job.e;
+    }
+    PyMem_Free(src_path);
+    PyMem_Free(dst_path);
+    return result;
+}
+
+const char*const aes_crypt_file__doc__ = "\
+crypt_file(key, iv, src_path, dst_path, offset=0)\n\
+\n\
+Encrypt or decrypt the file at src_path with AES-CTR, writing the result to\n\
+the file at dst_path, and return the number of bytes processed. This gives\n\
+the same result as AES(key, iv).process() on the whole file, but the data\n\
+never passes through Python and the GIL is released throughout.\n\
+\n\
+If offset is given then only the bytes of the file from offset onwards are\n\
+processed, using the keystream from offset onwards, and the first offset\n\
+bytes of dst_path are left as they were: this continues an encryption that\n\
+was interrupted after offset bytes. dst_path is created if need be, and is\n\
+cut off at the end of the output. It may be the same as src_path, to encrypt\n\
+a file in place.\n\
+\n\
+@param iv: the initial counter block, a string of exactly 16 bytes, or None\n\
+    for all zeroes";
+
+/* The keystream blocks of process_many() messages are made this many at a
+   time, so that the blocks of several short messages are encrypted together.
+   Messages of at least this many blocks are long enough to be encrypted on
+   their own. */
+static const size_t MANY_BATCH = 64;
+
+typedef struct {
+    pycryptopp_aesni_key ks[MANY_BATCH];
+    const pycryptopp_aesni_key* kp[MANY_BATCH];
+    byte ctr[MANY_BATCH][CryptoPP::AES::BLOCKSIZE];
+    byte stream[MANY_BATCH][CryptoPP::AES::BLOCKSIZE];
+    byte* out[MANY_BATCH];
+    const byte* in[MANY_BATCH];
+    size_t len[MANY_BATCH];
+} AES_ManyBatch;
+
+static void
+AES_ManyBatch_flush(AES_ManyBatch* batch, size_t nblocks) {
+    pycryptopp_aesni_encrypt_blocks_multikey(batch->kp, batch->stream[0], batch->ctr[0], nblocks);
+    for (size_t i = 0; i < nblocks; i++)
+        CryptoPP::xorbuf(batch->out[i], batch->in[i], batch->stream[i], batch->len[i]);
+}
+
+static void
+AES_process_many_aesni(const pycryptopp_many* m) {
+    static const byte zeroiv[CryptoPP::AES::BLOCKSIZE] = {0};
+    AES_ManyBatch* batch = new AES_ManyBatch;
+    size_t nkeys = 0;
+    size_t nblocks = 0;
+    for (Py_ssize_t i = 0; i < m->n; i++) {
+        const byte* iv = m->ivs[i] ? m->ivs[i] : zeroiv;
+        if (m->lens[i] >= MANY_BATCH * CryptoPP::AES::BLOCKSIZE) {
+            pycryptopp_aesni_key ks;
+            pycryptopp_aesni_set_key(&ks, m->keys[i], m->keysizes[i]);
+            pycryptopp_aesni_ctr(&ks, iv, 0, m->outs[i], m->ins[i], m->lens[i]);
+            CryptoPP::SecureWipeArray(ks.rk, sizeof(ks.rk));
+            continue;
+        }
+
+        byte ctr[CryptoPP::AES::BLOCKSIZE];
+        memcpy(ctr, iv, sizeof(ctr));
+        const pycryptopp_aesni_key* ks = NULL;
+        for (size_t done = 0; done < m->lens[i]; done += CryptoPP::AES::BLOCKSIZE) {
+            if (nblocks == MANY_BATCH) {
+                AES_ManyBatch_flush(batch, nblocks);
+                nblocks = 0;
+                nkeys = 0;
+                ks = NULL;
+            }
+            if (!ks) {
+                pycryptopp_aesni_set_key(&batch->ks[nkeys], m->keys[i], m->keysizes[i]);
+                ks = &batch->ks[nkeys++];
+            }
+            batch->kp[nblocks] = ks;
+            memcpy(batch->ctr[nblocks], ctr, sizeof(ctr));
+            CryptoPP::IncrementCounterByOne(ctr, sizeof(ctr));
+            batch->out[nblocks] = m->outs[i] + done;
+            batch->in[nblocks] = m->ins[i] + done;
+            batch->len[nblocks] = CryptoPP::STDMIN(m->lens[i] - done, static_cast<size_t>(CryptoPP::AES::BLOCKSIZE));
+            nblocks++;
+        }
+    }
+    AES_ManyBatch_flush(batch, nblocks);
+    CryptoPP::SecureWipeArray(reinterpret_cast<byte*>(batch->ks), sizeof(batch->ks));
+    CryptoPP::SecureWipeArray(&batch->stream[0][0], sizeof(batch->stream));
+    delete batch;
+}
+
+static void
+AES_process_many_portable(const pycryptopp_many* m) {
+    static const byte zeroiv[CryptoPP::AES::BLOCKSIZE] = {0};
+    CryptoPP::CTR_Mode<CryptoPP::AES>::Encryption e;
+    for (Py_ssize_t i = 0; i < m->n; i++) {
+        e.SetKeyWithIV(m->keys[i], m->keysizes[i], m->ivs[i] ? m->ivs[i] : zeroiv);
+        e.ProcessData(m->outs[i], m->ins[i], m->lens[i]);
+    }
+}
+
+PyObject *
+aes_process_many(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "keys", "ivs", "datas", "record_size", NULL };
+    PyObject* keys;
+    PyObject* ivs;
+    PyObject* datas;
+    PyObject* record_size = Py_None;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "OOO|O:process_many", const_cast<char**>(kwlist), &keys, &ivs, &datas, &record_size))
+        return NULL;
+
+    pycryptopp_many m;
+    PyObject* result = NULL;
+    if (pycryptopp_many_parse(&m, keys, ivs, datas, record_size, CryptoPP::AES::BLOCKSIZE, aes_error) == 0) {
+        Py_ssize_t i;
+        for (i = 0; i < m.n; i++) {
+            if (m.keysizes[i] != 16 && m.keysizes[i] != 24 && m.keysizes[i] != 32) {
+                PyErr_Format(aes_error, "Precondition violation: each key is required to be 16, 24 or 32 bytes long, but keys[%zd] was %zu bytes.", i, m.keysizes[i]);
+                break;
+            }
+        }
+        if (i == m.n) {
+            const bool use_aesni = pycryptopp_use_aesni;
+            if (m.pinned && m.total >= PYCRYPTOPP_GIL_MINSIZE) {
+                Py_BEGIN_ALLOW_THREADS
+                if (use_aesni)
+                    AES_process_many_aesni(&m);
+                else
+                    AES_process_many_portable(&m);
+                Py_END_ALLOW_THREADS
+            } else if (use_aesni)
+                AES_process_many_aesni(&m);
+            else
+                AES_process_many_portable(&m);
+            result = m.result;
+            m.result = NULL;
+        }
+    }
+    Py_XDECREF(m.result);
+    pycryptopp_many_release(&m);
+    return result;
+}
+
+const char*const aes_process_many__doc__ = "\
+process_many(keys, ivs, datas, record_size=None)\n\
+\n\
+Encrypt or decrypt many messages with AES-CTR in one call, each under its\n\
+own key and IV, giving the same results as\n\
+[AES(key, iv).process(data) for (key, iv, data) in zip(keys, ivs, datas)]\n\
+but without the cost of making an AES object for each message. With AES-NI\n\
+the blocks of different messages are encrypted together, which makes this\n\
+much faster for messages of a few hundred bytes.\n\
+\n\
+datas is either a list or tuple of messages, in which case a list of results\n\
+is returned, or, if record_size is given, one buffer holding messages of\n\
+exactly record_size bytes each, in which case the results are returned\n\
+packed together in one string in the same way.\n\
+\n\
+@param keys: a list or tuple with a key of 16, 24 or 32 bytes for each\n\
+    message, or one buffer holding all of the keys, which must then be the\n\
+    same size\n\
+@param ivs: a list or tuple with a 16-byte initial counter block for each\n\
+    message, or one buffer holding all of them, or None for all zeroes";
+
+PyObject *
+aes_has_aesni(PyObject *dummy, PyObject *args) {
+    return PyBool_FromLong(pycryptopp_aesni_available());
+}
+
+const char*const aes_has_aesni__doc__ = "\
+Return True if AES objects can use the AES-NI instructions of this\n\
+processor, which are much faster than the portable implementation. They do\n\
+so automatically, producing exactly the same output either way.";
+
+PyObject *
+aes__set_use_aesni(PyObject *dummy, PyObject *args) {
+    PyObject* flag;
+    if (!PyArg_ParseTuple(args, "O:_set_use_aesni", &flag))
+        return NULL;
+    const int use = PyObject_IsTrue(flag);
+    if (use < 0)
+        return NULL;
+    if (use && !pycryptopp_aesni_available())
+        return PyErr_Format(aes_error, "Precondition violation: AES-NI is not available on this processor or in this build.");
+    const bool previous = pycryptopp_use_aesni;
+    pycryptopp_use_aesni = use;
+    return PyBool_FromLong(previous);
+}
+
+const char*const aes__set_use_aesni__doc__ = "\
+_set_use_aesni(flag)\n\
+\n\
+Choose whether AES and AES-GCM objects created from now on use AES-NI (if\n\
+flag is true) or the portable implementation, returning the previous choice. This is for\n\
+testing both implementations against each other; there is no other reason\n\
+to call it.";
+
+bool
+aes_check(PyObject* obj) {
+    return PyObject_TypeCheck(obj, &AES_type);
+}
+
+PyThread_type_lock*
+aes_lock(PyObject* obj) {
+    return &reinterpret_cast<AES*>(obj)->lock;
+}
+
+void
+aes_crypt(PyObject* obj, byte* out, const byte* in, size_t len) {
+    AES_crypt(reinterpret_cast<AES*>(obj), out, in, len);
+}
+
 void
 init_aes(PyObject*const module) {
+    pycryptopp_use_aesni = pycryptopp_aesni_available();
+
     if (PyType_Ready(&AES_type) < 0)
         return;
     Py_INCREF(&AES_type);
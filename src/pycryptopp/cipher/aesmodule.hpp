@@ -1,7 +1,49 @@
 #ifndef __INCL_AESMODULE_HPP
 #define __INCL_AESMODULE_HPP
 
+#include "../objectlock.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
 extern void
 init_aes(PyObject* module);
 
+extern PyObject *
+aes_encrypt_blocks(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const aes_encrypt_blocks__doc__;
+
+extern PyObject *
+aes_crypt_file(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const aes_crypt_file__doc__;
+
+extern PyObject *
+aes_process_many(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const aes_process_many__doc__;
+
+extern PyObject *
+aes_has_aesni(PyObject *dummy, PyObject *args);
+extern const char*const aes_has_aesni__doc__;
+
+extern PyObject *
+aes__set_use_aesni(PyObject *dummy, PyObject *args);
+extern const char*const aes__set_use_aesni__doc__;
+
+/* For the other modules of this library: whether obj is an AES object, the
+   address of its lock, and encrypting or decrypting the next len bytes with
+   it. The caller of aes_crypt() must hold the object's lock, if it has one,
+   but need not hold the GIL. */
+extern bool
+aes_check(PyObject* obj);
+
+extern PyThread_type_lock*
+aes_lock(PyObject* obj);
+
+extern void
+aes_crypt(PyObject* obj, byte* out, const byte* in, size_t len);
+
 #endif /* #ifndef __INCL_AESMODULE_HPP */
@@ -0,0 +1,253 @@
+/**
+ * aesni.cpp -- AES encryption using the AES-NI instructions
+ *
+ * Each function that uses the instructions is compiled for AES-NI on its own
+ * (see PYCRYPTOPP_AESNI_TARGET), so nothing else in the build assumes the
+ * processor has them, and the choice between this code and Crypto++'s is
+ * made at run time with the CPUID check from Crypto++'s cpu.cpp.
+ */
+
+#include <string.h>
+#include <assert.h>
+
+#include "aesni.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/cpu.h>
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/cpu.h>
+#include <src-cryptopp/misc.h>
+#endif
+
+bool pycryptopp_use_aesni = false;
+
+#if defined(PYCRYPTOPP_AESNI_TARGET) && defined(CRYPTOPP_CPUID_AVAILABLE)
+
+#include <emmintrin.h>
+#include <wmmintrin.h>
+
+using CryptoPP::word32;
+using CryptoPP::word64;
+
+bool
+pycryptopp_aesni_available() {
+    return CryptoPP::HasAESNI();
+}
+
+/* SubWord(w) and RotWord(SubWord(w)) of FIPS-197, for words held with their
+   first byte in the low-order bits. */
+PYCRYPTOPP_AESNI_TARGET static inline word32
+sub_word(word32 w) {
+    return static_cast<word32>(_mm_cvtsi128_si32(_mm_aeskeygenassist_si128(_mm_set1_epi32(static_cast<int>(w)), 0)));
+}
+
+PYCRYPTOPP_AESNI_TARGET static inline word32
+rot_sub_word(word32 w) {
+    return static_cast<word32>(_mm_cvtsi128_si32(_mm_shuffle_epi32(_mm_aeskeygenassist_si128(_mm_set1_epi32(static_cast<int>(w)), 0), 0x55)));
+}
+
+PYCRYPTOPP_AESNI_TARGET void
+pycryptopp_aesni_set_key(pycryptopp_aesni_key* ks, const byte* key, size_t keysize) {
+    static const byte rcon[] = { 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1b, 0x36 };
+    assert (keysize == 16 || keysize == 24 || keysize == 32);
+
+    /* The key expansion of FIPS-197 section 5.2, for any key size. */
+    const size_t nk = keysize / 4;
+    ks->rounds = static_cast<int>(nk) + 6;
+    const size_t nw = 4 * (ks->rounds + 1);
+    word32 w[4*15];
+    memcpy(w, key, keysize);
+    for (size_t i = nk; i < nw; i++) {
+        word32 temp = w[i-1];
+        if (i % nk == 0)
+            temp = rot_sub_word(temp) ^ rcon[i/nk - 1];
+        else if (nk > 6 && i % nk == 4)
+            temp = sub_word(temp);
+        w[i] = w[i-nk] ^ temp;
+    }
+    memcpy(ks->rk, w, nw * 4);
+    CryptoPP::SecureWipeArray(w, nw);
+}
+
+PYCRYPTOPP_AESNI_TARGET static inline __m128i
+encrypt_block(const __m128i* rk, int rounds, __m128i b) {
+    b = _mm_xor_si128(b, rk[0]);
+    for (int r = 1; r < rounds; r++)
+        b = _mm_aesenc_si128(b, rk[r]);
+    return _mm_aesenclast_si128(b, rk[rounds]);
+}
+
+PYCRYPTOPP_AESNI_TARGET static inline void
+load_key(__m128i* rk, const pycryptopp_aesni_key* ks) {
+    for (int r = 0; r <= ks->rounds; r++)
+        rk[r] = _mm_loadu_si128(reinterpret_cast<const __m128i*>(ks->rk + 16*r));
+}
+
+/* The counter block for the big-endian 128-bit counter (hi, lo). */
+PYCRYPTOPP_AESNI_TARGET static inline __m128i
+counter_block(word64 hi, word64 lo) {
+    return _mm_set_epi64x(static_cast<long long>(CryptoPP::ByteReverse(lo)), static_cast<long long>(CryptoPP::ByteReverse(hi)));
+}
+
+/* Eight independent blocks are encrypted at a time to keep the AES unit
+   busy: each AESENC instruction takes several cycles to produce its result
+   but a new one can be started every cycle. */
+#define CTR_WAYS 8
+
+PYCRYPTOPP_AESNI_TARGET void
+pycryptopp_aesni_encrypt_blocks(const pycryptopp_aesni_key* ks, byte* out, const byte* in, size_t nblocks) {
+    __m128i rk[15];
+    load_key(rk, ks);
+    const int rounds = ks->rounds;
+
+    while (nblocks >= CTR_WAYS) {
+        __m128i b[CTR_WAYS];
+        for (int j = 0; j < CTR_WAYS; j++)
+            b[j] = _mm_xor_si128(_mm_loadu_si128(reinterpret_cast<const __m128i*>(in + 16*j)), rk[0]);
+        for (int r = 1; r < rounds; r++)
+            for (int j = 0; j < CTR_WAYS; j++)
+                b[j] = _mm_aesenc_si128(b[j], rk[r]);
+        for (int j = 0; j < CTR_WAYS; j++)
+            _mm_storeu_si128(reinterpret_cast<__m128i*>(out + 16*j), _mm_aesenclast_si128(b[j], rk[rounds]));
+        in += 16*CTR_WAYS;
+        out += 16*CTR_WAYS;
+        nblocks -= CTR_WAYS;
+    }
+
+    for (size_t i = 0; i < nblocks; i++) {
+        const __m128i b = _mm_loadu_si128(reinterpret_cast<const __m128i*>(in + 16*i));
+        _mm_storeu_si128(reinterpret_cast<__m128i*>(out + 16*i), encrypt_block(rk, rounds, b));
+    }
+}
+
+PYCRYPTOPP_AESNI_TARGET void
+pycryptopp_aesni_encrypt_blocks_multikey(const pycryptopp_aesni_key* const* ks, byte* out, const byte* in, size_t nblocks) {
+    while (nblocks >= CTR_WAYS) {
+        const int rounds = ks[0]->rounds;
+        bool same_rounds = true;
+        for (int j = 1; j < CTR_WAYS; j++)
+            same_rounds = same_rounds && ks[j]->rounds == rounds;
+        if (!same_rounds)
+            break;
+
+        __m128i b[CTR_WAYS];
+        for (int j = 0; j < CTR_WAYS; j++)
+            b[j] = _mm_xor_si128(_mm_loadu_si128(reinterpret_cast<const __m128i*>(in + 16*j)), _mm_loadu_si128(reinterpret_cast<const __m128i*>(ks[j]->rk)));
+        for (int r = 1; r < rounds; r++)
+            for (int j = 0; j < CTR_WAYS; j++)
+                b[j] = _mm_aesenc_si128(b[j], _mm_loadu_si128(reinterpret_cast<const __m128i*>(ks[j]->rk + 16*r)));
+        for (int j = 0; j < CTR_WAYS; j++)
+            _mm_storeu_si128(reinterpret_cast<__m128i*>(out + 16*j), _mm_aesenclast_si128(b[j], _mm_loadu_si128(reinterpret_cast<const __m128i*>(ks[j]->rk + 16*rounds))));
+        ks += CTR_WAYS;
+        in += 16*CTR_WAYS;
+        out += 16*CTR_WAYS;
+        nblocks -= CTR_WAYS;
+    }
+
+    /* the last few, or a mixture of key sizes */
+    for (size_t i = 0; i < nblocks; i++)
+        pycryptopp_aesni_encrypt_blocks(ks[i], out + 16*i, in + 16*i, 1);
+}
+
+PYCRYPTOPP_AESNI_TARGET void
+pycryptopp_aesni_ctr(const pycryptopp_aesni_key* ks, const byte* iv, CryptoPP::lword pos, byte* out, const byte* in, size_t len) {
+    __m128i rk[15];
+    load_key(rk, ks);
+    const int rounds = ks->rounds;
+
+    /* Crypto++ treats the whole counter block as one big-endian number,
+       which wraps around at 2^128. */
+    word64 hi = CryptoPP::GetWord<word64>(false, CryptoPP::BIG_ENDIAN_ORDER, iv);
+    word64 lo = CryptoPP::GetWord<word64>(false, CryptoPP::BIG_ENDIAN_ORDER, iv + 8);
+    const word64 block = pos / 16;
+    lo += block;
+    if (lo < block)
+        hi++;
+
+    /* the end of a block left partly used */
+    const size_t skip = static_cast<size_t>(pos % 16);
+    if (skip && len) {
+        byte ks_block[16];
+        _mm_storeu_si128(reinterpret_cast<__m128i*>(ks_block), encrypt_block(rk, rounds, counter_block(hi, lo)));
+        const size_t n = CryptoPP::STDMIN(len, 16 - skip);
+        for (size_t i = 0; i < n; i++)
+            out[i] = in[i] ^ ks_block[skip + i];
+        CryptoPP::SecureWipeArray(ks_block, sizeof(ks_block));
+        in += n;
+        out += n;
+        len -= n;
+        if (++lo == 0)
+            hi++;
+    }
+
+    while (len >= 16*CTR_WAYS) {
+        __m128i b[CTR_WAYS];
+        for (int j = 0; j < CTR_WAYS; j++) {
+            b[j] = _mm_xor_si128(counter_block(hi, lo), rk[0]);
+            if (++lo == 0)
+                hi++;
+        }
+        for (int r = 1; r < rounds; r++)
+            for (int j = 0; j < CTR_WAYS; j++)
+                b[j] = _mm_aesenc_si128(b[j], rk[r]);
+        for (int j = 0; j < CTR_WAYS; j++) {
+            b[j] = _mm_aesenclast_si128(b[j], rk[rounds]);
+            b[j] = _mm_xor_si128(b[j], _mm_loadu_si128(reinterpret_cast<const __m128i*>(in + 16*j)));
+            _mm_storeu_si128(reinterpret_cast<__m128i*>(out + 16*j), b[j]);
+        }
+        in += 16*CTR_WAYS;
+        out += 16*CTR_WAYS;
+        len -= 16*CTR_WAYS;
+    }
+
+    while (len >= 16) {
+        __m128i b = encrypt_block(rk, rounds, counter_block(hi, lo));
+        if (++lo == 0)
+            hi++;
+        b = _mm_xor_si128(b, _mm_loadu_si128(reinterpret_cast<const __m128i*>(in)));
+        _mm_storeu_si128(reinterpret_cast<__m128i*>(out), b);
+        in += 16;
+        out += 16;
+        len -= 16;
+    }
+
+    /* the start of a block, to be finished by the next call */
+    if (len) {
+        byte ks_block[16];
+        _mm_storeu_si128(reinterpret_cast<__m128i*>(ks_block), encrypt_block(rk, rounds, counter_block(hi, lo)));
+        for (size_t i = 0; i < len; i++)
+            out[i] = in[i] ^ ks_block[i];
+        CryptoPP::SecureWipeArray(ks_block, sizeof(ks_block));
+    }
+}
+
+#else /* AES-NI is not available in this build */
+
+bool
+pycryptopp_aesni_available() {
+    return false;
+}
+
+void
+pycryptopp_aesni_set_key(pycryptopp_aesni_key* ks, const byte* key, size_t keysize) {
+    assert (0);
+}
+
+void
+pycryptopp_aesni_encrypt_blocks(const pycryptopp_aesni_key* ks, byte* out, const byte* in, size_t nblocks) {
+    assert (0);
+}
+
+void
+pycryptopp_aesni_encrypt_blocks_multikey(const pycryptopp_aesni_key* const* ks, byte* out, const byte* in, size_t nblocks) {
+    assert (0);
+}
+
+void
+pycryptopp_aesni_ctr(const pycryptopp_aesni_key* ks, const byte* iv, CryptoPP::lword pos, byte* out, const byte* in, size_t len) {
+    assert (0);
+}
+
+#endif
@@ -0,0 +1,73 @@
+#ifndef __INCL_AESNI_HPP
+#define __INCL_AESNI_HPP
+
+/**
+ * aesni.hpp -- AES encryption using the AES-NI instructions of x86 and
+ * x86-64 processors.
+ *
+ * The embedded Crypto++ is built with CRYPTOPP_DISABLE_ASM, which also turns
+ * off its AES-NI code, leaving only the table-driven implementation. The
+ * functions here are compiled for AES-NI separately from the rest of the
+ * build, so they may only be called if pycryptopp_aesni_available() says the
+ * processor we are running on has the instructions.
+ */
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
+#ifndef PYCRYPTOPP_DISABLE_AESNI
+#if (defined(__x86_64__) || defined(__i386__)) && \
+    ((defined(__clang__) && (__clang_major__ > 3 || (__clang_major__ == 3 && __clang_minor__ >= 8))) || \
+     (!defined(__clang__) && defined(__GNUC__) && (__GNUC__ > 4 || (__GNUC__ == 4 && __GNUC_MINOR__ >= 9))))
+/* GCC and Clang can compile single functions for AES-NI. */
+#define PYCRYPTOPP_AESNI_TARGET __attribute__((target("aes,sse2")))
+#elif (defined(_M_X64) || defined(_M_IX86)) && defined(_MSC_VER) && (_MSC_VER >= 1600)
+/* MSVC lets any function use any intrinsic. */
+#define PYCRYPTOPP_AESNI_TARGET
+#endif
+#endif /* #ifndef PYCRYPTOPP_DISABLE_AESNI */
+
+/* An expanded AES encryption key. */
+typedef struct {
+    byte rk[16*15];
+    int rounds;
+} pycryptopp_aesni_key;
+
+/* True if this build has the AES-NI code and the processor supports it. */
+extern bool
+pycryptopp_aesni_available();
+
+/* Whether newly created AES and AES-GCM objects use the AES-NI code rather
+   than Crypto++'s. This is set when the aes module is initialized, according
+   to what the processor supports, and only ever changed by the self-test. */
+extern bool pycryptopp_use_aesni;
+
+/* Expand key, which must be 16, 24 or 32 bytes long. */
+extern void
+pycryptopp_aesni_set_key(pycryptopp_aesni_key* ks, const byte* key, size_t keysize);
+
+/* Encrypt nblocks independent 16-byte blocks (ECB). in and out may be the
+   same buffer. */
+extern void
+pycryptopp_aesni_encrypt_blocks(const pycryptopp_aesni_key* ks, byte* out, const byte* in, size_t nblocks);
+
+/* Encrypt nblocks independent 16-byte blocks, block i under the key ks[i].
+   Blocks under different keys are worked on together, which is much faster
+   than encrypting them one at a time when each key only has a few blocks. */
+extern void
+pycryptopp_aesni_encrypt_blocks_multikey(const pycryptopp_aesni_key* const* ks, byte* out, const byte* in, size_t nblocks);
+
+/**
+ * XOR len bytes of the CTR-mode keystream into in, writing the result to out.
+ * The keystream is that of Crypto++'s CTR_Mode<AES> with initial counter
+ * block iv, starting pos bytes in; pos need not be a multiple of the block
+ * size. in and out may be the same buffer.
+ */
+extern void
+pycryptopp_aesni_ctr(const pycryptopp_aesni_key* ks, const byte* iv, CryptoPP::lword pos, byte* out, const byte* in, size_t len);
+
+#endif /* #ifndef __INCL_AESNI_HPP */
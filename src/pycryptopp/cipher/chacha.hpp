@@ -0,0 +1,60 @@
+#ifndef __INCL_CHACHA_HPP
+#define __INCL_CHACHA_HPP
+
+/**
+ * chacha.hpp -- the ChaCha20 stream cipher, with the keystream generated
+ * several blocks at a time using the vector instructions of the processor.
+ *
+ * Crypto++'s chacha.cpp computes one block at a time, cannot seek, and only
+ * has Bernstein's original 8-byte nonce, so pycryptopp has its own. The
+ * choice between the vector code and the portable code is made at run time
+ * (see simd.hpp), and every one of them gives the same keystream.
+ */
+
+#include <stddef.h>
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
+/* The ChaCha20 input block: the constants, the key, the block counter
+   (words 12 and 13, to which the number of each block is added) and the
+   nonce. */
+typedef struct {
+    CryptoPP::word32 input[16];
+} pycryptopp_chacha;
+
+/* Set st up for the 32-byte key and either an 8-byte nonce, which leaves a
+   64-bit block counter as in Bernstein's ChaCha20, or a 12-byte nonce,
+   which leaves a 32-bit one as in RFC 8439. */
+extern void
+pycryptopp_chacha_init(pycryptopp_chacha* st, const byte* key, const byte* nonce, size_t noncesize);
+
+/* HChaCha20, from the XChaCha20 draft (draft-irtf-cfrg-xchacha): derive the
+   32-byte XChaCha20 subkey from key and the first 16 bytes of the nonce. */
+extern void
+pycryptopp_hchacha20(byte* subkey, const byte* key, const byte* nonce);
+
+/**
+ * XOR len bytes of the keystream of st into in, writing the result to out,
+ * starting pos bytes into the keystream; pos need not be a multiple of the
+ * 64-byte block size. in and out may be the same buffer. With a 12-byte
+ * nonce the counter must not wrap, so pos + len must be at most 2^38.
+ */
+extern void
+pycryptopp_chacha_xor(const pycryptopp_chacha* st, CryptoPP::lword pos, byte* out, const byte* in, size_t len);
+
+/* The most blocks the vector code of this build can generate at once on
+   this processor: 8 with AVX2, 4 with SSE2 or NEON, otherwise 1. */
+extern unsigned
+pycryptopp_chacha_max_width();
+
+/* How many blocks pycryptopp_chacha_xor() generates at once. This is set to
+   pycryptopp_chacha_max_width() when the chacha20 module is initialized,
+   and only ever changed by the tests. */
+extern unsigned pycryptopp_chacha_width;
+
+#endif /* #ifndef __INCL_CHACHA_HPP */
@@ -0,0 +1,68 @@
+from pycryptopp import _import_my_names
+
+# These initializations to None are just to pacify pyflakes, which
+# doesn't understand that we have to do some funky import trickery
+# below in _import_my_names() in order to get sensible namespaces.
+ChaCha20=None
+XChaCha20=None
+Error=None
+simd_width=None
+_set_simd_width=None
+
+_import_my_names(globals(), "chacha20_")
+
+del _import_my_names
+
+def start_up_self_test():
+    """
+    A quick test intended to detect major errors such as the library being
+    miscompiled and segfaulting or returning incorrect answers, run on
+    import.
+
+    The keystream is computed by different code depending on how many blocks
+    this processor can work on at once (see simd_width()), so each of the
+    widths that may be used is tested.
+    """
+    for width in [1, 4, 8]:
+        if width <= simd_width():
+            previous = _set_simd_width(width)
+            try:
+                _self_test()
+            finally:
+                _set_simd_width(previous)
+
+def _self_test():
+    from binascii import a2b_hex
+
+    # draft-strombergson-chacha-test-vectors TC1: all-zero key and IV
+    ks = a2b_hex("76b8e0ada0f13d90405d6ae55386bd28bdd219b8a08ded1aa836efcc8b770dc7"
+                 "da41597c5157488d7724e03fb8d84a376a43b8f41518a11cc387b669b2ee6586")
+    stream = ChaCha20("\x00"*32).process("\x00"*1000)
+    if stream[:64] != ks:
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+    # the same keystream, a piece at a time, and from the middle
+    cryptor = ChaCha20("\x00"*32, "\x00"*8)
+    pieces = "".join([cryptor.process("\x00"*n) for n in [1, 63, 200, 513, 223]])
+    cryptor.seek(333)
+    if pieces != stream or cryptor.process("\x00"*667) != stream[333:]:
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+    # RFC 8439 section 2.3.2
+    cryptor = ChaCha20(a2b_hex("000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f"),
+                       a2b_hex("000000090000004a00000000"))
+    cryptor.seek(64)
+    if cryptor.process("\x00"*64) != a2b_hex("10f1e7e4d13b5915500fdd1fa32071c4c7d1f4c733c068030422aa9ac3d46c4e"
+                                             "d2826446079faa0914c2d705d98b02a2b5129cd1de164eb9cbd083e8a2503c4e"):
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+    # draft-irtf-cfrg-xchacha section A.3.2 (the first block of it)
+    cryptor = XChaCha20(a2b_hex("808182838485868788898a8b8c8d8e8f909192939495969798999a9b9c9d9e9f"),
+                        a2b_hex("404142434445464748494a4b4c4d4e4f5051525354555658"))
+    cryptor.seek(64)
+    ct = cryptor.process('The dhole (pronounced "dole") is also known as the Asiatic wild ')
+    if ct != a2b_hex("7d0a2e6b7f7c65a236542630294e063b7ab9b555a5d5149aa21e4ae1e4fbce87"
+                     "ecc8e08a8b5e350abe622b2ffa617b202cfad72032a3037e76ffdcdc4376ee05"):
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+start_up_self_test()
@@ -0,0 +1,514 @@
+/**
+ * chacha20module.cpp -- Python wrappers for the ChaCha20 and XChaCha20
+ * stream ciphers
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "chacha20module.hpp"
+#include "chacha.hpp"
+#include "../buffers.hpp"
+#include "../objectlock.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+static const char*const chacha20___doc__ = "_chacha20 stream cipher\n\
+You are advised to run chacha20.start_up_self_test() after importing this module.";
+
+static PyObject *chacha20_error;
+
+/* With a 12-byte IV the block counter is only 32 bits long, so the
+   keystream ends after this many bytes. */
+static const CryptoPP::lword IETF_STREAM_LIMIT = static_cast<CryptoPP::lword>(1) << 38;
+
+typedef struct {
+    PyObject_HEAD
+
+    /* internal */
+    pycryptopp_chacha st;
+    /* The key as given. XChaCha20 derives a new subkey from it for every
+       IV, so reset() needs it. */
+    byte key[32];
+    PyThread_type_lock lock;
+    /* the offset into the keystream of the next byte to be processed */
+    CryptoPP::lword pos;
+    /* the length of the keystream, or 0 if it is practically unlimited */
+    CryptoPP::lword limit;
+    /* whether this is an XChaCha20 object */
+    bool extended;
+} ChaCha20;
+
+/* Raise chacha20.Error and return -1 unless ivsize is valid for self. */
+static int
+ChaCha20_check_iv(ChaCha20* self, Py_ssize_t ivsize) {
+    if (self->extended) {
+        if (ivsize != 24) {
+            PyErr_Format(chacha20_error, "Precondition violation: the IV is required to be exactly 24 bytes, not %zd", ivsize);
+            return -1;
+        }
+    } else if (ivsize != 8 && ivsize != 12) {
+        PyErr_Format(chacha20_error, "Precondition violation: the IV is required to be 8 or 12 bytes, not %zd", ivsize);
+        return -1;
+    }
+    return 0;
+}
+
+/* Start a new keystream from self's key and iv, which must be a valid size.
+   The caller must hold self's lock, if it has one. */
+static void
+ChaCha20_set_iv(ChaCha20* self, const byte* iv, Py_ssize_t ivsize) {
+    if (self->extended) {
+        byte subkey[32];
+        pycryptopp_hchacha20(subkey, self->key, iv);
+        pycryptopp_chacha_init(&self->st, subkey, iv + 16, 8);
+        CryptoPP::SecureWipeArray(subkey, sizeof(subkey));
+    } else
+        pycryptopp_chacha_init(&self->st, self->key, iv, ivsize);
+    self->limit = ivsize == 12 ? IETF_STREAM_LIMIT : 0;
+    self->pos = 0;
+}
+
+/* As ChaCha20_set_iv(), with a new key as well. Raises chacha20.Error and
+   returns -1, leaving self unchanged, if the key is not a valid size. */
+static int
+ChaCha20_set_key(ChaCha20* self, const byte* key, Py_ssize_t keysize, const byte* iv, Py_ssize_t ivsize) {
+    if (keysize != 32) {
+        PyErr_Format(chacha20_error, "Precondition violation: you are required to pass a valid key size (32 bytes), but it was %zd bytes.", keysize);
+        return -1;
+    }
+    memcpy(self->key, key, 32);
+    ChaCha20_set_iv(self, iv, ivsize);
+    return 0;
+}
+
+/* Parse the optional iv argument, where None or a missing iv means all
+   zeroes of the default size. Returns -1 with an exception set if the iv is
+   not valid for self. */
+static int
+ChaCha20_parse_iv(ChaCha20* self, const char** iv, Py_ssize_t* ivsize) {
+    static const char zeroiv[24] = {0};
+    if (!*iv) {
+        *iv = zeroiv;
+        *ivsize = self->extended ? 24 : 8;
+        return 0;
+    }
+    return ChaCha20_check_iv(self, *ivsize);
+}
+
+/* Process the next len bytes, or return false, doing nothing, if that would
+   run past the end of the keystream. The caller must hold self's lock, if it
+   has one, but need not hold the GIL. */
+static bool
+ChaCha20_crypt(ChaCha20* self, byte* out, const byte* in, size_t len) {
+    if (self->limit && (self->pos > self->limit || len > self->limit - self->pos))
+        return false;
+    pycryptopp_chacha_xor(&self->st, self->pos, out, in, len);
+    self->pos += len;
+    return true;
+}
+
+static PyObject *
+ChaCha20_stream_exhausted() {
+    return PyErr_Format(chacha20_error, "Precondition violation: with a 12-byte IV the keystream is 2^38 bytes (256 GiB) long, and this would run past the end of it.");
+}
+
+static PyObject *
+ChaCha20_process(ChaCha20* self, PyObject* msgobj) {
+    Py_buffer msg;
+    if (pycryptopp_get_read_buffer(msgobj, &msg, chacha20_error))
+        return NULL;
+    assert (msg.len >= 0);
+
+    PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msg.len));
+    if (!result) {
+        PyBuffer_Release(&msg);
+        return NULL;
+    }
+
+    byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    bool ok = false;
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(msg), msg.len,
+        ok = ChaCha20_crypt(self, out, reinterpret_cast<const byte*>(msg.buf), msg.len));
+    PyBuffer_Release(&msg);
+    if (!ok) {
+        Py_DECREF(result);
+        return ChaCha20_stream_exhausted();
+    }
+    return reinterpret_cast<PyObject*>(result);
+}
+
+PyDoc_STRVAR(ChaCha20_process__doc__,
+"Encrypt or decrypt the next bytes, returning the result.\n\
+\n\
+The argument may be any object supporting the buffer protocol, such as a\n\
+str, bytearray, memoryview, array or mmap.\n\
+\n\
+Large inputs are processed with the GIL released, so other Python threads\n\
+can run meanwhile. Concurrent calls on the same object are serialized.");
+
+static PyObject *
+ChaCha20_process_into(ChaCha20* self, PyObject* args) {
+    PyObject* srcobj;
+    PyObject* dstobj;
+    if (!PyArg_ParseTuple(args, "OO:process_into", &srcobj, &dstobj))
+        return NULL;
+
+    Py_buffer src;
+    if (pycryptopp_get_read_buffer(srcobj, &src, chacha20_error))
+        return NULL;
+    Py_buffer dst;
+    if (pycryptopp_get_write_buffer(dstobj, &dst, chacha20_error)) {
+        PyBuffer_Release(&src);
+        return NULL;
+    }
+    if (dst.len < src.len) {
+        PyErr_Format(chacha20_error, "Precondition violation: dst is required to be at least as long as src (%zd bytes), but it was %zd bytes.", src.len, dst.len);
+        PyBuffer_Release(&dst);
+        PyBuffer_Release(&src);
+        return NULL;
+    }
+
+    bool ok = false;
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(src) && PYCRYPTOPP_BUFFER_PINNED(dst), src.len,
+        ok = ChaCha20_crypt(self, reinterpret_cast<byte*>(dst.buf), reinterpret_cast<const byte*>(src.buf), src.len));
+    PyBuffer_Release(&dst);
+    PyBuffer_Release(&src);
+    if (!ok)
+        return ChaCha20_stream_exhausted();
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(ChaCha20_process_into__doc__,
+"process_into(src, dst)\n\
+\n\
+Encrypt or decrypt the next len(src) bytes of src, writing the result into\n\
+the first len(src) bytes of dst instead of returning a new string.\n\
+\n\
+src may be any object supporting the buffer protocol; dst must be a writable\n\
+one, such as a bytearray. src and dst may be the same buffer, to process it\n\
+in place, but must not otherwise overlap.");
+
+static PyObject *
+ChaCha20_seek(ChaCha20* self, PyObject* args) {
+    PY_LONG_LONG offset;
+    if (!PyArg_ParseTuple(args, "L:seek", &offset))
+        return NULL;
+    if (offset < 0)
+        return PyErr_Format(chacha20_error, "Precondition violation: offset is required to be non-negative, but it was %lld.", offset);
+
+    ENTER_OBJECTLOCK(self);
+    self->pos = static_cast<CryptoPP::lword>(offset);
+    LEAVE_OBJECTLOCK(self);
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(ChaCha20_seek__doc__,
+"seek(offset)\n\
+\n\
+Position the cipher so that the next call to .process() will use the\n\
+keystream starting offset bytes after the beginning, as though exactly\n\
+offset bytes had been processed since the object was created. offset need\n\
+not be a multiple of the 64-byte block size. This takes the same (small)\n\
+time for any offset, and may move backwards as well as forwards, so any part\n\
+of a stream can be decrypted without the parts before it.");
+
+static PyObject *
+ChaCha20_tell(ChaCha20* self, PyObject* dummy) {
+    ENTER_OBJECTLOCK(self);
+    CryptoPP::lword pos = self->pos;
+    LEAVE_OBJECTLOCK(self);
+    return PyLong_FromUnsignedLongLong(pos);
+}
+
+PyDoc_STRVAR(ChaCha20_tell__doc__,
+"Return the offset into the keystream of the next byte to be processed, which\n\
+is the number of bytes processed since the object was created or since the\n\
+last .seek(), plus the offset passed to that .seek().");
+
+static PyObject *
+ChaCha20_rekey(ChaCha20* self, PyObject* args, PyObject* kwdict) {
+    static const char *kwlist[] = { "key", "iv", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *iv = NULL;
+    Py_ssize_t ivsize = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#|z#:rekey", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize))
+        return NULL;
+    if (ChaCha20_parse_iv(self, &iv, &ivsize))
+        return NULL;
+
+    ENTER_OBJECTLOCK(self);
+    const int result = ChaCha20_set_key(self, reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv), ivsize);
+    LEAVE_OBJECTLOCK(self);
+    if (result)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(ChaCha20_rekey__doc__,
+"rekey(key, iv=None)\n\
+\n\
+Start again with a new key and IV, exactly as though this were a new object\n\
+made with the same class and (key, iv), but without allocating a new\n\
+object.");
+
+static PyObject *
+ChaCha20_reset(ChaCha20* self, PyObject* args) {
+    const char *iv = NULL;
+    Py_ssize_t ivsize = 0;
+    if (!PyArg_ParseTuple(args, "t#:reset", &iv, &ivsize))
+        return NULL;
+    if (ChaCha20_check_iv(self, ivsize))
+        return NULL;
+
+    ENTER_OBJECTLOCK(self);
+    ChaCha20_set_iv(self, reinterpret_cast<const byte*>(iv), ivsize);
+    LEAVE_OBJECTLOCK(self);
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(ChaCha20_reset__doc__,
+"reset(iv)\n\
+\n\
+Start again with the same key and a new IV, exactly as though this were a\n\
+new object made with the same class and (key, iv).");
+
+static PyMethodDef ChaCha20_methods[] = {
+    {"process", reinterpret_cast<PyCFunction>(ChaCha20_process), METH_O, ChaCha20_process__doc__},
+    {"process_into", reinterpret_cast<PyCFunction>(ChaCha20_process_into), METH_VARARGS, ChaCha20_process_into__doc__},
+    {"seek", reinterpret_cast<PyCFunction>(ChaCha20_seek), METH_VARARGS, ChaCha20_seek__doc__},
+    {"tell", reinterpret_cast<PyCFunction>(ChaCha20_tell), METH_NOARGS, ChaCha20_tell__doc__},
+    {"rekey", reinterpret_cast<PyCFunction>(ChaCha20_rekey), METH_KEYWORDS, ChaCha20_rekey__doc__},
+    {"reset", reinterpret_cast<PyCFunction>(ChaCha20_reset), METH_VARARGS, ChaCha20_reset__doc__},
+    {NULL},
+};
+
+static PyObject *
+ChaCha20_new_common(PyTypeObject* type, bool extended) {
+    ChaCha20* self = reinterpret_cast<ChaCha20*>(type->tp_alloc(type, 0));
+    if (!self)
+        return NULL;
+    self->lock = NULL;
+    self->pos = 0;
+    self->limit = 0;
+    self->extended = extended;
+    return reinterpret_cast<PyObject*>(self);
+}
+
+static PyObject *
+ChaCha20_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+    return ChaCha20_new_common(type, false);
+}
+
+static PyObject *
+XChaCha20_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+    return ChaCha20_new_common(type, true);
+}
+
+static void
+ChaCha20_dealloc(PyObject* self) {
+    ChaCha20* mself = reinterpret_cast<ChaCha20*>(self);
+    CryptoPP::SecureWipeArray(mself->key, sizeof(mself->key));
+    CryptoPP::SecureWipeArray(mself->st.input, 16);
+    FREE_OBJECTLOCK(mself);
+    self->ob_type->tp_free(self);
+}
+
+static int
+ChaCha20_init(PyObject* self, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "key", "iv", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *iv = NULL;
+    Py_ssize_t ivsize = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#|z#:__init__", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize))
+        return -1;
+    ChaCha20* mself = reinterpret_cast<ChaCha20*>(self);
+    if (ChaCha20_parse_iv(mself, &iv, &ivsize))
+        return -1;
+
+    ENTER_OBJECTLOCK(mself);
+    const int result = ChaCha20_set_key(mself, reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv), ivsize);
+    LEAVE_OBJECTLOCK(mself);
+    return result;
+}
+
+PyDoc_STRVAR(ChaCha20__doc__,
+"A ChaCha20 cipher object.\n\
+\n\
+This object encrypts/decrypts with the keystream of ChaCha20 under the given\n\
+key and IV (nonce), starting at the beginning of the keystream when you\n\
+instantiate the object. Successive calls to .process() will use the\n\
+keystream from where the last one left off.\n\
+\n\
+With an 8-byte IV this is Bernstein's ChaCha20, with a 64-bit block counter\n\
+and so practically no limit on the length of the keystream. With a 12-byte\n\
+IV it is the ChaCha20 of RFC 8439, whose keystream is 2^38 bytes long;\n\
+.process() raises chacha20.Error rather than go past the end. RFC 8439\n\
+starts encrypting at block 1, so call .seek(64) first to get its\n\
+ciphertexts.\n\
+\n\
+Never use the same key and IV for two different messages. IVs of 8 or 12\n\
+bytes are too short to choose at random; use XChaCha20 for that.\n\
+\n\
+@param key: a string of exactly 32 bytes\n\
+@param iv: a string of 8 or 12 bytes, or None for 8 zero bytes\
+");
+
+PyDoc_STRVAR(XChaCha20__doc__,
+"An XChaCha20 cipher object.\n\
+\n\
+XChaCha20 is ChaCha20 with a 24-byte IV (nonce), long enough to be chosen at\n\
+random for every message, as described in draft-irtf-cfrg-xchacha: the key\n\
+and the first 16 bytes of the IV give a subkey with HChaCha20, which is used\n\
+for ChaCha20 with the last 8 bytes of the IV. It has the same methods as\n\
+ChaCha20, and no practical limit on the length of the keystream.\n\
+\n\
+@param key: a string of exactly 32 bytes\n\
+@param iv: a string of exactly 24 bytes, or None for all zeroes\
+");
+
+static PyTypeObject ChaCha20_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_chacha20.ChaCha20", /*tp_name*/
+    sizeof(ChaCha20),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    ChaCha20_dealloc, /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    ChaCha20__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    ChaCha20_methods,      /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    ChaCha20_init,               /* tp_init */
+    0,                         /* tp_alloc */
+    ChaCha20_new,                /* tp_new */
+};
+
+static PyTypeObject XChaCha20_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_chacha20.XChaCha20", /*tp_name*/
+    sizeof(ChaCha20),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    ChaCha20_dealloc, /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    XChaCha20__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    ChaCha20_methods,      /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    ChaCha20_init,               /* tp_init */
+    0,                         /* tp_alloc */
+    XChaCha20_new,               /* tp_new */
+};
+
+PyObject *
+chacha20_simd_width(PyObject *dummy, PyObject *args) {
+    return PyInt_FromLong(pycryptopp_chacha_max_width());
+}
+
+const char*const chacha20_simd_width__doc__ = "\
+Return how many 64-byte blocks of keystream ChaCha20 and XChaCha20 objects\n\
+compute at once on this processor: 8 with AVX2, 4 with SSE2 or NEON, and 1\n\
+if this build has no vector code for it. They do so automatically, producing\n\
+exactly the same output either way.";
+
+PyObject *
+chacha20__set_simd_width(PyObject *dummy, PyObject *args) {
+    int width;
+    if (!PyArg_ParseTuple(args, "i:_set_simd_width", &width))
+        return NULL;
+    const unsigned max_width = pycryptopp_chacha_max_width();
+    if ((width != 1 && width != 4 && width != 8) || static_cast<unsigned>(width) > max_width)
+        return PyErr_Format(chacha20_error, "Precondition violation: width is required to be 1, 4 or 8 and at most simd_width(), which is %u here, but it was %d.", max_width, width);
+    const unsigned previous = pycryptopp_chacha_width;
+    pycryptopp_chacha_width = static_cast<unsigned>(width);
+    return PyInt_FromLong(previous);
+}
+
+const char*const chacha20__set_simd_width__doc__ = "\
+_set_simd_width(width)\n\
+\n\
+Make all ChaCha20 and XChaCha20 objects compute the keystream width blocks\n\
+at a time, where width is 1, 4 or 8 and no more than simd_width(), and\n\
+return the previous width. This is for testing the implementations against\n\
+each other; there is no other reason to call it.";
+
+void
+init_chacha20(PyObject*const module) {
+    pycryptopp_chacha_width = pycryptopp_chacha_max_width();
+
+    if (PyType_Ready(&ChaCha20_type) < 0)
+        return;
+    Py_INCREF(&ChaCha20_type);
+    PyModule_AddObject(module, "chacha20_ChaCha20", (PyObject *)&ChaCha20_type);
+
+    if (PyType_Ready(&XChaCha20_type) < 0)
+        return;
+    Py_INCREF(&XChaCha20_type);
+    PyModule_AddObject(module, "chacha20_XChaCha20", (PyObject *)&XChaCha20_type);
+
+    chacha20_error = PyErr_NewException(const_cast<char*>("_chacha20.Error"), NULL, NULL);
+    PyModule_AddObject(module, "chacha20_Error", chacha20_error);
+
+    PyModule_AddStringConstant(module, "chacha20___doc__", const_cast<char*>(chacha20___doc__));
+}
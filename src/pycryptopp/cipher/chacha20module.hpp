@@ -0,0 +1,15 @@
+#ifndef __INCL_CHACHA20MODULE_HPP
+#define __INCL_CHACHA20MODULE_HPP
+
+extern void
+init_chacha20(PyObject* module);
+
+extern PyObject *
+chacha20_simd_width(PyObject *dummy, PyObject *args);
+extern const char*const chacha20_simd_width__doc__;
+
+extern PyObject *
+chacha20__set_simd_width(PyObject *dummy, PyObject *args);
+extern const char*const chacha20__set_simd_width__doc__;
+
+#endif /* #ifndef __INCL_CHACHA20MODULE_HPP */
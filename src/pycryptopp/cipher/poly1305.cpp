@@ -0,0 +1,159 @@
+/**
+ * poly1305.cpp -- the Poly1305 one-time authenticator
+ *
+ * After poly1305-donna by Andrew Moon (public domain): the accumulator and
+ * the key are held in five 26-bit limbs, so that every product fits in 64
+ * bits.
+ */
+
+#include <string.h>
+
+#include "poly1305.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+using CryptoPP::word32;
+using CryptoPP::word64;
+
+static const word32 MASK26 = 0x3ffffff;
+
+static inline word32
+load32(const byte* p) {
+    return CryptoPP::GetWord<word32>(false, CryptoPP::LITTLE_ENDIAN_ORDER, p);
+}
+
+/* Add each 16-byte block of m, with hibit set above it, to h and multiply by
+   r, modulo 2^130 - 5. */
+static void
+poly1305_blocks(pycryptopp_poly1305* st, const byte* m, size_t len, word32 hibit) {
+    const word32 r0 = st->r[0], r1 = st->r[1], r2 = st->r[2], r3 = st->r[3], r4 = st->r[4];
+    const word32 s1 = r1 * 5, s2 = r2 * 5, s3 = r3 * 5, s4 = r4 * 5;
+    word32 h0 = st->h[0], h1 = st->h[1], h2 = st->h[2], h3 = st->h[3], h4 = st->h[4];
+
+    while (len >= 16) {
+        h0 += load32(m + 0) & MASK26;
+        h1 += (load32(m + 3) >> 2) & MASK26;
+        h2 += (load32(m + 6) >> 4) & MASK26;
+        h3 += (load32(m + 9) >> 6) & MASK26;
+        h4 += (load32(m + 12) >> 8) | hibit;
+
+        word64 d0 = (word64)h0*r0 + (word64)h1*s4 + (word64)h2*s3 + (word64)h3*s2 + (word64)h4*s1;
+        word64 d1 = (word64)h0*r1 + (word64)h1*r0 + (word64)h2*s4 + (word64)h3*s3 + (word64)h4*s2;
+        word64 d2 = (word64)h0*r2 + (word64)h1*r1 + (word64)h2*r0 + (word64)h3*s4 + (word64)h4*s3;
+        word64 d3 = (word64)h0*r3 + (word64)h1*r2 + (word64)h2*r1 + (word64)h3*r0 + (word64)h4*s4;
+        word64 d4 = (word64)h0*r4 + (word64)h1*r3 + (word64)h2*r2 + (word64)h3*r1 + (word64)h4*r0;
+
+        word32 c = (word32)(d0 >> 26); h0 = (word32)d0 & MASK26;
+        d1 += c; c = (word32)(d1 >> 26); h1 = (word32)d1 & MASK26;
+        d2 += c; c = (word32)(d2 >> 26); h2 = (word32)d2 & MASK26;
+        d3 += c; c = (word32)(d3 >> 26); h3 = (word32)d3 & MASK26;
+        d4 += c; c = (word32)(d4 >> 26); h4 = (word32)d4 & MASK26;
+        h0 += c * 5; c = h0 >> 26; h0 &= MASK26;
+        h1 += c;
+
+        m += 16;
+        len -= 16;
+    }
+
+    st->h[0] = h0; st->h[1] = h1; st->h[2] = h2; st->h[3] = h3; st->h[4] = h4;
+}
+
+void
+pycryptopp_poly1305_init(pycryptopp_poly1305* st, const byte* key) {
+    /* r is clamped as the specification requires */
+    st->r[0] = load32(key + 0) & 0x3ffffff;
+    st->r[1] = (load32(key + 3) >> 2) & 0x3ffff03;
+    st->r[2] = (load32(key + 6) >> 4) & 0x3ffc0ff;
+    st->r[3] = (load32(key + 9) >> 6) & 0x3f03fff;
+    st->r[4] = (load32(key + 12) >> 8) & 0x00fffff;
+    for (int i = 0; i < 5; i++)
+        st->h[i] = 0;
+    for (int i = 0; i < 4; i++)
+        st->pad[i] = load32(key + 16 + 4*i);
+    st->leftover = 0;
+}
+
+void
+pycryptopp_poly1305_update(pycryptopp_poly1305* st, const byte* msg, size_t len) {
+    if (st->leftover) {
+        const size_t n = CryptoPP::STDMIN(len, 16 - st->leftover);
+        memcpy(st->buffer + st->leftover, msg, n);
+        st->leftover += n;
+        msg += n;
+        len -= n;
+        if (st->leftover < 16)
+            return;
+        poly1305_blocks(st, st->buffer, 16, 1UL << 24);
+        st->leftover = 0;
+    }
+    if (len >= 16) {
+        const size_t n = len & ~static_cast<size_t>(15);
+        poly1305_blocks(st, msg, n, 1UL << 24);
+        msg += n;
+        len -= n;
+    }
+    if (len) {
+        memcpy(st->buffer, msg, len);
+        st->leftover = len;
+    }
+}
+
+void
+pycryptopp_poly1305_final(pycryptopp_poly1305* st, byte* mac) {
+    /* the last partial block is padded with a one and then zeroes */
+    if (st->leftover) {
+        st->buffer[st->leftover] = 1;
+        memset(st->buffer + st->leftover + 1, 0, 16 - st->leftover - 1);
+        poly1305_blocks(st, st->buffer, 16, 0);
+    }
+
+    /* carry h all the way through */
+    word32 h0 = st->h[0], h1 = st->h[1], h2 = st->h[2], h3 = st->h[3], h4 = st->h[4];
+    word32 c;
+    c = h1 >> 26; h1 &= MASK26;
+    h2 += c; c = h2 >> 26; h2 &= MASK26;
+    h3 += c; c = h3 >> 26; h3 &= MASK26;
+    h4 += c; c = h4 >> 26; h4 &= MASK26;
+    h0 += c * 5; c = h0 >> 26; h0 &= MASK26;
+    h1 += c;
+
+    /* g = h - (2^130 - 5) */
+    word32 g0 = h0 + 5; c = g0 >> 26; g0 &= MASK26;
+    word32 g1 = h1 + c; c = g1 >> 26; g1 &= MASK26;
+    word32 g2 = h2 + c; c = g2 >> 26; g2 &= MASK26;
+    word32 g3 = h3 + c; c = g3 >> 26; g3 &= MASK26;
+    word32 g4 = h4 + c - (1UL << 26);
+
+    /* take g if it did not go negative, without branching */
+    word32 mask = (g4 >> 31) - 1;
+    g0 &= mask; g1 &= mask; g2 &= mask; g3 &= mask; g4 &= mask;
+    mask = ~mask;
+    h0 = (h0 & mask) | g0;
+    h1 = (h1 & mask) | g1;
+    h2 = (h2 & mask) | g2;
+    h3 = (h3 & mask) | g3;
+    h4 = (h4 & mask) | g4;
+
+    /* h mod 2^128, plus the pad */
+    h0 = (h0 | (h1 << 26)) & 0xffffffff;
+    h1 = ((h1 >> 6) | (h2 << 20)) & 0xffffffff;
+    h2 = ((h2 >> 12) | (h3 << 14)) & 0xffffffff;
+    h3 = ((h3 >> 18) | (h4 << 8)) & 0xffffffff;
+    word64 f;
+    f = (word64)h0 + st->pad[0]; h0 = (word32)f;
+    f = (word64)h1 + st->pad[1] + (f >> 32); h1 = (word32)f;
+    f = (word64)h2 + st->pad[2] + (f >> 32); h2 = (word32)f;
+    f = (word64)h3 + st->pad[3] + (f >> 32); h3 = (word32)f;
+
+    CryptoPP::PutWord(false, CryptoPP::LITTLE_ENDIAN_ORDER, mac + 0, h0);
+    CryptoPP::PutWord(false, CryptoPP::LITTLE_ENDIAN_ORDER, mac + 4, h1);
+    CryptoPP::PutWord(false, CryptoPP::LITTLE_ENDIAN_ORDER, mac + 8, h2);
+    CryptoPP::PutWord(false, CryptoPP::LITTLE_ENDIAN_ORDER, mac + 12, h3);
+
+    CryptoPP::SecureWipeArray(reinterpret_cast<byte*>(st), sizeof(*st));
+}
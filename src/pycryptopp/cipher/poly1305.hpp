@@ -0,0 +1,41 @@
+#ifndef __INCL_POLY1305_HPP
+#define __INCL_POLY1305_HPP
+
+/**
+ * poly1305.hpp -- the Poly1305 one-time authenticator, as used by NaCl's
+ * crypto_secretbox. The embedded Crypto++ does not have it.
+ *
+ * This is the portable 32-bit implementation ("poly1305-donna-32"), which
+ * runs in constant time.
+ */
+
+#include <stddef.h>
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
+typedef struct {
+    CryptoPP::word32 r[5];
+    CryptoPP::word32 h[5];
+    CryptoPP::word32 pad[4];
+    size_t leftover;
+    byte buffer[16];
+} pycryptopp_poly1305;
+
+/* Start authenticating a message under the 32-byte one-time key. */
+extern void
+pycryptopp_poly1305_init(pycryptopp_poly1305* st, const byte* key);
+
+extern void
+pycryptopp_poly1305_update(pycryptopp_poly1305* st, const byte* msg, size_t len);
+
+/* Write the 16-byte tag of everything passed to update() to mac, and wipe
+   the state. */
+extern void
+pycryptopp_poly1305_final(pycryptopp_poly1305* st, byte* mac);
+
+#endif /* #ifndef __INCL_POLY1305_HPP */
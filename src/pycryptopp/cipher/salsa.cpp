@@ -0,0 +1,341 @@
+/**
+ * salsa.cpp -- XSalsa20, generating the Salsa20 keystream 1, 4 or 8 blocks
+ * at once
+ *
+ * This is laid out like chacha.cpp: the vector versions hold word i of four
+ * (SSE2, NEON) or eight (AVX2) consecutive blocks in the lanes of one
+ * register, and transpose the result back into blocks at the end.
+ */
+
+#include <string.h>
+
+#include "salsa.hpp"
+#include "../simd.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+#include <emmintrin.h>
+#include <immintrin.h>
+#endif
+#if defined(PYCRYPTOPP_NEON)
+#include <arm_neon.h>
+#endif
+
+using CryptoPP::word32;
+using CryptoPP::word64;
+
+unsigned pycryptopp_salsa_width = 1;
+
+static inline word32
+load32(const byte* p) {
+    return CryptoPP::GetWord<word32>(false, CryptoPP::LITTLE_ENDIAN_ORDER, p);
+}
+
+/* Words 0, 5, 10 and 15 are "expand 32-byte k", and the key goes in words
+   1 to 4 and 11 to 14. */
+static void
+set_constants_and_key(word32* input, const byte* key) {
+    input[0] = 0x61707865;
+    input[5] = 0x3320646e;
+    input[10] = 0x79622d32;
+    input[15] = 0x6b206574;
+    for (int i = 0; i < 4; i++) {
+        input[1+i] = load32(key + 4*i);
+        input[11+i] = load32(key + 16 + 4*i);
+    }
+}
+
+#define ROTL32(v, n) (((v) << (n)) | ((v) >> (32 - (n))))
+
+#define QUARTERROUND(a, b, c, d) \
+    b ^= ROTL32(a + d, 7); \
+    c ^= ROTL32(b + a, 9); \
+    d ^= ROTL32(c + b, 13); \
+    a ^= ROTL32(d + c, 18);
+
+/* The twenty rounds, as ten column rounds each followed by a row round. */
+#define SALSA_ROUNDS(QR, x) \
+    for (int r = 0; r < 10; r++) { \
+        QR(x[0], x[4], x[8], x[12]); \
+        QR(x[5], x[9], x[13], x[1]); \
+        QR(x[10], x[14], x[2], x[6]); \
+        QR(x[15], x[3], x[7], x[11]); \
+        QR(x[0], x[1], x[2], x[3]); \
+        QR(x[5], x[6], x[7], x[4]); \
+        QR(x[10], x[11], x[8], x[9]); \
+        QR(x[15], x[12], x[13], x[14]); \
+    }
+
+void
+pycryptopp_xsalsa20_expand_key(pycryptopp_xsalsa20_key* k, const byte* key) {
+    set_constants_and_key(k->input, key);
+}
+
+void
+pycryptopp_xsalsa20_init_expanded(pycryptopp_salsa* st, const pycryptopp_xsalsa20_key* k, const byte* nonce) {
+    /* HSalsa20: the rounds without the final addition, keeping the words
+       which were the constants and the nonce */
+    word32 x[16];
+    memcpy(x, k->input, sizeof(x));
+    for (int i = 0; i < 4; i++)
+        x[6+i] = load32(nonce + 4*i);
+    SALSA_ROUNDS(QUARTERROUND, x);
+
+    word32* input = st->input;
+    input[0] = 0x61707865;
+    input[5] = 0x3320646e;
+    input[10] = 0x79622d32;
+    input[15] = 0x6b206574;
+    input[1] = x[0];
+    input[2] = x[5];
+    input[3] = x[10];
+    input[4] = x[15];
+    input[11] = x[6];
+    input[12] = x[7];
+    input[13] = x[8];
+    input[14] = x[9];
+    input[6] = load32(nonce + 16);
+    input[7] = load32(nonce + 20);
+    input[8] = 0;
+    input[9] = 0;
+    CryptoPP::SecureWipeArray(x, 16);
+}
+
+void
+pycryptopp_xsalsa20_init(pycryptopp_salsa* st, const byte* key, const byte* nonce) {
+    pycryptopp_xsalsa20_key k;
+    pycryptopp_xsalsa20_expand_key(&k, key);
+    pycryptopp_xsalsa20_init_expanded(st, &k, nonce);
+    CryptoPP::SecureWipeArray(k.input, 16);
+}
+
+/* Write the block with the given counter to out. */
+static void
+salsa_block(const word32* input, word64 counter, byte* out) {
+    word32 j[16], x[16];
+    memcpy(j, input, sizeof(j));
+    j[8] = static_cast<word32>(counter);
+    j[9] = static_cast<word32>(counter >> 32);
+    memcpy(x, j, sizeof(x));
+    SALSA_ROUNDS(QUARTERROUND, x);
+    for (int i = 0; i < 16; i++)
+        CryptoPP::PutWord(false, CryptoPP::LITTLE_ENDIAN_ORDER, out + 4*i, x[i] + j[i]);
+    CryptoPP::SecureWipeArray(x, 16);
+}
+
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+
+#define SSE2_ROTL(v, n) _mm_or_si128(_mm_slli_epi32(v, n), _mm_srli_epi32(v, 32 - (n)))
+
+#define SSE2_QUARTERROUND(a, b, c, d) \
+    b = _mm_xor_si128(b, SSE2_ROTL(_mm_add_epi32(a, d), 7)); \
+    c = _mm_xor_si128(c, SSE2_ROTL(_mm_add_epi32(b, a), 9)); \
+    d = _mm_xor_si128(d, SSE2_ROTL(_mm_add_epi32(c, b), 13)); \
+    a = _mm_xor_si128(a, SSE2_ROTL(_mm_add_epi32(d, c), 18));
+
+PYCRYPTOPP_SSE2_TARGET static inline void
+xor16_sse2(byte* out, const byte* in, __m128i ks) {
+    _mm_storeu_si128(reinterpret_cast<__m128i*>(out), _mm_xor_si128(_mm_loadu_si128(reinterpret_cast<const __m128i*>(in)), ks));
+}
+
+/* XOR the four blocks starting at counter into the 256 bytes at in. */
+PYCRYPTOPP_SSE2_TARGET static void
+salsa_xor4_sse2(const word32* input, word64 counter, byte* out, const byte* in) {
+    __m128i j[16], x[16];
+    for (int i = 0; i < 16; i++)
+        j[i] = _mm_set1_epi32(static_cast<int>(input[i]));
+    word32 lo[4], hi[4];
+    for (int b = 0; b < 4; b++) {
+        lo[b] = static_cast<word32>(counter + b);
+        hi[b] = static_cast<word32>((counter + b) >> 32);
+    }
+    j[8] = _mm_loadu_si128(reinterpret_cast<const __m128i*>(lo));
+    j[9] = _mm_loadu_si128(reinterpret_cast<const __m128i*>(hi));
+    for (int i = 0; i < 16; i++)
+        x[i] = j[i];
+
+    SALSA_ROUNDS(SSE2_QUARTERROUND, x);
+
+    for (int i = 0; i < 16; i++)
+        x[i] = _mm_add_epi32(x[i], j[i]);
+    for (int g = 0; g < 4; g++) {
+        /* words 4g to 4g+3 of each block */
+        const __m128i t0 = _mm_unpacklo_epi32(x[4*g], x[4*g+1]);
+        const __m128i t1 = _mm_unpacklo_epi32(x[4*g+2], x[4*g+3]);
+        const __m128i t2 = _mm_unpackhi_epi32(x[4*g], x[4*g+1]);
+        const __m128i t3 = _mm_unpackhi_epi32(x[4*g+2], x[4*g+3]);
+        xor16_sse2(out + 16*g, in + 16*g, _mm_unpacklo_epi64(t0, t1));
+        xor16_sse2(out + 64 + 16*g, in + 64 + 16*g, _mm_unpackhi_epi64(t0, t1));
+        xor16_sse2(out + 128 + 16*g, in + 128 + 16*g, _mm_unpacklo_epi64(t2, t3));
+        xor16_sse2(out + 192 + 16*g, in + 192 + 16*g, _mm_unpackhi_epi64(t2, t3));
+    }
+}
+
+#define AVX2_ROTL(v, n) _mm256_or_si256(_mm256_slli_epi32(v, n), _mm256_srli_epi32(v, 32 - (n)))
+
+#define AVX2_QUARTERROUND(a, b, c, d) \
+    b = _mm256_xor_si256(b, AVX2_ROTL(_mm256_add_epi32(a, d), 7)); \
+    c = _mm256_xor_si256(c, AVX2_ROTL(_mm256_add_epi32(b, a), 9)); \
+    d = _mm256_xor_si256(d, AVX2_ROTL(_mm256_add_epi32(c, b), 13)); \
+    a = _mm256_xor_si256(a, AVX2_ROTL(_mm256_add_epi32(d, c), 18));
+
+PYCRYPTOPP_AVX2_TARGET static inline void
+xor32_avx2(byte* out, const byte* in, __m256i ks) {
+    _mm256_storeu_si256(reinterpret_cast<__m256i*>(out), _mm256_xor_si256(_mm256_loadu_si256(reinterpret_cast<const __m256i*>(in)), ks));
+}
+
+/* XOR the eight blocks starting at counter into the 512 bytes at in. */
+PYCRYPTOPP_AVX2_TARGET static void
+salsa_xor8_avx2(const word32* input, word64 counter, byte* out, const byte* in) {
+    __m256i j[16], x[16];
+    for (int i = 0; i < 16; i++)
+        j[i] = _mm256_set1_epi32(static_cast<int>(input[i]));
+    word32 lo[8], hi[8];
+    for (int b = 0; b < 8; b++) {
+        lo[b] = static_cast<word32>(counter + b);
+        hi[b] = static_cast<word32>((counter + b) >> 32);
+    }
+    j[8] = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(lo));
+    j[9] = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(hi));
+    for (int i = 0; i < 16; i++)
+        x[i] = j[i];
+
+    SALSA_ROUNDS(AVX2_QUARTERROUND, x);
+
+    for (int i = 0; i < 16; i++)
+        x[i] = _mm256_add_epi32(x[i], j[i]);
+    for (int g = 0; g < 4; g += 2) {
+        /* t[h][b] holds words 4(g+h) to 4(g+h)+3 of block b in its low half
+           and of block b+4 in its high half */
+        __m256i t[2][4];
+        for (int h = 0; h < 2; h++) {
+            const __m256i* w = x + 4*(g+h);
+            const __m256i t0 = _mm256_unpacklo_epi32(w[0], w[1]);
+            const __m256i t1 = _mm256_unpacklo_epi32(w[2], w[3]);
+            const __m256i t2 = _mm256_unpackhi_epi32(w[0], w[1]);
+            const __m256i t3 = _mm256_unpackhi_epi32(w[2], w[3]);
+            t[h][0] = _mm256_unpacklo_epi64(t0, t1);
+            t[h][1] = _mm256_unpackhi_epi64(t0, t1);
+            t[h][2] = _mm256_unpacklo_epi64(t2, t3);
+            t[h][3] = _mm256_unpackhi_epi64(t2, t3);
+        }
+        for (int b = 0; b < 4; b++) {
+            xor32_avx2(out + 64*b + 16*g, in + 64*b + 16*g, _mm256_permute2x128_si256(t[0][b], t[1][b], 0x20));
+            xor32_avx2(out + 64*(b+4) + 16*g, in + 64*(b+4) + 16*g, _mm256_permute2x128_si256(t[0][b], t[1][b], 0x31));
+        }
+    }
+}
+
+#endif /* #if defined(PYCRYPTOPP_SSE2_TARGET) */
+
+#if defined(PYCRYPTOPP_NEON)
+
+#define NEON_ROTL(v, n) vorrq_u32(vshlq_n_u32(v, n), vshrq_n_u32(v, 32 - (n)))
+
+#define NEON_QUARTERROUND(a, b, c, d) \
+    b = veorq_u32(b, NEON_ROTL(vaddq_u32(a, d), 7)); \
+    c = veorq_u32(c, NEON_ROTL(vaddq_u32(b, a), 9)); \
+    d = veorq_u32(d, NEON_ROTL(vaddq_u32(c, b), 13)); \
+    a = veorq_u32(a, NEON_ROTL(vaddq_u32(d, c), 18));
+
+static inline void
+xor16_neon(byte* out, const byte* in, uint32x4_t ks) {
+    vst1q_u8(out, veorq_u8(vld1q_u8(in), vreinterpretq_u8_u32(ks)));
+}
+
+/* XOR the four blocks starting at counter into the 256 bytes at in. */
+static void
+salsa_xor4_neon(const word32* input, word64 counter, byte* out, const byte* in) {
+    uint32x4_t j[16], x[16];
+    for (int i = 0; i < 16; i++)
+        j[i] = vdupq_n_u32(input[i]);
+    word32 lo[4], hi[4];
+    for (int b = 0; b < 4; b++) {
+        lo[b] = static_cast<word32>(counter + b);
+        hi[b] = static_cast<word32>((counter + b) >> 32);
+    }
+    j[8] = vld1q_u32(lo);
+    j[9] = vld1q_u32(hi);
+    for (int i = 0; i < 16; i++)
+        x[i] = j[i];
+
+    SALSA_ROUNDS(NEON_QUARTERROUND, x);
+
+    for (int i = 0; i < 16; i++)
+        x[i] = vaddq_u32(x[i], j[i]);
+    for (int g = 0; g < 4; g++) {
+        /* words 4g to 4g+3 of each block */
+        const uint32x4x2_t p = vtrnq_u32(x[4*g], x[4*g+1]);
+        const uint32x4x2_t q = vtrnq_u32(x[4*g+2], x[4*g+3]);
+        xor16_neon(out + 16*g, in + 16*g, vcombine_u32(vget_low_u32(p.val[0]), vget_low_u32(q.val[0])));
+        xor16_neon(out + 64 + 16*g, in + 64 + 16*g, vcombine_u32(vget_low_u32(p.val[1]), vget_low_u32(q.val[1])));
+        xor16_neon(out + 128 + 16*g, in + 128 + 16*g, vcombine_u32(vget_high_u32(p.val[0]), vget_high_u32(q.val[0])));
+        xor16_neon(out + 192 + 16*g, in + 192 + 16*g, vcombine_u32(vget_high_u32(p.val[1]), vget_high_u32(q.val[1])));
+    }
+}
+
+#endif /* #if defined(PYCRYPTOPP_NEON) */
+
+unsigned
+pycryptopp_salsa_max_width() {
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+    if (pycryptopp_has_avx2())
+        return 8;
+    if (pycryptopp_has_sse2())
+        return 4;
+    return 1;
+#elif defined(PYCRYPTOPP_NEON)
+    return 4;
+#else
+    return 1;
+#endif
+}
+
+void
+pycryptopp_salsa_xor(const pycryptopp_salsa* st, CryptoPP::lword pos, byte* out, const byte* in, size_t len) {
+    word64 block = pos / 64;
+    const size_t offset = static_cast<size_t>(pos % 64);
+    byte ks[64];
+
+    if (offset && len) {
+        salsa_block(st->input, block, ks);
+        const size_t n = CryptoPP::STDMIN(len, 64 - offset);
+        CryptoPP::xorbuf(out, in, ks + offset, n);
+        out += n;
+        in += n;
+        len -= n;
+        block++;
+    }
+
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+    if (pycryptopp_salsa_width >= 8) {
+        for (; len >= 512; out += 512, in += 512, len -= 512, block += 8)
+            salsa_xor8_avx2(st->input, block, out, in);
+    }
+    if (pycryptopp_salsa_width >= 4) {
+        for (; len >= 256; out += 256, in += 256, len -= 256, block += 4)
+            salsa_xor4_sse2(st->input, block, out, in);
+    }
+#elif defined(PYCRYPTOPP_NEON)
+    if (pycryptopp_salsa_width >= 4) {
+        for (; len >= 256; out += 256, in += 256, len -= 256, block += 4)
+            salsa_xor4_neon(st->input, block, out, in);
+    }
+#endif
+
+    for (; len >= 64; out += 64, in += 64, len -= 64, block++) {
+        salsa_block(st->input, block, ks);
+        CryptoPP::xorbuf(out, in, ks, 64);
+    }
+    if (len) {
+        salsa_block(st->input, block, ks);
+        CryptoPP::xorbuf(out, in, ks, len);
+    }
+    CryptoPP::SecureWipeArray(ks, 64);
+}
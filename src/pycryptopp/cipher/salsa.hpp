@@ -0,0 +1,70 @@
+#ifndef __INCL_SALSA_HPP
+#define __INCL_SALSA_HPP
+
+/**
+ * salsa.hpp -- the XSalsa20 stream cipher, with the Salsa20 keystream
+ * generated several blocks at a time using the vector instructions of the
+ * processor.
+ *
+ * Crypto++'s salsa.cpp has an SSE2 version, but it is written in inline
+ * assembly, which the embedded build turns off with CRYPTOPP_DISABLE_ASM.
+ * The vector code here uses intrinsics instead, and the choice between it
+ * and the portable code is made at run time (see simd.hpp). Every one of
+ * them gives the same keystream as Crypto++'s XSalsa20.
+ */
+
+#include <stddef.h>
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
+/* The Salsa20 input block: the constants, the key, the nonce and the 64-bit
+   block counter (words 8 and 9, to which the number of each block is
+   added). */
+typedef struct {
+    CryptoPP::word32 input[16];
+} pycryptopp_salsa;
+
+/* An XSalsa20 key made ready for use with any number of nonces: the
+   HSalsa20 input block with the constants and the key filled in. */
+typedef struct {
+    CryptoPP::word32 input[16];
+} pycryptopp_xsalsa20_key;
+
+/* Set k up from the 32-byte key. */
+extern void
+pycryptopp_xsalsa20_expand_key(pycryptopp_xsalsa20_key* k, const byte* key);
+
+/* Set st up for XSalsa20 with the expanded key k and the 24-byte nonce: the
+   key and the first 16 bytes of the nonce give a subkey with HSalsa20,
+   which is used for Salsa20 with the last 8 bytes of the nonce. */
+extern void
+pycryptopp_xsalsa20_init_expanded(pycryptopp_salsa* st, const pycryptopp_xsalsa20_key* k, const byte* nonce);
+
+/* The same, straight from the 32-byte key. */
+extern void
+pycryptopp_xsalsa20_init(pycryptopp_salsa* st, const byte* key, const byte* nonce);
+
+/**
+ * XOR len bytes of the keystream of st into in, writing the result to out,
+ * starting pos bytes into the keystream; pos need not be a multiple of the
+ * 64-byte block size. in and out may be the same buffer.
+ */
+extern void
+pycryptopp_salsa_xor(const pycryptopp_salsa* st, CryptoPP::lword pos, byte* out, const byte* in, size_t len);
+
+/* The most blocks the vector code of this build can generate at once on
+   this processor: 8 with AVX2, 4 with SSE2 or NEON, otherwise 1. */
+extern unsigned
+pycryptopp_salsa_max_width();
+
+/* How many blocks pycryptopp_salsa_xor() generates at once. This is set to
+   pycryptopp_salsa_max_width() when the xsalsa20 module is initialized,
+   and only ever changed by the tests. */
+extern unsigned pycryptopp_salsa_width;
+
+#endif /* #ifndef __INCL_SALSA_HPP */
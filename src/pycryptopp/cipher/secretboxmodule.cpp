@@ -0,0 +1,541 @@
+/**
+ * secretboxmodule.cpp -- XSalsa20-Poly1305 authenticated encryption,
+ * compatible with NaCl's crypto_secretbox
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "secretboxmodule.hpp"
+#include "poly1305.hpp"
+#include "../buffers.hpp"
+#include "../objectlock.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/salsa.h>
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/salsa.h>
+#include <src-cryptopp/misc.h>
+#endif
+
+static const char*const secretbox___doc__ = "_secretbox authenticated cipher\n\
+You are advised to run secretbox.start_up_self_test() after importing this module.";
+
+static PyObject *secretbox_error;
+static PyObject *secretbox_authentication_error;
+
+static const Py_ssize_t KEYBYTES = 32;
+static const Py_ssize_t NONCEBYTES = 24;
+static const Py_ssize_t MACBYTES = 16;
+
+/* The data is encrypted and authenticated in pieces of this size, so that
+   each piece is still in the L1 cache for the second of the two. */
+static const size_t CHUNK = 4096;
+
+/* Key the cipher and the authenticator for one message. As in NaCl, the
+   first 32 bytes of the keystream are the Poly1305 key, and the message is
+   encrypted with the rest. */
+static void
+secretbox_start(CryptoPP::XSalsa20::Encryption* e, pycryptopp_poly1305* mac, const byte* key, const byte* nonce) {
+    e->SetKeyWithIV(key, KEYBYTES, nonce, NONCEBYTES);
+    byte subkey[32] = {0};
+    e->ProcessString(subkey, sizeof(subkey));
+    pycryptopp_poly1305_init(mac, subkey);
+    CryptoPP::SecureWipeArray(subkey, sizeof(subkey));
+}
+
+/* Encrypt or decrypt len bytes, authenticating the ciphertext. in and out
+   may be the same. */
+static void
+secretbox_crypt(CryptoPP::XSalsa20::Encryption* e, pycryptopp_poly1305* mac, bool decrypting, byte* out, const byte* in, size_t len) {
+    while (len) {
+        const size_t n = CryptoPP::STDMIN(len, CHUNK);
+        if (decrypting) {
+            pycryptopp_poly1305_update(mac, in, n);
+            e->ProcessData(out, in, n);
+        } else {
+            e->ProcessData(out, in, n);
+            pycryptopp_poly1305_update(mac, out, n);
+        }
+        in += n;
+        out += n;
+        len -= n;
+    }
+}
+
+static int
+check_key_and_nonce(Py_ssize_t keysize, Py_ssize_t noncesize) {
+    if (keysize != KEYBYTES) {
+        PyErr_Format(secretbox_error, "Precondition violation: the key is required to be exactly %zd bytes, but it was %zd bytes.", KEYBYTES, keysize);
+        return -1;
+    }
+    if (noncesize != NONCEBYTES) {
+        PyErr_Format(secretbox_error, "Precondition violation: the nonce is required to be exactly %zd bytes, but it was %zd bytes.", NONCEBYTES, noncesize);
+        return -1;
+    }
+    return 0;
+}
+
+typedef struct {
+    PyObject_HEAD
+
+    /* internal */
+    CryptoPP::XSalsa20::Encryption* e;
+    PyThread_type_lock lock;
+    pycryptopp_poly1305 mac;
+    bool decrypting;
+    bool finalized;
+} SecretBox;
+
+static PyObject *
+SecretBox_finalized_error() {
+    PyErr_SetString(secretbox_error, "Precondition violation: this object has already been finalized; use a new one (with a new nonce) for the next message.");
+    return NULL;
+}
+
+/* Raise secretbox.Error and return -1 if self cannot be used. This is only a
+   first check: finalized must be checked again once self's lock is held,
+   since another thread may finalize self while this one waits for it. */
+static int
+SecretBox_check_state(SecretBox* self) {
+    if (!self->e) {
+        PyErr_SetString(secretbox_error, "Precondition violation: this object has not been initialized.");
+        return -1;
+    }
+    if (self->finalized) {
+        SecretBox_finalized_error();
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *
+SecretBox_update(SecretBox* self, PyObject* msgobj) {
+    if (SecretBox_check_state(self))
+        return NULL;
+    Py_buffer msg;
+    if (pycryptopp_get_read_buffer(msgobj, &msg, secretbox_error))
+        return NULL;
+    assert (msg.len >= 0);
+
+    PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msg.len));
+    if (!result) {
+        PyBuffer_Release(&msg);
+        return NULL;
+    }
+
+    byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    bool finalized;
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(msg), msg.len,
+        finalized = self->finalized;
+        if (!finalized)
+            secretbox_crypt(self->e, &self->mac, self->decrypting, out, reinterpret_cast<const byte*>(msg.buf), msg.len));
+    PyBuffer_Release(&msg);
+    if (finalized) {
+        Py_DECREF(result);
+        return SecretBox_finalized_error();
+    }
+    return reinterpret_cast<PyObject*>(result);
+}
+
+PyDoc_STRVAR(SecretBox_update__doc__,
+"Encrypt or decrypt the next bytes, returning the result.\n\
+\n\
+The argument may be any object supporting the buffer protocol. Large inputs\n\
+are processed with the GIL released.");
+
+static PyObject *
+SecretBox_finalize_encryption(SecretBox* self, PyObject* dummy) {
+    if (SecretBox_check_state(self))
+        return NULL;
+    byte tag[16];
+    ENTER_OBJECTLOCK(self);
+    const bool finalized = self->finalized;
+    if (!finalized) {
+        pycryptopp_poly1305_final(&self->mac, tag);
+        self->finalized = true;
+    }
+    LEAVE_OBJECTLOCK(self);
+    if (finalized)
+        return SecretBox_finalized_error();
+    return PyString_FromStringAndSize(reinterpret_cast<const char*>(tag), sizeof(tag));
+}
+
+PyDoc_STRVAR(SecretBox_finalize_encryption__doc__,
+"Finish encrypting and return the 16-byte authentication tag, which must be\n\
+sent along with the ciphertext. Nothing more can be done with this object\n\
+afterwards.");
+
+static PyObject *
+SecretBox_finalize_decryption(SecretBox* self, PyObject* tagobj) {
+    if (SecretBox_check_state(self))
+        return NULL;
+    Py_buffer expected;
+    if (pycryptopp_get_read_buffer(tagobj, &expected, secretbox_error))
+        return NULL;
+    if (expected.len != MACBYTES) {
+        PyErr_Format(secretbox_error, "Precondition violation: the tag is required to be exactly %zd bytes, but it was %zd bytes.", MACBYTES, expected.len);
+        PyBuffer_Release(&expected);
+        return NULL;
+    }
+
+    byte tag[16];
+    ENTER_OBJECTLOCK(self);
+    const bool finalized = self->finalized;
+    if (!finalized) {
+        pycryptopp_poly1305_final(&self->mac, tag);
+        self->finalized = true;
+    }
+    LEAVE_OBJECTLOCK(self);
+    if (finalized) {
+        PyBuffer_Release(&expected);
+        return SecretBox_finalized_error();
+    }
+    /* VerifyBufsEqual takes the same time wherever the tags differ. */
+    const bool ok = CryptoPP::VerifyBufsEqual(tag, reinterpret_cast<const byte*>(expected.buf), sizeof(tag));
+    PyBuffer_Release(&expected);
+    if (!ok) {
+        PyErr_SetString(secretbox_authentication_error, "The ciphertext or tag has been corrupted or tampered with.");
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(SecretBox_finalize_decryption__doc__,
+"finalize(tag)\n\
+\n\
+Finish decrypting and check the 16-byte tag, raising\n\
+secretbox.AuthenticationError if it does not match. Until this returns, the\n\
+plaintext from .update() must not be trusted or acted upon. Nothing more can\n\
+be done with this object afterwards.");
+
+static PyMethodDef Encryptor_methods[] = {
+    {"update", reinterpret_cast<PyCFunction>(SecretBox_update), METH_O, SecretBox_update__doc__},
+    {"finalize", reinterpret_cast<PyCFunction>(SecretBox_finalize_encryption), METH_NOARGS, SecretBox_finalize_encryption__doc__},
+    {NULL},
+};
+
+static PyMethodDef Decryptor_methods[] = {
+    {"update", reinterpret_cast<PyCFunction>(SecretBox_update), METH_O, SecretBox_update__doc__},
+    {"finalize", reinterpret_cast<PyCFunction>(SecretBox_finalize_decryption), METH_O, SecretBox_finalize_decryption__doc__},
+    {NULL},
+};
+
+static PyObject *
+SecretBox_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+    SecretBox* self = reinterpret_cast<SecretBox*>(type->tp_alloc(type, 0));
+    if (!self)
+        return NULL;
+    self->e = NULL;
+    self->lock = NULL;
+    self->decrypting = false;
+    self->finalized = false;
+    return reinterpret_cast<PyObject*>(self);
+}
+
+static void
+SecretBox_dealloc(PyObject* self) {
+    SecretBox* mself = reinterpret_cast<SecretBox*>(self);
+    delete mself->e;
+    CryptoPP::SecureWipeArray(reinterpret_cast<byte*>(&mself->mac), sizeof(mself->mac));
+    FREE_OBJECTLOCK(mself);
+    self->ob_type->tp_free(self);
+}
+
+static int
+SecretBox_init(SecretBox* self, PyObject *args, PyObject *kwdict, bool decrypting) {
+    static const char *kwlist[] = { "key", "nonce", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *nonce = NULL;
+    Py_ssize_t noncesize = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#t#:__init__", const_cast<char**>(kwlist), &key, &keysize, &nonce, &noncesize))
+        return -1;
+    if (check_key_and_nonce(keysize, noncesize))
+        return -1;
+
+    ENTER_OBJECTLOCK(self);
+    if (!self->e)
+        self->e = new CryptoPP::XSalsa20::Encryption();
+    secretbox_start(self->e, &self->mac, reinterpret_cast<const byte*>(key), reinterpret_cast<const byte*>(nonce));
+    self->decrypting = decrypting;
+    self->finalized = false;
+    LEAVE_OBJECTLOCK(self);
+    return 0;
+}
+
+static int
+Encryptor_init(PyObject* self, PyObject *args, PyObject *kwdict) {
+    return SecretBox_init(reinterpret_cast<SecretBox*>(self), args, kwdict, false);
+}
+
+static int
+Decryptor_init(PyObject* self, PyObject *args, PyObject *kwdict) {
+    return SecretBox_init(reinterpret_cast<SecretBox*>(self), args, kwdict, true);
+}
+
+PyDoc_STRVAR(Encryptor__doc__,
+"An XSalsa20-Poly1305 encryptor for one message, for messages too large to\n\
+encrypt with secretbox() in one go.\n\
+\n\
+Encrypt the message in as many pieces as you like with .update(), then call\n\
+.finalize() to get the authentication tag. The tag followed by the\n\
+ciphertext is the same as what secretbox() returns.\n\
+\n\
+Never encrypt two messages with the same key and nonce.\n\
+\n\
+@param key: a string of exactly 32 bytes\n\
+@param nonce: a string of exactly 24 bytes\
+");
+
+PyDoc_STRVAR(Decryptor__doc__,
+"An XSalsa20-Poly1305 decryptor for one message.\n\
+\n\
+Decrypt the ciphertext in as many pieces as you like with .update(), then\n\
+call .finalize() with the tag, which raises secretbox.AuthenticationError\n\
+unless the ciphertext is authentic. Do not use the plaintext before then.\n\
+\n\
+The parameters are the same as for Encryptor.\
+");
+
+static PyTypeObject Encryptor_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_secretbox.Encryptor", /*tp_name*/
+    sizeof(SecretBox),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    SecretBox_dealloc, /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    Encryptor__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    Encryptor_methods,      /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    Encryptor_init,               /* tp_init */
+    0,                         /* tp_alloc */
+    SecretBox_new,                /* tp_new */
+};
+
+static PyTypeObject Decryptor_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_secretbox.Decryptor", /*tp_name*/
+    sizeof(SecretBox),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    SecretBox_dealloc, /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    Decryptor__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    Decryptor_methods,      /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    Decryptor_init,               /* tp_init */
+    0,                         /* tp_alloc */
+    SecretBox_new,                /* tp_new */
+};
+
+/* Encrypt or decrypt a whole message, writing the tag to (or checking it
+   against) tag. Returns false if decrypting and the tag does not match. */
+static bool
+secretbox_oneshot(const byte* key, const byte* nonce, bool decrypting, byte* out, const byte* in, size_t len, byte* tag) {
+    CryptoPP::XSalsa20::Encryption e;
+    pycryptopp_poly1305 mac;
+    secretbox_start(&e, &mac, key, nonce);
+    secretbox_crypt(&e, &mac, decrypting, out, in, len);
+    byte computed[16];
+    pycryptopp_poly1305_final(&mac, computed);
+    if (!decrypting) {
+        memcpy(tag, computed, sizeof(computed));
+        return true;
+    }
+    /* VerifyBufsEqual takes the same time wherever the tags differ. */
+    const bool ok = CryptoPP::VerifyBufsEqual(computed, tag, sizeof(computed));
+    if (!ok)
+        CryptoPP::SecureWipeArray(out, len);
+    return ok;
+}
+
+PyObject *
+secretbox_secretbox(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "key", "nonce", "message", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *nonce = NULL;
+    Py_ssize_t noncesize = 0;
+    PyObject* msgobj;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#t#O:secretbox", const_cast<char**>(kwlist), &key, &keysize, &nonce, &noncesize, &msgobj))
+        return NULL;
+    if (check_key_and_nonce(keysize, noncesize))
+        return NULL;
+
+    Py_buffer msg;
+    if (pycryptopp_get_read_buffer(msgobj, &msg, secretbox_error))
+        return NULL;
+    assert (msg.len >= 0);
+    PyObject* result = PyString_FromStringAndSize(NULL, MACBYTES + msg.len);
+    if (!result) {
+        PyBuffer_Release(&msg);
+        return NULL;
+    }
+
+    byte* box = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    const byte* in = reinterpret_cast<const byte*>(msg.buf);
+    if (PYCRYPTOPP_BUFFER_PINNED(msg) && msg.len >= PYCRYPTOPP_GIL_MINSIZE) {
+        Py_BEGIN_ALLOW_THREADS
+        secretbox_oneshot(reinterpret_cast<const byte*>(key), reinterpret_cast<const byte*>(nonce), false, box + MACBYTES, in, msg.len, box);
+        Py_END_ALLOW_THREADS
+    } else
+        secretbox_oneshot(reinterpret_cast<const byte*>(key), reinterpret_cast<const byte*>(nonce), false, box + MACBYTES, in, msg.len, box);
+    PyBuffer_Release(&msg);
+    return result;
+}
+
+const char*const secretbox_secretbox__doc__ = "\
+secretbox(key, nonce, message)\n\
+\n\
+Encrypt and authenticate message with XSalsa20-Poly1305, returning the\n\
+16-byte authentication tag followed by the ciphertext. This is the same as\n\
+libsodium's crypto_secretbox_easy(), and NaCl's crypto_secretbox() without\n\
+the leading zero bytes. The message is encrypted and authenticated in one\n\
+pass, with the GIL released if it is large.\n\
+\n\
+Never encrypt two messages with the same key and nonce. A random nonce is\n\
+long enough to be safe.\n\
+\n\
+@param key: a string of exactly 32 bytes\n\
+@param nonce: a string of exactly 24 bytes\n\
+@param message: any object supporting the buffer protocol";
+
+PyObject *
+secretbox_secretbox_open(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "key", "nonce", "box", NULL };
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    const char *nonce = NULL;
+    Py_ssize_t noncesize = 0;
+    PyObject* boxobj;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#t#O:secretbox_open", const_cast<char**>(kwlist), &key, &keysize, &nonce, &noncesize, &boxobj))
+        return NULL;
+    if (check_key_and_nonce(keysize, noncesize))
+        return NULL;
+
+    Py_buffer box;
+    if (pycryptopp_get_read_buffer(boxobj, &box, secretbox_error))
+        return NULL;
+    assert (box.len >= 0);
+    if (box.len < MACBYTES) {
+        PyBuffer_Release(&box);
+        PyErr_SetString(secretbox_authentication_error, "The box is too short to hold an authentication tag.");
+        return NULL;
+    }
+    PyObject* result = PyString_FromStringAndSize(NULL, box.len - MACBYTES);
+    if (!result) {
+        PyBuffer_Release(&box);
+        return NULL;
+    }
+
+    byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    byte tag[16];
+    memcpy(tag, box.buf, sizeof(tag));
+    const byte* in = reinterpret_cast<const byte*>(box.buf) + MACBYTES;
+    bool ok;
+    if (PYCRYPTOPP_BUFFER_PINNED(box) && box.len >= PYCRYPTOPP_GIL_MINSIZE) {
+        Py_BEGIN_ALLOW_THREADS
+        ok = secretbox_oneshot(reinterpret_cast<const byte*>(key), reinterpret_cast<const byte*>(nonce), true, out, in, box.len - MACBYTES, tag);
+        Py_END_ALLOW_THREADS
+    } else
+        ok = secretbox_oneshot(reinterpret_cast<const byte*>(key), reinterpret_cast<const byte*>(nonce), true, out, in, box.len - MACBYTES, tag);
+    PyBuffer_Release(&box);
+    if (!ok) {
+        Py_DECREF(result);
+        PyErr_SetString(secretbox_authentication_error, "The box has been corrupted or tampered with.");
+        return NULL;
+    }
+    return result;
+}
+
+const char*const secretbox_secretbox_open__doc__ = "\
+secretbox_open(key, nonce, box)\n\
+\n\
+Check and decrypt a box made by secretbox(), returning the message, or\n\
+raise secretbox.AuthenticationError if it is not authentic. The box is\n\
+checked and decrypted in one pass, with the GIL released if it is large;\n\
+the plaintext is never returned unless it is authentic.";
+
+void
+init_secretbox(PyObject*const module) {
+    if (PyType_Ready(&Encryptor_type) < 0)
+        return;
+    Py_INCREF(&Encryptor_type);
+    PyModule_AddObject(module, "secretbox_Encryptor", (PyObject *)&Encryptor_type);
+
+    if (PyType_Ready(&Decryptor_type) < 0)
+        return;
+    Py_INCREF(&Decryptor_type);
+    PyModule_AddObject(module, "secretbox_Decryptor", (PyObject *)&Decryptor_type);
+
+    secretbox_error = PyErr_NewException(const_cast<char*>("_secretbox.Error"), NULL, NULL);
+    PyModule_AddObject(module, "secretbox_Error", secretbox_error);
+
+    secretbox_authentication_error = PyErr_NewException(const_cast<char*>("_secretbox.AuthenticationError"), secretbox_error, NULL);
+    PyModule_AddObject(module, "secretbox_AuthenticationError", secretbox_authentication_error);
+
+    PyModule_AddIntConstant(module, "secretbox_KEYBYTES", KEYBYTES);
+    PyModule_AddIntConstant(module, "secretbox_NONCEBYTES", NONCEBYTES);
+    PyModule_AddIntConstant(module, "secretbox_MACBYTES", MACBYTES);
+
+    PyModule_AddStringConstant(module, "secretbox___doc__", const_cast<char*>(secretbox___doc__));
+}
@@ -0,0 +1,15 @@
+#ifndef __INCL_SECRETBOXMODULE_HPP
+#define __INCL_SECRETBOXMODULE_HPP
+
+extern void
+init_secretbox(PyObject* module);
+
+extern PyObject *
+secretbox_secretbox(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const secretbox_secretbox__doc__;
+
+extern PyObject *
+secretbox_secretbox_open(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const secretbox_secretbox_open__doc__;
+
+#endif /* #ifndef __INCL_SECRETBOXMODULE_HPP */
@@ -5,7 +5,24 @@ _import_my_names(globals(), "xsalsa20_")
 del _import_my_names
 
 def selftest():
-    # pyflakes doesn't know that XSalsa20 is made available above
+    # pyflakes doesn't know that these are made available above
+    simd_width = globals()["simd_width"]
+    _set_simd_width = globals()["_set_simd_width"]
+
+    # The keystream is computed by different code depending on how many
+    # blocks this processor can work on at once, so the portable code is
+    # checked against the test vector and every other width against it.
+    previous = _set_simd_width(1)
+    try:
+        expected = _selftest()
+        for width in [4, 8]:
+            if width <= simd_width():
+                _set_simd_width(width)
+                assert _selftest() == expected
+    finally:
+        _set_simd_width(previous)
+
+def _selftest():
     XSalsa20 = globals()["XSalsa20"]
     from binascii import unhexlify
     key = unhexlify("ad5eadf7163b0d36e44c126037a03419"
@@ -28,4 +45,10 @@ def selftest():
         offset += chunksize
     assert decrypted == expected
 
+    # enough keystream for the vector code, whole and in pieces
+    stream = XSalsa20(key, iv).process("\x00"*1000)
+    p = XSalsa20(key, iv)
+    assert "".join([p.process("\x00"*n) for n in [1, 63, 200, 513, 223]]) == stream
+    return stream
+
 selftest()
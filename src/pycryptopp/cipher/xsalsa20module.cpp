@@ -1,5 +1,5 @@
 /**
- * xsalsa20module.cpp -- Python wrappers around Crypto++'s salsa
+ * xsalsa20module.cpp -- Python wrappers for the XSalsa20 stream cipher
  */
 
 #define PY_SSIZE_T_CLEAN
@@ -9,13 +9,19 @@ typedef int Py_ssize_t;
 #endif
 
 #include "xsalsa20module.hpp"
+#include "salsa.hpp"
+#include "../buffers.hpp"
+#include "../objectlock.hpp"
 
 #ifdef DISABLE_EMBEDDED_CRYPTOPP
-#include <cryptopp/salsa.h>
+#include <cryptopp/misc.h>
 #else
-#include <src-cryptopp/salsa.h>
+#include <src-cryptopp/misc.h>
 #endif
 
+#include "../fileio.hpp"
+#include "../many.hpp"
+
 static const char* const xsalsa20__doc__ = "_xsalsa20 cipher";
 
 static PyObject *xsalsa20_error;
@@ -24,8 +30,12 @@ typedef struct {
 	PyObject_HEAD
 
 	/* internal */
-//	CryptoPP::CTR_Mode<CryptoPP::XSalsa20>::Encryption *e;
-	CryptoPP::XSalsa20::Encryption *e;
+	pycryptopp_salsa st;
+	/* the key as given, from which reset() derives a new subkey */
+	byte key[32];
+	PyThread_type_lock lock;
+	/* the offset into the keystream of the next byte to be processed */
+	CryptoPP::lword pos;
 } XSalsa20;
 
 PyDoc_STRVAR(XSalsa20__doc__,
@@ -37,36 +47,187 @@ use the current counter and increment it.\n\
 \n\
 ");
 
+/* Process the next len bytes. The caller must hold self's lock, if it has
+   one, but need not hold the GIL. */
+static void XSalsa20_crypt(XSalsa20* self, byte* out, const byte* in, size_t len) {
+	pycryptopp_salsa_xor(&self->st, self->pos, out, in, len);
+	self->pos += len;
+}
+
 static PyObject *XSalsa20_process(XSalsa20* self, PyObject* msgobj) {
-	if(!PyString_CheckExact(msgobj)) {
-		PyStringObject* typerepr = reinterpret_cast<PyStringObject*>(PyObject_Repr(reinterpret_cast<PyObject*>(msgobj->ob_type)));
-		if (typerepr) {
-			PyErr_Format(xsalsa20_error, "Precondition violation: you are required to pass a Python string object (not a unicode, a subclass of string, or anything else), but you passed %s.", PyString_AS_STRING(reinterpret_cast<PyObject*>(typerepr)));
-			Py_DECREF(typerepr);
-		} else
-			PyErr_Format(xsalsa20_error, "Precondition violation: you are required to pass a Python string object (not a unicode, a subclass of string, or anything else).");
+	Py_buffer msg;
+	if (pycryptopp_get_read_buffer(msgobj, &msg, xsalsa20_error))
+		return NULL;
+	assert (msg.len >= 0);
+
+	PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msg.len));
+	if (!result) {
+		PyBuffer_Release(&msg);
 		return NULL;
 	}
 
-	const char* msg;
-	Py_ssize_t msgsize;
-	if (PyString_AsStringAndSize(msgobj, const_cast<char**>(&msg), &msgsize))
+	byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+	WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(msg), msg.len,
+		XSalsa20_crypt(self, out, reinterpret_cast<const byte*>(msg.buf), msg.len));
+	PyBuffer_Release(&msg);
+	return reinterpret_cast<PyObject*>(result);
+}
+
+PyDoc_STRVAR(XSalsa20_process__doc__,
+"Encrypt or decrypt the next bytes, returning the result.\n\
+\n\
+The argument may be any object supporting the buffer protocol, such as a\n\
+str, bytearray, memoryview, array or mmap.\n\
+\n\
+Large inputs are processed with the GIL released, so other Python threads\n\
+can run meanwhile. Concurrent calls on the same XSalsa20 object are\n\
+serialized.");
+
+static PyObject *XSalsa20_process_into(XSalsa20* self, PyObject* args) {
+	PyObject* srcobj;
+	PyObject* dstobj;
+	if (!PyArg_ParseTuple(args, "OO:process_into", &srcobj, &dstobj))
 		return NULL;
-	assert (msgsize >= 0);
 
-	PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msgsize));
-	if (!result)
+	Py_buffer src;
+	if (pycryptopp_get_read_buffer(srcobj, &src, xsalsa20_error))
+		return NULL;
+	Py_buffer dst;
+	if (pycryptopp_get_write_buffer(dstobj, &dst, xsalsa20_error)) {
+		PyBuffer_Release(&src);
 		return NULL;
+	}
+	if (dst.len < src.len) {
+		PyErr_Format(xsalsa20_error, "Precondition violation: dst is required to be at least as long as src (%zd bytes), but it was %zd bytes.", src.len, dst.len);
+		PyBuffer_Release(&dst);
+		PyBuffer_Release(&src);
+		return NULL;
+	}
 
-	self->e->ProcessString(reinterpret_cast<byte*>(PyString_AS_STRING(result)), reinterpret_cast<const byte*>(msg), msgsize);
-	return reinterpret_cast<PyObject*>(result);
+	WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(src) && PYCRYPTOPP_BUFFER_PINNED(dst), src.len,
+		XSalsa20_crypt(self, reinterpret_cast<byte*>(dst.buf), reinterpret_cast<const byte*>(src.buf), src.len));
+	PyBuffer_Release(&dst);
+	PyBuffer_Release(&src);
+	Py_RETURN_NONE;
 }
 
-PyDoc_STRVAR(XSalsa20_process__doc__,
-"Encrypt or decrypt the next bytes, returning the result.");
+PyDoc_STRVAR(XSalsa20_process_into__doc__,
+"process_into(src, dst)\n\
+\n\
+Encrypt or decrypt the next len(src) bytes of src, writing the result into\n\
+the first len(src) bytes of dst instead of returning a new string.\n\
+\n\
+src may be any object supporting the buffer protocol; dst must be a writable\n\
+one, such as a bytearray. src and dst may be the same buffer, to process it\n\
+in place, but must not otherwise overlap.");
+
+static PyObject *XSalsa20_seek(XSalsa20* self, PyObject* args) {
+	PY_LONG_LONG offset;
+	if (!PyArg_ParseTuple(args, "L:seek", &offset))
+		return NULL;
+	if (offset < 0)
+		return PyErr_Format(xsalsa20_error, "Precondition violation: offset is required to be non-negative, but it was %lld.", offset);
+
+	ENTER_OBJECTLOCK(self);
+	self->pos = static_cast<CryptoPP::lword>(offset);
+	LEAVE_OBJECTLOCK(self);
+	Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(XSalsa20_seek__doc__,
+"seek(offset)\n\
+\n\
+Position the cipher so that the next call to .process() will use the\n\
+keystream starting offset bytes after the beginning, as though exactly\n\
+offset bytes had been processed since the object was created. offset need\n\
+not be a multiple of the 64-byte block size. This takes the same (small)\n\
+time for any offset, and may move backwards as well as forwards, so any part\n\
+of a stream can be decrypted without the parts before it.");
+
+static PyObject *XSalsa20_tell(XSalsa20* self, PyObject* dummy) {
+	ENTER_OBJECTLOCK(self);
+	CryptoPP::lword pos = self->pos;
+	LEAVE_OBJECTLOCK(self);
+	return PyLong_FromUnsignedLongLong(pos);
+}
+
+PyDoc_STRVAR(XSalsa20_tell__doc__,
+"Return the offset into the keystream of the next byte to be processed, which\n\
+is the number of bytes processed since the object was created or since the\n\
+last .seek(), plus the offset passed to that .seek().");
+
+/* Start a new keystream from key and iv. Raises xsalsa20.Error and returns
+   -1, leaving self unchanged, if the key is not a valid size. The caller must
+   hold self's lock, if it has one. */
+static int XSalsa20_set_key(XSalsa20* self, const byte* key, Py_ssize_t keysize, const byte* iv) {
+	if (keysize != 32) {
+		PyErr_Format(xsalsa20_error, "Precondition violation: you are required to pass a valid key size (32 bytes), but it was %zd bytes.", keysize);
+		return -1;
+	}
+	memcpy(self->key, key, 32);
+	pycryptopp_xsalsa20_init(&self->st, key, iv);
+	self->pos = 0;
+	return 0;
+}
+
+static PyObject *XSalsa20_rekey(XSalsa20* self, PyObject* args, PyObject* kwdict) {
+	static const char *kwlist[] = { "key", "iv", NULL };
+	const char *key = NULL;
+	Py_ssize_t keysize = 0;
+	const char *iv = NULL;
+	const char defaultiv[24] = {0};
+	Py_ssize_t ivsize = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#|t#:rekey", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize))
+		return NULL;
+
+	if (!iv)
+		iv = defaultiv;
+	else if (ivsize != 24)
+		return PyErr_Format(xsalsa20_error, "Precondition violation: if an IV is passed, it must be exactly 24 bytes, not %zd", ivsize);
+
+	ENTER_OBJECTLOCK(self);
+	const int result = XSalsa20_set_key(self, reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv));
+	LEAVE_OBJECTLOCK(self);
+	if (result)
+		return NULL;
+	Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(XSalsa20_rekey__doc__,
+"rekey(key, iv=None)\n\
+\n\
+Start again with a new key and IV, exactly as though this were a new\n\
+XSalsa20 object made with XSalsa20(key, iv), but without allocating a new\n\
+object.");
+
+static PyObject *XSalsa20_reset(XSalsa20* self, PyObject* args) {
+	const char *iv = NULL;
+	Py_ssize_t ivsize = 0;
+	if (!PyArg_ParseTuple(args, "t#:reset", &iv, &ivsize))
+		return NULL;
+	if (ivsize != 24)
+		return PyErr_Format(xsalsa20_error, "Precondition violation: the IV is required to be exactly 24 bytes, not %zd", ivsize);
+
+	ENTER_OBJECTLOCK(self);
+	pycryptopp_xsalsa20_init(&self->st, self->key, reinterpret_cast<const byte*>(iv));
+	self->pos = 0;
+	LEAVE_OBJECTLOCK(self);
+	Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(XSalsa20_reset__doc__,
+"reset(iv)\n\
+\n\
+Start again with the same key and a new IV, exactly as though this were a\n\
+new XSalsa20 object made with XSalsa20(key, iv).");
 
 static PyMethodDef XSalsa20_methods[] = {
 	{"process", reinterpret_cast<PyCFunction>(XSalsa20_process), METH_O, XSalsa20_process__doc__},
+	{"process_into", reinterpret_cast<PyCFunction>(XSalsa20_process_into), METH_VARARGS, XSalsa20_process_into__doc__},
+	{"seek", reinterpret_cast<PyCFunction>(XSalsa20_seek), METH_VARARGS, XSalsa20_seek__doc__},
+	{"tell", reinterpret_cast<PyCFunction>(XSalsa20_tell), METH_NOARGS, XSalsa20_tell__doc__},
+	{"rekey", reinterpret_cast<PyCFunction>(XSalsa20_rekey), METH_KEYWORDS, XSalsa20_rekey__doc__},
+	{"reset", reinterpret_cast<PyCFunction>(XSalsa20_reset), METH_VARARGS, XSalsa20_reset__doc__},
 	{NULL},
 };
 
@@ -74,13 +235,15 @@ static PyObject* XSalsa20_new(PyTypeObject* type, PyObject *args, PyObject *kwdi
 	XSalsa20* self = reinterpret_cast<XSalsa20*>(type->tp_alloc(type, 0));
 	if (!self)
 		return NULL;
-	self->e = NULL;
+	self->lock = NULL;
+	self->pos = 0;
 	return reinterpret_cast<PyObject*>(self);
 }
 
 static void XSalsa20_dealloc(PyObject* self) {
-	if (reinterpret_cast<XSalsa20*>(self)->e)
-		delete reinterpret_cast<XSalsa20*>(self)->e;
+	CryptoPP::SecureWipeArray(reinterpret_cast<XSalsa20*>(self)->key, 32);
+	CryptoPP::SecureWipeArray(reinterpret_cast<XSalsa20*>(self)->st.input, 16);
+	FREE_OBJECTLOCK(reinterpret_cast<XSalsa20*>(self));
 	self->ob_type->tp_free(self);
 }
 
@@ -103,22 +266,253 @@ static int XSalsa20_init(PyObject* self, PyObject *args, PyObject *kwdict) {
             return -1;
         }
 
-	try {
-		reinterpret_cast<XSalsa20*>(self)->e = new CryptoPP::XSalsa20::Encryption(reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv));
+	XSalsa20* mself = reinterpret_cast<XSalsa20*>(self);
+	ENTER_OBJECTLOCK(mself);
+	const int result = XSalsa20_set_key(mself, reinterpret_cast<const byte*>(key), keysize, reinterpret_cast<const byte*>(iv));
+	LEAVE_OBJECTLOCK(mself);
+	return result;
+}
+
+
+typedef struct {
+	PyObject_HEAD
+
+	/* internal */
+	pycryptopp_xsalsa20_key k;
+} Context;
+
+PyDoc_STRVAR(Context__doc__,
+"Context(key)\n\
+\n\
+An XSalsa20 key, ready to encrypt or decrypt any number of messages each\n\
+under its own 24-byte nonce. ctx.process(nonce, data) gives the same result\n\
+as XSalsa20(key, nonce).process(data), but without making a new cipher\n\
+object, which is most of the cost for short messages.\n\
+\n\
+A Context cannot be changed once made, so one may be shared between threads\n\
+freely.");
+
+static PyObject *Context_process(Context* self, PyObject* args) {
+	const char *nonce = NULL;
+	Py_ssize_t noncesize = 0;
+	PyObject* msgobj;
+	if (!PyArg_ParseTuple(args, "t#O:process", &nonce, &noncesize, &msgobj))
+		return NULL;
+	if (noncesize != 24)
+		return PyErr_Format(xsalsa20_error, "Precondition violation: the nonce is required to be exactly 24 bytes, not %zd", noncesize);
+
+	Py_buffer msg;
+	if (pycryptopp_get_read_buffer(msgobj, &msg, xsalsa20_error))
+		return NULL;
+	assert (msg.len >= 0);
+
+	PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, msg.len));
+	if (!result) {
+		PyBuffer_Release(&msg);
+		return NULL;
+	}
+
+	/* self never changes, so there is nothing to lock */
+	pycryptopp_salsa st;
+	pycryptopp_xsalsa20_init_expanded(&st, &self->k, reinterpret_cast<const byte*>(nonce));
+	byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+	if (PYCRYPTOPP_BUFFER_PINNED(msg) && msg.len >= PYCRYPTOPP_GIL_MINSIZE) {
+		Py_BEGIN_ALLOW_THREADS
+		pycryptopp_salsa_xor(&st, 0, out, reinterpret_cast<const byte*>(msg.buf), msg.len);
+		Py_END_ALLOW_THREADS
+	} else
+		pycryptopp_salsa_xor(&st, 0, out, reinterpret_cast<const byte*>(msg.buf), msg.len);
+	CryptoPP::SecureWipeArray(st.input, 16);
+	PyBuffer_Release(&msg);
+	return reinterpret_cast<PyObject*>(result);
+}
+
+PyDoc_STRVAR(Context_process__doc__,
+"process(nonce, data)\n\
+\n\
+Encrypt or decrypt data with this key and the given 24-byte nonce, starting\n\
+from the beginning of the keystream, and return the result. data may be any\n\
+object supporting the buffer protocol.");
+
+static PyMethodDef Context_methods[] = {
+	{"process", reinterpret_cast<PyCFunction>(Context_process), METH_VARARGS, Context_process__doc__},
+	{NULL},
+};
+
+static PyObject* Context_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+	static const char *kwlist[] = { "key", NULL };
+	const char *key = NULL;
+	Py_ssize_t keysize = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#:Context", const_cast<char**>(kwlist), &key, &keysize))
+		return NULL;
+	if (keysize != 32)
+		return PyErr_Format(xsalsa20_error, "Precondition violation: you are required to pass a valid key size (32 bytes), but it was %zd bytes.", keysize);
+
+	Context* self = reinterpret_cast<Context*>(type->tp_alloc(type, 0));
+	if (!self)
+		return NULL;
+	pycryptopp_xsalsa20_expand_key(&self->k, reinterpret_cast<const byte*>(key));
+	return reinterpret_cast<PyObject*>(self);
+}
+
+static void Context_dealloc(PyObject* self) {
+	CryptoPP::SecureWipeArray(reinterpret_cast<Context*>(self)->k.input, 16);
+	self->ob_type->tp_free(self);
+}
+
+typedef struct {
+	pycryptopp_salsa st;
+	CryptoPP::lword pos;
+} XSalsa20_file_job;
+
+static void XSalsa20_process_file_window(void* context, byte* out, const byte* in, size_t len) {
+	XSalsa20_file_job* job = reinterpret_cast<XSalsa20_file_job*>(context);
+	pycryptopp_salsa_xor(&job->st, job->pos, out, in, len);
+	job->pos += len;
+}
+
+PyObject *xsalsa20_crypt_file(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+	static const char *kwlist[] = { "key", "iv", "src_path", "dst_path", "offset", NULL };
+	const char *key = NULL;
+	Py_ssize_t keysize = 0;
+	const char *iv = NULL;
+	const char defaultiv[24] = {0};
+	Py_ssize_t ivsize = 0;
+	char* src_path = NULL;
+	char* dst_path = NULL;
+	PY_LONG_LONG offset = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#z#etet|L:crypt_file", const_cast<char**>(kwlist), &key, &keysize, &iv, &ivsize, Py_FileSystemDefaultEncoding, &src_path, Py_FileSystemDefaultEncoding, &dst_path, &offset))
+		return NULL;
+
+	PyObject* result = NULL;
+	if (keysize != 32)
+		PyErr_Format(xsalsa20_error, "Precondition violation: you are required to pass a valid key size (32 bytes), but it was %zd bytes.", keysize);
+	else if (iv && ivsize != 24)
+		PyErr_Format(xsalsa20_error, "Precondition violation: if an IV is passed, it must be exactly 24 bytes, not %zd", ivsize);
+	else if (offset < 0)
+		PyErr_Format(xsalsa20_error, "Precondition violation: offset is required to be non-negative, but it was %lld.", offset);
+	else {
+		XSalsa20_file_job job;
+		pycryptopp_xsalsa20_init(&job.st, reinterpret_cast<const byte*>(key), reinterpret_cast<const byte*>(iv ? iv : defaultiv));
+		job.pos = static_cast<CryptoPP::lword>(offset);
+		PY_LONG_LONG processed;
+		if (pycryptopp_process_file(src_path, dst_path, offset, XSalsa20_process_file_window, &job, &processed) == 0)
+			result = PyLong_FromLongLong(processed);
+		CryptoPP::SecureWipeArray(job.st.input, 16);
 	}
-	catch (CryptoPP::InvalidKeyLength le)
-	{
-	        PyErr_Format(xsalsa20_error, "Precondition violation: you are required to pass a valid key size.  Crypto++ gave this exception: %s", le.what());
-        	return -1;
+	PyMem_Free(src_path);
+	PyMem_Free(dst_path);
+	return result;
+}
+
+const char*const xsalsa20_crypt_file__doc__ = "\
+crypt_file(key, iv, src_path, dst_path, offset=0)\n\
+\n\
+Encrypt or decrypt the file at src_path with XSalsa20, writing the result to\n\
+the file at dst_path, and return the number of bytes processed. This gives\n\
+the same result as XSalsa20(key, iv).process() on the whole file, but the\n\
+data never passes through Python and the GIL is released throughout.\n\
+\n\
+If offset is given then only the bytes of the file from offset onwards are\n\
+processed, using the keystream from offset onwards, and the first offset\n\
+bytes of dst_path are left as they were. dst_path is created if need be, and\n\
+is cut off at the end of the output. It may be the same as src_path, to\n\
+encrypt a file in place.\n\
+\n\
+@param iv: a string of exactly 24 bytes, or None for all zeroes";
+
+static void XSalsa20_process_many(const pycryptopp_many* m) {
+	static const byte zeroiv[24] = {0};
+	pycryptopp_salsa st;
+	for (Py_ssize_t i = 0; i < m->n; i++) {
+		pycryptopp_xsalsa20_init(&st, m->keys[i], m->ivs[i] ? m->ivs[i] : zeroiv);
+		pycryptopp_salsa_xor(&st, 0, m->outs[i], m->ins[i], m->lens[i]);
 	}
-	if (!reinterpret_cast<XSalsa20*>(self)->e)
-	{
-		PyErr_NoMemory();
-		return -1;
+	CryptoPP::SecureWipeArray(st.input, 16);
+}
+
+PyObject *xsalsa20_process_many(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+	static const char *kwlist[] = { "keys", "ivs", "datas", "record_size", NULL };
+	PyObject* keys;
+	PyObject* ivs;
+	PyObject* datas;
+	PyObject* record_size = Py_None;
+	if (!PyArg_ParseTupleAndKeywords(args, kwdict, "OOO|O:process_many", const_cast<char**>(kwlist), &keys, &ivs, &datas, &record_size))
+		return NULL;
+
+	pycryptopp_many m;
+	PyObject* result = NULL;
+	if (pycryptopp_many_parse(&m, keys, ivs, datas, record_size, 24, xsalsa20_error) == 0) {
+		Py_ssize_t i;
+		for (i = 0; i < m.n; i++) {
+			if (m.keysizes[i] != 32) {
+				PyErr_Format(xsalsa20_error, "Precondition violation: each key is required to be 32 bytes long, but keys[%zd] was %zu bytes.", i, m.keysizes[i]);
+				break;
+			}
+		}
+		if (i == m.n) {
+			if (m.pinned && m.total >= PYCRYPTOPP_GIL_MINSIZE) {
+				Py_BEGIN_ALLOW_THREADS
+				XSalsa20_process_many(&m);
+				Py_END_ALLOW_THREADS
+			} else
+				XSalsa20_process_many(&m);
+			result = m.result;
+			m.result = NULL;
+		}
 	}
-	return 0;
+	Py_XDECREF(m.result);
+	pycryptopp_many_release(&m);
+	return result;
+}
+
+const char*const xsalsa20_process_many__doc__ = "\
+process_many(keys, ivs, datas, record_size=None)\n\
+\n\
+Encrypt or decrypt many messages with XSalsa20 in one call, each under its\n\
+own key and IV, giving the same results as\n\
+[XSalsa20(key, iv).process(data) for (key, iv, data) in zip(keys, ivs, datas)]\n\
+but without the cost of making an XSalsa20 object for each message.\n\
+\n\
+datas is either a list or tuple of messages, in which case a list of results\n\
+is returned, or, if record_size is given, one buffer holding messages of\n\
+exactly record_size bytes each, in which case the results are returned\n\
+packed together in one string in the same way.\n\
+\n\
+@param keys: a list or tuple with a 32-byte key for each message, or one\n\
+    buffer holding all of the keys\n\
+@param ivs: a list or tuple with a 24-byte IV for each message, or one buffer\n\
+    holding all of them, or None for all zeroes";
+
+PyObject *xsalsa20_simd_width(PyObject *dummy, PyObject *args) {
+	return PyInt_FromLong(pycryptopp_salsa_max_width());
 }
 
+const char*const xsalsa20_simd_width__doc__ = "\
+Return how many 64-byte blocks of keystream XSalsa20 objects compute at once\n\
+on this processor: 8 with AVX2, 4 with SSE2 or NEON, and 1 if this build has\n\
+no vector code for it. They do so automatically, producing exactly the same\n\
+output either way.";
+
+PyObject *xsalsa20__set_simd_width(PyObject *dummy, PyObject *args) {
+	int width;
+	if (!PyArg_ParseTuple(args, "i:_set_simd_width", &width))
+		return NULL;
+	const unsigned max_width = pycryptopp_salsa_max_width();
+	if ((width != 1 && width != 4 && width != 8) || static_cast<unsigned>(width) > max_width)
+		return PyErr_Format(xsalsa20_error, "Precondition violation: width is required to be 1, 4 or 8 and at most simd_width(), which is %u here, but it was %d.", max_width, width);
+	const unsigned previous = pycryptopp_salsa_width;
+	pycryptopp_salsa_width = static_cast<unsigned>(width);
+	return PyInt_FromLong(previous);
+}
+
+const char*const xsalsa20__set_simd_width__doc__ = "\
+_set_simd_width(width)\n\
+\n\
+Make all XSalsa20 objects, crypt_file() and process_many() compute the\n\
+keystream width blocks at a time, where width is 1, 4 or 8 and no more than\n\
+simd_width(), and return the previous width. This is for testing the\n\
+implementations against each other; there is no other reason to call it.";
 
 static PyTypeObject XSalsa20_type = {
 	PyObject_HEAD_INIT(NULL)
@@ -162,13 +556,62 @@ static PyTypeObject XSalsa20_type = {
 	XSalsa20_new,   		 /*tp_new*/
 };
 
+static PyTypeObject Context_type = {
+	PyObject_HEAD_INIT(NULL)
+	0,                       /*ob_size*/
+	"_xsalsa.Context",       /*tp_name*/
+	sizeof(Context),	 /*tp_basicsize*/
+	0,                       /*tp_itemsize*/
+	Context_dealloc,         /*tp_dealloc*/
+	0,			 /*tp_print*/
+	0, 			 /*tp_getattr*/
+	0,  			 /*tp_setattr*/
+	0,  			 /*tp_compare*/
+	0,  			 /*tp_repr*/
+	0,   			 /*tp_as_number*/
+	0,   			 /*tp_as_sequence*/
+	0,   			 /*tp_as_mapping*/
+	0,    			 /*tp_hash*/
+	0,   			 /*tp_call*/
+	0,     			 /*tp_str*/
+	0,   			 /*tp_getattro*/
+	0,    			 /*tp_setattro*/
+	0, 			 /*tp_as_buffer*/
+	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+	Context__doc__,  	 /*tp_doc*/
+	0,   	 		 /*tp_traverse*/
+	0,   			 /*tp_clear*/
+	0,      		 /*tp_richcompare*/
+	0,   			 /*tp_weaklistoffset*/
+	0,   			 /*tp_iter*/
+	0,   			 /*tp_iternext*/
+	Context_methods,  	 /*tp_methods*/
+	0,   			 /*tp_members*/
+	0,    			 /*tp_getset*/
+	0,   			 /*tp_base*/
+	0,   			 /*tp_dict*/
+	0,   			 /*tp_descr_get*/
+	0,   			 /*tp_descr_set*/
+	0,   			 /*tp_dictoffset*/
+	0, 			 /*tp_init*/
+	0,   			 /*tp_alloc*/
+	Context_new,   		 /*tp_new*/
+};
+
 void init_xsalsa20(PyObject*const module)
 {
+	pycryptopp_salsa_width = pycryptopp_salsa_max_width();
+
 	if (PyType_Ready(&XSalsa20_type) < 0)
 		return;
 	Py_INCREF(&XSalsa20_type);
 	PyModule_AddObject(module, "xsalsa20_XSalsa20", (PyObject *)&XSalsa20_type);
 
+	if (PyType_Ready(&Context_type) < 0)
+		return;
+	Py_INCREF(&Context_type);
+	PyModule_AddObject(module, "xsalsa20_Context", (PyObject *)&Context_type);
+
 	xsalsa20_error = PyErr_NewException(const_cast<char*>("_xsalsa20.Error"), NULL, NULL);
 	PyModule_AddObject(module, "xsalsa20_Error", xsalsa20_error);
 
@@ -3,4 +3,20 @@
 
 extern void init_xsalsa20(PyObject* module);
 
+extern PyObject *
+xsalsa20_crypt_file(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const xsalsa20_crypt_file__doc__;
+
+extern PyObject *
+xsalsa20_process_many(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const xsalsa20_process_many__doc__;
+
+extern PyObject *
+xsalsa20_simd_width(PyObject *dummy, PyObject *args);
+extern const char*const xsalsa20_simd_width__doc__;
+
+extern PyObject *
+xsalsa20__set_simd_width(PyObject *dummy, PyObject *args);
+extern const char*const xsalsa20__set_simd_width__doc__;
+
 #endif; /*#ifndef __INCL_XSALSA20MODULE_HPP*/
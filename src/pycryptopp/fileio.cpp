@@ -0,0 +1,238 @@
+/**
+ * fileio.cpp -- run a stream cipher or a hash function over a file without
+ * the data passing through Python.
+ *
+ * The file is read and written in large windows with plain read() and
+ * write() calls (or pread(), for a descriptor belonging to the caller).
+ * Each window is transformed in place while it is still in cache, and the
+ * GIL is released throughout, so other Python threads keep running while a
+ * large file is encrypted or hashed.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include <errno.h>
+#include <limits.h>
+#include <fcntl.h>
+#include <sys/types.h>
+#include <sys/stat.h>
+#ifdef _WIN32
+#include <io.h>
+#define open _open
+#define close _close
+#define read _read
+#define write _write
+#define lseek _lseeki64
+#define ftruncate _chsize_s
+typedef __int64 file_offset;
+#else
+#include <unistd.h>
+typedef off_t file_offset;
+#endif
+#ifndef O_BINARY
+#define O_BINARY 0
+#endif
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+#include "fileio.hpp"
+
+/* How much of the file to work on at a time: large enough that the system
+   calls cost nothing next to the crypto, small enough to stay in cache. */
+static const size_t WINDOW = 1024*1024;
+
+/* Read up to len bytes, stopping early only at the end of the file. With
+   at not negative, read from that offset with pread() instead of from the
+   file position. Returns the number of bytes read, or -1 with errno set. */
+static Py_ssize_t
+read_fully(int fd, byte* buf, size_t len, file_offset at=-1) {
+    size_t got = 0;
+    while (got < len) {
+#ifdef _WIN32
+        const int n = read(fd, buf + got, static_cast<unsigned int>(len - got));
+#else
+        const Py_ssize_t n = at < 0 ? read(fd, buf + got, len - got) : pread(fd, buf + got, len - got, at + static_cast<file_offset>(got));
+#endif
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            return -1;
+        }
+        if (n == 0)
+            break;
+        got += n;
+    }
+    return static_cast<Py_ssize_t>(got);
+}
+
+static int
+write_fully(int fd, const byte* buf, size_t len) {
+    while (len) {
+        const int n = write(fd, buf, static_cast<unsigned int>(len));
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            return -1;
+        }
+        buf += n;
+        len -= n;
+    }
+    return 0;
+}
+
+int
+pycryptopp_process_file(const char* src_path, const char* dst_path, PY_LONG_LONG offset, pycryptopp_file_func func, void* context, PY_LONG_LONG* processed) {
+    byte* buf = reinterpret_cast<byte*>(PyMem_Malloc(WINDOW));
+    if (!buf) {
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    const char* failed = NULL;
+    int err = 0;
+    file_offset pos = static_cast<file_offset>(offset);
+    int src = -1, dst = -1;
+
+    Py_BEGIN_ALLOW_THREADS
+    src = open(src_path, O_RDONLY | O_BINARY);
+    if (src < 0)
+        failed = src_path;
+    if (!failed) {
+        dst = open(dst_path, O_WRONLY | O_CREAT | O_BINARY, 0666);
+        if (dst < 0)
+            failed = dst_path;
+    }
+    if (!failed && lseek(src, pos, SEEK_SET) < 0)
+        failed = src_path;
+    if (!failed && lseek(dst, pos, SEEK_SET) < 0)
+        failed = dst_path;
+    while (!failed) {
+        const Py_ssize_t n = read_fully(src, buf, WINDOW);
+        if (n < 0) {
+            failed = src_path;
+            break;
+        }
+        if (n == 0)
+            break;
+        func(context, buf, buf, n);
+        if (write_fully(dst, buf, n)) {
+            failed = dst_path;
+            break;
+        }
+        pos += n;
+    }
+    if (!failed && ftruncate(dst, pos) != 0)
+        failed = dst_path;
+    if (failed)
+        err = errno;
+    if (dst >= 0 && close(dst) != 0 && !failed) {
+        failed = dst_path;
+        err = errno;
+    }
+    if (src >= 0)
+        close(src);
+    Py_END_ALLOW_THREADS
+
+    CryptoPP::SecureWipeArray(buf, WINDOW);
+    PyMem_Free(buf);
+    if (failed) {
+        errno = err;
+        PyErr_SetFromErrnoWithFilename(PyExc_IOError, const_cast<char*>(failed));
+        return -1;
+    }
+    *processed = static_cast<PY_LONG_LONG>(pos) - offset;
+    return 0;
+}
+
+int
+pycryptopp_get_path_or_fd(PyObject* path_or_fd, char** path, int* fd, PyObject* error) {
+    *path = NULL;
+    *fd = -1;
+    if (PyInt_Check(path_or_fd) || PyLong_Check(path_or_fd)) {
+        /* Out-of-range values are clamped rather than raising, so that they
+           fail the range check below like any other. */
+        const Py_ssize_t n = PyNumber_AsSsize_t(path_or_fd, NULL);
+        if (n == -1 && PyErr_Occurred())
+            return -1;
+        if (n < 0 || n > INT_MAX) {
+            PyErr_Format(error, "Precondition violation: a file descriptor is required to be non-negative and at most %d, but it was %zd.", INT_MAX, n);
+            return -1;
+        }
+        *fd = static_cast<int>(n);
+        return 0;
+    }
+    if (!PyArg_Parse(path_or_fd, "et", Py_FileSystemDefaultEncoding, path))
+        return -1;
+    return 0;
+}
+
+int
+pycryptopp_read_file(const char* path, int fd, PY_LONG_LONG offset, PY_LONG_LONG length, pycryptopp_read_func func, void* context, PY_LONG_LONG* processed) {
+    byte* buf = reinterpret_cast<byte*>(PyMem_Malloc(WINDOW));
+    if (!buf) {
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    bool failed = false;
+    int err = 0;
+    file_offset pos = static_cast<file_offset>(offset);
+    PY_LONG_LONG left = length;
+#ifdef _WIN32
+    const bool use_pread = false;
+#else
+    const bool use_pread = path == NULL;
+#endif
+
+    Py_BEGIN_ALLOW_THREADS
+    if (path) {
+        fd = open(path, O_RDONLY | O_BINARY);
+        if (fd < 0)
+            failed = true;
+    }
+    if (!failed && !use_pread && lseek(fd, pos, SEEK_SET) < 0)
+        failed = true;
+    while (!failed && left != 0) {
+        size_t want = WINDOW;
+        if (left > 0 && static_cast<PY_LONG_LONG>(want) > left)
+            want = static_cast<size_t>(left);
+        const Py_ssize_t n = read_fully(fd, buf, want, use_pread ? pos : -1);
+        if (n < 0) {
+            failed = true;
+            break;
+        }
+        if (n == 0)
+            break;
+        func(context, buf, n);
+        pos += n;
+        if (left > 0)
+            left -= n;
+    }
+    if (failed)
+        err = errno;
+    if (path && fd >= 0)
+        close(fd);
+    Py_END_ALLOW_THREADS
+
+    CryptoPP::SecureWipeArray(buf, WINDOW);
+    PyMem_Free(buf);
+    if (failed) {
+        errno = err;
+        if (path)
+            PyErr_SetFromErrnoWithFilename(PyExc_IOError, const_cast<char*>(path));
+        else
+            PyErr_SetFromErrno(PyExc_IOError);
+        return -1;
+    }
+    *processed = static_cast<PY_LONG_LONG>(pos) - offset;
+    return 0;
+}
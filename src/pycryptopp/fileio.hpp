@@ -0,0 +1,59 @@
+#ifndef __INCL_FILEIO_HPP
+#define __INCL_FILEIO_HPP
+
+/**
+ * fileio.hpp -- run a stream cipher or a hash function over a file without
+ * the data passing through Python.
+ */
+
+/* Transform len bytes from in to out; in and out may be the same buffer.
+   This is called with the GIL released, so it must not touch Python objects
+   or throw. */
+typedef void (*pycryptopp_file_func)(void* context, byte* out, const byte* in, size_t len);
+
+/**
+ * Read the file at src_path from byte offset onwards, pass it through func a
+ * large window at a time, and write the result to the same offsets of the
+ * file at dst_path, which is created if it does not exist. Bytes of dst_path
+ * before offset are left as they were, and it is cut off at the end of the
+ * output. src_path and dst_path may name the same file, to transform it in
+ * place.
+ *
+ * Call this with the GIL held; it is released while the work is done. On
+ * success stores the number of bytes processed in *processed and returns 0;
+ * on failure raises IOError and returns -1.
+ */
+extern int
+pycryptopp_process_file(const char* src_path, const char* dst_path, PY_LONG_LONG offset, pycryptopp_file_func func, void* context, PY_LONG_LONG* processed);
+
+/**
+ * Get the file named by path_or_fd, which is either a path (str or unicode)
+ * or an open file descriptor (a non-negative int or long that fits in a C
+ * int). On success stores either the path, which the caller must release
+ * with PyMem_Free(), in *path and -1 in *fd, or NULL in *path and the
+ * descriptor in *fd, and returns 0; on failure raises an exception (error
+ * for a descriptor out of range) and returns -1.
+ */
+extern int
+pycryptopp_get_path_or_fd(PyObject* path_or_fd, char** path, int* fd, PyObject* error);
+
+/* Take in len more bytes of the file. This is called with the GIL released,
+   so it must not touch Python objects or throw. */
+typedef void (*pycryptopp_read_func)(void* context, const byte* in, size_t len);
+
+/**
+ * Read the file at path, or if path is NULL the open file descriptor fd,
+ * from byte offset onwards, passing it to func a large window at a time. If
+ * length is not negative, stop after length bytes. A descriptor is read
+ * with pread() where there is one, so its file position is left as it was
+ * (on Windows it is moved), and it is not closed.
+ *
+ * Call this with the GIL held; it is released while the work is done. On
+ * success stores the number of bytes read, which is less than length only
+ * if the file ended first, in *processed and returns 0; on failure raises
+ * IOError and returns -1.
+ */
+extern int
+pycryptopp_read_file(const char* path, int fd, PY_LONG_LONG offset, PY_LONG_LONG length, pycryptopp_read_func func, void* context, PY_LONG_LONG* processed);
+
+#endif /* #ifndef __INCL_FILEIO_HPP */
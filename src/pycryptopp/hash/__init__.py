@@ -1,3 +1,3 @@
-import sha256
+import sha256, sha512, blake2, merkle, treehash
 
-quiet_pyflakes=[sha256]
+quiet_pyflakes=[sha256, sha512, blake2, merkle, treehash]
@@ -0,0 +1,31 @@
+from pycryptopp import _import_my_names
+
+# These initializations to None are just to pacify pyflakes, which
+# doesn't understand that we have to do some funky import trickery
+# below in _import_my_names() in order to get sensible namespaces.
+BLAKE2b=None
+BLAKE2s=None
+Error=None
+
+_import_my_names(globals(), "blake2_")
+
+del _import_my_names
+
+def start_up_self_test():
+    """
+    This is a quick test intended to detect major errors such as the library being
+    miscompiled and segfaulting or returning incorrect answers, as
+    sha256.start_up_self_test() explains: keyed answers from the BLAKE2
+    reference test vectors, for messages of more than one block.
+    """
+    msg = ''.join([ chr(c) for c in range(255) ])
+    h = BLAKE2b(msg[:100], key=msg[:64])
+    h.update(msg[100:129])
+    if h.hexdigest().lower() != '64475dfe7600d7171bea0b394e27c9b00d8e74dd1e416a79473682ad3dfdbb706631558055cfc8a40e07bd015a4540dcdea15883cbbf31412df1de1cd4152b91':
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+    h = BLAKE2s(msg[:50], key=msg[:32])
+    h.update(msg[50:65])
+    if h.hexdigest().lower() != '21fe0ceb0052be7fb0f004187cacd7de67fa6eb0938d927677f2398c132317a8':
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+start_up_self_test()
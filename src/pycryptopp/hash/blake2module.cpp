@@ -0,0 +1,173 @@
+/**
+ * blake2module.cpp -- Python wrappers around Crypto++'s BLAKE2b and BLAKE2s
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "blake2module.hpp"
+#include "hashobject.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/blake2.h>
+#else
+#include <src-cryptopp/blake2.h>
+#endif
+
+static const char*const blake2___doc__ = "_blake2 hash functions";
+
+static PyObject *blake2_error;
+
+PyDoc_STRVAR(BLAKE2b__doc__,
+"BLAKE2b(msg=None, key=None, digest_size=64)\n\
+\n\
+a BLAKE2b hash object, with the same methods as sha256.SHA256\n\
+\n\
+The optional message has the same effect as calling .update() with it. With\n\
+a key of up to 64 bytes this is BLAKE2b's own keyed mode, a MAC, which needs\n\
+no HMAC construction around it. digest_size, from 1 to 64 bytes, is part of\n\
+what is hashed, so a shorter digest is not a prefix of the longer one.");
+
+PyDoc_STRVAR(BLAKE2s__doc__,
+"BLAKE2s(msg=None, key=None, digest_size=32)\n\
+\n\
+a BLAKE2s hash object, with the same methods as sha256.SHA256\n\
+\n\
+The optional message has the same effect as calling .update() with it. With\n\
+a key of up to 32 bytes this is BLAKE2s's own keyed mode, a MAC, which needs\n\
+no HMAC construction around it. digest_size, from 1 to 32 bytes, is part of\n\
+what is hashed, so a shorter digest is not a prefix of the longer one.");
+
+template <class H>
+static PyObject *
+BLAKE2_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "msg", "key", "digest_size", NULL };
+    PyObject *msgobj = NULL;
+    const char *key = NULL;
+    Py_ssize_t keysize = 0;
+    int digest_size = H::DIGESTSIZE;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "|Oz#i", const_cast<char**>(kwlist), &msgobj, &key, &keysize, &digest_size))
+        return NULL;
+    if (keysize > H::MAX_KEYLENGTH)
+        return PyErr_Format(blake2_error, "Precondition violation: key is required to be at most %d bytes long, but it was %zd bytes.", static_cast<int>(H::MAX_KEYLENGTH), keysize);
+    if (digest_size < 1 || digest_size > H::DIGESTSIZE)
+        return PyErr_Format(blake2_error, "Precondition violation: digest_size is required to be from 1 to %d, but it was %d.", static_cast<int>(H::DIGESTSIZE), digest_size);
+
+    pycryptopp_hash* self = reinterpret_cast<pycryptopp_hash*>(type->tp_alloc(type, 0));
+    if (!self)
+        return NULL;
+    /* Always the keyed constructor: the other one leaves the digest size
+       out of the parameter block, which is wrong for short digests. */
+    H* h = new H(reinterpret_cast<const byte*>(key), static_cast<size_t>(keysize), NULL, 0, NULL, 0, false, static_cast<unsigned int>(digest_size));
+    if (pycryptopp_hash_setup(self, h, pycryptopp_hash_clone<H>, blake2_error, msgobj)) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    return reinterpret_cast<PyObject*>(self);
+}
+
+static PyTypeObject BLAKE2b_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_blake2.BLAKE2b", /*tp_name*/
+    sizeof(pycryptopp_hash),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    pycryptopp_hash_dealloc,   /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    BLAKE2b__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    pycryptopp_hash_methods,   /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    0,                         /* tp_init */
+    0,                         /* tp_alloc */
+    BLAKE2_new<CryptoPP::BLAKE2b>, /* tp_new */
+};
+
+static PyTypeObject BLAKE2s_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_blake2.BLAKE2s", /*tp_name*/
+    sizeof(pycryptopp_hash),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    pycryptopp_hash_dealloc,   /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    BLAKE2s__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    pycryptopp_hash_methods,   /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    0,                         /* tp_init */
+    0,                         /* tp_alloc */
+    BLAKE2_new<CryptoPP::BLAKE2s>, /* tp_new */
+};
+
+void
+init_blake2(PyObject* module) {
+    if (PyType_Ready(&BLAKE2b_type) < 0)
+        return;
+    Py_INCREF(&BLAKE2b_type);
+    PyModule_AddObject(module, "blake2_BLAKE2b", (PyObject *)&BLAKE2b_type);
+
+    if (PyType_Ready(&BLAKE2s_type) < 0)
+        return;
+    Py_INCREF(&BLAKE2s_type);
+    PyModule_AddObject(module, "blake2_BLAKE2s", (PyObject *)&BLAKE2s_type);
+
+    blake2_error = PyErr_NewException(const_cast<char*>("_blake2.Error"), NULL, NULL);
+    PyModule_AddObject(module, "blake2_Error", blake2_error);
+
+    PyModule_AddStringConstant(module, "blake2___doc__", const_cast<char*>(blake2___doc__));
+}
@@ -0,0 +1,7 @@
+#ifndef __INCL_BLAKE2MODULE_HPP
+#define __INCL_BLAKE2MODULE_HPP
+
+extern void
+init_blake2(PyObject* module);
+
+#endif /* #ifndef __INCL_BLAKE2MODULE_HPP */
@@ -0,0 +1,201 @@
+/**
+ * hashobject.cpp -- the Python hash object of the hash functions taken
+ * from Crypto++ (see hashobject.hpp)
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "hashobject.hpp"
+#include "../buffers.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/hex.h>
+#include <cryptopp/filters.h>
+#else
+#include <src-cryptopp/hex.h>
+#include <src-cryptopp/filters.h>
+#endif
+
+static PyObject *
+hash_digested_error(pycryptopp_hash* self) {
+    return PyErr_Format(self->error, "Precondition violation: once .digest() has been called you are required to never call .update() again.");
+}
+
+static int
+hash_update_view(void* context, Py_buffer* msg) {
+    pycryptopp_hash* self = reinterpret_cast<pycryptopp_hash*>(context);
+    bool digested;
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(*msg), msg->len,
+        /* Another thread may have finalized while we waited for the lock. */
+        digested = self->digest != NULL;
+        if (!digested)
+            self->h->Update(reinterpret_cast<const byte*>(msg->buf), msg->len));
+    if (digested) {
+        hash_digested_error(self);
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *
+hash_update(pycryptopp_hash* self, PyObject* msgobj) {
+    if (self->digest)
+        return hash_digested_error(self);
+
+    if (pycryptopp_pass_messages(msgobj, hash_update_view, self))
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(hash_update__doc__,
+"Update the hash object with the string msg. Repeated calls are equivalent to\n\
+a single call with the concatenation of all the messages.\n\
+\n\
+msg may be any object supporting the buffer protocol, such as a str,\n\
+bytearray, memoryview, array or mmap, or a list or tuple of such objects,\n\
+which is equivalent to calling .update() with each of them in turn.\n\
+\n\
+Large messages are hashed with the GIL released, so other Python threads can\n\
+run meanwhile. Concurrent calls on the same hash object are serialized, but\n\
+the items of a list are hashed one at a time, so those of lists passed to\n\
+concurrent calls may be interleaved.");
+
+static PyObject *
+hash_digest(pycryptopp_hash* self, PyObject* dummy) {
+    if (!self->digest) {
+        PyStringObject* digest = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, self->h->DigestSize()));
+        if (!digest)
+            return NULL;
+        ENTER_OBJECTLOCK(self);
+        /* Another thread may have finalized while we waited for the lock. */
+        if (!self->digest) {
+            self->h->Final(reinterpret_cast<byte*>(PyString_AS_STRING(digest)));
+            self->digest = digest;
+        } else
+            Py_DECREF(digest);
+        LEAVE_OBJECTLOCK(self);
+    }
+
+    Py_INCREF(self->digest);
+    return reinterpret_cast<PyObject*>(self->digest);
+}
+
+PyDoc_STRVAR(hash_digest__doc__,
+"Return the binary digest of the messages that were passed to the update()\n\
+method (including the initial message if any).");
+
+static PyObject *
+hash_hexdigest(pycryptopp_hash* self, PyObject* dummy) {
+    PyObject* digest = hash_digest(self, NULL);
+    if (!digest)
+        return NULL;
+    Py_ssize_t dsize = PyString_GET_SIZE(digest);
+    PyStringObject* hexdigest = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, dsize*2));
+    if (!hexdigest) {
+        Py_DECREF(digest);
+        return NULL;
+    }
+    CryptoPP::ArraySink* as = new CryptoPP::ArraySink(reinterpret_cast<byte*>(PyString_AS_STRING(hexdigest)), dsize*2);
+    CryptoPP::HexEncoder enc;
+    enc.Attach(as);
+    enc.Put(reinterpret_cast<const byte*>(PyString_AS_STRING(digest)), static_cast<size_t>(dsize));
+    Py_DECREF(digest); digest = NULL;
+
+    return reinterpret_cast<PyObject*>(hexdigest);
+}
+
+PyDoc_STRVAR(hash_hexdigest__doc__,
+"Return the hex-encoded digest of the messages that were passed to the update()\n\
+method (including the initial message if any).");
+
+static PyObject *
+hash_copy(pycryptopp_hash* self, PyObject* dummy) {
+    pycryptopp_hash* copy = reinterpret_cast<pycryptopp_hash*>(self->ob_type->tp_alloc(self->ob_type, 0));
+    if (!copy)
+        return NULL;
+    copy->h = NULL;
+    copy->clone = self->clone;
+    copy->error = self->error;
+    copy->digest = NULL;
+    copy->lock = NULL;
+    ENTER_OBJECTLOCK(self);
+    copy->h = self->clone(self->h);
+    copy->digest = self->digest;
+    Py_XINCREF(copy->digest);
+    LEAVE_OBJECTLOCK(self);
+    if (!copy->h) {
+        Py_DECREF(copy);
+        return PyErr_NoMemory();
+    }
+    return reinterpret_cast<PyObject*>(copy);
+}
+
+PyDoc_STRVAR(hash_copy__doc__,
+"Return a new hash object in the same state as this one, which can be updated\n\
+and finalized independently of it, without hashing the messages so far\n\
+again: hash a common prefix once and then copy() it for each message that\n\
+starts with it.");
+
+static PyObject *
+hash_digest_so_far(pycryptopp_hash* self, PyObject* dummy) {
+    if (self->digest)
+        return hash_digest(self, NULL);
+
+    PyStringObject* digest = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, self->h->DigestSize()));
+    if (!digest)
+        return NULL;
+    ENTER_OBJECTLOCK(self);
+    CryptoPP::HashTransformation* h = self->clone(self->h);
+    LEAVE_OBJECTLOCK(self);
+    if (!h) {
+        Py_DECREF(digest);
+        return PyErr_NoMemory();
+    }
+    h->Final(reinterpret_cast<byte*>(PyString_AS_STRING(digest)));
+    delete h;
+    return reinterpret_cast<PyObject*>(digest);
+}
+
+PyDoc_STRVAR(hash_digest_so_far__doc__,
+"Return the binary digest of the messages passed to the update() method so\n\
+far, without finalizing this hash object: it can still be updated, and\n\
+.digest_so_far() called again later. This is the same as .copy().digest().");
+
+PyMethodDef pycryptopp_hash_methods[] = {
+    {"update", reinterpret_cast<PyCFunction>(hash_update), METH_O, hash_update__doc__},
+    {"digest", reinterpret_cast<PyCFunction>(hash_digest), METH_NOARGS, hash_digest__doc__},
+    {"hexdigest", reinterpret_cast<PyCFunction>(hash_hexdigest), METH_NOARGS, hash_hexdigest__doc__},
+    {"copy", reinterpret_cast<PyCFunction>(hash_copy), METH_NOARGS, hash_copy__doc__},
+    {"digest_so_far", reinterpret_cast<PyCFunction>(hash_digest_so_far), METH_NOARGS, hash_digest_so_far__doc__},
+    {NULL},
+};
+
+int
+pycryptopp_hash_setup(pycryptopp_hash* self, CryptoPP::HashTransformation* h, CryptoPP::HashTransformation* (*clone)(const CryptoPP::HashTransformation*), PyObject* error, PyObject* msgobj) {
+    self->h = h;
+    self->clone = clone;
+    self->error = error;
+    self->digest = NULL;
+    self->lock = NULL;
+    if (!h) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    if (msgobj)
+        return pycryptopp_pass_messages(msgobj, hash_update_view, self);
+    return 0;
+}
+
+void
+pycryptopp_hash_dealloc(PyObject* obj) {
+    pycryptopp_hash* self = reinterpret_cast<pycryptopp_hash*>(obj);
+    Py_XDECREF(self->digest);
+    delete self->h;
+    FREE_OBJECTLOCK(self);
+    self->ob_type->tp_free(obj);
+}
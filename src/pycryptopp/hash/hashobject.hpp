@@ -0,0 +1,56 @@
+#ifndef __INCL_HASHOBJECT_HPP
+#define __INCL_HASHOBJECT_HPP
+
+/**
+ * hashobject.hpp -- the Python hash object of the hash functions taken
+ * from Crypto++ (SHA-512, BLAKE2b and BLAKE2s), with the same methods as
+ * sha256.SHA256: update(), digest(), hexdigest(), copy() and
+ * digest_so_far().
+ *
+ * Each module defines its own type, with a tp_new which makes the Crypto++
+ * object and calls pycryptopp_hash_setup(), and uses the rest of these
+ * functions for the rest of the type.
+ */
+
+#include "../objectlock.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/cryptlib.h>
+#else
+#include <src-cryptopp/cryptlib.h>
+#endif
+
+typedef struct {
+    PyObject_HEAD
+
+    /* internal */
+    CryptoPP::HashTransformation* h;
+    /* makes a copy of h, of the same class */
+    CryptoPP::HashTransformation* (*clone)(const CryptoPP::HashTransformation* h);
+    /* the Error of the module the type belongs to */
+    PyObject* error;
+    PyStringObject* digest;
+    PyThread_type_lock lock;
+} pycryptopp_hash;
+
+template <class H>
+CryptoPP::HashTransformation*
+pycryptopp_hash_clone(const CryptoPP::HashTransformation* h) {
+    return new H(*static_cast<const H*>(h));
+}
+
+/**
+ * Set up self, newly allocated by tp_new, to hash with h, which it takes
+ * ownership of (if h is NULL, self is left safe to deallocate), and hash
+ * msgobj if it is not NULL. Returns -1 with an exception set on failure.
+ */
+extern int
+pycryptopp_hash_setup(pycryptopp_hash* self, CryptoPP::HashTransformation* h, CryptoPP::HashTransformation* (*clone)(const CryptoPP::HashTransformation*), PyObject* error, PyObject* msgobj);
+
+extern PyMethodDef pycryptopp_hash_methods[];
+
+extern void
+pycryptopp_hash_dealloc(PyObject* self);
+
+#endif /* #ifndef __INCL_HASHOBJECT_HPP */
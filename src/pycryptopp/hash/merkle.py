@@ -0,0 +1,51 @@
+"""
+Complete binary SHA-256 hash trees, built and checked in native code.
+
+build() returns every node of the tree in one string, 32 bytes per node,
+laid out as in Tahoe-LAFS's hashtree.py; auth_path() extracts what is
+needed to prove that a leaf is in the tree, and verify_many() checks many
+such proofs at once.
+"""
+
+from pycryptopp import _import_my_names
+
+# These initializations to None are just to pacify pyflakes, which
+# doesn't understand that we have to do some funky import trickery
+# below in _import_my_names() in order to get sensible namespaces.
+build=None
+auth_path=None
+verify_many=None
+Error=None
+
+_import_my_names(globals(), "merkle_")
+
+del _import_my_names
+
+def verify(root, leaf, leafnum, path, tag=None, sha256d=False):
+    """
+    Return True if leaf is leaf leafnum of the tree with the given root,
+    according to its authentication path; see verify_many().
+    """
+    return verify_many(root, [leaf], [leafnum], [path], tag, sha256d)[0]
+
+def start_up_self_test():
+    """
+    A quick test intended to detect major errors such as the library being
+    miscompiled and segfaulting or returning incorrect answers, run on
+    import.
+    """
+    from pycryptopp.hash.sha256 import SHA256
+    def H(s):
+        return SHA256(s).digest()
+    leaves = [ H(chr(i)) for i in range(3) ]
+    empty = "\x00"*32
+    root = H(H(leaves[0] + leaves[1]) + H(leaves[2] + empty))
+    nodes = build(leaves)
+    if nodes[:32] != root or len(nodes) != 7*32:
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+    paths = [ auth_path(nodes, i) for i in range(3) ]
+    if verify_many(root, leaves, [0, 1, 2], paths) != [True, True, True] or \
+       verify_many(root, leaves, [1, 2, 0], paths) != [False, False, False]:
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+start_up_self_test()
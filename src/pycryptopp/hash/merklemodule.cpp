@@ -0,0 +1,564 @@
+/**
+ * merklemodule.cpp -- SHA-256 hash trees, built and checked in native code
+ *
+ * A tree with P leaves, P being a power of two, is kept as one string of
+ * 2P-1 32-byte nodes in the order used by Tahoe-LAFS's hashtree.py: the root
+ * is node 0 and the children of node i are nodes 2i+1 and 2i+2, so leaf j is
+ * node P-1+j. Each row of the tree is hashed with pycryptopp_sha256_many(),
+ * several nodes at a time.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include <stdio.h>
+#include <string.h>
+
+#include "merklemodule.hpp"
+#include "sha256core.hpp"
+#include "../buffers.hpp"
+#include "../objectlock.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+static const char*const merkle___doc__ = "_merkle hash trees";
+
+static PyObject *merkle_error;
+
+/* How many nodes are hashed with each call of pycryptopp_sha256_many(). */
+#define CHUNK 256
+
+/* The longest decimal number of an empty leaf. */
+#define MAX_DIGITS 20
+
+/* How the nodes of a tree are hashed: SHA-256 (applied twice if sha256d)
+   of left+right, or, if there is a tag, of
+   netstring(tag)+netstring(left)+netstring(right), where netstring(s) is
+   "%d:%s," % (len(s), s). With an empty leaf tag, the leaves added to make
+   the number of leaves a power of two are the hashes of
+   netstring(empty_leaf_tag)+str(j), j being the number of the leaf; without
+   one they are all zeroes. */
+typedef struct {
+    bool sha256d;
+    /* netstring(tag)+"32:", or nothing */
+    byte* prefix;
+    size_t prefixsize;
+    /* netstring(empty_leaf_tag), or nothing */
+    byte* empty_prefix;
+    size_t empty_prefixsize;
+    bool has_empty_leaf_tag;
+
+    /* room for CHUNK messages, and their digests if sha256d */
+    byte* scratch;
+    size_t msgsize;
+    const byte* msgs[CHUNK];
+    size_t lens[CHUNK];
+    byte digests[32*CHUNK];
+} node_hasher;
+
+static byte*
+make_netstring(const char* s, size_t len, const char* suffix, size_t* size) {
+    char header[32];
+    const int headersize = sprintf(header, "%lu:", static_cast<unsigned long>(len));
+    const size_t suffixsize = strlen(suffix);
+    *size = headersize + len + 1 + suffixsize;
+    byte* result = reinterpret_cast<byte*>(PyMem_Malloc(*size));
+    if (result) {
+        memcpy(result, header, headersize);
+        memcpy(result + headersize, s, len);
+        result[headersize + len] = ',';
+        memcpy(result + headersize + len + 1, suffix, suffixsize);
+    }
+    return result;
+}
+
+/* Set h up. Returns -1 with an exception set on failure; either way, call
+   node_hasher_free() afterwards. */
+static int
+node_hasher_init(node_hasher* h, const char* tag, Py_ssize_t tagsize, const char* empty_leaf_tag, Py_ssize_t empty_leaf_tagsize, PyObject* sha256dobj) {
+    memset(h, 0, sizeof(*h));
+    const int sha256d = sha256dobj ? PyObject_IsTrue(sha256dobj) : 0;
+    if (sha256d < 0)
+        return -1;
+    h->sha256d = sha256d;
+    if (tag && !(h->prefix = make_netstring(tag, tagsize, "32:", &h->prefixsize))) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    h->has_empty_leaf_tag = empty_leaf_tag != NULL;
+    if (empty_leaf_tag && !(h->empty_prefix = make_netstring(empty_leaf_tag, empty_leaf_tagsize, "", &h->empty_prefixsize))) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    h->msgsize = CryptoPP::STDMAX(h->prefixsize + 32 + 4 + 32 + 1, h->empty_prefixsize + MAX_DIGITS);
+    if (!(h->scratch = reinterpret_cast<byte*>(PyMem_Malloc(CHUNK * h->msgsize)))) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    return 0;
+}
+
+static void
+node_hasher_free(node_hasher* h) {
+    PyMem_Free(h->prefix);
+    PyMem_Free(h->empty_prefix);
+    PyMem_Free(h->scratch);
+}
+
+/* Hash the n messages in h->msgs, writing the results to out. */
+static void
+node_hasher_run(node_hasher* h, size_t n, byte* out) {
+    if (h->sha256d) {
+        pycryptopp_sha256_many(h->msgs, h->lens, n, h->digests);
+        for (size_t k = 0; k < n; k++) {
+            h->msgs[k] = h->digests + 32*k;
+            h->lens[k] = 32;
+        }
+    }
+    pycryptopp_sha256_many(h->msgs, h->lens, n, out);
+}
+
+/* Hash the n pairs of nodes lefts[k], rights[k], writing the parents to
+   out. */
+static void
+hash_pairs(node_hasher* h, const byte* const* lefts, const byte* const* rights, size_t n, byte* out) {
+    for (size_t start = 0; start < n; start += CHUNK) {
+        const size_t count = CryptoPP::STDMIN(n - start, static_cast<size_t>(CHUNK));
+        for (size_t k = 0; k < count; k++) {
+            byte* msg = h->scratch + k*h->msgsize;
+            byte* p = msg;
+            if (h->prefix) {
+                memcpy(p, h->prefix, h->prefixsize);
+                p += h->prefixsize;
+                memcpy(p, lefts[start+k], 32);
+                memcpy(p + 32, ",32:", 4);
+                memcpy(p + 36, rights[start+k], 32);
+                p[68] = ',';
+                p += 69;
+            } else {
+                memcpy(p, lefts[start+k], 32);
+                memcpy(p + 32, rights[start+k], 32);
+                p += 64;
+            }
+            h->msgs[k] = msg;
+            h->lens[k] = p - msg;
+        }
+        node_hasher_run(h, count, out + 32*start);
+    }
+}
+
+/* Write the empty leaves first to first+n-1 to out. */
+static void
+hash_empty_leaves(node_hasher* h, size_t first, size_t n, byte* out) {
+    if (!h->has_empty_leaf_tag) {
+        memset(out, 0, 32*n);
+        return;
+    }
+    for (size_t start = 0; start < n; start += CHUNK) {
+        const size_t count = CryptoPP::STDMIN(n - start, static_cast<size_t>(CHUNK));
+        for (size_t k = 0; k < count; k++) {
+            byte* msg = h->scratch + k*h->msgsize;
+            memcpy(msg, h->empty_prefix, h->empty_prefixsize);
+            char digits[MAX_DIGITS+1];
+            const int ndigits = sprintf(digits, "%lu", static_cast<unsigned long>(first + start + k));
+            memcpy(msg + h->empty_prefixsize, digits, ndigits);
+            h->msgs[k] = msg;
+            h->lens[k] = h->empty_prefixsize + ndigits;
+        }
+        node_hasher_run(h, count, out + 32*start);
+    }
+}
+
+/* Fill in the tree of P leaves at nodes, whose first n leaves are already
+   there. lefts and rights have room for P/2 pointers each. */
+static void
+build_tree(node_hasher* h, byte* nodes, size_t P, size_t n, const byte** lefts, const byte** rights) {
+    hash_empty_leaves(h, n, P - n, nodes + 32*(P-1+n));
+    for (size_t m = P; m > 1; m /= 2) {
+        /* the m nodes of this row start at node m-1, and their parents at
+           node m/2-1 */
+        const byte* row = nodes + 32*(m-1);
+        for (size_t k = 0; k < m/2; k++) {
+            lefts[k] = row + 64*k;
+            rights[k] = row + 64*k + 32;
+        }
+        hash_pairs(h, lefts, rights, m/2, nodes + 32*(m/2-1));
+    }
+}
+
+/* Take apart obj, which is a list or tuple of n strings of size bytes each
+   or one buffer holding them, copying them to a new array which the caller
+   must PyMem_Free(). If n is negative it is set to the number of records.
+   Returns NULL with an exception set on failure. */
+static byte*
+copy_records(PyObject* obj, size_t size, Py_ssize_t* n, const char* name) {
+    byte* result = NULL;
+    if (PyList_Check(obj) || PyTuple_Check(obj)) {
+        PyObject* items = PySequence_Tuple(obj);
+        if (!items)
+            return NULL;
+        const Py_ssize_t count = PyTuple_GET_SIZE(items);
+        if (*n >= 0 && count != *n)
+            PyErr_Format(merkle_error, "Precondition violation: %s is required to have %zd items, but it had %zd.", name, *n, count);
+        else if (!(result = reinterpret_cast<byte*>(PyMem_Malloc(count*size + 1))))
+            PyErr_NoMemory();
+        else {
+            for (Py_ssize_t i = 0; i < count; i++) {
+                Py_buffer view;
+                if (pycryptopp_get_read_buffer(PyTuple_GET_ITEM(items, i), &view, merkle_error)) {
+                    PyMem_Free(result);
+                    result = NULL;
+                    break;
+                }
+                const bool ok = static_cast<size_t>(view.len) == size;
+                if (ok)
+                    memcpy(result + i*size, view.buf, size);
+                else
+                    PyErr_Format(merkle_error, "Precondition violation: each item of %s is required to be %zu bytes long, but %s[%zd] was %zd bytes.", name, size, name, i, view.len);
+                PyBuffer_Release(&view);
+                if (!ok) {
+                    PyMem_Free(result);
+                    result = NULL;
+                    break;
+                }
+            }
+            *n = count;
+        }
+        Py_DECREF(items);
+        return result;
+    }
+
+    Py_buffer view;
+    if (pycryptopp_get_read_buffer(obj, &view, merkle_error))
+        return NULL;
+    if ((*n >= 0 && static_cast<size_t>(view.len) != *n * size) || (*n < 0 && view.len % size))
+        PyErr_Format(merkle_error, "Precondition violation: %s is required to be a list or tuple of %zu-byte strings, or one buffer holding them, but it was a buffer of %zd bytes.", name, size, view.len);
+    else if (!(result = reinterpret_cast<byte*>(PyMem_Malloc(view.len + 1))))
+        PyErr_NoMemory();
+    else {
+        memcpy(result, view.buf, view.len);
+        if (*n < 0)
+            *n = view.len / size;
+    }
+    PyBuffer_Release(&view);
+    return result;
+}
+
+/* The number of leaves of a tree of len bytes, or 0 if there is no such
+   tree. */
+static size_t
+tree_leaves(Py_ssize_t len) {
+    if (len <= 0 || len % 32)
+        return 0;
+    const size_t P = (len / 32 + 1) / 2;
+    if (P & (P - 1) || 32*(2*P - 1) != static_cast<size_t>(len))
+        return 0;
+    return P;
+}
+
+PyObject *
+merkle_build(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "leaves", "tag", "empty_leaf_tag", "sha256d", NULL };
+    PyObject* leaves;
+    const char* tag = NULL;
+    Py_ssize_t tagsize = 0;
+    const char* empty_leaf_tag = NULL;
+    Py_ssize_t empty_leaf_tagsize = 0;
+    PyObject* sha256dobj = NULL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "O|z#z#O:build", const_cast<char**>(kwlist), &leaves, &tag, &tagsize, &empty_leaf_tag, &empty_leaf_tagsize, &sha256dobj))
+        return NULL;
+
+    PyObject* result = NULL;
+    Py_ssize_t n = -1;
+    const byte** lefts = NULL;
+    const byte** rights = NULL;
+    node_hasher h;
+    byte* leafdata = copy_records(leaves, 32, &n, "leaves");
+    if (node_hasher_init(&h, tag, tagsize, empty_leaf_tag, empty_leaf_tagsize, sha256dobj) || !leafdata)
+        goto done;
+    if (n == 0) {
+        PyErr_Format(merkle_error, "Precondition violation: a tree is required to have at least one leaf.");
+        goto done;
+    }
+
+    {
+        size_t P = 1;
+        while (P < static_cast<size_t>(n))
+            P *= 2;
+        lefts = PyMem_New(const byte*, P/2 + 1);
+        rights = PyMem_New(const byte*, P/2 + 1);
+        if (!lefts || !rights) {
+            PyErr_NoMemory();
+            goto done;
+        }
+        if (!(result = PyString_FromStringAndSize(NULL, 32*(2*P-1))))
+            goto done;
+        byte* nodes = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+        memcpy(nodes + 32*(P-1), leafdata, 32*n);
+        if (32*P >= PYCRYPTOPP_GIL_MINSIZE) {
+            Py_BEGIN_ALLOW_THREADS
+            build_tree(&h, nodes, P, n, lefts, rights);
+            Py_END_ALLOW_THREADS
+        } else
+            build_tree(&h, nodes, P, n, lefts, rights);
+    }
+
+ done:
+    PyMem_Free(leafdata);
+    PyMem_Free(lefts);
+    PyMem_Free(rights);
+    node_hasher_free(&h);
+    return result;
+}
+
+const char*const merkle_build__doc__ = "\
+build(leaves, tag=None, empty_leaf_tag=None, sha256d=False)\n\
+\n\
+Build the complete binary hash tree over leaves, and return all of its\n\
+nodes as one string of 32 bytes per node, the root first: the children of\n\
+node i are nodes 2i+1 and 2i+2, so with P leaves (after padding) the root\n\
+is string[:32] and leaf j is node P-1+j. The hashing is done with the GIL\n\
+released, several nodes at a time (see sha256.hash_many()).\n\
+\n\
+If the number of leaves is not a power of two, empty leaves are added to\n\
+make it one.\n\
+\n\
+@param leaves: a list or tuple of 32-byte leaf hashes, or one buffer\n\
+    holding them\n\
+@param tag: if given, each node is the hash of\n\
+    netstring(tag)+netstring(left)+netstring(right) rather than of\n\
+    left+right, where netstring(s) is \"%d:%s,\" % (len(s), s)\n\
+@param empty_leaf_tag: if given, empty leaf j is the hash of\n\
+    netstring(empty_leaf_tag)+str(j); otherwise it is 32 zero bytes\n\
+@param sha256d: if true, each hash is SHA-256 applied twice\n\
+\n\
+Tahoe-LAFS's hash trees are build(leaves, tag=\"Merkle tree internal node\",\n\
+empty_leaf_tag=\"Merkle tree empty leaf\", sha256d=True).";
+
+PyObject *
+merkle_auth_path(PyObject *dummy, PyObject *args) {
+    const char* nodes;
+    Py_ssize_t nodessize;
+    Py_ssize_t leafnum;
+    if (!PyArg_ParseTuple(args, "t#n:auth_path", &nodes, &nodessize, &leafnum))
+        return NULL;
+    const size_t P = tree_leaves(nodessize);
+    if (!P)
+        return PyErr_Format(merkle_error, "Precondition violation: nodes is required to be a tree made by build(), but it was %zd bytes long.", nodessize);
+    if (leafnum < 0 || static_cast<size_t>(leafnum) >= P)
+        return PyErr_Format(merkle_error, "Precondition violation: leafnum is required to be at least 0 and less than the %zu leaves of the tree, but it was %zd.", P, leafnum);
+
+    size_t depth = 0;
+    for (size_t m = P; m > 1; m /= 2)
+        depth++;
+    PyObject* result = PyString_FromStringAndSize(NULL, 32*depth);
+    if (!result)
+        return NULL;
+    char* out = PyString_AS_STRING(result);
+    for (size_t i = P - 1 + leafnum; i > 0; i = (i - 1) / 2, out += 32) {
+        const size_t sibling = i % 2 ? i + 1 : i - 1;
+        memcpy(out, nodes + 32*sibling, 32);
+    }
+    return result;
+}
+
+const char*const merkle_auth_path__doc__ = "\
+auth_path(nodes, leafnum)\n\
+\n\
+Return the authentication path of leaf leafnum of the tree nodes made by\n\
+build(): the siblings of the nodes from the leaf up to (but not including)\n\
+the root, 32 bytes each, starting with the sibling of the leaf. This is\n\
+what verify_many() needs, with the leaf and the root, to check that the\n\
+leaf is in the tree.";
+
+/* Replace the n nodes at cur, which are nodes idx[0], ..., idx[n-1] of
+   their trees, with their parents, given their siblings. */
+static void
+verify_level(node_hasher* h, byte* cur, size_t* idx, const byte* const* siblings, size_t n, const byte** lefts, const byte** rights, byte* next) {
+    for (size_t k = 0; k < n; k++) {
+        if (idx[k] % 2) {
+            lefts[k] = cur + 32*k;
+            rights[k] = siblings[k];
+        } else {
+            lefts[k] = siblings[k];
+            rights[k] = cur + 32*k;
+        }
+        idx[k] = (idx[k] - 1) / 2;
+    }
+    hash_pairs(h, lefts, rights, n, next);
+    memcpy(cur, next, 32*n);
+}
+
+typedef struct {
+    node_hasher* h;
+    size_t n;
+    size_t depth;
+    byte* cur;
+    size_t* idx;
+    const byte* paths;
+    const byte** siblings;
+    const byte** lefts;
+    const byte** rights;
+    byte* next;
+} verify_job;
+
+static void
+verify_run(verify_job* j) {
+    for (size_t level = 0; level < j->depth; level++) {
+        for (size_t k = 0; k < j->n; k++)
+            j->siblings[k] = j->paths + 32*(k*j->depth + level);
+        verify_level(j->h, j->cur, j->idx, j->siblings, j->n, j->lefts, j->rights, j->next);
+    }
+}
+
+PyObject *
+merkle_verify_many(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "root", "leaves", "leafnums", "paths", "tag", "sha256d", NULL };
+    const char* root;
+    Py_ssize_t rootsize;
+    PyObject* leaves;
+    PyObject* leafnumsobj;
+    PyObject* pathsobj;
+    const char* tag = NULL;
+    Py_ssize_t tagsize = 0;
+    PyObject* sha256dobj = NULL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#OOO|z#O:verify_many", const_cast<char**>(kwlist), &root, &rootsize, &leaves, &leafnumsobj, &pathsobj, &tag, &tagsize, &sha256dobj))
+        return NULL;
+    if (rootsize != 32)
+        return PyErr_Format(merkle_error, "Precondition violation: root is required to be 32 bytes long, but it was %zd bytes.", rootsize);
+
+    PyObject* result = NULL;
+    PyObject* leafnums = NULL;
+    byte* cur = NULL;
+    byte* paths = NULL;
+    size_t* idx = NULL;
+    const byte** siblings = NULL;
+    const byte** lefts = NULL;
+    const byte** rights = NULL;
+    byte* next = NULL;
+    Py_ssize_t n = -1;
+    Py_ssize_t i;
+    size_t depth = 0;
+    node_hasher h;
+    if (node_hasher_init(&h, tag, tagsize, NULL, 0, sha256dobj))
+        goto done;
+
+    /* a snapshot, since converting an item to an integer can run Python
+       code which changes a list */
+    if (!(leafnums = PySequence_Tuple(leafnumsobj)))
+        goto done;
+    n = PyTuple_GET_SIZE(leafnums);
+
+    /* the paths are all as long as each other, and say how deep the tree is */
+    if (n) {
+        Py_ssize_t pathsize;
+        if (PyList_Check(pathsobj) || PyTuple_Check(pathsobj)) {
+            if (PySequence_Size(pathsobj) != n) {
+                PyErr_Format(merkle_error, "Precondition violation: paths is required to have %zd items, but it had %zd.", n, PySequence_Size(pathsobj));
+                goto done;
+            }
+            PyObject* first = PySequence_GetItem(pathsobj, 0);
+            if (!first)
+                goto done;
+            pathsize = PyObject_Length(first);
+            Py_DECREF(first);
+            if (pathsize < 0)
+                goto done;
+        } else {
+            pathsize = PyObject_Length(pathsobj);
+            if (pathsize < 0)
+                goto done;
+            pathsize /= n;
+        }
+        if (pathsize % 32 || pathsize / 32 >= static_cast<Py_ssize_t>(8*sizeof(size_t))) {
+            PyErr_Format(merkle_error, "Precondition violation: each path is required to be a whole number of 32-byte hashes, as made by auth_path(), but it was %zd bytes.", pathsize);
+            goto done;
+        }
+        depth = pathsize / 32;
+    }
+
+    if (!(cur = copy_records(leaves, 32, &n, "leaves")))
+        goto done;
+    if (!(paths = copy_records(pathsobj, 32*depth, &n, "paths")))
+        goto done;
+    idx = PyMem_New(size_t, n+1);
+    siblings = PyMem_New(const byte*, n+1);
+    lefts = PyMem_New(const byte*, n+1);
+    rights = PyMem_New(const byte*, n+1);
+    next = reinterpret_cast<byte*>(PyMem_Malloc(32*n + 1));
+    if (!idx || !siblings || !lefts || !rights || !next) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    for (i = 0; i < n; i++) {
+        const Py_ssize_t leafnum = PyNumber_AsSsize_t(PyTuple_GET_ITEM(leafnums, i), PyExc_OverflowError);
+        if (leafnum == -1 && PyErr_Occurred())
+            goto done;
+        if (leafnum < 0 || (leafnum >> depth) != 0) {
+            PyErr_Format(merkle_error, "Precondition violation: each leaf number is required to be at least 0 and less than the %lu leaves of a tree with paths of %lu hashes, but leafnums[%zd] was %zd.", 1UL << depth, static_cast<unsigned long>(depth), i, leafnum);
+            goto done;
+        }
+        idx[i] = (static_cast<size_t>(1) << depth) - 1 + leafnum;
+    }
+
+    {
+        verify_job job = { &h, static_cast<size_t>(n), depth, cur, idx, paths, siblings, lefts, rights, next };
+        if (32*n*(depth+1) >= PYCRYPTOPP_GIL_MINSIZE) {
+            Py_BEGIN_ALLOW_THREADS
+            verify_run(&job);
+            Py_END_ALLOW_THREADS
+        } else
+            verify_run(&job);
+    }
+
+    if (!(result = PyList_New(n)))
+        goto done;
+    for (i = 0; i < n; i++) {
+        PyObject* ok = CryptoPP::VerifyBufsEqual(cur + 32*i, reinterpret_cast<const byte*>(root), 32) ? Py_True : Py_False;
+        Py_INCREF(ok);
+        PyList_SET_ITEM(result, i, ok);
+    }
+
+ done:
+    Py_XDECREF(leafnums);
+    PyMem_Free(cur);
+    PyMem_Free(paths);
+    PyMem_Free(idx);
+    PyMem_Free(siblings);
+    PyMem_Free(lefts);
+    PyMem_Free(rights);
+    PyMem_Free(next);
+    node_hasher_free(&h);
+    return result;
+}
+
+const char*const merkle_verify_many__doc__ = "\
+verify_many(root, leaves, leafnums, paths, tag=None, sha256d=False)\n\
+\n\
+Check many leaves of one tree at once, given the root of the tree and the\n\
+authentication path of each leaf, as made by auth_path(). Return a list with\n\
+True for each leaf that is leaf leafnums[i] of the tree with that root, and\n\
+False for each that is not. tag and sha256d are as for build(). The leaves\n\
+are checked together, a level of the tree at a time, with the GIL released.\n\
+\n\
+@param leaves: a list or tuple of 32-byte leaf hashes, or one buffer\n\
+    holding them\n\
+@param leafnums: a sequence of the number of each leaf in the tree\n\
+@param paths: a list or tuple of the authentication path of each leaf, all\n\
+    of the same length, or one buffer holding them";
+
+void
+init_merkle(PyObject* module) {
+    merkle_error = PyErr_NewException(const_cast<char*>("_merkle.Error"), NULL, NULL);
+    PyModule_AddObject(module, "merkle_Error", merkle_error);
+
+    PyModule_AddStringConstant(module, "merkle___doc__", const_cast<char*>(merkle___doc__));
+}
@@ -0,0 +1,19 @@
+#ifndef __INCL_MERKLEMODULE_HPP
+#define __INCL_MERKLEMODULE_HPP
+
+extern void
+init_merkle(PyObject* module);
+
+extern PyObject *
+merkle_build(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const merkle_build__doc__;
+
+extern PyObject *
+merkle_auth_path(PyObject *dummy, PyObject *args);
+extern const char*const merkle_auth_path__doc__;
+
+extern PyObject *
+merkle_verify_many(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const merkle_verify_many__doc__;
+
+#endif /* #ifndef __INCL_MERKLEMODULE_HPP */
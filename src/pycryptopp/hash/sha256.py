@@ -4,7 +4,14 @@ from pycryptopp import _import_my_names
 # doesn't understand that we have to do some funky import trickery
 # below in _import_my_names() in order to get sensible namespaces.
 SHA256=None
+TaggedHasher=None
 Error=None
+hash_many=None
+hash_file=None
+simd_width=None
+_set_simd_width=None
+implementations=None
+_set_implementation=None
 
 _import_my_names(globals(), "sha256_")
 
@@ -29,6 +36,16 @@ def start_up_self_test():
     different length inputs.) This one is recursive so that there
     is a single fixed result that we expect.
     """
+    # Each implementation of the compression function (see
+    # implementations()) is checked on its own.
+    for impl in implementations():
+        previous = _set_implementation(impl)
+        try:
+            _self_test_implementation()
+        finally:
+            _set_implementation(previous)
+
+def _self_test_implementation():
     hx = SHA256()
     s = ''.join([ chr(c) for c in range(65) ])
     for i in range(0, 65):
@@ -40,4 +57,23 @@ def start_up_self_test():
     if hx.hexdigest().lower() != '5191c7841dd4e16aa454d40af924585dffc67157ffdbfd0236acddd07901629d':
         raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
 
+    # hash_many() has its own implementation for each number of messages
+    # this processor can hash at once (see simd_width()), each of which is
+    # checked against SHA256 objects, with messages of every length up to a
+    # little over two blocks.
+    # So is TaggedHasher.hash_many(), with a tag leaving part of a block
+    # to be hashed with each message.
+    msgs = [ s[:i] + s[:i % 65] for i in range(131) ]
+    expected = ''.join([ SHA256(msg).digest() for msg in msgs ])
+    tagged = TaggedHasher(s[:40])
+    expected_tagged = ''.join([ SHA256("40:" + s[:40] + "," + msg).digest() for msg in msgs ])
+    for width in [1, 4, 8]:
+        if width <= simd_width():
+            previous = _set_simd_width(width)
+            try:
+                if hash_many(msgs) != expected or tagged.hash_many(msgs) != expected_tagged:
+                    raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+            finally:
+                _set_simd_width(previous)
+
 start_up_self_test()
@@ -0,0 +1,669 @@
+/**
+ * sha256core.cpp -- SHA-256, one message at a time with the SHA extensions
+ * or the AVX2 message schedule, or 1, 4 or 8 messages at once
+ *
+ * The SHA extensions do four rounds (sha256rnds2, twice) and most of the
+ * message schedule (sha256msg1, sha256msg2) in a few instructions. Without
+ * them, AVX2 can still compute the message schedule of two blocks at once,
+ * four words of each at a time, leaving only the rounds to scalar code.
+ *
+ * The vector versions hold the same word of the state (and of the message
+ * schedule) of four (SSE2, NEON) or eight (AVX2) different messages in the
+ * lanes of one register, so that every instruction works on all of the
+ * messages. The blocks are transposed into that form as they are loaded.
+ * Messages of different lengths share a group of lanes: a lane whose
+ * message has run out is given a block of zeroes, and its state is put
+ * back afterwards.
+ */
+
+#include <string.h>
+
+#include "sha256core.hpp"
+#include "../simd.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+#include <emmintrin.h>
+#include <immintrin.h>
+#endif
+#if defined(PYCRYPTOPP_NEON)
+#include <arm_neon.h>
+#endif
+
+using CryptoPP::word32;
+using CryptoPP::word64;
+
+unsigned pycryptopp_sha256_impl = PYCRYPTOPP_SHA256_PORTABLE;
+unsigned pycryptopp_sha256_width = 1;
+
+const word32 pycryptopp_sha256_iv[8] = {
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+};
+
+static const word32 K[64] = {
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+};
+
+static inline word32
+load_be32(const byte* p) {
+    return CryptoPP::GetWord<word32>(false, CryptoPP::BIG_ENDIAN_ORDER, p);
+}
+
+static inline void
+store_be32(byte* p, word32 v) {
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, p, v);
+}
+
+/* Eight rounds, starting with round i, after which the working variables
+   are back where they started. */
+#define EIGHT_ROUNDS(R, i) \
+    R(a, b, c, d, e, f, g, h, i); \
+    R(h, a, b, c, d, e, f, g, i+1); \
+    R(g, h, a, b, c, d, e, f, i+2); \
+    R(f, g, h, a, b, c, d, e, i+3); \
+    R(e, f, g, h, a, b, c, d, i+4); \
+    R(d, e, f, g, h, a, b, c, i+5); \
+    R(c, d, e, f, g, h, a, b, i+6); \
+    R(b, c, d, e, f, g, h, a, i+7);
+
+#define ROTR32(v, n) (((v) >> (n)) | ((v) << (32 - (n))))
+#define CH(x, y, z) ((z) ^ ((x) & ((y) ^ (z))))
+#define MAJ(x, y, z) (((x) & (y)) | ((z) & ((x) | (y))))
+#define BSIG0(x) (ROTR32(x, 2) ^ ROTR32(x, 13) ^ ROTR32(x, 22))
+#define BSIG1(x) (ROTR32(x, 6) ^ ROTR32(x, 11) ^ ROTR32(x, 25))
+#define SSIG0(x) (ROTR32(x, 7) ^ ROTR32(x, 18) ^ ((x) >> 3))
+#define SSIG1(x) (ROTR32(x, 17) ^ ROTR32(x, 19) ^ ((x) >> 10))
+
+#define ROUND(a, b, c, d, e, f, g, h, i) \
+    t1 = h + BSIG1(e) + CH(e, f, g) + K[i] + w[i]; \
+    d += t1; \
+    h = t1 + BSIG0(a) + MAJ(a, b, c);
+
+/* A round where wk[i] already holds K[i] + w[i]. */
+#define WK_ROUND(a, b, c, d, e, f, g, h, i) \
+    t1 = h + BSIG1(e) + CH(e, f, g) + wk[i]; \
+    d += t1; \
+    h = t1 + BSIG0(a) + MAJ(a, b, c);
+
+static void
+sha256_compress_portable(word32* state, const byte* blocks, size_t nblocks) {
+    word32 w[64];
+    for (; nblocks; nblocks--, blocks += 64) {
+        for (int i = 0; i < 16; i++)
+            w[i] = load_be32(blocks + 4*i);
+        for (int i = 16; i < 64; i++)
+            w[i] = SSIG1(w[i-2]) + w[i-7] + SSIG0(w[i-15]) + w[i-16];
+
+        word32 a = state[0], b = state[1], c = state[2], d = state[3];
+        word32 e = state[4], f = state[5], g = state[6], h = state[7];
+        word32 t1;
+        for (int i = 0; i < 64; i += 8) {
+            EIGHT_ROUNDS(ROUND, i);
+        }
+        state[0] += a; state[1] += b; state[2] += c; state[3] += d;
+        state[4] += e; state[5] += f; state[6] += g; state[7] += h;
+    }
+}
+
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+
+/* The 64 rounds of one block, given the message schedule plus the round
+   constants. */
+static inline void
+sha256_rounds(word32* state, const word32* wk) {
+    word32 a = state[0], b = state[1], c = state[2], d = state[3];
+    word32 e = state[4], f = state[5], g = state[6], h = state[7];
+    word32 t1;
+    for (int i = 0; i < 64; i += 8) {
+        EIGHT_ROUNDS(WK_ROUND, i);
+    }
+    state[0] += a; state[1] += b; state[2] += c; state[3] += d;
+    state[4] += e; state[5] += f; state[6] += g; state[7] += h;
+}
+
+#define AVX2_SCHED_ROTR(v, n) _mm256_or_si256(_mm256_srli_epi32(v, n), _mm256_slli_epi32(v, 32 - (n)))
+#define AVX2_SCHED_SSIG0(x) _mm256_xor_si256(_mm256_xor_si256(AVX2_SCHED_ROTR(x, 7), AVX2_SCHED_ROTR(x, 18)), _mm256_srli_epi32(x, 3))
+#define AVX2_SCHED_SSIG1(x) _mm256_xor_si256(_mm256_xor_si256(AVX2_SCHED_ROTR(x, 17), AVX2_SCHED_ROTR(x, 19)), _mm256_srli_epi32(x, 10))
+
+/* Store four words of K + w for each of the two blocks, from the low and
+   high halves of x. */
+PYCRYPTOPP_AVX2_TARGET static inline void
+store_wk_avx2(word32 (*wk)[64], int i, __m256i x) {
+    const __m128i k = _mm_loadu_si128(reinterpret_cast<const __m128i*>(K + i));
+    x = _mm256_add_epi32(x, _mm256_inserti128_si256(_mm256_castsi128_si256(k), k, 1));
+    _mm_storeu_si128(reinterpret_cast<__m128i*>(wk[0] + i), _mm256_castsi256_si128(x));
+    _mm_storeu_si128(reinterpret_cast<__m128i*>(wk[1] + i), _mm256_extracti128_si256(x, 1));
+}
+
+/* The message schedule of two blocks at a time, one in each half of the
+   registers, four words of it at a time. Words i-2 and i-1 are needed for
+   words i and i+1, which are needed for words i+2 and i+3, so SSIG1 is done
+   in two steps. */
+PYCRYPTOPP_AVX2_TARGET static void
+sha256_compress_avx2(word32* state, const byte* blocks, size_t nblocks) {
+    const __m256i bswap = _mm256_set_epi8(12,13,14,15, 8,9,10,11, 4,5,6,7, 0,1,2,3,
+                                          12,13,14,15, 8,9,10,11, 4,5,6,7, 0,1,2,3);
+    word32 wk[2][64];
+    while (nblocks) {
+        /* a lone last block is done twice over, and the second copy of it
+           ignored */
+        const byte* second = nblocks >= 2 ? blocks + 64 : blocks;
+        __m256i x[4];
+        for (int q = 0; q < 4; q++) {
+            const __m128i lo = _mm_loadu_si128(reinterpret_cast<const __m128i*>(blocks + 16*q));
+            const __m128i hi = _mm_loadu_si128(reinterpret_cast<const __m128i*>(second + 16*q));
+            x[q] = _mm256_shuffle_epi8(_mm256_inserti128_si256(_mm256_castsi128_si256(lo), hi, 1), bswap);
+            store_wk_avx2(wk, 4*q, x[q]);
+        }
+        for (int i = 16; i < 64; i += 4) {
+            /* x[0], ..., x[3] hold words i-16 to i-1 */
+            const __m256i w15 = _mm256_alignr_epi8(x[1], x[0], 4);
+            const __m256i w7 = _mm256_alignr_epi8(x[3], x[2], 4);
+            __m256i n = _mm256_add_epi32(_mm256_add_epi32(x[0], AVX2_SCHED_SSIG0(w15)), w7);
+            n = _mm256_add_epi32(n, AVX2_SCHED_SSIG1(_mm256_srli_si256(x[3], 8)));
+            n = _mm256_add_epi32(n, AVX2_SCHED_SSIG1(_mm256_slli_si256(n, 8)));
+            x[0] = x[1]; x[1] = x[2]; x[2] = x[3]; x[3] = n;
+            store_wk_avx2(wk, i, n);
+        }
+        sha256_rounds(state, wk[0]);
+        if (nblocks == 1)
+            break;
+        sha256_rounds(state, wk[1]);
+        nblocks -= 2;
+        blocks += 128;
+    }
+    CryptoPP::SecureWipeArray(&wk[0][0], 128);
+}
+
+#endif /* #if defined(PYCRYPTOPP_SSE2_TARGET) */
+
+#if defined(PYCRYPTOPP_SHANI_TARGET)
+
+/* Four rounds with the SHA extensions, given K + w for them in msg. */
+#define SHANI_ROUNDS(msg) \
+    state1 = _mm_sha256rnds2_epu32(state1, state0, msg); \
+    state0 = _mm_sha256rnds2_epu32(state0, state1, _mm_shuffle_epi32(msg, 0x0e));
+
+PYCRYPTOPP_SHANI_TARGET static void
+sha256_compress_shani(word32* state, const byte* blocks, size_t nblocks) {
+    const __m128i bswap = _mm_set_epi64x(0x0c0d0e0f08090a0bULL, 0x0405060700010203ULL);
+
+    /* sha256rnds2 wants the state as ABEF and CDGH */
+    __m128i tmp = _mm_shuffle_epi32(_mm_loadu_si128(reinterpret_cast<const __m128i*>(state)), 0xb1);
+    __m128i state1 = _mm_shuffle_epi32(_mm_loadu_si128(reinterpret_cast<const __m128i*>(state + 4)), 0x1b);
+    __m128i state0 = _mm_alignr_epi8(tmp, state1, 8);
+    state1 = _mm_blend_epi16(state1, tmp, 0xf0);
+
+    for (; nblocks; nblocks--, blocks += 64) {
+        const __m128i save0 = state0, save1 = state1;
+        /* m[q & 3] holds words 4q to 4q+3 of the message schedule */
+        __m128i m[4], msg;
+        for (int q = 0; q < 4; q++) {
+            m[q] = _mm_shuffle_epi8(_mm_loadu_si128(reinterpret_cast<const __m128i*>(blocks + 16*q)), bswap);
+            msg = _mm_add_epi32(m[q], _mm_loadu_si128(reinterpret_cast<const __m128i*>(K + 4*q)));
+            SHANI_ROUNDS(msg);
+        }
+        for (int q = 4; q < 16; q++) {
+            m[q & 3] = _mm_sha256msg2_epu32(
+                _mm_add_epi32(_mm_sha256msg1_epu32(m[q & 3], m[(q - 3) & 3]),
+                              _mm_alignr_epi8(m[(q - 1) & 3], m[(q - 2) & 3], 4)),
+                m[(q - 1) & 3]);
+            msg = _mm_add_epi32(m[q & 3], _mm_loadu_si128(reinterpret_cast<const __m128i*>(K + 4*q)));
+            SHANI_ROUNDS(msg);
+        }
+        state0 = _mm_add_epi32(state0, save0);
+        state1 = _mm_add_epi32(state1, save1);
+    }
+
+    tmp = _mm_shuffle_epi32(state0, 0x1b);
+    state1 = _mm_shuffle_epi32(state1, 0xb1);
+    state0 = _mm_blend_epi16(tmp, state1, 0xf0);
+    state1 = _mm_alignr_epi8(state1, tmp, 8);
+    _mm_storeu_si128(reinterpret_cast<__m128i*>(state), state0);
+    _mm_storeu_si128(reinterpret_cast<__m128i*>(state + 4), state1);
+}
+
+#endif /* #if defined(PYCRYPTOPP_SHANI_TARGET) */
+
+bool
+pycryptopp_sha256_available(unsigned impl) {
+    switch (impl) {
+    case PYCRYPTOPP_SHA256_PORTABLE:
+        return true;
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+    case PYCRYPTOPP_SHA256_AVX2:
+        return pycryptopp_has_avx2();
+#endif
+#if defined(PYCRYPTOPP_SHANI_TARGET)
+    case PYCRYPTOPP_SHA256_SHA_NI:
+        return pycryptopp_has_sha_ni();
+#endif
+    default:
+        return false;
+    }
+}
+
+void
+pycryptopp_sha256_compress(word32* state, const byte* blocks, size_t nblocks) {
+#if defined(PYCRYPTOPP_SHANI_TARGET)
+    if (pycryptopp_sha256_impl == PYCRYPTOPP_SHA256_SHA_NI) {
+        sha256_compress_shani(state, blocks, nblocks);
+        return;
+    }
+#endif
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+    if (pycryptopp_sha256_impl == PYCRYPTOPP_SHA256_AVX2) {
+        sha256_compress_avx2(state, blocks, nblocks);
+        return;
+    }
+#endif
+    sha256_compress_portable(state, blocks, nblocks);
+}
+
+void
+pycryptopp_sha256_init(pycryptopp_sha256_ctx* ctx) {
+    memcpy(ctx->state, pycryptopp_sha256_iv, sizeof(ctx->state));
+    ctx->length = 0;
+}
+
+void
+pycryptopp_sha256_update(pycryptopp_sha256_ctx* ctx, const byte* msg, size_t len) {
+    const size_t used = static_cast<size_t>(ctx->length % 64);
+    ctx->length += len;
+    if (used) {
+        const size_t n = CryptoPP::STDMIN(len, 64 - used);
+        memcpy(ctx->buffer + used, msg, n);
+        if (used + n < 64)
+            return;
+        pycryptopp_sha256_compress(ctx->state, ctx->buffer, 1);
+        msg += n;
+        len -= n;
+    }
+    if (len >= 64) {
+        pycryptopp_sha256_compress(ctx->state, msg, len / 64);
+        msg += len - len % 64;
+        len %= 64;
+    }
+    memcpy(ctx->buffer, msg, len);
+}
+
+void
+pycryptopp_sha256_final(pycryptopp_sha256_ctx* ctx, byte* out) {
+    size_t used = static_cast<size_t>(ctx->length % 64);
+    ctx->buffer[used++] = 0x80;
+    if (used > 56) {
+        memset(ctx->buffer + used, 0, 64 - used);
+        pycryptopp_sha256_compress(ctx->state, ctx->buffer, 1);
+        used = 0;
+    }
+    memset(ctx->buffer + used, 0, 56 - used);
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, ctx->buffer + 56, ctx->length * 8);
+    pycryptopp_sha256_compress(ctx->state, ctx->buffer, 1);
+    for (int i = 0; i < 8; i++)
+        store_be32(out + 4*i, ctx->state[i]);
+    CryptoPP::SecureWipeArray(ctx->state, 8);
+    CryptoPP::SecureWipeArray(ctx->buffer, 64);
+}
+
+/* The compression function on width messages at once: word i of the state
+   of message l is state[width*i + l], and its next block is at blocks[l]. */
+typedef void (*compress_lanes_func)(word32* state, const byte* const* blocks);
+
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+
+#define SSE2_ROTR(v, n) _mm_or_si128(_mm_srli_epi32(v, n), _mm_slli_epi32(v, 32 - (n)))
+#define SSE2_XOR3(x, y, z) _mm_xor_si128(_mm_xor_si128(x, y), z)
+#define SSE2_CH(x, y, z) _mm_xor_si128(z, _mm_and_si128(x, _mm_xor_si128(y, z)))
+#define SSE2_MAJ(x, y, z) _mm_or_si128(_mm_and_si128(x, y), _mm_and_si128(z, _mm_or_si128(x, y)))
+#define SSE2_BSIG0(x) SSE2_XOR3(SSE2_ROTR(x, 2), SSE2_ROTR(x, 13), SSE2_ROTR(x, 22))
+#define SSE2_BSIG1(x) SSE2_XOR3(SSE2_ROTR(x, 6), SSE2_ROTR(x, 11), SSE2_ROTR(x, 25))
+#define SSE2_SSIG0(x) SSE2_XOR3(SSE2_ROTR(x, 7), SSE2_ROTR(x, 18), _mm_srli_epi32(x, 3))
+#define SSE2_SSIG1(x) SSE2_XOR3(SSE2_ROTR(x, 17), SSE2_ROTR(x, 19), _mm_srli_epi32(x, 10))
+
+#define SSE2_ROUND(a, b, c, d, e, f, g, h, i) \
+    t1 = _mm_add_epi32(_mm_add_epi32(h, SSE2_BSIG1(e)), \
+                       _mm_add_epi32(_mm_add_epi32(SSE2_CH(e, f, g), _mm_set1_epi32(static_cast<int>(K[i]))), w[i])); \
+    d = _mm_add_epi32(d, t1); \
+    h = _mm_add_epi32(t1, _mm_add_epi32(SSE2_BSIG0(a), SSE2_MAJ(a, b, c)));
+
+/* SSE2 has no byte shuffle: swap the bytes of each 16-bit half, then the
+   halves. */
+PYCRYPTOPP_SSE2_TARGET static inline __m128i
+bswap32_sse2(__m128i v) {
+    v = _mm_or_si128(_mm_slli_epi16(v, 8), _mm_srli_epi16(v, 8));
+    return _mm_shufflehi_epi16(_mm_shufflelo_epi16(v, 0xb1), 0xb1);
+}
+
+PYCRYPTOPP_SSE2_TARGET static void
+sha256_compress4_sse2(word32* state, const byte* const* blocks) {
+    __m128i w[64];
+    for (int g = 0; g < 4; g++) {
+        /* words 4g to 4g+3 of each block */
+        const __m128i r0 = _mm_loadu_si128(reinterpret_cast<const __m128i*>(blocks[0] + 16*g));
+        const __m128i r1 = _mm_loadu_si128(reinterpret_cast<const __m128i*>(blocks[1] + 16*g));
+        const __m128i r2 = _mm_loadu_si128(reinterpret_cast<const __m128i*>(blocks[2] + 16*g));
+        const __m128i r3 = _mm_loadu_si128(reinterpret_cast<const __m128i*>(blocks[3] + 16*g));
+        const __m128i t0 = _mm_unpacklo_epi32(r0, r1);
+        const __m128i t1 = _mm_unpacklo_epi32(r2, r3);
+        const __m128i t2 = _mm_unpackhi_epi32(r0, r1);
+        const __m128i t3 = _mm_unpackhi_epi32(r2, r3);
+        w[4*g] = bswap32_sse2(_mm_unpacklo_epi64(t0, t1));
+        w[4*g+1] = bswap32_sse2(_mm_unpackhi_epi64(t0, t1));
+        w[4*g+2] = bswap32_sse2(_mm_unpacklo_epi64(t2, t3));
+        w[4*g+3] = bswap32_sse2(_mm_unpackhi_epi64(t2, t3));
+    }
+    for (int i = 16; i < 64; i++)
+        w[i] = _mm_add_epi32(_mm_add_epi32(SSE2_SSIG1(w[i-2]), w[i-7]), _mm_add_epi32(SSE2_SSIG0(w[i-15]), w[i-16]));
+
+    __m128i* s = reinterpret_cast<__m128i*>(state);
+    __m128i a = _mm_loadu_si128(s), b = _mm_loadu_si128(s+1), c = _mm_loadu_si128(s+2), d = _mm_loadu_si128(s+3);
+    __m128i e = _mm_loadu_si128(s+4), f = _mm_loadu_si128(s+5), g = _mm_loadu_si128(s+6), h = _mm_loadu_si128(s+7);
+    __m128i t1;
+    for (int i = 0; i < 64; i += 8) {
+        EIGHT_ROUNDS(SSE2_ROUND, i);
+    }
+    _mm_storeu_si128(s, _mm_add_epi32(_mm_loadu_si128(s), a));
+    _mm_storeu_si128(s+1, _mm_add_epi32(_mm_loadu_si128(s+1), b));
+    _mm_storeu_si128(s+2, _mm_add_epi32(_mm_loadu_si128(s+2), c));
+    _mm_storeu_si128(s+3, _mm_add_epi32(_mm_loadu_si128(s+3), d));
+    _mm_storeu_si128(s+4, _mm_add_epi32(_mm_loadu_si128(s+4), e));
+    _mm_storeu_si128(s+5, _mm_add_epi32(_mm_loadu_si128(s+5), f));
+    _mm_storeu_si128(s+6, _mm_add_epi32(_mm_loadu_si128(s+6), g));
+    _mm_storeu_si128(s+7, _mm_add_epi32(_mm_loadu_si128(s+7), h));
+}
+
+#define AVX2_ROTR(v, n) _mm256_or_si256(_mm256_srli_epi32(v, n), _mm256_slli_epi32(v, 32 - (n)))
+#define AVX2_XOR3(x, y, z) _mm256_xor_si256(_mm256_xor_si256(x, y), z)
+#define AVX2_CH(x, y, z) _mm256_xor_si256(z, _mm256_and_si256(x, _mm256_xor_si256(y, z)))
+#define AVX2_MAJ(x, y, z) _mm256_or_si256(_mm256_and_si256(x, y), _mm256_and_si256(z, _mm256_or_si256(x, y)))
+#define AVX2_BSIG0(x) AVX2_XOR3(AVX2_ROTR(x, 2), AVX2_ROTR(x, 13), AVX2_ROTR(x, 22))
+#define AVX2_BSIG1(x) AVX2_XOR3(AVX2_ROTR(x, 6), AVX2_ROTR(x, 11), AVX2_ROTR(x, 25))
+#define AVX2_SSIG0(x) AVX2_XOR3(AVX2_ROTR(x, 7), AVX2_ROTR(x, 18), _mm256_srli_epi32(x, 3))
+#define AVX2_SSIG1(x) AVX2_XOR3(AVX2_ROTR(x, 17), AVX2_ROTR(x, 19), _mm256_srli_epi32(x, 10))
+
+#define AVX2_ROUND(a, b, c, d, e, f, g, h, i) \
+    t1 = _mm256_add_epi32(_mm256_add_epi32(h, AVX2_BSIG1(e)), \
+                          _mm256_add_epi32(_mm256_add_epi32(AVX2_CH(e, f, g), _mm256_set1_epi32(static_cast<int>(K[i]))), w[i])); \
+    d = _mm256_add_epi32(d, t1); \
+    h = _mm256_add_epi32(t1, _mm256_add_epi32(AVX2_BSIG0(a), AVX2_MAJ(a, b, c)));
+
+PYCRYPTOPP_AVX2_TARGET static void
+sha256_compress8_avx2(word32* state, const byte* const* blocks) {
+    const __m256i bswap = _mm256_set_epi8(12,13,14,15, 8,9,10,11, 4,5,6,7, 0,1,2,3,
+                                          12,13,14,15, 8,9,10,11, 4,5,6,7, 0,1,2,3);
+    __m256i w[64];
+    for (int g = 0; g < 2; g++) {
+        /* words 8g to 8g+7 of each block */
+        __m256i r[8], t[8], u[8];
+        for (int l = 0; l < 8; l++)
+            r[l] = _mm256_shuffle_epi8(_mm256_loadu_si256(reinterpret_cast<const __m256i*>(blocks[l] + 32*g)), bswap);
+        for (int l = 0; l < 8; l += 4) {
+            t[l] = _mm256_unpacklo_epi32(r[l], r[l+1]);
+            t[l+1] = _mm256_unpackhi_epi32(r[l], r[l+1]);
+            t[l+2] = _mm256_unpacklo_epi32(r[l+2], r[l+3]);
+            t[l+3] = _mm256_unpackhi_epi32(r[l+2], r[l+3]);
+            /* u[l+k] holds word k of blocks l to l+3 in its low half and
+               word k+4 of them in its high half */
+            u[l] = _mm256_unpacklo_epi64(t[l], t[l+2]);
+            u[l+1] = _mm256_unpackhi_epi64(t[l], t[l+2]);
+            u[l+2] = _mm256_unpacklo_epi64(t[l+1], t[l+3]);
+            u[l+3] = _mm256_unpackhi_epi64(t[l+1], t[l+3]);
+        }
+        for (int k = 0; k < 4; k++) {
+            w[8*g+k] = _mm256_permute2x128_si256(u[k], u[k+4], 0x20);
+            w[8*g+k+4] = _mm256_permute2x128_si256(u[k], u[k+4], 0x31);
+        }
+    }
+    for (int i = 16; i < 64; i++)
+        w[i] = _mm256_add_epi32(_mm256_add_epi32(AVX2_SSIG1(w[i-2]), w[i-7]), _mm256_add_epi32(AVX2_SSIG0(w[i-15]), w[i-16]));
+
+    __m256i* s = reinterpret_cast<__m256i*>(state);
+    __m256i a = _mm256_loadu_si256(s), b = _mm256_loadu_si256(s+1), c = _mm256_loadu_si256(s+2), d = _mm256_loadu_si256(s+3);
+    __m256i e = _mm256_loadu_si256(s+4), f = _mm256_loadu_si256(s+5), g = _mm256_loadu_si256(s+6), h = _mm256_loadu_si256(s+7);
+    __m256i t1;
+    for (int i = 0; i < 64; i += 8) {
+        EIGHT_ROUNDS(AVX2_ROUND, i);
+    }
+    _mm256_storeu_si256(s, _mm256_add_epi32(_mm256_loadu_si256(s), a));
+    _mm256_storeu_si256(s+1, _mm256_add_epi32(_mm256_loadu_si256(s+1), b));
+    _mm256_storeu_si256(s+2, _mm256_add_epi32(_mm256_loadu_si256(s+2), c));
+    _mm256_storeu_si256(s+3, _mm256_add_epi32(_mm256_loadu_si256(s+3), d));
+    _mm256_storeu_si256(s+4, _mm256_add_epi32(_mm256_loadu_si256(s+4), e));
+    _mm256_storeu_si256(s+5, _mm256_add_epi32(_mm256_loadu_si256(s+5), f));
+    _mm256_storeu_si256(s+6, _mm256_add_epi32(_mm256_loadu_si256(s+6), g));
+    _mm256_storeu_si256(s+7, _mm256_add_epi32(_mm256_loadu_si256(s+7), h));
+}
+
+#endif /* #if defined(PYCRYPTOPP_SSE2_TARGET) */
+
+#if defined(PYCRYPTOPP_NEON)
+
+#define NEON_ROTR(v, n) vorrq_u32(vshrq_n_u32(v, n), vshlq_n_u32(v, 32 - (n)))
+#define NEON_XOR3(x, y, z) veorq_u32(veorq_u32(x, y), z)
+#define NEON_CH(x, y, z) veorq_u32(z, vandq_u32(x, veorq_u32(y, z)))
+#define NEON_MAJ(x, y, z) vorrq_u32(vandq_u32(x, y), vandq_u32(z, vorrq_u32(x, y)))
+#define NEON_BSIG0(x) NEON_XOR3(NEON_ROTR(x, 2), NEON_ROTR(x, 13), NEON_ROTR(x, 22))
+#define NEON_BSIG1(x) NEON_XOR3(NEON_ROTR(x, 6), NEON_ROTR(x, 11), NEON_ROTR(x, 25))
+#define NEON_SSIG0(x) NEON_XOR3(NEON_ROTR(x, 7), NEON_ROTR(x, 18), vshrq_n_u32(x, 3))
+#define NEON_SSIG1(x) NEON_XOR3(NEON_ROTR(x, 17), NEON_ROTR(x, 19), vshrq_n_u32(x, 10))
+
+#define NEON_ROUND(a, b, c, d, e, f, g, h, i) \
+    t1 = vaddq_u32(vaddq_u32(h, NEON_BSIG1(e)), vaddq_u32(vaddq_u32(NEON_CH(e, f, g), vdupq_n_u32(K[i])), w[i])); \
+    d = vaddq_u32(d, t1); \
+    h = vaddq_u32(t1, vaddq_u32(NEON_BSIG0(a), NEON_MAJ(a, b, c)));
+
+static void
+sha256_compress4_neon(word32* state, const byte* const* blocks) {
+    uint32x4_t w[64];
+    for (int i = 0; i < 16; i++) {
+        word32 v[4];
+        for (int l = 0; l < 4; l++)
+            v[l] = load_be32(blocks[l] + 4*i);
+        w[i] = vld1q_u32(v);
+    }
+    for (int i = 16; i < 64; i++)
+        w[i] = vaddq_u32(vaddq_u32(NEON_SSIG1(w[i-2]), w[i-7]), vaddq_u32(NEON_SSIG0(w[i-15]), w[i-16]));
+
+    uint32x4_t a = vld1q_u32(state), b = vld1q_u32(state+4), c = vld1q_u32(state+8), d = vld1q_u32(state+12);
+    uint32x4_t e = vld1q_u32(state+16), f = vld1q_u32(state+20), g = vld1q_u32(state+24), h = vld1q_u32(state+28);
+    uint32x4_t t1;
+    for (int i = 0; i < 64; i += 8) {
+        EIGHT_ROUNDS(NEON_ROUND, i);
+    }
+    vst1q_u32(state, vaddq_u32(vld1q_u32(state), a));
+    vst1q_u32(state+4, vaddq_u32(vld1q_u32(state+4), b));
+    vst1q_u32(state+8, vaddq_u32(vld1q_u32(state+8), c));
+    vst1q_u32(state+12, vaddq_u32(vld1q_u32(state+12), d));
+    vst1q_u32(state+16, vaddq_u32(vld1q_u32(state+16), e));
+    vst1q_u32(state+20, vaddq_u32(vld1q_u32(state+20), f));
+    vst1q_u32(state+24, vaddq_u32(vld1q_u32(state+24), g));
+    vst1q_u32(state+28, vaddq_u32(vld1q_u32(state+28), h));
+}
+
+#endif /* #if defined(PYCRYPTOPP_NEON) */
+
+/* A message split into the blocks given to the compression function: if
+   it continues a message already partly hashed, a first block made of the
+   last, partial, block of that and the start of this one; then the whole
+   blocks of the rest of it, where they are; and then what is left of it
+   with the padding, copied into tail. */
+typedef struct {
+    bool has_first;
+    byte first[64];
+    const byte* msg;
+    size_t whole;
+    size_t nblocks;
+    byte tail[128];
+} lane;
+
+/* Set up a lane for msg, of len bytes, as the continuation of start. */
+static void
+lane_init(lane* l, const pycryptopp_sha256_ctx* start, const byte* msg, size_t len) {
+    const word64 bitlen = (start->length + len) * 8;
+    size_t used = static_cast<size_t>(start->length % 64);
+    l->has_first = used && used + len >= 64;
+    if (l->has_first) {
+        memcpy(l->first, start->buffer, used);
+        memcpy(l->first + used, msg, 64 - used);
+        msg += 64 - used;
+        len -= 64 - used;
+        used = 0;
+    }
+    l->msg = msg;
+    l->whole = len / 64;
+    const size_t rest = used + len % 64;
+    const size_t tailsize = rest < 56 ? 64 : 128;
+    memcpy(l->tail, start->buffer, used);
+    memcpy(l->tail + used, msg + 64*l->whole, len % 64);
+    l->tail[rest] = 0x80;
+    memset(l->tail + rest + 1, 0, tailsize - 8 - (rest + 1));
+    CryptoPP::PutWord(false, CryptoPP::BIG_ENDIAN_ORDER, l->tail + tailsize - 8, bitlen);
+    l->nblocks = l->has_first + l->whole + tailsize / 64;
+}
+
+static inline const byte*
+lane_block(const lane* l, size_t j) {
+    if (l->has_first) {
+        if (j == 0)
+            return l->first;
+        j--;
+    }
+    return j < l->whole ? l->msg + 64*j : l->tail + 64*(j - l->whole);
+}
+
+static void
+lane_wipe(lane* l) {
+    CryptoPP::SecureWipeArray(l->first, 64);
+    CryptoPP::SecureWipeArray(l->tail, 128);
+}
+
+static void
+hash_one(const pycryptopp_sha256_ctx* start, const byte* msg, size_t len, byte* out) {
+    lane l;
+    lane_init(&l, start, msg, len);
+    word32 state[8];
+    memcpy(state, start->state, sizeof(state));
+    if (l.has_first)
+        pycryptopp_sha256_compress(state, l.first, 1);
+    pycryptopp_sha256_compress(state, l.msg, l.whole);
+    pycryptopp_sha256_compress(state, l.tail, l.nblocks - l.has_first - l.whole);
+    for (int i = 0; i < 8; i++)
+        store_be32(out + 4*i, state[i]);
+    lane_wipe(&l);
+}
+
+/* Hash n messages, where 0 < n <= width, with compress. */
+static void
+hash_lanes(compress_lanes_func compress, unsigned width, const pycryptopp_sha256_ctx* start, const byte* const* msgs, const size_t* lens, size_t n, byte* out) {
+    static const byte zeroes[64] = {0};
+    lane lanes[8];
+    const byte* blocks[8];
+    word32 state[64], saved[64];
+    size_t minblocks = ~static_cast<size_t>(0), maxblocks = 0;
+
+    for (int i = 0; i < 8; i++)
+        for (unsigned l = 0; l < width; l++)
+            state[width*i + l] = start->state[i];
+    for (size_t l = 0; l < n; l++) {
+        lane_init(&lanes[l], start, msgs[l], lens[l]);
+        minblocks = CryptoPP::STDMIN(minblocks, lanes[l].nblocks);
+        maxblocks = CryptoPP::STDMAX(maxblocks, lanes[l].nblocks);
+    }
+    for (size_t l = n; l < width; l++)
+        blocks[l] = zeroes;
+
+    for (size_t j = 0; j < maxblocks; j++) {
+        for (size_t l = 0; l < n; l++)
+            blocks[l] = j < lanes[l].nblocks ? lane_block(&lanes[l], j) : zeroes;
+        if (j < minblocks)
+            compress(state, blocks);
+        else {
+            /* some of the messages are finished */
+            memcpy(saved, state, 32*width);
+            compress(state, blocks);
+            for (size_t l = 0; l < n; l++) {
+                if (j >= lanes[l].nblocks) {
+                    for (int i = 0; i < 8; i++)
+                        state[width*i + l] = saved[width*i + l];
+                }
+            }
+        }
+    }
+
+    for (size_t l = 0; l < n; l++) {
+        for (int i = 0; i < 8; i++)
+            store_be32(out + 32*l + 4*i, state[width*i + l]);
+        lane_wipe(&lanes[l]);
+    }
+}
+
+unsigned
+pycryptopp_sha256_max_width() {
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+    if (pycryptopp_has_avx2())
+        return 8;
+    if (pycryptopp_has_sse2())
+        return 4;
+    return 1;
+#elif defined(PYCRYPTOPP_NEON)
+    return 4;
+#else
+    return 1;
+#endif
+}
+
+void
+pycryptopp_sha256_many(const byte* const* msgs, const size_t* lens, size_t n, byte* out) {
+    pycryptopp_sha256_ctx start;
+    pycryptopp_sha256_init(&start);
+    pycryptopp_sha256_many_from(&start, msgs, lens, n, out);
+}
+
+void
+pycryptopp_sha256_many_from(const pycryptopp_sha256_ctx* start, const byte* const* msgs, const size_t* lens, size_t n, byte* out) {
+    size_t i = 0;
+    compress_lanes_func compress4 = NULL;
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+    /* the SHA extensions beat even eight lanes of AVX2 */
+    if (pycryptopp_sha256_impl == PYCRYPTOPP_SHA256_SHA_NI) {
+        for (; i < n; i++)
+            hash_one(start, msgs[i], lens[i], out + 32*i);
+        return;
+    }
+    if (pycryptopp_sha256_width >= 8) {
+        for (; n - i >= 8; i += 8)
+            hash_lanes(sha256_compress8_avx2, 8, start, msgs + i, lens + i, 8, out + 32*i);
+    }
+    if (pycryptopp_sha256_width >= 4)
+        compress4 = sha256_compress4_sse2;
+#elif defined(PYCRYPTOPP_NEON)
+    if (pycryptopp_sha256_width >= 4)
+        compress4 = sha256_compress4_neon;
+#endif
+    if (compress4) {
+        for (; n - i >= 4; i += 4)
+            hash_lanes(compress4, 4, start, msgs + i, lens + i, 4, out + 32*i);
+        /* Even two messages are hashed faster with four lanes than one at a
+           time. */
+        if (n - i >= 2) {
+            hash_lanes(compress4, 4, start, msgs + i, lens + i, n - i, out + 32*i);
+            i = n;
+        }
+    }
+    for (; i < n; i++)
+        hash_one(start, msgs[i], lens[i], out + 32*i);
+}
@@ -0,0 +1,102 @@
+#ifndef __INCL_SHA256CORE_HPP
+#define __INCL_SHA256CORE_HPP
+
+/**
+ * sha256core.hpp -- SHA-256, using the SHA extensions or the vector
+ * instructions of the processor where it has them.
+ *
+ * The embedded Crypto++ is built with CRYPTOPP_DISABLE_ASM, which leaves its
+ * SHA256 with only the portable compression function. Here the compression
+ * function of one message can use the SHA extensions (SHA-NI), or on
+ * processors without them compute the message schedule with AVX2, two
+ * blocks at a time.
+ *
+ * Many independent messages can also be hashed at once: each lane of a
+ * vector register holds the state of a different message, so four (SSE2,
+ * NEON) or eight (AVX2) messages are hashed for the price of little more
+ * than one. The choice between all of these and the portable code is made
+ * at run time (see simd.hpp), and every one of them gives the same digests
+ * as Crypto++'s SHA256.
+ */
+
+#include <stddef.h>
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
+/* The initial hash value of SHA-256. */
+extern const CryptoPP::word32 pycryptopp_sha256_iv[8];
+
+/* The implementations of the compression function of one message: the
+   portable code, the portable rounds with the message schedule computed
+   with AVX2, and the SHA extensions. */
+#define PYCRYPTOPP_SHA256_PORTABLE 0
+#define PYCRYPTOPP_SHA256_AVX2 1
+#define PYCRYPTOPP_SHA256_SHA_NI 2
+
+/* True if this build has implementation impl and the processor supports
+   it. */
+extern bool
+pycryptopp_sha256_available(unsigned impl);
+
+/* The implementation pycryptopp_sha256_compress() uses. This is set to the
+   fastest available one when the sha256 module is initialized, and only
+   ever changed by the tests. */
+extern unsigned pycryptopp_sha256_impl;
+
+/* Run the compression function on state for each of the nblocks 64-byte
+   blocks at blocks. */
+extern void
+pycryptopp_sha256_compress(CryptoPP::word32* state, const byte* blocks, size_t nblocks);
+
+/* The state of a hash of one message, which may be copied with memcpy() to
+   fork it. */
+typedef struct {
+    CryptoPP::word32 state[8];
+    /* the last, partial, block of the message so far */
+    byte buffer[64];
+    /* the length of the message so far, in bytes */
+    CryptoPP::word64 length;
+} pycryptopp_sha256_ctx;
+
+extern void
+pycryptopp_sha256_init(pycryptopp_sha256_ctx* ctx);
+
+extern void
+pycryptopp_sha256_update(pycryptopp_sha256_ctx* ctx, const byte* msg, size_t len);
+
+/* Write the 32-byte digest of the message to out, after which ctx may only
+   be initialized again. */
+extern void
+pycryptopp_sha256_final(pycryptopp_sha256_ctx* ctx, byte* out);
+
+/**
+ * Hash the n messages msgs[0], ..., msgs[n-1], of lens[0], ..., lens[n-1]
+ * bytes, writing the 32-byte digest of message i to out + 32*i.
+ */
+extern void
+pycryptopp_sha256_many(const byte* const* msgs, const size_t* lens, size_t n, byte* out);
+
+/* The same, but hashing each message as the continuation of the message
+   hashed so far by start (such as a fixed prefix), which is left as it
+   was. */
+extern void
+pycryptopp_sha256_many_from(const pycryptopp_sha256_ctx* start, const byte* const* msgs, const size_t* lens, size_t n, byte* out);
+
+/* The most messages the vector code of this build can hash at once on this
+   processor: 8 with AVX2, 4 with SSE2 or NEON, otherwise 1. Where the SHA
+   extensions are used, pycryptopp_sha256_many() hashes one message at a
+   time with them instead, which is faster still. */
+extern unsigned
+pycryptopp_sha256_max_width();
+
+/* How many messages pycryptopp_sha256_many() hashes at once. This is set to
+   pycryptopp_sha256_max_width() when the sha256 module is initialized, and
+   only ever changed by the tests. */
+extern unsigned pycryptopp_sha256_width;
+
+#endif /* #ifndef __INCL_SHA256CORE_HPP */
@@ -1,5 +1,5 @@
 /**
- * sha256module.cpp -- Python wrappers around Crypto++'s SHA-256
+ * sha256module.cpp -- Python wrappers around SHA-256 (see sha256core.hpp)
  */
 
 #define PY_SSIZE_T_CLEAN
@@ -9,14 +9,20 @@ typedef int Py_ssize_t;
 #endif
 
 #include <assert.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "sha256module.hpp"
+#include "sha256core.hpp"
+#include "../buffers.hpp"
+#include "../fileio.hpp"
+#include "../objectlock.hpp"
 
 /* from Crypto++ */
 #ifdef DISABLE_EMBEDDED_CRYPTOPP
-#include <cryptopp/sha.h>
 #include <cryptopp/hex.h>
 #include <cryptopp/filters.h>
 #else
-#include <src-cryptopp/sha.h>
 #include <src-cryptopp/hex.h>
 #include <src-cryptopp/filters.h>
 #endif
@@ -29,40 +35,74 @@ typedef struct {
     PyObject_HEAD
 
     /* internal */
-    CryptoPP::SHA256* h;
+    pycryptopp_sha256_ctx h;
     PyStringObject* digest;
+    PyThread_type_lock lock;
 } SHA256;
 
 PyDoc_STRVAR(SHA256__doc__,
 "a SHA256 hash object\n\
-Its constructor takes an optional string, which has the same effect as\n\
-calling .update() with that string.");
+Its constructor takes an optional message, which has the same effect as\n\
+calling .update() with that message.");
+
+static PyObject *
+SHA256_digested_error() {
+    return PyErr_Format(sha256_error, "Precondition violation: once .digest() has been called you are required to never call .update() again.");
+}
+
+static int
+SHA256_update_view(void* context, Py_buffer* msg) {
+    SHA256* self = reinterpret_cast<SHA256*>(context);
+    bool digested;
+    WITH_OBJECTLOCK(self, PYCRYPTOPP_BUFFER_PINNED(*msg), msg->len,
+        /* Another thread may have finalized while we waited for the lock. */
+        digested = self->digest != NULL;
+        if (!digested)
+            pycryptopp_sha256_update(&self->h, reinterpret_cast<const byte*>(msg->buf), msg->len));
+    if (digested) {
+        SHA256_digested_error();
+        return -1;
+    }
+    return 0;
+}
 
 static PyObject *
 SHA256_update(SHA256* self, PyObject* msgobj) {
     if (self->digest)
-        return PyErr_Format(sha256_error, "Precondition violation: once .digest() has been called you are required to never call .update() again.");
+        return SHA256_digested_error();
 
-    const char *msg;
-    Py_ssize_t msgsize;
-    if (PyString_AsStringAndSize(msgobj, const_cast<char**>(&msg), &msgsize))
+    if (pycryptopp_pass_messages(msgobj, SHA256_update_view, self))
         return NULL;
-    self->h->Update(reinterpret_cast<const byte*>(msg), msgsize);
     Py_RETURN_NONE;
 }
 
 PyDoc_STRVAR(SHA256_update__doc__,
 "Update the hash object with the string msg. Repeated calls are equivalent to\n\
-a single call with the concatenation of all the messages.");
+a single call with the concatenation of all the messages.\n\
+\n\
+msg may be any object supporting the buffer protocol, such as a str,\n\
+bytearray, memoryview, array or mmap, or a list or tuple of such objects,\n\
+which is equivalent to calling .update() with each of them in turn.\n\
+\n\
+Large messages are hashed with the GIL released, so other Python threads can\n\
+run meanwhile. Concurrent calls on the same hash object are serialized, but\n\
+the items of a list are hashed one at a time, so those of lists passed to\n\
+concurrent calls may be interleaved.");
 
 static PyObject *
 SHA256_digest(SHA256* self, PyObject* dummy) {
     if (!self->digest) {
-        assert (self->h);
-        self->digest = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, self->h->DigestSize()));
-        if (!self->digest)
+        PyStringObject* digest = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, 32));
+        if (!digest)
             return NULL;
-        self->h->Final(reinterpret_cast<byte*>(PyString_AS_STRING(self->digest)));
+        ENTER_OBJECTLOCK(self);
+        /* Another thread may have finalized while we waited for the lock. */
+        if (!self->digest) {
+            pycryptopp_sha256_final(&self->h, reinterpret_cast<byte*>(PyString_AS_STRING(digest)));
+            self->digest = digest;
+        } else
+            Py_DECREF(digest);
+        LEAVE_OBJECTLOCK(self);
     }
 
     Py_INCREF(self->digest);
@@ -93,10 +133,55 @@ PyDoc_STRVAR(SHA256_hexdigest__doc__,
 "Return the hex-encoded digest of the messages that were passed to the update()\n\
 method (including the initial message if any).");
 
+static PyObject *
+SHA256_copy(SHA256* self, PyObject* dummy) {
+    SHA256* copy = reinterpret_cast<SHA256*>(self->ob_type->tp_alloc(self->ob_type, 0));
+    if (!copy)
+        return NULL;
+    copy->lock = NULL;
+    ENTER_OBJECTLOCK(self);
+    copy->h = self->h;
+    copy->digest = self->digest;
+    Py_XINCREF(copy->digest);
+    LEAVE_OBJECTLOCK(self);
+    return reinterpret_cast<PyObject*>(copy);
+}
+
+PyDoc_STRVAR(SHA256_copy__doc__,
+"Return a new hash object in the same state as this one, which can be updated\n\
+and finalized independently of it. This only copies the hash state, which is\n\
+about a hundred bytes, so the messages hashed so far are not hashed again:\n\
+hash a common prefix once and then copy() it for each message that starts\n\
+with it.");
+
+static PyObject *
+SHA256_digest_so_far(SHA256* self, PyObject* dummy) {
+    if (self->digest)
+        return SHA256_digest(self, NULL);
+
+    pycryptopp_sha256_ctx h;
+    PyStringObject* digest = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, 32));
+    if (!digest)
+        return NULL;
+    ENTER_OBJECTLOCK(self);
+    h = self->h;
+    LEAVE_OBJECTLOCK(self);
+    pycryptopp_sha256_final(&h, reinterpret_cast<byte*>(PyString_AS_STRING(digest)));
+    return reinterpret_cast<PyObject*>(digest);
+}
+
+PyDoc_STRVAR(SHA256_digest_so_far__doc__,
+"Return the binary digest of the messages passed to the update() method so\n\
+far, without finalizing this hash object: it can still be updated, and\n\
+.digest_so_far() called again later. This is the same as .copy().digest()\n\
+without making the copy.");
+
 static PyMethodDef SHA256_methods[] = {
     {"update", reinterpret_cast<PyCFunction>(SHA256_update), METH_O, SHA256_update__doc__},
     {"digest", reinterpret_cast<PyCFunction>(SHA256_digest), METH_NOARGS, SHA256_digest__doc__},
     {"hexdigest", reinterpret_cast<PyCFunction>(SHA256_hexdigest), METH_NOARGS, SHA256_hexdigest__doc__},
+    {"copy", reinterpret_cast<PyCFunction>(SHA256_copy), METH_NOARGS, SHA256_copy__doc__},
+    {"digest_so_far", reinterpret_cast<PyCFunction>(SHA256_digest_so_far), METH_NOARGS, SHA256_digest_so_far__doc__},
     {NULL},
 };
 
@@ -105,30 +190,29 @@ SHA256_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
     SHA256* self = reinterpret_cast<SHA256*>(type->tp_alloc(type, 0));
     if (!self)
         return NULL;
-    self->h = new CryptoPP::SHA256();
-    if (!self->h)
-        return PyErr_NoMemory();
+    pycryptopp_sha256_init(&self->h);
     self->digest = NULL;
+    self->lock = NULL;
     return reinterpret_cast<PyObject*>(self);
 }
 
 static void
 SHA256_dealloc(SHA256* self) {
     Py_XDECREF(self->digest);
-    delete self->h;
+    CryptoPP::SecureWipeBuffer(reinterpret_cast<byte*>(&self->h), sizeof(self->h));
+    FREE_OBJECTLOCK(self);
     self->ob_type->tp_free((PyObject*)self);
 }
 
 static int
 SHA256_init(PyObject* self, PyObject *args, PyObject *kwdict) {
     static const char *kwlist[] = { "msg", NULL };
-    const char *msg = NULL;
-    Py_ssize_t msgsize = 0;
-    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "|t#", const_cast<char**>(kwlist), &msg, &msgsize))
+    PyObject *msgobj = NULL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "|O", const_cast<char**>(kwlist), &msgobj))
         return -1;
 
-    if (msg)
-        reinterpret_cast<SHA256*>(self)->h->Update(reinterpret_cast<const byte*>(msg), msgsize);
+    if (msgobj)
+        return pycryptopp_pass_messages(msgobj, SHA256_update_view, self);
     return 0;
 }
 
@@ -175,13 +259,584 @@ static PyTypeObject SHA256_type = {
     SHA256_new,                /* tp_new */
 };
 
+bool
+sha256_check(PyObject* obj) {
+    return PyObject_TypeCheck(obj, &SHA256_type);
+}
+
+bool
+sha256_finalized(PyObject* obj) {
+    return reinterpret_cast<SHA256*>(obj)->digest != NULL;
+}
+
+PyThread_type_lock*
+sha256_lock(PyObject* obj) {
+    return &reinterpret_cast<SHA256*>(obj)->lock;
+}
+
+void
+sha256_update(PyObject* obj, const byte* msg, size_t len) {
+    pycryptopp_sha256_update(&reinterpret_cast<SHA256*>(obj)->h, msg, len);
+}
+
+/* Hash the n messages as the continuation of start, writing the digests to
+   out. With sha256d, hash each of those digests again, using scratch, of
+   32*n bytes, and reusing msgs and lens. */
+static void
+hash_records(const pycryptopp_sha256_ctx* start, bool sha256d, const byte** msgs, size_t* lens, size_t n, byte* out, byte* scratch) {
+    if (!sha256d) {
+        pycryptopp_sha256_many_from(start, msgs, lens, n, out);
+        return;
+    }
+    pycryptopp_sha256_many_from(start, msgs, lens, n, scratch);
+    for (size_t i = 0; i < n; i++) {
+        msgs[i] = scratch + 32*i;
+        lens[i] = 32;
+    }
+    pycryptopp_sha256_many(msgs, lens, n, out);
+    CryptoPP::SecureWipeBuffer(scratch, 32*n);
+}
+
+/* The work of hash_many() and TaggedHasher.hash_many(), hashing each of
+   messages (or each record of it) as the continuation of start. */
+static PyObject *
+hash_many_from(const pycryptopp_sha256_ctx* start, bool sha256d, PyObject* messages, PyObject* record_sizeobj) {
+    Py_ssize_t record_size = -1;
+    if (record_sizeobj != Py_None) {
+        record_size = PyNumber_AsSsize_t(record_sizeobj, PyExc_OverflowError);
+        if (record_size == -1 && PyErr_Occurred())
+            return NULL;
+        if (record_size <= 0)
+            return PyErr_Format(sha256_error, "Precondition violation: record_size is required to be positive, but it was %zd.", record_size);
+    }
+
+    PyObject* items = NULL;
+    Py_ssize_t n;
+    if (record_size < 0) {
+        if (!PyList_Check(messages) && !PyTuple_Check(messages))
+            return PyErr_Format(sha256_error, "Precondition violation: messages is required to be a list or tuple of messages, or a buffer of records if record_size is given, but it was %.200s.", Py_TYPE(messages)->tp_name);
+        if (!(items = PySequence_Tuple(messages)))
+            return NULL;
+        n = PyTuple_GET_SIZE(items);
+    } else
+        n = 1;
+
+    PyObject* result = NULL;
+    Py_buffer* views = PyMem_New(Py_buffer, n+1);
+    Py_ssize_t nviews = 0;
+    const byte** msgs = NULL;
+    size_t* lens = NULL;
+    byte* scratch = NULL;
+    bool pinned = true;
+    size_t total = 0;
+    if (!views) {
+        PyErr_NoMemory();
+        goto done;
+    }
+
+    if (record_size < 0) {
+        msgs = PyMem_New(const byte*, n+1);
+        lens = PyMem_New(size_t, n+1);
+        if (!msgs || !lens) {
+            PyErr_NoMemory();
+            goto done;
+        }
+        for (; nviews < n; nviews++) {
+            Py_buffer* view = &views[nviews];
+            if (pycryptopp_get_read_buffer(PyTuple_GET_ITEM(items, nviews), view, PyExc_TypeError))
+                goto done;
+            if (!PYCRYPTOPP_BUFFER_PINNED(*view))
+                pinned = false;
+            msgs[nviews] = reinterpret_cast<const byte*>(view->buf);
+            lens[nviews] = view->len;
+            total += view->len;
+        }
+    } else {
+        if (pycryptopp_get_read_buffer(messages, &views[0], PyExc_TypeError))
+            goto done;
+        nviews = 1;
+        pinned = PYCRYPTOPP_BUFFER_PINNED(views[0]);
+        if (views[0].len % record_size) {
+            PyErr_Format(sha256_error, "Precondition violation: messages is required to be a whole number of records of %zd bytes, but it was %zd bytes.", record_size, views[0].len);
+            goto done;
+        }
+        n = views[0].len / record_size;
+        msgs = PyMem_New(const byte*, n+1);
+        lens = PyMem_New(size_t, n+1);
+        if (!msgs || !lens) {
+            PyErr_NoMemory();
+            goto done;
+        }
+        for (Py_ssize_t i = 0; i < n; i++) {
+            msgs[i] = reinterpret_cast<const byte*>(views[0].buf) + i*record_size;
+            lens[i] = record_size;
+        }
+        total = views[0].len;
+    }
+
+    if (sha256d && !(scratch = PyMem_New(byte, 32*n+1))) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    result = PyString_FromStringAndSize(NULL, 32*n);
+    if (result) {
+        byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+        if (pinned && total >= PYCRYPTOPP_GIL_MINSIZE) {
+            Py_BEGIN_ALLOW_THREADS
+            hash_records(start, sha256d, msgs, lens, n, out, scratch);
+            Py_END_ALLOW_THREADS
+        } else
+            hash_records(start, sha256d, msgs, lens, n, out, scratch);
+    }
+
+ done:
+    /* The views keep the items with new-style buffers alive. The others
+       are only used with the GIL held. */
+    if (views) {
+        for (Py_ssize_t i = 0; i < nviews; i++)
+            PyBuffer_Release(&views[i]);
+    }
+    PyMem_Free(views);
+    PyMem_Free(msgs);
+    PyMem_Free(lens);
+    PyMem_Free(scratch);
+    Py_XDECREF(items);
+    return result;
+}
+
+PyObject *
+sha256_hash_many(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "messages", "record_size", NULL };
+    PyObject* messages;
+    PyObject* record_sizeobj = Py_None;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "O|O:hash_many", const_cast<char**>(kwlist), &messages, &record_sizeobj))
+        return NULL;
+
+    pycryptopp_sha256_ctx start;
+    pycryptopp_sha256_init(&start);
+    return hash_many_from(&start, false, messages, record_sizeobj);
+}
+
+const char*const sha256_hash_many__doc__ = "\
+hash_many(messages, record_size=None)\n\
+\n\
+Return the SHA-256 digests of many messages, packed together in one string\n\
+of 32 bytes per message: the same as\n\
+\"\".join([SHA256(msg).digest() for msg in messages])\n\
+but without making a hash object for each message. On a processor with SSE2\n\
+or NEON four messages are hashed at once, and eight with AVX2, so this is\n\
+much faster for many short messages, such as the leaves of a hash tree.\n\
+\n\
+messages is either a list or tuple of objects supporting the buffer\n\
+protocol, or, if record_size is given, one buffer holding messages of\n\
+exactly record_size bytes each. Large inputs are hashed with the GIL\n\
+released.";
+
+typedef struct {
+    PyObject_HEAD
+
+    /* internal */
+    /* the state after hashing netstring(tag) */
+    pycryptopp_sha256_ctx start;
+    bool sha256d;
+} TaggedHasher;
+
+PyDoc_STRVAR(TaggedHasher__doc__,
+"TaggedHasher(tag, sha256d=False)\n\
+\n\
+A hash function computing SHA256(netstring(tag) + data), where netstring(tag)\n\
+is \"%d:%s,\" % (len(tag), tag), as Tahoe-LAFS does to keep the hashes it\n\
+makes for different purposes apart. The tag is hashed once, when the\n\
+TaggedHasher is made, and every hash starts from the state after it. With\n\
+sha256d true the digest is hashed again, giving\n\
+SHA256(SHA256(netstring(tag) + data)) as Tahoe-LAFS's tagged hashes do.\n\
+\n\
+A TaggedHasher cannot be changed once made, so one may be shared between\n\
+threads.");
+
+static void
+TaggedHasher_hash_one(const TaggedHasher* self, const byte* msg, size_t len, byte* out) {
+    pycryptopp_sha256_ctx h = self->start;
+    pycryptopp_sha256_update(&h, msg, len);
+    pycryptopp_sha256_final(&h, out);
+    if (self->sha256d) {
+        pycryptopp_sha256_init(&h);
+        pycryptopp_sha256_update(&h, out, 32);
+        pycryptopp_sha256_final(&h, out);
+    }
+}
+
+static PyObject *
+TaggedHasher_hash(TaggedHasher* self, PyObject* dataobj) {
+    Py_buffer data;
+    if (pycryptopp_get_read_buffer(dataobj, &data, PyExc_TypeError))
+        return NULL;
+    PyObject* result = PyString_FromStringAndSize(NULL, 32);
+    if (result) {
+        byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+        const byte* msg = reinterpret_cast<const byte*>(data.buf);
+        if (PYCRYPTOPP_BUFFER_PINNED(data) && data.len >= PYCRYPTOPP_GIL_MINSIZE) {
+            Py_BEGIN_ALLOW_THREADS
+            TaggedHasher_hash_one(self, msg, data.len, out);
+            Py_END_ALLOW_THREADS
+        } else
+            TaggedHasher_hash_one(self, msg, data.len, out);
+    }
+    PyBuffer_Release(&data);
+    return result;
+}
+
+PyDoc_STRVAR(TaggedHasher_hash__doc__,
+"hash(data)\n\
+\n\
+Return the 32-byte tagged hash of data. Large inputs are hashed with the GIL\n\
+released.");
+
+static PyObject *
+TaggedHasher_hash_many(TaggedHasher* self, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "datas", "record_size", NULL };
+    PyObject* datas;
+    PyObject* record_sizeobj = Py_None;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "O|O:hash_many", const_cast<char**>(kwlist), &datas, &record_sizeobj))
+        return NULL;
+    return hash_many_from(&self->start, self->sha256d, datas, record_sizeobj);
+}
+
+PyDoc_STRVAR(TaggedHasher_hash_many__doc__,
+"hash_many(datas, record_size=None)\n\
+\n\
+Return the tagged hashes of many messages, packed together in one string of\n\
+32 bytes per message: the same as \"\".join(map(self.hash, datas)), but\n\
+hashing several messages at once as the module-level hash_many() does.\n\
+datas is either a list or tuple of objects supporting the buffer protocol,\n\
+or, if record_size is given, one buffer holding messages of exactly\n\
+record_size bytes each.");
+
+static PyMethodDef TaggedHasher_methods[] = {
+    {"hash", reinterpret_cast<PyCFunction>(TaggedHasher_hash), METH_O, TaggedHasher_hash__doc__},
+    {"hash_many", reinterpret_cast<PyCFunction>(TaggedHasher_hash_many), METH_KEYWORDS, TaggedHasher_hash_many__doc__},
+    {NULL},
+};
+
+static PyObject *
+TaggedHasher_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "tag", "sha256d", NULL };
+    const char* tag;
+    Py_ssize_t tagsize;
+    PyObject* sha256dobj = Py_False;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "t#|O:TaggedHasher", const_cast<char**>(kwlist), &tag, &tagsize, &sha256dobj))
+        return NULL;
+    const int sha256d = PyObject_IsTrue(sha256dobj);
+    if (sha256d < 0)
+        return NULL;
+
+    TaggedHasher* self = reinterpret_cast<TaggedHasher*>(type->tp_alloc(type, 0));
+    if (!self)
+        return NULL;
+    char prefix[32];
+    PyOS_snprintf(prefix, sizeof(prefix), "%ld:", static_cast<long>(tagsize));
+    pycryptopp_sha256_init(&self->start);
+    pycryptopp_sha256_update(&self->start, reinterpret_cast<const byte*>(prefix), strlen(prefix));
+    pycryptopp_sha256_update(&self->start, reinterpret_cast<const byte*>(tag), tagsize);
+    pycryptopp_sha256_update(&self->start, reinterpret_cast<const byte*>(","), 1);
+    self->sha256d = sha256d;
+    return reinterpret_cast<PyObject*>(self);
+}
+
+static void
+TaggedHasher_dealloc(TaggedHasher* self) {
+    CryptoPP::SecureWipeBuffer(reinterpret_cast<byte*>(&self->start), sizeof(self->start));
+    self->ob_type->tp_free((PyObject*)self);
+}
+
+static PyTypeObject TaggedHasher_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_sha256.TaggedHasher", /*tp_name*/
+    sizeof(TaggedHasher),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    reinterpret_cast<destructor>(TaggedHasher_dealloc), /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    TaggedHasher__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    TaggedHasher_methods,      /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    0,                         /* tp_init */
+    0,                         /* tp_alloc */
+    TaggedHasher_new,          /* tp_new */
+};
+
+typedef struct {
+    pycryptopp_sha256_ctx whole;
+    /* with block_size not 0, the hash of the current block, how much of it
+       has been hashed, and the digests of the blocks before it */
+    size_t block_size;
+    pycryptopp_sha256_ctx block;
+    size_t in_block;
+    byte* block_digests;
+    size_t nblocks, capacity;
+    bool nomem;
+} hash_file_job;
+
+/* Finish the current block, adding its digest to the list. */
+static void
+hash_file_end_block(hash_file_job* job) {
+    if (job->nblocks == job->capacity) {
+        const size_t capacity = job->capacity ? 2*job->capacity : 64;
+        byte* block_digests = reinterpret_cast<byte*>(realloc(job->block_digests, 32*capacity));
+        if (!block_digests) {
+            job->nomem = true;
+            return;
+        }
+        job->block_digests = block_digests;
+        job->capacity = capacity;
+    }
+    pycryptopp_sha256_final(&job->block, job->block_digests + 32*job->nblocks);
+    job->nblocks++;
+    pycryptopp_sha256_init(&job->block);
+    job->in_block = 0;
+}
+
+static void
+hash_file_window(void* context, const byte* in, size_t len) {
+    hash_file_job* job = reinterpret_cast<hash_file_job*>(context);
+    pycryptopp_sha256_update(&job->whole, in, len);
+    if (!job->block_size)
+        return;
+    while (len && !job->nomem) {
+        const size_t n = CryptoPP::STDMIN(len, job->block_size - job->in_block);
+        pycryptopp_sha256_update(&job->block, in, n);
+        job->in_block += n;
+        in += n;
+        len -= n;
+        if (job->in_block == job->block_size)
+            hash_file_end_block(job);
+    }
+}
+
+PyObject *
+sha256_hash_file(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "path_or_fd", "offset", "length", "block_size", NULL };
+    PyObject* path_or_fd;
+    PY_LONG_LONG offset = 0;
+    PyObject* lengthobj = Py_None;
+    PyObject* block_sizeobj = Py_None;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "O|LOO:hash_file", const_cast<char**>(kwlist), &path_or_fd, &offset, &lengthobj, &block_sizeobj))
+        return NULL;
+
+    PY_LONG_LONG length = -1;
+    if (lengthobj != Py_None) {
+        length = PyLong_AsLongLong(lengthobj);
+        if (length == -1 && PyErr_Occurred())
+            return NULL;
+        if (length < 0)
+            return PyErr_Format(sha256_error, "Precondition violation: length is required to be None or non-negative, but it was %lld.", length);
+    }
+    if (offset < 0)
+        return PyErr_Format(sha256_error, "Precondition violation: offset is required to be non-negative, but it was %lld.", offset);
+    Py_ssize_t block_size = 0;
+    if (block_sizeobj != Py_None) {
+        block_size = PyNumber_AsSsize_t(block_sizeobj, PyExc_OverflowError);
+        if (block_size == -1 && PyErr_Occurred())
+            return NULL;
+        if (block_size <= 0)
+            return PyErr_Format(sha256_error, "Precondition violation: block_size is required to be positive, but it was %zd.", block_size);
+    }
+
+    char* path;
+    int fd;
+    if (pycryptopp_get_path_or_fd(path_or_fd, &path, &fd, sha256_error))
+        return NULL;
+
+    hash_file_job job;
+    pycryptopp_sha256_init(&job.whole);
+    pycryptopp_sha256_init(&job.block);
+    job.block_size = static_cast<size_t>(block_size);
+    job.in_block = 0;
+    job.block_digests = NULL;
+    job.nblocks = job.capacity = 0;
+    job.nomem = false;
+
+    PyObject* result = NULL;
+    PY_LONG_LONG processed;
+    if (pycryptopp_read_file(path, fd, offset, length, hash_file_window, &job, &processed) == 0) {
+        /* the last block may be short, but is only empty if the whole of
+           the range is */
+        if (job.block_size && (job.in_block || processed == 0))
+            hash_file_end_block(&job);
+        if (length >= 0 && processed < length)
+            PyErr_Format(sha256_error, "Precondition violation: the file is required to have length bytes from offset, which is %lld bytes, but it ended after %lld.", length, processed);
+        else if (job.nomem)
+            PyErr_NoMemory();
+        else {
+            PyObject* digest = PyString_FromStringAndSize(NULL, 32);
+            if (digest) {
+                pycryptopp_sha256_final(&job.whole, reinterpret_cast<byte*>(PyString_AS_STRING(digest)));
+                if (!job.block_size)
+                    result = digest;
+                else
+                    result = Py_BuildValue("Ns#", digest, job.block_digests, static_cast<Py_ssize_t>(32*job.nblocks));
+            }
+        }
+    }
+    CryptoPP::SecureWipeBuffer(reinterpret_cast<byte*>(&job.whole), sizeof(job.whole));
+    CryptoPP::SecureWipeBuffer(reinterpret_cast<byte*>(&job.block), sizeof(job.block));
+    free(job.block_digests);
+    PyMem_Free(path);
+    return result;
+}
+
+const char*const sha256_hash_file__doc__ = "\
+hash_file(path_or_fd, offset=0, length=None, block_size=None)\n\
+\n\
+Return the SHA-256 digest of the file with the given path, or of the open\n\
+file descriptor if an integer is given, from byte offset onwards: length\n\
+bytes of it, or the rest of it if length is None. This gives the same digest\n\
+as SHA256(data).digest() on those bytes, but the file is read in large\n\
+windows without the data passing through Python, and the GIL is released\n\
+throughout. A descriptor is read without moving its file position (except on\n\
+Windows), and is not closed.\n\
+\n\
+If block_size is given, return a pair instead: the digest, and the digests\n\
+of each block_size bytes of the same range, packed together in one string\n\
+of 32 bytes per block as hash_many() does. The last block may be shorter.\n\
+\n\
+Raises IOError if the file cannot be read, and Error if length is given and\n\
+the file ends before offset + length.";
+
+PyObject *
+sha256_simd_width(PyObject *dummy, PyObject *args) {
+    return PyInt_FromLong(pycryptopp_sha256_max_width());
+}
+
+const char*const sha256_simd_width__doc__ = "\
+Return how many messages hash_many() hashes at once on this processor: 8\n\
+with AVX2, 4 with SSE2 or NEON, and 1 if this build has no vector code for\n\
+it. It does so automatically, producing exactly the same digests either\n\
+way.";
+
+PyObject *
+sha256__set_simd_width(PyObject *dummy, PyObject *args) {
+    int width;
+    if (!PyArg_ParseTuple(args, "i:_set_simd_width", &width))
+        return NULL;
+    const unsigned max_width = pycryptopp_sha256_max_width();
+    if ((width != 1 && width != 4 && width != 8) || static_cast<unsigned>(width) > max_width)
+        return PyErr_Format(sha256_error, "Precondition violation: width is required to be 1, 4 or 8 and at most simd_width(), which is %u here, but it was %d.", max_width, width);
+    const unsigned previous = pycryptopp_sha256_width;
+    pycryptopp_sha256_width = static_cast<unsigned>(width);
+    return PyInt_FromLong(previous);
+}
+
+const char*const sha256__set_simd_width__doc__ = "\
+_set_simd_width(width)\n\
+\n\
+Make hash_many() hash width messages at a time, where width is 1, 4 or 8\n\
+and no more than simd_width(), and return the previous width. This is for\n\
+testing the implementations against each other; there is no other reason\n\
+to call it.";
+
+/* The names of the implementations of the compression function, fastest
+   first, indexed by their PYCRYPTOPP_SHA256_* number. */
+static const char*const impl_names[] = { "portable", "avx2", "sha-ni" };
+static const unsigned impl_order[] = { PYCRYPTOPP_SHA256_SHA_NI, PYCRYPTOPP_SHA256_AVX2, PYCRYPTOPP_SHA256_PORTABLE };
+
+PyObject *
+sha256_implementations(PyObject *dummy, PyObject *args) {
+    PyObject* result = PyList_New(0);
+    if (!result)
+        return NULL;
+    for (size_t i = 0; i < sizeof(impl_order)/sizeof(impl_order[0]); i++) {
+        if (!pycryptopp_sha256_available(impl_order[i]))
+            continue;
+        PyObject* name = PyString_FromString(impl_names[impl_order[i]]);
+        if (!name || PyList_Append(result, name)) {
+            Py_XDECREF(name);
+            Py_DECREF(result);
+            return NULL;
+        }
+        Py_DECREF(name);
+    }
+    return result;
+}
+
+const char*const sha256_implementations__doc__ = "\
+Return the names of the implementations of the SHA-256 compression function\n\
+this build has and this processor supports, fastest first: 'sha-ni' (the SHA\n\
+extensions), 'avx2' (the message schedule computed with AVX2) and\n\
+'portable'. The first of them is used by SHA256 objects, and by hash_many()\n\
+where it beats hashing several messages at once (see simd_width()). They\n\
+all produce exactly the same digests.";
+
+PyObject *
+sha256__set_implementation(PyObject *dummy, PyObject *args) {
+    const char* name;
+    if (!PyArg_ParseTuple(args, "s:_set_implementation", &name))
+        return NULL;
+    for (unsigned impl = 0; impl < sizeof(impl_names)/sizeof(impl_names[0]); impl++) {
+        if (strcmp(name, impl_names[impl]) == 0 && pycryptopp_sha256_available(impl)) {
+            const unsigned previous = pycryptopp_sha256_impl;
+            pycryptopp_sha256_impl = impl;
+            return PyString_FromString(impl_names[previous]);
+        }
+    }
+    return PyErr_Format(sha256_error, "Precondition violation: name is required to be one of implementations(), but it was '%.200s'.", name);
+}
+
+const char*const sha256__set_implementation__doc__ = "\
+_set_implementation(name)\n\
+\n\
+Make SHA256 objects and hash_many() use the implementation of the\n\
+compression function called name, which is one of implementations(), and\n\
+return the name of the previous one. This is for testing the\n\
+implementations against each other; there is no other reason to call it.\n\
+It must not be called while other threads are hashing.";
+
 void
 init_sha256(PyObject* module) {
+    pycryptopp_sha256_width = pycryptopp_sha256_max_width();
+    for (size_t i = 0; i < sizeof(impl_order)/sizeof(impl_order[0]); i++) {
+        if (pycryptopp_sha256_available(impl_order[i])) {
+            pycryptopp_sha256_impl = impl_order[i];
+            break;
+        }
+    }
+
     if (PyType_Ready(&SHA256_type) < 0)
         return;
     Py_INCREF(&SHA256_type);
     PyModule_AddObject(module, "sha256_SHA256", (PyObject *)&SHA256_type);
 
+    if (PyType_Ready(&TaggedHasher_type) < 0)
+        return;
+    Py_INCREF(&TaggedHasher_type);
+    PyModule_AddObject(module, "sha256_TaggedHasher", (PyObject *)&TaggedHasher_type);
+
     sha256_error = PyErr_NewException(const_cast<char*>("_sha256.Error"), NULL, NULL);
     PyModule_AddObject(module, "sha256_Error", sha256_error);
 
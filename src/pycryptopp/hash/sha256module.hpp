@@ -1,7 +1,57 @@
 #ifndef __INCL_SHA256MODULE_HPP
 #define __INCL_SHA256MODULE_HPP
 
+#include "../objectlock.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
 extern void
 init_sha256(PyObject* module);
 
+extern PyObject *
+sha256_hash_many(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const sha256_hash_many__doc__;
+
+extern PyObject *
+sha256_hash_file(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const sha256_hash_file__doc__;
+
+extern PyObject *
+sha256_simd_width(PyObject *dummy, PyObject *args);
+extern const char*const sha256_simd_width__doc__;
+
+extern PyObject *
+sha256__set_simd_width(PyObject *dummy, PyObject *args);
+extern const char*const sha256__set_simd_width__doc__;
+
+extern PyObject *
+sha256_implementations(PyObject *dummy, PyObject *args);
+extern const char*const sha256_implementations__doc__;
+
+extern PyObject *
+sha256__set_implementation(PyObject *dummy, PyObject *args);
+extern const char*const sha256__set_implementation__doc__;
+
+/* For the other modules of this library: whether obj is a SHA256 object,
+   whether its digest has been taken (after which it must not be updated),
+   the address of its lock, and hashing more of the message with it. The
+   caller of sha256_update() must hold the object's lock, if it has one, but
+   need not hold the GIL. */
+extern bool
+sha256_check(PyObject* obj);
+
+extern bool
+sha256_finalized(PyObject* obj);
+
+extern PyThread_type_lock*
+sha256_lock(PyObject* obj);
+
+extern void
+sha256_update(PyObject* obj, const byte* msg, size_t len);
+
 #endif /* #ifndef __INCL_SHA256MODULE_HPP */
@@ -0,0 +1,26 @@
+from pycryptopp import _import_my_names
+
+# These initializations to None are just to pacify pyflakes, which
+# doesn't understand that we have to do some funky import trickery
+# below in _import_my_names() in order to get sensible namespaces.
+SHA512=None
+Error=None
+
+_import_my_names(globals(), "sha512_")
+
+del _import_my_names
+
+def start_up_self_test():
+    """
+    This is a quick test intended to detect major errors such as the library being
+    miscompiled and segfaulting or returning incorrect answers, as
+    sha256.start_up_self_test() explains: the two-block example of FIPS 180-2,
+    hashed in pieces which straddle its block boundary.
+    """
+    msg = "abcdefghbcdefghicdefghijdefghijkefghijklfghijklmghijklmnhijklmnoijklmnopjklmnopqklmnopqrlmnopqrsmnopqrstnopqrstu"
+    h = SHA512(msg[:100])
+    h.update(msg[100:])
+    if h.hexdigest().lower() != '8e959b75dae313da8cf4f72814fc143f8f7779c6eb9f7fa17299aeadb6889018501d289e4900f7e4331b99dec4b5433ac7d329eeb6dd26545e96e55b874be909':
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+start_up_self_test()
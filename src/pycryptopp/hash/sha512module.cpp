@@ -0,0 +1,100 @@
+/**
+ * sha512module.cpp -- Python wrappers around Crypto++'s SHA-512
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "sha512module.hpp"
+#include "hashobject.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/sha.h>
+#else
+#include <src-cryptopp/sha.h>
+#endif
+
+static const char*const sha512___doc__ = "_sha512 hash function";
+
+static PyObject *sha512_error;
+
+PyDoc_STRVAR(SHA512__doc__,
+"a SHA512 hash object, with the same methods as sha256.SHA256\n\
+Its constructor takes an optional message, which has the same effect as\n\
+calling .update() with that message.");
+
+static PyObject *
+SHA512_new(PyTypeObject* type, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "msg", NULL };
+    PyObject *msgobj = NULL;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "|O:SHA512", const_cast<char**>(kwlist), &msgobj))
+        return NULL;
+
+    pycryptopp_hash* self = reinterpret_cast<pycryptopp_hash*>(type->tp_alloc(type, 0));
+    if (!self)
+        return NULL;
+    if (pycryptopp_hash_setup(self, new CryptoPP::SHA512(), pycryptopp_hash_clone<CryptoPP::SHA512>, sha512_error, msgobj)) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    return reinterpret_cast<PyObject*>(self);
+}
+
+static PyTypeObject SHA512_type = {
+    PyObject_HEAD_INIT(NULL)
+    0,                         /*ob_size*/
+    "_sha512.SHA512", /*tp_name*/
+    sizeof(pycryptopp_hash),             /*tp_basicsize*/
+    0,                         /*tp_itemsize*/
+    pycryptopp_hash_dealloc,   /*tp_dealloc*/
+    0,                         /*tp_print*/
+    0,                         /*tp_getattr*/
+    0,                         /*tp_setattr*/
+    0,                         /*tp_compare*/
+    0,                         /*tp_repr*/
+    0,                         /*tp_as_number*/
+    0,                         /*tp_as_sequence*/
+    0,                         /*tp_as_mapping*/
+    0,                         /*tp_hash */
+    0,                         /*tp_call*/
+    0,                         /*tp_str*/
+    0,                         /*tp_getattro*/
+    0,                         /*tp_setattro*/
+    0,                         /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
+    SHA512__doc__,           /* tp_doc */
+    0,		               /* tp_traverse */
+    0,		               /* tp_clear */
+    0,		               /* tp_richcompare */
+    0,		               /* tp_weaklistoffset */
+    0,		               /* tp_iter */
+    0,		               /* tp_iternext */
+    pycryptopp_hash_methods,   /* tp_methods */
+    0,                         /* tp_members */
+    0,                         /* tp_getset */
+    0,                         /* tp_base */
+    0,                         /* tp_dict */
+    0,                         /* tp_descr_get */
+    0,                         /* tp_descr_set */
+    0,                         /* tp_dictoffset */
+    0,                         /* tp_init */
+    0,                         /* tp_alloc */
+    SHA512_new,                /* tp_new */
+};
+
+void
+init_sha512(PyObject* module) {
+    if (PyType_Ready(&SHA512_type) < 0)
+        return;
+    Py_INCREF(&SHA512_type);
+    PyModule_AddObject(module, "sha512_SHA512", (PyObject *)&SHA512_type);
+
+    sha512_error = PyErr_NewException(const_cast<char*>("_sha512.Error"), NULL, NULL);
+    PyModule_AddObject(module, "sha512_Error", sha512_error);
+
+    PyModule_AddStringConstant(module, "sha512___doc__", const_cast<char*>(sha512___doc__));
+}
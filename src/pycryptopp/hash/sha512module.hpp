@@ -0,0 +1,7 @@
+#ifndef __INCL_SHA512MODULE_HPP
+#define __INCL_SHA512MODULE_HPP
+
+extern void
+init_sha512(PyObject* module);
+
+#endif /* #ifndef __INCL_SHA512MODULE_HPP */
@@ -0,0 +1,75 @@
+"""
+SHA-256 tree hashes, for hashing large inputs on several cores at once.
+
+A single SHA-256 hash is inherently serial. A tree hash instead cuts its
+input into chunks of CHUNK_SIZE (1 MiB) bytes, hashes each chunk on its
+own, and combines their digests into a root, so hash() and hash_file() can
+hash the chunks on as many native threads as there are cores. The root is
+the same whatever the number of threads:
+
+  leaf = SHA256(netstring(LEAF_TAG) + chunk)
+  node = SHA256(netstring(NODE_TAG) + left + right)
+  root = SHA256(netstring(ROOT_TAG) + top + 8-byte big-endian length)
+
+where netstring(s) is "%d:%s," % (len(s), s). The last chunk may be
+shorter, and an empty input is one empty chunk. Each level of nodes pairs up
+the level below it in order, and an odd node at the end of a level is
+carried up to the next level as it is; top is the single node left at the
+end, and length is the length of the whole input in bytes.
+reference_hash() is the same thing in a few lines of Python.
+
+A tree hash is not the SHA-256 digest of its input, and CHUNK_SIZE and the
+tags are part of its definition, so they will never change.
+"""
+
+import hashlib, struct
+
+from pycryptopp import _import_my_names
+
+# These initializations to None are just to pacify pyflakes, which
+# doesn't understand that we have to do some funky import trickery
+# below in _import_my_names() in order to get sensible namespaces.
+hash=None
+hash_file=None
+CHUNK_SIZE=None
+LEAF_TAG=None
+NODE_TAG=None
+ROOT_TAG=None
+Error=None
+
+_import_my_names(globals(), "treehash_")
+
+del _import_my_names
+
+def _tagged_hash(tag, *parts):
+    h = hashlib.sha256("%d:%s," % (len(tag), tag))
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+def reference_hash(data):
+    """
+    Return the tree hash of the str data, one chunk and one node at a time
+    with hashlib: the same as hash(data), but slower. This is the
+    definition that hash() and hash_file() are tested against.
+    """
+    level = [ _tagged_hash(LEAF_TAG, data[i:i+CHUNK_SIZE])
+              for i in range(0, max(len(data), 1), CHUNK_SIZE) ]
+    while len(level) > 1:
+        parents = [ _tagged_hash(NODE_TAG, level[i], level[i+1])
+                    for i in range(0, len(level) - 1, 2) ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return _tagged_hash(ROOT_TAG, level[0], struct.pack(">Q", len(data)))
+
+def start_up_self_test():
+    """
+    A quick test intended to detect major errors such as the library being
+    miscompiled and segfaulting or returning incorrect answers, run on
+    import.
+    """
+    if hash("abc").encode("hex") != "13a9eab5281b7e8787b633dcf3b45408d1283f3a0af9b273d709ae9e1a27ae22":
+        raise Error("pycryptopp failed startup self-test. Please run pycryptopp unit tests.")
+
+start_up_self_test()
@@ -0,0 +1,356 @@
+/**
+ * treehashmodule.cpp -- SHA-256 tree hashes of large inputs, with the
+ * chunks hashed on several threads
+ *
+ * The input is cut into chunks of CHUNK_SIZE bytes (the last one may be
+ * shorter; an empty input is one empty chunk), and each chunk is hashed on
+ * its own, so the chunks can be hashed on as many threads as there are
+ * cores. Their digests are then combined a level at a time into a root,
+ * which is the same whatever the number of threads. Every hash is tagged
+ * with what it is a hash of:
+ *
+ *   leaf = SHA256(netstring(LEAF_TAG) + chunk)
+ *   node = SHA256(netstring(NODE_TAG) + left + right)
+ *   root = SHA256(netstring(ROOT_TAG) + top + 8-byte big-endian length)
+ *
+ * where netstring(s) is "%d:%s," % (len(s), s). Each level of nodes pairs
+ * up the level below it in order; an odd node at the end of a level is
+ * carried up to the next level as it is. top is the single node left at
+ * the end, and length is the length of the whole input in bytes.
+ * treehash.reference_hash() does the same in Python.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include <stdlib.h>
+#include <string.h>
+
+#include "treehashmodule.hpp"
+#include "sha256core.hpp"
+#include "../buffers.hpp"
+#include "../fileio.hpp"
+#include "../objectlock.hpp"
+#include "../parallel.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+static const char*const treehash___doc__ = "_treehash tree hashes";
+
+static PyObject *treehash_error;
+
+/* Part of the definition of the hash: changing any of these changes every
+   root. */
+#define CHUNK_SIZE (1 << 20)
+static const char*const LEAF_TAG = "pycryptopp_tree_hash_leaf_v1";
+static const char*const NODE_TAG = "pycryptopp_tree_hash_node_v1";
+static const char*const ROOT_TAG = "pycryptopp_tree_hash_root_v1";
+
+/* How many nodes are hashed with each call of
+   pycryptopp_sha256_many_from(). */
+#define PAIRS 256
+
+/* How many chunks hash_file() reads for each thread before hashing them. */
+#define CHUNKS_PER_THREAD 2
+
+/* SHA-256 after netstring(tag) of each of the tags, which every hash of
+   that kind continues from. */
+static pycryptopp_sha256_ctx leaf_start;
+static pycryptopp_sha256_ctx node_start;
+static pycryptopp_sha256_ctx root_start;
+
+static void
+start_tagged(pycryptopp_sha256_ctx* ctx, const char* tag) {
+    char header[32];
+    const int headersize = PyOS_snprintf(header, sizeof(header), "%ld:", static_cast<long>(strlen(tag)));
+    pycryptopp_sha256_init(ctx);
+    pycryptopp_sha256_update(ctx, reinterpret_cast<const byte*>(header), headersize);
+    pycryptopp_sha256_update(ctx, reinterpret_cast<const byte*>(tag), strlen(tag));
+    pycryptopp_sha256_update(ctx, reinterpret_cast<const byte*>(","), 1);
+}
+
+static size_t
+count_chunks(size_t len) {
+    return len ? (len - 1) / CHUNK_SIZE + 1 : 1;
+}
+
+typedef struct {
+    const byte* data;
+    size_t len;
+    byte* leaves;
+} leaf_job;
+
+static void
+leaf_job_task(void* context, Py_ssize_t i) {
+    const leaf_job* job = reinterpret_cast<const leaf_job*>(context);
+    const size_t start = static_cast<size_t>(i) * CHUNK_SIZE;
+    pycryptopp_sha256_ctx ctx = leaf_start;
+    pycryptopp_sha256_update(&ctx, job->data + start, CryptoPP::STDMIN(job->len - start, static_cast<size_t>(CHUNK_SIZE)));
+    pycryptopp_sha256_final(&ctx, job->leaves + 32*i);
+}
+
+/* Write the leaf of each of the count_chunks(len) chunks of data to leaves,
+   using up to threads threads. This does not touch Python objects, so may
+   be called with the GIL released. */
+static void
+hash_leaves(const byte* data, size_t len, byte* leaves, int threads) {
+    leaf_job job = { data, len, leaves };
+    const size_t nchunks = count_chunks(len);
+    if (threads > 1 && nchunks > 1)
+        pycryptopp_run_parallel(leaf_job_task, &job, nchunks, static_cast<int>(CryptoPP::STDMIN(static_cast<size_t>(threads), nchunks)));
+    else
+        for (size_t i = 0; i < nchunks; i++)
+            leaf_job_task(&job, i);
+}
+
+/* Combine the n leaves at nodes, which are overwritten, into the root of
+   an input of length bytes. This does not touch Python objects, so may be
+   called with the GIL released. */
+static void
+hash_root(byte* nodes, size_t n, CryptoPP::word64 length, byte* out) {
+    const byte* msgs[PAIRS];
+    size_t lens[PAIRS];
+    byte digests[32*PAIRS];
+    for (size_t i = 0; i < PAIRS; i++)
+        lens[i] = 64;
+    while (n > 1) {
+        /* Node j of the next level goes where node j of this one was, after
+           every node it is made from has been read. */
+        const size_t npairs = n / 2;
+        for (size_t first = 0; first < npairs; first += PAIRS) {
+            const size_t m = CryptoPP::STDMIN(npairs - first, static_cast<size_t>(PAIRS));
+            for (size_t i = 0; i < m; i++)
+                msgs[i] = nodes + 64*(first + i);
+            pycryptopp_sha256_many_from(&node_start, msgs, lens, m, digests);
+            memcpy(nodes + 32*first, digests, 32*m);
+        }
+        if (n % 2)
+            memmove(nodes + 32*npairs, nodes + 32*(n - 1), 32);
+        n = npairs + n % 2;
+    }
+
+    byte lengthbytes[8];
+    for (int i = 7; i >= 0; i--, length >>= 8)
+        lengthbytes[i] = static_cast<byte>(length);
+    pycryptopp_sha256_ctx ctx = root_start;
+    pycryptopp_sha256_update(&ctx, nodes, 32);
+    pycryptopp_sha256_update(&ctx, lengthbytes, sizeof(lengthbytes));
+    pycryptopp_sha256_final(&ctx, out);
+}
+
+static int
+check_threads(int threads) {
+    if (threads < 1) {
+        PyErr_Format(treehash_error, "Precondition violation: threads is required to be at least 1, but it was %d", threads);
+        return -1;
+    }
+    return 0;
+}
+
+PyObject *
+treehash_hash(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "data", "threads", NULL };
+    PyObject* dataobj;
+    int threads = 1;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "O|i:hash", const_cast<char**>(kwlist), &dataobj, &threads))
+        return NULL;
+    if (check_threads(threads))
+        return NULL;
+
+    Py_buffer data;
+    if (pycryptopp_get_read_buffer(dataobj, &data, PyExc_TypeError))
+        return NULL;
+    PyObject* result = NULL;
+    const size_t len = static_cast<size_t>(data.len);
+    byte* leaves = reinterpret_cast<byte*>(PyMem_Malloc(32*count_chunks(len)));
+    if (!leaves)
+        PyErr_NoMemory();
+    else if ((result = PyString_FromStringAndSize(NULL, 32))) {
+        const byte* msg = reinterpret_cast<const byte*>(data.buf);
+        byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+        /* Bytes that may move while the GIL is released are hashed with it
+           held, but still on as many threads. */
+        if (PYCRYPTOPP_BUFFER_PINNED(data) && len >= PYCRYPTOPP_GIL_MINSIZE) {
+            Py_BEGIN_ALLOW_THREADS
+            hash_leaves(msg, len, leaves, threads);
+            hash_root(leaves, count_chunks(len), len, out);
+            Py_END_ALLOW_THREADS
+        } else {
+            hash_leaves(msg, len, leaves, threads);
+            hash_root(leaves, count_chunks(len), len, out);
+        }
+    }
+    PyMem_Free(leaves);
+    PyBuffer_Release(&data);
+    return result;
+}
+
+const char*const treehash_hash__doc__ = "\
+hash(data, threads=1)\n\
+\n\
+Return the 32-byte tree hash of data, which may be any object supporting\n\
+the buffer protocol, such as a str, bytearray, memoryview or mmap. The\n\
+chunks of CHUNK_SIZE bytes are hashed on up to threads native threads at\n\
+once, so a large input is hashed up to threads times as fast as by one\n\
+SHA256 object on a machine with that many cores; the result is exactly the\n\
+same whatever the number of threads. Large inputs are hashed with the GIL\n\
+released, except for those (such as mmap objects) whose memory may be\n\
+moved meanwhile.\n\
+\n\
+This is not the SHA-256 digest of data: see the module documentation for\n\
+how the tree is hashed, and reference_hash() for the same in Python.";
+
+typedef struct {
+    int threads;
+
+    /* chunks read but not hashed yet, whole ones except perhaps at the end
+       of the file */
+    byte* batch;
+    size_t batchsize;
+    size_t filled;
+
+    byte* leaves;
+    size_t nleaves;
+    size_t capacity;
+    bool nomem;
+} hash_file_job;
+
+/* Hash the chunks in job->batch, adding their leaves to the list. */
+static void
+hash_file_flush(hash_file_job* job) {
+    const size_t nchunks = count_chunks(job->filled);
+    if (job->nleaves + nchunks > job->capacity) {
+        const size_t capacity = CryptoPP::STDMAX(2*job->capacity, job->nleaves + nchunks);
+        byte* leaves = reinterpret_cast<byte*>(realloc(job->leaves, 32*capacity));
+        if (!leaves) {
+            job->nomem = true;
+            return;
+        }
+        job->leaves = leaves;
+        job->capacity = capacity;
+    }
+    hash_leaves(job->batch, job->filled, job->leaves + 32*job->nleaves, job->threads);
+    job->nleaves += nchunks;
+    job->filled = 0;
+}
+
+static void
+hash_file_window(void* context, const byte* in, size_t len) {
+    hash_file_job* job = reinterpret_cast<hash_file_job*>(context);
+    while (len && !job->nomem) {
+        const size_t n = CryptoPP::STDMIN(len, job->batchsize - job->filled);
+        memcpy(job->batch + job->filled, in, n);
+        job->filled += n;
+        in += n;
+        len -= n;
+        if (job->filled == job->batchsize)
+            hash_file_flush(job);
+    }
+}
+
+PyObject *
+treehash_hash_file(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "path_or_fd", "offset", "length", "threads", NULL };
+    PyObject* path_or_fd;
+    PY_LONG_LONG offset = 0;
+    PyObject* lengthobj = Py_None;
+    int threads = 1;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "O|LOi:hash_file", const_cast<char**>(kwlist), &path_or_fd, &offset, &lengthobj, &threads))
+        return NULL;
+    if (check_threads(threads))
+        return NULL;
+
+    PY_LONG_LONG length = -1;
+    if (lengthobj != Py_None) {
+        length = PyLong_AsLongLong(lengthobj);
+        if (length == -1 && PyErr_Occurred())
+            return NULL;
+        if (length < 0)
+            return PyErr_Format(treehash_error, "Precondition violation: length is required to be None or non-negative, but it was %lld.", length);
+    }
+    if (offset < 0)
+        return PyErr_Format(treehash_error, "Precondition violation: offset is required to be non-negative, but it was %lld.", offset);
+
+    char* path;
+    int fd;
+    if (pycryptopp_get_path_or_fd(path_or_fd, &path, &fd, treehash_error))
+        return NULL;
+
+    hash_file_job job;
+    job.threads = threads;
+    job.batchsize = static_cast<size_t>(CHUNK_SIZE) * CHUNKS_PER_THREAD * threads;
+    job.filled = 0;
+    job.leaves = NULL;
+    job.nleaves = job.capacity = 0;
+    job.nomem = false;
+    if (!(job.batch = reinterpret_cast<byte*>(PyMem_Malloc(job.batchsize)))) {
+        PyMem_Free(path);
+        return PyErr_NoMemory();
+    }
+
+    PyObject* result = NULL;
+    PY_LONG_LONG processed;
+    if (pycryptopp_read_file(path, fd, offset, length, hash_file_window, &job, &processed) == 0) {
+        /* what is left of the file, which is one empty chunk if the whole
+           of the range is empty */
+        if (!job.nomem && (job.filled || job.nleaves == 0)) {
+            Py_BEGIN_ALLOW_THREADS
+            hash_file_flush(&job);
+            Py_END_ALLOW_THREADS
+        }
+        if (length >= 0 && processed < length)
+            PyErr_Format(treehash_error, "Precondition violation: the file is required to have length bytes from offset, which is %lld bytes, but it ended after %lld.", length, processed);
+        else if (job.nomem)
+            PyErr_NoMemory();
+        else if ((result = PyString_FromStringAndSize(NULL, 32))) {
+            byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+            Py_BEGIN_ALLOW_THREADS
+            hash_root(job.leaves, job.nleaves, processed, out);
+            Py_END_ALLOW_THREADS
+        }
+    }
+    PyMem_Free(job.batch);
+    free(job.leaves);
+    PyMem_Free(path);
+    return result;
+}
+
+const char*const treehash_hash_file__doc__ = "\
+hash_file(path_or_fd, offset=0, length=None, threads=1)\n\
+\n\
+Return the tree hash of the file with the given path, or of the open file\n\
+descriptor if an integer is given, from byte offset onwards: length bytes\n\
+of it, or the rest of it if length is None. This gives the same result as\n\
+hash(data, threads) on those bytes, but the file is read without the data\n\
+passing through Python, and the GIL is released throughout. The file is\n\
+read a few chunks for each thread at a time, and each batch is hashed on up\n\
+to threads native threads. A descriptor is read without moving its file\n\
+position (except on Windows), and is not closed.\n\
+\n\
+Raises IOError if the file cannot be read, and Error if length is given and\n\
+the file ends before offset + length.";
+
+void
+init_treehash(PyObject* module) {
+    start_tagged(&leaf_start, LEAF_TAG);
+    start_tagged(&node_start, NODE_TAG);
+    start_tagged(&root_start, ROOT_TAG);
+
+    treehash_error = PyErr_NewException(const_cast<char*>("_treehash.Error"), NULL, NULL);
+    PyModule_AddObject(module, "treehash_Error", treehash_error);
+
+    PyModule_AddIntConstant(module, "treehash_CHUNK_SIZE", CHUNK_SIZE);
+    PyModule_AddStringConstant(module, "treehash_LEAF_TAG", const_cast<char*>(LEAF_TAG));
+    PyModule_AddStringConstant(module, "treehash_NODE_TAG", const_cast<char*>(NODE_TAG));
+    PyModule_AddStringConstant(module, "treehash_ROOT_TAG", const_cast<char*>(ROOT_TAG));
+
+    PyModule_AddStringConstant(module, "treehash___doc__", const_cast<char*>(treehash___doc__));
+}
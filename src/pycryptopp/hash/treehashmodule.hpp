@@ -0,0 +1,15 @@
+#ifndef __INCL_TREEHASHMODULE_HPP
+#define __INCL_TREEHASHMODULE_HPP
+
+extern void
+init_treehash(PyObject* module);
+
+extern PyObject *
+treehash_hash(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const treehash_hash__doc__;
+
+extern PyObject *
+treehash_hash_file(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const treehash_hash_file__doc__;
+
+#endif /* #ifndef __INCL_TREEHASHMODULE_HPP */
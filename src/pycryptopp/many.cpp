@@ -0,0 +1,227 @@
+/**
+ * many.cpp -- the arguments of the process_many() functions
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#else
+#include <src-cryptopp/config.h>
+#endif
+
+#include "buffers.hpp"
+#include "many.hpp"
+
+static int
+is_sequence(PyObject* obj) {
+    return PyList_Check(obj) || PyTuple_Check(obj);
+}
+
+static Py_buffer*
+get_view(pycryptopp_many* m, PyObject* obj, PyObject* error) {
+    Py_buffer* view = &m->views[m->nviews];
+    if (pycryptopp_get_read_buffer(obj, view, error))
+        return NULL;
+    m->nviews++;
+    if (!PYCRYPTOPP_BUFFER_PINNED(*view))
+        m->pinned = false;
+    return view;
+}
+
+/* Get the items of seq, which must be a list or tuple of n buffers. */
+static PyObject*
+get_items(pycryptopp_many* m, PyObject* seq, const char* name, PyObject* error) {
+    PyObject* items = PySequence_Tuple(seq);
+    if (!items)
+        return NULL;
+    if (PyTuple_GET_SIZE(items) != m->n) {
+        PyErr_Format(error, "Precondition violation: %s is required to have one item for each of the %zd messages, but it had %zd.", name, m->n, PyTuple_GET_SIZE(items));
+        Py_DECREF(items);
+        return NULL;
+    }
+    return items;
+}
+
+int
+pycryptopp_many_parse(pycryptopp_many* m, PyObject* keys, PyObject* ivs, PyObject* datas, PyObject* record_sizeobj, size_t ivsize, PyObject* error) {
+    memset(m, 0, sizeof(*m));
+    m->pinned = true;
+
+    Py_ssize_t record_size = -1;
+    if (record_sizeobj != Py_None) {
+        record_size = PyNumber_AsSsize_t(record_sizeobj, PyExc_OverflowError);
+        if (record_size == -1 && PyErr_Occurred())
+            return -1;
+        if (record_size <= 0) {
+            PyErr_Format(error, "Precondition violation: record_size is required to be positive, but it was %zd.", record_size);
+            return -1;
+        }
+    }
+
+    PyObject* items[3] = { NULL, NULL, NULL };
+    Py_buffer packed;
+    int result = -1;
+    byte* out;
+    Py_ssize_t i;
+
+    if (record_size < 0) {
+        if (!is_sequence(datas)) {
+            PyErr_Format(error, "Precondition violation: datas is required to be a list or tuple of messages, or a buffer of records if record_size is given, but it was %.200s.", Py_TYPE(datas)->tp_name);
+            return -1;
+        }
+        m->n = PySequence_Size(datas);
+    } else {
+        if (pycryptopp_get_read_buffer(datas, &packed, error))
+            return -1;
+        if (packed.len % record_size) {
+            PyErr_Format(error, "Precondition violation: datas is required to be a whole number of records of %zd bytes, but it was %zd bytes.", record_size, packed.len);
+            PyBuffer_Release(&packed);
+            return -1;
+        }
+        m->n = packed.len / record_size;
+    }
+
+    const Py_ssize_t n = m->n;
+    m->keys = PyMem_New(const byte*, n+1);
+    m->keysizes = PyMem_New(size_t, n+1);
+    m->ivs = PyMem_New(const byte*, n+1);
+    m->ins = PyMem_New(const byte*, n+1);
+    m->lens = PyMem_New(size_t, n+1);
+    m->outs = PyMem_New(byte*, n+1);
+    m->views = PyMem_New(Py_buffer, 3*n+3);
+    if (!m->keys || !m->keysizes || !m->ivs || !m->ins || !m->lens || !m->outs || !m->views) {
+        if (record_size >= 0)
+            PyBuffer_Release(&packed);
+        PyErr_NoMemory();
+        goto done;
+    }
+
+    /* the messages */
+    if (record_size < 0) {
+        if (!(items[0] = get_items(m, datas, "datas", error)))
+            goto done;
+        for (i = 0; i < n; i++) {
+            Py_buffer* view = get_view(m, PyTuple_GET_ITEM(items[0], i), error);
+            if (!view)
+                goto done;
+            m->ins[i] = reinterpret_cast<const byte*>(view->buf);
+            m->lens[i] = view->len;
+            m->total += view->len;
+        }
+    } else {
+        m->views[m->nviews++] = packed;
+        if (!PYCRYPTOPP_BUFFER_PINNED(packed))
+            m->pinned = false;
+        for (i = 0; i < n; i++) {
+            m->ins[i] = reinterpret_cast<const byte*>(packed.buf) + i*record_size;
+            m->lens[i] = record_size;
+        }
+        m->total = packed.len;
+    }
+
+    /* the keys */
+    if (is_sequence(keys)) {
+        if (!(items[1] = get_items(m, keys, "keys", error)))
+            goto done;
+        for (i = 0; i < n; i++) {
+            Py_buffer* view = get_view(m, PyTuple_GET_ITEM(items[1], i), error);
+            if (!view)
+                goto done;
+            m->keys[i] = reinterpret_cast<const byte*>(view->buf);
+            m->keysizes[i] = view->len;
+        }
+    } else {
+        Py_buffer* view = get_view(m, keys, error);
+        if (!view)
+            goto done;
+        if (n && view->len % n) {
+            PyErr_Format(error, "Precondition violation: keys is required to hold one key of the same size for each of the %zd messages, but it was %zd bytes.", n, view->len);
+            goto done;
+        }
+        for (i = 0; i < n; i++) {
+            m->keysizes[i] = view->len / n;
+            m->keys[i] = reinterpret_cast<const byte*>(view->buf) + i*m->keysizes[i];
+        }
+    }
+
+    /* the IVs */
+    if (ivs == Py_None) {
+        for (i = 0; i < n; i++)
+            m->ivs[i] = NULL;
+    } else if (is_sequence(ivs)) {
+        if (!(items[2] = get_items(m, ivs, "ivs", error)))
+            goto done;
+        for (i = 0; i < n; i++) {
+            Py_buffer* view = get_view(m, PyTuple_GET_ITEM(items[2], i), error);
+            if (!view)
+                goto done;
+            if (static_cast<size_t>(view->len) != ivsize) {
+                PyErr_Format(error, "Precondition violation: each IV is required to be exactly %zu bytes, but ivs[%zd] was %zd bytes.", ivsize, i, view->len);
+                goto done;
+            }
+            m->ivs[i] = reinterpret_cast<const byte*>(view->buf);
+        }
+    } else {
+        Py_buffer* view = get_view(m, ivs, error);
+        if (!view)
+            goto done;
+        if (static_cast<size_t>(view->len) != n * ivsize) {
+            PyErr_Format(error, "Precondition violation: ivs is required to hold one IV of %zu bytes for each of the %zd messages, but it was %zd bytes.", ivsize, n, view->len);
+            goto done;
+        }
+        for (i = 0; i < n; i++)
+            m->ivs[i] = reinterpret_cast<const byte*>(view->buf) + i*ivsize;
+    }
+
+    /* somewhere to put the results */
+    if (record_size < 0) {
+        if (!(m->result = PyList_New(n)))
+            goto done;
+        for (i = 0; i < n; i++) {
+            PyObject* s = PyString_FromStringAndSize(NULL, m->lens[i]);
+            if (!s)
+                goto done;
+            PyList_SET_ITEM(m->result, i, s);
+            m->outs[i] = reinterpret_cast<byte*>(PyString_AS_STRING(s));
+        }
+    } else {
+        if (!(m->result = PyString_FromStringAndSize(NULL, n*record_size)))
+            goto done;
+        out = reinterpret_cast<byte*>(PyString_AS_STRING(m->result));
+        for (i = 0; i < n; i++)
+            m->outs[i] = out + i*record_size;
+    }
+    result = 0;
+
+ done:
+    /* The views keep the items with new-style buffers alive. The others
+       are only used with the GIL held, so nothing can happen to the
+       caller's sequences in the meantime. */
+    for (int j = 0; j < 3; j++)
+        Py_XDECREF(items[j]);
+    if (result)
+        Py_CLEAR(m->result);
+    return result;
+}
+
+void
+pycryptopp_many_release(pycryptopp_many* m) {
+    if (m->views) {
+        for (Py_ssize_t i = 0; i < m->nviews; i++)
+            PyBuffer_Release(&m->views[i]);
+    }
+    PyMem_Free(m->keys);
+    PyMem_Free(m->keysizes);
+    PyMem_Free(m->ivs);
+    PyMem_Free(m->ins);
+    PyMem_Free(m->lens);
+    PyMem_Free(m->outs);
+    PyMem_Free(m->views);
+    memset(m, 0, sizeof(*m));
+}
@@ -0,0 +1,56 @@
+#ifndef __INCL_MANY_HPP
+#define __INCL_MANY_HPP
+
+/**
+ * many.hpp -- the arguments of the process_many() functions, which run a
+ * stream cipher over many messages, each with its own key and IV, in one
+ * call.
+ */
+
+typedef struct {
+    /* the number of messages, and for each of them its key, its IV (or
+       NULL for all zeroes), its input and where to put its output; and the
+       total length of the messages */
+    Py_ssize_t n;
+    const byte** keys;
+    size_t* keysizes;
+    const byte** ivs;
+    const byte** ins;
+    size_t* lens;
+    byte** outs;
+    size_t total;
+
+    /* the return value: a list of strings, or one string */
+    PyObject* result;
+
+    /* True if every buffer may be used with the GIL released */
+    bool pinned;
+
+    /* internal */
+    Py_buffer* views;
+    Py_ssize_t nviews;
+} pycryptopp_many;
+
+/**
+ * Take apart the arguments of a process_many() call.
+ *
+ * datas is a sequence of messages, or, if record_size is not None, one
+ * buffer holding messages of record_size bytes each. keys is a sequence of
+ * the same length, or one buffer holding all of the keys, which must then
+ * be the same size. ivs is None, a sequence, or one buffer holding all of
+ * the IVs, each ivsize bytes.
+ *
+ * On success returns 0, with m->result holding a new list of empty strings
+ * (or one string) of the right lengths for the outputs to be written to.
+ * Key sizes are left for the caller to check. On failure raises error and
+ * returns -1. Either way, call pycryptopp_many_release() afterwards.
+ */
+extern int
+pycryptopp_many_parse(pycryptopp_many* m, PyObject* keys, PyObject* ivs, PyObject* datas, PyObject* record_size, size_t ivsize, PyObject* error);
+
+/* Release the buffers held by m and free its arrays. m->result is left
+   alone. */
+extern void
+pycryptopp_many_release(pycryptopp_many* m);
+
+#endif /* #ifndef __INCL_MANY_HPP */
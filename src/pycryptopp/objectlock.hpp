@@ -0,0 +1,113 @@
+#ifndef __INCL_OBJECTLOCK_HPP
+#define __INCL_OBJECTLOCK_HPP
+
+/**
+ * objectlock.hpp -- helpers for releasing the GIL around long-running
+ * Crypto++ calls while keeping each Python object safe to share between
+ * threads.
+ *
+ * This follows the scheme used by the hashlib module of the Python standard
+ * library: an object grows a lock the first time it is handed a large
+ * input, and from then on every operation on that object holds the lock.
+ * Objects which are only ever used for small inputs never pay for a lock.
+ *
+ * A struct using these helpers must have a member declared as
+ *
+ *     PyThread_type_lock lock;
+ *
+ * which is NULL until the first large operation.
+ */
+
+#ifdef WITH_THREAD
+#include <pythread.h>
+#endif
+
+/* Inputs of at least this many bytes are processed with the GIL released.
+   Below this the cost of releasing and re-acquiring the GIL outweighs the
+   work being done. */
+#define PYCRYPTOPP_GIL_MINSIZE 2048
+
+#ifdef WITH_THREAD
+
+/* Allocate obj's lock if it does not have one yet and size is large enough
+   to be worth releasing the GIL for. */
+#define OBJECTLOCK_PREPARE(obj, size) \
+    if (!(obj)->lock && (size) >= PYCRYPTOPP_GIL_MINSIZE) { \
+        (obj)->lock = PyThread_allocate_lock(); \
+    }
+
+/* Allocate obj's lock unconditionally, for objects whose every operation is
+   expensive (public-key operations). Returns NULL from the enclosing
+   function on failure. */
+#define OBJECTLOCK_REQUIRE(obj) \
+    if (!(obj)->lock) { \
+        (obj)->lock = PyThread_allocate_lock(); \
+        if (!(obj)->lock) \
+            return PyErr_NoMemory(); \
+    }
+
+/* Acquire obj's lock (if it has one) while holding the GIL. If another
+   thread holds the lock then wait for it with the GIL released. */
+#define ENTER_OBJECTLOCK(obj) \
+    if ((obj)->lock) { \
+        if (!PyThread_acquire_lock((obj)->lock, 0)) { \
+            Py_BEGIN_ALLOW_THREADS \
+            PyThread_acquire_lock((obj)->lock, 1); \
+            Py_END_ALLOW_THREADS \
+        } \
+    }
+
+#define LEAVE_OBJECTLOCK(obj) \
+    if ((obj)->lock) { \
+        PyThread_release_lock((obj)->lock); \
+    }
+
+#define FREE_OBJECTLOCK(obj) \
+    if ((obj)->lock) { \
+        PyThread_free_lock((obj)->lock); \
+        (obj)->lock = NULL; \
+    }
+
+/* Run stmt with obj's lock held. If obj has a lock then the GIL is released
+   for the duration; otherwise stmt runs with the GIL held, which is safe
+   because only locked objects are ever used with the GIL released. stmt
+   must not touch any Python objects and must not throw. */
+#define WITH_OBJECTLOCK_NOGIL(obj, stmt) \
+    if ((obj)->lock) { \
+        Py_BEGIN_ALLOW_THREADS \
+        PyThread_acquire_lock((obj)->lock, 1); \
+        stmt; \
+        PyThread_release_lock((obj)->lock); \
+        Py_END_ALLOW_THREADS \
+    } else { \
+        stmt; \
+    }
+
+/* Run stmt with obj's lock held. If release_gil is true then this behaves
+   like OBJECTLOCK_PREPARE followed by WITH_OBJECTLOCK_NOGIL; otherwise stmt
+   runs with the GIL held, as it must when it uses memory that is only valid
+   while the GIL is held. */
+#define WITH_OBJECTLOCK(obj, release_gil, size, stmt) \
+    if (release_gil) { \
+        OBJECTLOCK_PREPARE(obj, size); \
+        WITH_OBJECTLOCK_NOGIL(obj, stmt); \
+    } else { \
+        ENTER_OBJECTLOCK(obj); \
+        stmt; \
+        LEAVE_OBJECTLOCK(obj); \
+    }
+
+#else /* WITH_THREAD */
+
+typedef void *PyThread_type_lock;
+#define OBJECTLOCK_PREPARE(obj, size)
+#define OBJECTLOCK_REQUIRE(obj)
+#define ENTER_OBJECTLOCK(obj)
+#define LEAVE_OBJECTLOCK(obj)
+#define FREE_OBJECTLOCK(obj)
+#define WITH_OBJECTLOCK_NOGIL(obj, stmt) stmt;
+#define WITH_OBJECTLOCK(obj, release_gil, size, stmt) stmt;
+
+#endif /* WITH_THREAD */
+
+#endif /* #ifndef __INCL_OBJECTLOCK_HPP */
@@ -0,0 +1,127 @@
+/**
+ * parallel.cpp -- run independent pieces of native work on several threads.
+ *
+ * Threads are started for each job with the portable PyThread API rather
+ * than kept in a pool: jobs are only split up when each piece is large
+ * (tens of kilobytes of crypto or more), so the cost of starting a thread is
+ * lost in the noise, and there is nothing to clean up when the interpreter
+ * exits.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "parallel.hpp"
+
+#ifdef WITH_THREAD
+#include <pythread.h>
+
+typedef struct {
+    pycryptopp_task_func func;
+    void* context;
+    Py_ssize_t ntasks;
+
+    /* protects next and running */
+    PyThread_type_lock mutex;
+    Py_ssize_t next;
+    /* the number of helper threads still working, plus one until the
+       calling thread has finished its own share */
+    int running;
+
+    /* released by whichever thread brings running down to zero, if that is
+       a helper thread */
+    PyThread_type_lock done;
+} Job;
+
+/** Run tasks from job until there are none left. */
+static void
+Job_work(Job* job) {
+    for (;;) {
+        PyThread_acquire_lock(job->mutex, 1);
+        Py_ssize_t i = job->next;
+        if (i < job->ntasks)
+            job->next++;
+        PyThread_release_lock(job->mutex);
+        if (i >= job->ntasks)
+            return;
+        job->func(job->context, i);
+    }
+}
+
+static void
+Job_helper(void* arg) {
+    Job* job = reinterpret_cast<Job*>(arg);
+    Job_work(job);
+    PyThread_acquire_lock(job->mutex, 1);
+    int last = (--job->running == 0);
+    PyThread_release_lock(job->mutex);
+    if (last)
+        PyThread_release_lock(job->done);
+}
+
+void
+pycryptopp_run_parallel(pycryptopp_task_func func, void* context, Py_ssize_t ntasks, int nthreads) {
+    if (nthreads > ntasks)
+        nthreads = static_cast<int>(ntasks);
+
+    Job job;
+    job.func = func;
+    job.context = context;
+    job.ntasks = ntasks;
+    job.next = 0;
+    job.running = 1;
+    job.mutex = NULL;
+    job.done = NULL;
+
+    if (nthreads > 1) {
+        job.mutex = PyThread_allocate_lock();
+        job.done = PyThread_allocate_lock();
+    }
+    if (!job.mutex || !job.done) {
+        if (job.mutex)
+            PyThread_free_lock(job.mutex);
+        if (job.done)
+            PyThread_free_lock(job.done);
+        for (Py_ssize_t i = 0; i < ntasks; i++)
+            func(context, i);
+        return;
+    }
+
+    PyThread_acquire_lock(job.done, 1);
+    for (int t = 1; t < nthreads; t++) {
+        PyThread_acquire_lock(job.mutex, 1);
+        job.running++;
+        PyThread_release_lock(job.mutex);
+        if (PyThread_start_new_thread(Job_helper, &job) == -1) {
+            PyThread_acquire_lock(job.mutex, 1);
+            job.running--;
+            PyThread_release_lock(job.mutex);
+            break;
+        }
+    }
+
+    Job_work(&job);
+
+    PyThread_acquire_lock(job.mutex, 1);
+    int last = (--job.running == 0);
+    PyThread_release_lock(job.mutex);
+    if (!last)
+        PyThread_acquire_lock(job.done, 1);
+    /* Either every helper has finished, or the last one released job.done
+       after its final use of job, so it is safe to throw job away. */
+    PyThread_free_lock(job.done);
+    PyThread_free_lock(job.mutex);
+}
+
+#else /* WITH_THREAD */
+
+void
+pycryptopp_run_parallel(pycryptopp_task_func func, void* context, Py_ssize_t ntasks, int nthreads) {
+    for (Py_ssize_t i = 0; i < ntasks; i++)
+        func(context, i);
+}
+
+#endif /* WITH_THREAD */
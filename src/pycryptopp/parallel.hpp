@@ -0,0 +1,24 @@
+#ifndef __INCL_PARALLEL_HPP
+#define __INCL_PARALLEL_HPP
+
+/**
+ * parallel.hpp -- run independent pieces of native work on several threads.
+ */
+
+/* Do task number i of a job, using the job's context. Tasks are run
+   concurrently on native threads, so they must not touch Python objects or
+   throw. */
+typedef void (*pycryptopp_task_func)(void* context, Py_ssize_t i);
+
+/**
+ * Run func(context, i) for every i in [0, ntasks), on up to nthreads threads
+ * (the calling thread included), and return when all of them have finished.
+ * Tasks are handed out one at a time, so they need not be of equal size.
+ *
+ * If helper threads cannot be started then the calling thread does all of
+ * the work itself, so this always completes. Call it with the GIL released.
+ */
+extern void
+pycryptopp_run_parallel(pycryptopp_task_func func, void* context, Py_ssize_t ntasks, int nthreads);
+
+#endif /* #ifndef __INCL_PARALLEL_HPP */
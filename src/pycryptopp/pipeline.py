@@ -0,0 +1,84 @@
+"""
+Encryption and hashing in a single pass over the data.
+
+Encrypting a segment with AES and then hashing the plaintext and the
+ciphertext with SHA-256 reads every byte from memory three times. These
+functions do all three together, a few kilobytes at a time, while the data
+is still in the cache.
+"""
+
+from pycryptopp import _import_my_names
+
+# These initializations to None are just to pacify pyflakes, which
+# doesn't understand that we have to do some funky import trickery
+# below in _import_my_names() in order to get sensible namespaces.
+crypt_and_hash=None
+Error=None
+IntegrityError=None
+
+_import_my_names(globals(), "pipeline_")
+
+del _import_my_names
+
+try:
+    from hmac import compare_digest as _digests_equal
+except ImportError:
+    # Python before 2.7.7
+    def _digests_equal(a, b):
+        """ Compare two strs in a time that depends only on their lengths. """
+        if len(a) != len(b):
+            return False
+        result = 0
+        for x, y in zip(a, b):
+            result |= ord(x) ^ ord(y)
+        return result == 0
+
+def _hasher(h):
+    from pycryptopp.hash import sha256
+    if h is True:
+        return sha256.SHA256()
+    if h is False:
+        return None
+    return h
+
+def encrypt_and_hash(cryptor, data, hash_plaintext=True, hash_ciphertext=True):
+    """
+    Encrypt data with the AES object cryptor, hashing the plaintext and the
+    ciphertext as it goes. Returns (ciphertext, plaintext_hasher,
+    ciphertext_hasher).
+
+    hash_plaintext and hash_ciphertext may each be True, to hash with a new
+    sha256.SHA256 object, an existing SHA256 object to be updated (to hash
+    several segments in turn, for instance), or False or None not to hash
+    at all, in which case None is returned in its place.
+    """
+    plaintext_hasher = _hasher(hash_plaintext)
+    ciphertext_hasher = _hasher(hash_ciphertext)
+    ciphertext = crypt_and_hash(cryptor, data, plaintext_hasher, ciphertext_hasher)
+    return ciphertext, plaintext_hasher, ciphertext_hasher
+
+def decrypt_and_hash(cryptor, data, hash_plaintext=True, hash_ciphertext=True):
+    """
+    Decrypt data with the AES object cryptor, hashing the ciphertext and the
+    plaintext as it goes. Returns (plaintext, plaintext_hasher,
+    ciphertext_hasher). The parameters are as for encrypt_and_hash().
+    """
+    plaintext_hasher = _hasher(hash_plaintext)
+    ciphertext_hasher = _hasher(hash_ciphertext)
+    plaintext = crypt_and_hash(cryptor, data, ciphertext_hasher, plaintext_hasher)
+    return plaintext, plaintext_hasher, ciphertext_hasher
+
+def decrypt_and_verify(cryptor, data, ciphertext_digest=None, plaintext_digest=None):
+    """
+    Decrypt data with the AES object cryptor and return the plaintext, but
+    raise IntegrityError instead if the SHA-256 digest of the ciphertext is
+    not ciphertext_digest, or that of the plaintext is not plaintext_digest.
+    Either digest may be None not to check it. The digests are compared in
+    constant time.
+    """
+    plaintext, plaintext_hasher, ciphertext_hasher = decrypt_and_hash(cryptor, data, plaintext_digest is not None, ciphertext_digest is not None)
+    if ciphertext_hasher is not None and not _digests_equal(ciphertext_hasher.digest(), ciphertext_digest):
+        raise IntegrityError("The ciphertext does not match its digest.")
+    if plaintext_hasher is not None and not _digests_equal(plaintext_hasher.digest(), plaintext_digest):
+        raise IntegrityError("The plaintext does not match its digest.")
+    return plaintext
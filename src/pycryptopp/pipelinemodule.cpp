@@ -0,0 +1,213 @@
+/**
+ * pipelinemodule.cpp -- AES-CTR and SHA-256 fused into a single pass over
+ * the data
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#if (PY_VERSION_HEX < 0x02050000)
+typedef int Py_ssize_t;
+#endif
+
+#include "pipelinemodule.hpp"
+#include "buffers.hpp"
+#include "objectlock.hpp"
+#include "cipher/aesmodule.hpp"
+#include "hash/sha256module.hpp"
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/misc.h>
+#else
+#include <src-cryptopp/misc.h>
+#endif
+
+static const char*const pipeline___doc__ = "_pipeline -- encryption and hashing in one pass";
+
+static PyObject *pipeline_error;
+static PyObject *pipeline_integrity_error;
+
+/* The data is encrypted and hashed in pieces of this size, small enough for
+   each piece and its result to still be in the L1 cache when they are
+   hashed. */
+static const size_t CHUNK = 8*1024;
+
+static void
+crypt_and_hash(PyObject* cryptor, PyObject* input_hasher, PyObject* output_hasher, byte* out, const byte* in, size_t len) {
+    while (len) {
+        const size_t n = CryptoPP::STDMIN(len, CHUNK);
+        if (input_hasher)
+            sha256_update(input_hasher, in, n);
+        aes_crypt(cryptor, out, in, n);
+        if (output_hasher)
+            sha256_update(output_hasher, out, n);
+        in += n;
+        out += n;
+        len -= n;
+    }
+}
+
+/* The locks of the objects taking part, sorted by address, so that two calls
+   sharing some of their objects always take the locks in the same order and
+   can never each hold a lock that the other is waiting for. */
+typedef struct {
+    PyThread_type_lock* locks[3];
+    int n;
+} Locks;
+
+static void
+Locks_add(Locks* l, PyThread_type_lock* lock) {
+    int i = l->n++;
+    while (i > 0 && l->locks[i-1] > lock) {
+        l->locks[i] = l->locks[i-1];
+        i--;
+    }
+    l->locks[i] = lock;
+}
+
+/* Check that the SHA256 object obj (or NULL) can still be updated. Returns
+   -1 with an exception set if not. */
+static int
+check_not_finalized(PyObject* obj, const char* name) {
+    if (obj && sha256_finalized(obj)) {
+        PyErr_Format(pipeline_error, "Precondition violation: %s is required to be a SHA256 object whose .digest() has not been called yet.", name);
+        return -1;
+    }
+    return 0;
+}
+
+/* Check that obj is a SHA256 object that can still be updated, or None.
+   Returns the object, or NULL for None, setting *failed on failure. */
+static PyObject*
+get_hasher(PyObject* obj, const char* name, bool* failed) {
+    if (obj == Py_None)
+        return NULL;
+    if (!sha256_check(obj)) {
+        PyErr_Format(pipeline_error, "Precondition violation: %s is required to be a sha256.SHA256 object or None, but it was %.200s.", name, Py_TYPE(obj)->tp_name);
+        *failed = true;
+        return NULL;
+    }
+    if (check_not_finalized(obj, name)) {
+        *failed = true;
+        return NULL;
+    }
+    return obj;
+}
+
+PyObject *
+pipeline_crypt_and_hash(PyObject *dummy, PyObject *args, PyObject *kwdict) {
+    static const char *kwlist[] = { "cryptor", "data", "input_hasher", "output_hasher", NULL };
+    PyObject* cryptor;
+    PyObject* dataobj;
+    PyObject* input_hasherobj = Py_None;
+    PyObject* output_hasherobj = Py_None;
+    if (!PyArg_ParseTupleAndKeywords(args, kwdict, "OO|OO:crypt_and_hash", const_cast<char**>(kwlist), &cryptor, &dataobj, &input_hasherobj, &output_hasherobj))
+        return NULL;
+
+    if (!aes_check(cryptor))
+        return PyErr_Format(pipeline_error, "Precondition violation: cryptor is required to be an aes.AES object, but it was %.200s.", Py_TYPE(cryptor)->tp_name);
+    bool failed = false;
+    PyObject* input_hasher = get_hasher(input_hasherobj, "input_hasher", &failed);
+    PyObject* output_hasher = get_hasher(output_hasherobj, "output_hasher", &failed);
+    if (failed)
+        return NULL;
+    if (input_hasher && input_hasher == output_hasher)
+        return PyErr_Format(pipeline_error, "Precondition violation: input_hasher and output_hasher are required to be different objects.");
+
+    Py_buffer data;
+    if (pycryptopp_get_read_buffer(dataobj, &data, pipeline_error))
+        return NULL;
+    assert (data.len >= 0);
+
+    PyObject* result = PyString_FromStringAndSize(NULL, data.len);
+    if (!result) {
+        PyBuffer_Release(&data);
+        return NULL;
+    }
+    byte* out = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    const byte* in = reinterpret_cast<const byte*>(data.buf);
+
+#ifdef WITH_THREAD
+    Locks l;
+    l.n = 0;
+    Locks_add(&l, aes_lock(cryptor));
+    if (input_hasher)
+        Locks_add(&l, sha256_lock(input_hasher));
+    if (output_hasher)
+        Locks_add(&l, sha256_lock(output_hasher));
+
+    int i;
+    /* as OBJECTLOCK_PREPARE: only objects with a lock are ever used with the
+       GIL released, so if any lock cannot be had the GIL is kept */
+    bool release_gil = PYCRYPTOPP_BUFFER_PINNED(data) && data.len >= PYCRYPTOPP_GIL_MINSIZE;
+    for (i = 0; release_gil && i < l.n; i++) {
+        if (!*l.locks[i])
+            *l.locks[i] = PyThread_allocate_lock();
+        if (!*l.locks[i])
+            release_gil = false;
+    }
+
+    /* as ENTER_OBJECTLOCK */
+    for (i = 0; i < l.n; i++) {
+        if (*l.locks[i] && !PyThread_acquire_lock(*l.locks[i], 0)) {
+            Py_BEGIN_ALLOW_THREADS
+            PyThread_acquire_lock(*l.locks[i], 1);
+            Py_END_ALLOW_THREADS
+        }
+    }
+#endif
+
+    /* A hasher may have been finalized by another thread while we waited
+       for its lock. */
+    failed = check_not_finalized(input_hasher, "input_hasher") || check_not_finalized(output_hasher, "output_hasher");
+
+    if (!failed) {
+#ifdef WITH_THREAD
+        if (release_gil) {
+            Py_BEGIN_ALLOW_THREADS
+            crypt_and_hash(cryptor, input_hasher, output_hasher, out, in, data.len);
+            Py_END_ALLOW_THREADS
+        } else
+#endif
+            crypt_and_hash(cryptor, input_hasher, output_hasher, out, in, data.len);
+    }
+
+#ifdef WITH_THREAD
+    /* as LEAVE_OBJECTLOCK */
+    for (i = l.n-1; i >= 0; i--)
+        if (*l.locks[i])
+            PyThread_release_lock(*l.locks[i]);
+#endif
+
+    if (failed)
+        Py_CLEAR(result);
+    PyBuffer_Release(&data);
+    return result;
+}
+
+const char*const pipeline_crypt_and_hash__doc__ = "\
+crypt_and_hash(cryptor, data, input_hasher=None, output_hasher=None)\n\
+\n\
+Encrypt or decrypt data with the AES object cryptor and return the result,\n\
+as cryptor.process(data) does, while also updating input_hasher with data\n\
+and output_hasher with the result, as input_hasher.update(data) and\n\
+output_hasher.update(result) do. This is done in a single pass, a few\n\
+kilobytes at a time, so each byte is still in the cache when it is hashed,\n\
+and with the GIL released for large inputs.\n\
+\n\
+The cipher's threads are not used: the data is processed in one thread.\n\
+\n\
+@param cryptor: an aes.AES object\n\
+@param input_hasher: a sha256.SHA256 object, or None\n\
+@param output_hasher: a different sha256.SHA256 object, or None";
+
+void
+init_pipeline(PyObject*const module) {
+    pipeline_error = PyErr_NewException(const_cast<char*>("_pipeline.Error"), NULL, NULL);
+    PyModule_AddObject(module, "pipeline_Error", pipeline_error);
+
+    pipeline_integrity_error = PyErr_NewException(const_cast<char*>("_pipeline.IntegrityError"), pipeline_error, NULL);
+    PyModule_AddObject(module, "pipeline_IntegrityError", pipeline_integrity_error);
+
+    PyModule_AddStringConstant(module, "pipeline___doc__", const_cast<char*>(pipeline___doc__));
+}
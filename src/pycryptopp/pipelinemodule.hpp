@@ -0,0 +1,11 @@
+#ifndef __INCL_PIPELINEMODULE_HPP
+#define __INCL_PIPELINEMODULE_HPP
+
+extern void
+init_pipeline(PyObject* module);
+
+extern PyObject *
+pipeline_crypt_and_hash(PyObject *dummy, PyObject *args, PyObject *kwdict);
+extern const char*const pipeline_crypt_and_hash__doc__;
+
+#endif /* #ifndef __INCL_PIPELINEMODULE_HPP */
@@ -34,6 +34,7 @@ typedef int Py_ssize_t;
 #include <math.h>
 
 #include "ecdsamodule.hpp"
+#include "../objectlock.hpp"
 
 /* from Crypto++ */
 #ifdef DISABLE_EMBEDDED_CRYPTOPP
@@ -79,6 +80,7 @@ typedef struct {
 
     /* internal */
     ECDSA<ECP, SHA256>::Verifier *k;
+    PyThread_type_lock lock;
 } VerifyingKey;
 
 PyDoc_STRVAR(VerifyingKey__doc__,
@@ -125,6 +127,7 @@ static void
 VerifyingKey_dealloc(VerifyingKey* self) {
     if (self->k)
         delete self->k;
+    FREE_OBJECTLOCK(self);
     self->ob_type->tp_free((PyObject*)self);
 }
 
@@ -140,7 +143,12 @@ VerifyingKey_verify(VerifyingKey *self, PyObject *args, PyObject *kwdict) {
     assert (msgsize >= 0);
     assert (signaturesize >= 0);
 
-    if (self->k->VerifyMessage(reinterpret_cast<const byte*>(msg), msgsize, reinterpret_cast<const byte*>(signature), signaturesize))
+    /* Public-key operations are always expensive enough to be worth
+       releasing the GIL for. */
+    OBJECTLOCK_REQUIRE(self);
+    bool verified;
+    WITH_OBJECTLOCK_NOGIL(self, verified = self->k->VerifyMessage(reinterpret_cast<const byte*>(msg), msgsize, reinterpret_cast<const byte*>(signature), signaturesize));
+    if (verified)
         Py_RETURN_TRUE;
     else
         Py_RETURN_FALSE;
@@ -152,7 +160,9 @@ PyDoc_STRVAR(VerifyingKey_verify__doc__,
 static PyObject *
 VerifyingKey_serialize(VerifyingKey *self, PyObject *dummy) {
     ECDSA<ECP, SHA256>::Verifier *pubkey;
+    ENTER_OBJECTLOCK(self);
     pubkey = new ECDSA<ECP, SHA256>::Verifier(*(self->k));
+    LEAVE_OBJECTLOCK(self);
     const DL_GroupParameters_EC<ECP>& params = pubkey->GetKey().GetGroupParameters();
 
     Py_ssize_t len = params.GetEncodedElementSize(true);
@@ -221,12 +231,14 @@ typedef struct {
 
     /* internal */
     ECDSA<ECP, SHA256>::Signer *k;
+    PyThread_type_lock lock;
 } SigningKey;
 
 static void
 SigningKey_dealloc(SigningKey* self) {
     if (self->k)
         delete self->k;
+    FREE_OBJECTLOCK(self);
     self->ob_type->tp_free((PyObject*)self);
 }
 
@@ -393,6 +405,18 @@ SigningKey__dump(SigningKey *self, PyObject *dummy) {
 PyDoc_STRVAR(SigningKey__dump__doc__,
 "Print to stdout some descriptions of the math pieces.");
 
+/** Sign without touching any Python objects, so that it can run with the GIL
+ * released. Returns -1 and fills in error if Crypto++ throws. */
+static Py_ssize_t
+SigningKey_sign_nogil(ECDSA<ECP, SHA256>::Signer *k, RandomNumberGenerator& rng, const byte* msg, Py_ssize_t msgsize, byte* sig, std::string& error) {
+    try {
+        return k->SignMessage(rng, msg, msgsize, sig);
+    } catch (InvalidDataFormat le) {
+        error = le.what();
+        return -1;
+    }
+}
+
 static PyObject *
 SigningKey_sign(SigningKey *self, PyObject *msgobj) {
     const char *msg;
@@ -400,6 +424,8 @@ SigningKey_sign(SigningKey *self, PyObject *msgobj) {
     PyString_AsStringAndSize(msgobj, const_cast<char**>(&msg), reinterpret_cast<Py_ssize_t*>(&msgsize));
     assert (msgsize >= 0);
 
+    OBJECTLOCK_REQUIRE(self);
+
     Py_ssize_t sigsize;
     sigsize = self->k->SignatureLength();
 
@@ -410,16 +436,13 @@ SigningKey_sign(SigningKey *self, PyObject *msgobj) {
 
     AutoSeededRandomPool randpool(false); //XXX
 
+    byte* sig = reinterpret_cast<byte*>(PyString_AS_STRING(result));
     Py_ssize_t siglengthwritten;
-    try {
-        siglengthwritten = self->k->SignMessage(
-            randpool,
-            reinterpret_cast<const byte*>(msg),
-            msgsize,
-            reinterpret_cast<byte*>(PyString_AS_STRING(result)));
-    } catch (InvalidDataFormat le) {
+    std::string signerror;
+    WITH_OBJECTLOCK_NOGIL(self, siglengthwritten = SigningKey_sign_nogil(self->k, randpool, reinterpret_cast<const byte*>(msg), msgsize, sig, signerror));
+    if (siglengthwritten < 0) {
         Py_DECREF(result);
-        return PyErr_Format(ecdsa_error, "Signing key was corrupted.  Crypto++ gave this exception: %s", le.what());
+        return PyErr_Format(ecdsa_error, "Signing key was corrupted.  Crypto++ gave this exception: %s", signerror.c_str());
     }
 
     if (siglengthwritten < sigsize)
@@ -442,7 +465,10 @@ SigningKey_get_verifying_key(SigningKey *self, PyObject *dummy) {
     if (!verifier)
         return NULL;
 
+    verifier->lock = NULL;
+    ENTER_OBJECTLOCK(self);
     verifier->k = new ECDSA<ECP, SHA256>::Verifier(*(self->k));
+    LEAVE_OBJECTLOCK(self);
     if (!verifier->k)
         return PyErr_NoMemory();
     verifier->k->AccessKey().AccessGroupParameters().SetPointCompression(true);
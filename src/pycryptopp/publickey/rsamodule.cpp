@@ -12,6 +12,7 @@ typedef int Py_ssize_t;
 #endif
 
 #include "rsamodule.hpp"
+#include "../objectlock.hpp"
 
 /* from Crypto++ */
 #ifdef DISABLE_EMBEDDED_CRYPTOPP
@@ -43,6 +44,7 @@ typedef struct {
 
     /* internal */
     RSASS<PSS, SHA256>::Verifier *k;
+    PyThread_type_lock lock;
 } VerifyingKey;
 
 PyDoc_STRVAR(VerifyingKey__doc__,
@@ -52,6 +54,7 @@ static void
 VerifyingKey_dealloc(VerifyingKey* self) {
     if (self->k)
         delete self->k;
+    FREE_OBJECTLOCK(self);
     self->ob_type->tp_free((PyObject*)self);
 }
 
@@ -74,7 +77,12 @@ VerifyingKey_verify(VerifyingKey *self, PyObject *args, PyObject *kwdict) {
 
     assert (signaturesize == sigsize);
 
-    if (self->k->VerifyMessage(reinterpret_cast<const byte*>(msg), msgsize, reinterpret_cast<const byte*>(signature), signaturesize))
+    /* Public-key operations are always expensive enough to be worth
+       releasing the GIL for. */
+    OBJECTLOCK_REQUIRE(self);
+    bool verified;
+    WITH_OBJECTLOCK_NOGIL(self, verified = self->k->VerifyMessage(reinterpret_cast<const byte*>(msg), msgsize, reinterpret_cast<const byte*>(signature), signaturesize));
+    if (verified)
         Py_RETURN_TRUE;
     else
         Py_RETURN_FALSE;
@@ -87,7 +95,9 @@ static PyObject *
 VerifyingKey_serialize(VerifyingKey *self, PyObject *dummy) {
     std::string outstr;
     StringSink ss(outstr);
+    ENTER_OBJECTLOCK(self);
     self->k->DEREncode(ss);
+    LEAVE_OBJECTLOCK(self);
     PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(outstr.c_str(), outstr.size()));
     if (!result)
         return NULL;
@@ -144,6 +154,7 @@ VerifyingKey_construct() {
     if (!self)
         return NULL;
     self->k = NULL;
+    self->lock = NULL;
     return self;
 }
 
@@ -155,12 +166,14 @@ typedef struct {
 
     /* internal */
     RSASS<PSS, SHA256>::Signer *k;
+    PyThread_type_lock lock;
 } SigningKey;
 
 static void
 SigningKey_dealloc(SigningKey* self) {
     if (self->k)
         delete self->k;
+    FREE_OBJECTLOCK(self);
     self->ob_type->tp_free((PyObject*)self);
 }
 
@@ -171,6 +184,8 @@ SigningKey_sign(SigningKey *self, PyObject *msgobj) {
     PyString_AsStringAndSize(msgobj, const_cast<char**>(&msg), reinterpret_cast<Py_ssize_t*>(&msgsize));
     assert (msgsize >= 0);
 
+    OBJECTLOCK_REQUIRE(self);
+
     Py_ssize_t sigsize = self->k->SignatureLength();
     PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(NULL, sigsize));
     if (!result)
@@ -178,11 +193,13 @@ SigningKey_sign(SigningKey *self, PyObject *msgobj) {
     assert (sigsize >= 0);
 
     AutoSeededRandomPool randpool(false);
-    Py_ssize_t siglengthwritten = self->k->SignMessage(
+    byte* sig = reinterpret_cast<byte*>(PyString_AS_STRING(result));
+    Py_ssize_t siglengthwritten;
+    WITH_OBJECTLOCK_NOGIL(self, siglengthwritten = self->k->SignMessage(
         randpool,
         reinterpret_cast<const byte*>(msg),
         msgsize,
-        reinterpret_cast<byte*>(PyString_AS_STRING(result)));
+        sig));
     if (siglengthwritten < sigsize)
         fprintf(stderr, "%s: %d: %s: %s", __FILE__, __LINE__, "SigningKey_sign", "INTERNAL ERROR: signature was shorter than expected.");
     else if (siglengthwritten > sigsize) {
@@ -203,7 +220,9 @@ SigningKey_get_verifying_key(SigningKey *self, PyObject *dummy) {
     if (!verifier)
         return NULL;
 
+    ENTER_OBJECTLOCK(self);
     verifier->k = new RSASS<PSS, SHA256>::Verifier(*(self->k));
+    LEAVE_OBJECTLOCK(self);
     if (!verifier->k)
         return PyErr_NoMemory();
     return reinterpret_cast<PyObject*>(verifier);
@@ -216,7 +235,9 @@ static PyObject *
 SigningKey_serialize(SigningKey *self, PyObject *dummy) {
     std::string outstr;
     StringSink ss(outstr);
+    ENTER_OBJECTLOCK(self);
     self->k->DEREncode(ss);
+    LEAVE_OBJECTLOCK(self);
     PyStringObject* result = reinterpret_cast<PyStringObject*>(PyString_FromStringAndSize(outstr.c_str(), outstr.size()));
     if (!result)
         return NULL;
@@ -274,6 +295,7 @@ SigningKey_construct() {
     if (!self)
         return NULL;
     self->k = NULL;
+    self->lock = NULL;
     return self;
 }
 
@@ -294,17 +316,24 @@ rsa_generate(PyObject *dummy, PyObject *args, PyObject *kwdict) {
     if (sizeinbits < MIN_KEY_SIZE_BITS)
         return PyErr_Format(rsa_error, "Precondition violation: size in bits is required to be >= %d, but it was %d", MIN_KEY_SIZE_BITS, sizeinbits);
 
-    AutoSeededRandomPool osrng(false);
     SigningKey *signer = SigningKey_construct();
     if (!signer)
         return NULL;
-    signer->k = new RSASS<PSS, SHA256>::Signer(osrng, sizeinbits);
+    /* Key generation takes a long time (seconds, for big keys), so let other
+       threads run meanwhile. */
+    RSASS<PSS, SHA256>::Signer *k;
+    Py_BEGIN_ALLOW_THREADS
+    AutoSeededRandomPool osrng(false);
+    k = new RSASS<PSS, SHA256>::Signer(osrng, sizeinbits);
+    Py_END_ALLOW_THREADS
+    signer->k = k;
     if (!signer->k)
         return PyErr_NoMemory();
     return reinterpret_cast<PyObject*>(signer);
 }
 
 const char*const rsa_generate__doc__ = "Create a signing key using the operating system's random number generator.\n\
+The GIL is released while the key is generated.\n\
 \n\
 @param sizeinbits size of the key in bits\n\
 \n\
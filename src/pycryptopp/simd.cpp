@@ -0,0 +1,108 @@
+/**
+ * simd.cpp -- run-time checks for the vector instructions used by
+ * pycryptopp's own code, on top of the CPUID support in Crypto++'s cpu.cpp
+ */
+
+#include "simd.hpp"
+
+#if defined(PYCRYPTOPP_AVX2_TARGET) && defined(_MSC_VER)
+#include <immintrin.h>
+#endif
+
+using CryptoPP::word32;
+
+#if defined(PYCRYPTOPP_SSE2_TARGET)
+
+bool
+pycryptopp_has_sse2() {
+    return CryptoPP::HasSSE2();
+}
+
+/* The low 32 bits of extended control register 0, which say which register
+   sets the operating system saves on a context switch. Only to be called if
+   CPUID says the processor has XGETBV. */
+static word32
+xgetbv0() {
+#if defined(_MSC_VER)
+    return static_cast<word32>(_xgetbv(0));
+#else
+    word32 lo, hi;
+    /* the encoding of xgetbv, for assemblers which do not know it */
+    __asm__ __volatile__(".byte 0x0f, 0x01, 0xd0" : "=a" (lo), "=d" (hi) : "c" (0));
+    return lo;
+#endif
+}
+
+static bool
+detect_avx2() {
+    word32 regs[4];
+    if (!CryptoPP::CpuId(0, regs) || regs[0] < 7)
+        return false;
+    if (!CryptoPP::CpuId(1, regs))
+        return false;
+    /* AVX, and the OS saving the XMM and YMM registers (XCR0 bits 1 and 2) */
+    const word32 osxsave = 1 << 27, avx = 1 << 28;
+    if ((regs[2] & (osxsave | avx)) != (osxsave | avx) || (xgetbv0() & 6) != 6)
+        return false;
+    if (!CryptoPP::CpuId(7, regs))
+        return false;
+    return (regs[1] & (1 << 5)) != 0;
+}
+
+bool
+pycryptopp_has_avx2() {
+    static const bool result = detect_avx2();
+    return result;
+}
+
+#if defined(PYCRYPTOPP_SHANI_TARGET)
+
+static bool
+detect_sha_ni() {
+    word32 regs[4];
+    if (!CryptoPP::CpuId(0, regs) || regs[0] < 7)
+        return false;
+    if (!CryptoPP::CpuId(1, regs))
+        return false;
+    /* SSSE3 and SSE4.1 */
+    const word32 ssse3 = 1 << 9, sse41 = 1 << 19;
+    if ((regs[2] & (ssse3 | sse41)) != (ssse3 | sse41))
+        return false;
+    if (!CryptoPP::CpuId(7, regs))
+        return false;
+    return (regs[1] & (1 << 29)) != 0;
+}
+
+bool
+pycryptopp_has_sha_ni() {
+    static const bool result = detect_sha_ni();
+    return result;
+}
+
+#else /* #if defined(PYCRYPTOPP_SHANI_TARGET) */
+
+bool
+pycryptopp_has_sha_ni() {
+    return false;
+}
+
+#endif /* #if defined(PYCRYPTOPP_SHANI_TARGET) */
+
+#else /* #if defined(PYCRYPTOPP_SSE2_TARGET) */
+
+bool
+pycryptopp_has_sse2() {
+    return false;
+}
+
+bool
+pycryptopp_has_avx2() {
+    return false;
+}
+
+bool
+pycryptopp_has_sha_ni() {
+    return false;
+}
+
+#endif /* #if defined(PYCRYPTOPP_SSE2_TARGET) */
@@ -0,0 +1,68 @@
+#ifndef __INCL_SIMD_HPP
+#define __INCL_SIMD_HPP
+
+/**
+ * simd.hpp -- compiling single functions for the vector instructions of x86
+ * and ARM processors, and finding out at run time which of them the
+ * processor we are running on has.
+ *
+ * The embedded Crypto++ is built with CRYPTOPP_DISABLE_ASM, and the rest of
+ * the build assumes nothing beyond the compiler's default target. A
+ * function marked PYCRYPTOPP_SSE2_TARGET or PYCRYPTOPP_AVX2_TARGET may use
+ * the intrinsics of that instruction set whatever the compiler flags, but
+ * may only be called if pycryptopp_has_sse2() or pycryptopp_has_avx2() says
+ * so, and likewise PYCRYPTOPP_SHANI_TARGET (the SHA extensions, with the
+ * SSE4.1 instructions needed to use them) and pycryptopp_has_sha_ni().
+ * NEON is part of every AArch64 processor, and of 32-bit ARM builds
+ * made with -mfpu=neon, so PYCRYPTOPP_NEON is decided at compile time.
+ *
+ * Define PYCRYPTOPP_DISABLE_SIMD to build without any of this code.
+ */
+
+/* from Crypto++ */
+#ifdef DISABLE_EMBEDDED_CRYPTOPP
+#include <cryptopp/config.h>
+#include <cryptopp/cpu.h>
+#else
+#include <src-cryptopp/config.h>
+#include <src-cryptopp/cpu.h>
+#endif
+
+#ifndef PYCRYPTOPP_DISABLE_SIMD
+#if (defined(__x86_64__) || defined(__i386__)) && defined(CRYPTOPP_CPUID_AVAILABLE) && \
+    ((defined(__clang__) && (__clang_major__ > 3 || (__clang_major__ == 3 && __clang_minor__ >= 8))) || \
+     (!defined(__clang__) && defined(__GNUC__) && (__GNUC__ > 4 || (__GNUC__ == 4 && __GNUC_MINOR__ >= 9))))
+/* GCC and Clang can compile single functions for SSE2, AVX2 or the SHA
+   extensions. */
+#define PYCRYPTOPP_SSE2_TARGET __attribute__((target("sse2")))
+#define PYCRYPTOPP_AVX2_TARGET __attribute__((target("avx2")))
+#define PYCRYPTOPP_SHANI_TARGET __attribute__((target("sha,sse4.1")))
+#elif (defined(_M_X64) || defined(_M_IX86)) && defined(CRYPTOPP_CPUID_AVAILABLE) && defined(_MSC_VER) && (_MSC_VER >= 1700)
+/* MSVC lets any function use any intrinsic. */
+#define PYCRYPTOPP_SSE2_TARGET
+#define PYCRYPTOPP_AVX2_TARGET
+#if (_MSC_VER >= 1900)
+#define PYCRYPTOPP_SHANI_TARGET
+#endif
+#endif
+
+#if (defined(__ARM_NEON) || defined(__ARM_NEON__)) && !defined(__ARM_BIG_ENDIAN)
+#define PYCRYPTOPP_NEON
+#endif
+#endif /* #ifndef PYCRYPTOPP_DISABLE_SIMD */
+
+/* True if this build has SSE2 code and the processor supports it. */
+extern bool
+pycryptopp_has_sse2();
+
+/* True if this build has AVX2 code and both the processor and the operating
+   system support it. */
+extern bool
+pycryptopp_has_avx2();
+
+/* True if this build has code for the SHA extensions and the processor
+   supports them, along with SSE4.1. */
+extern bool
+pycryptopp_has_sha_ni();
+
+#endif /* #ifndef __INCL_SIMD_HPP */
@@ -1,4 +1,4 @@
-import random, re
+import os, random, re
 
 import unittest
 
@@ -8,6 +8,7 @@ global VERBOSE
 VERBOSE=False
 
 from pycryptopp.cipher import aes
+from pycryptopp.test.threadutil import run_in_threads, ncpus, check_speedup, check_threads_speedup
 
 from pkg_resources import resource_string, resource_listdir
 
@@ -44,6 +45,358 @@ class AES256(unittest.TestCase):
         ct2 = cryptor.process("\x00"*17)
         self.failUnlessEqual(self.enc0, b2a_hex(ct1+ct2))
 
+class Buffers(unittest.TestCase):
+    def _check_buffer(self, make):
+        k = randstr(16)
+        msg = randstr(1000)
+        expected = aes.AES(key=k).process(msg)
+        self.failUnlessEqual(aes.AES(key=k).process(make(msg)), expected)
+
+    def test_bytearray(self):
+        self._check_buffer(bytearray)
+
+    def test_memoryview(self):
+        self._check_buffer(lambda s: memoryview(bytearray(s))[:])
+
+    def test_array(self):
+        import array
+        self._check_buffer(lambda s: array.array('B', s))
+
+    def test_buffer(self):
+        self._check_buffer(lambda s: buffer("x"+s, 1))
+
+    def test_mmap(self):
+        import mmap
+        def make(s):
+            m = mmap.mmap(-1, len(s))
+            m.write(s)
+            return m
+        self._check_buffer(make)
+
+    def test_type_check(self):
+        cryptor = aes.AES(key="k"*16)
+        self.failUnlessRaises(aes.Error, cryptor.process, None)
+        self.failUnlessRaises(aes.Error, cryptor.process, u"unicode")
+        self.failUnlessRaises(aes.Error, cryptor.process, 1)
+
+    def test_process_into(self):
+        k = randstr(16)
+        msg = randstr(1000)
+        expected = aes.AES(key=k).process(msg)
+        cryptor = aes.AES(key=k)
+        dst = bytearray(len(msg)+10)
+        self.failUnlessEqual(cryptor.process_into(msg[:600], dst), None)
+        cryptor.process_into(memoryview(msg)[600:], memoryview(dst)[600:])
+        self.failUnlessEqual(str(dst[:1000]), expected)
+        self.failUnlessEqual(str(dst[1000:]), "\x00"*10)
+
+    def test_process_into_in_place(self):
+        k = randstr(16)
+        msg = randstr(100000)
+        buf = bytearray(msg)
+        aes.AES(key=k).process_into(buf, buf)
+        self.failUnlessEqual(str(buf), aes.AES(key=k).process(msg))
+        aes.AES(key=k).process_into(buf, buf)
+        self.failUnlessEqual(str(buf), msg)
+
+    def test_process_into_preconditions(self):
+        cryptor = aes.AES(key="k"*16)
+        self.failUnlessRaises(aes.Error, cryptor.process_into, "abc", bytearray(2))
+        self.failUnlessRaises(aes.Error, cryptor.process_into, "abc", "xyz")
+        self.failUnlessRaises(aes.Error, cryptor.process_into, None, bytearray(3))
+
+class Seek(unittest.TestCase):
+    def test_seek(self):
+        k = randstr(32)
+        iv = randstr(16)
+        keystream = aes.AES(key=k, iv=iv).process("\x00"*1100)
+        cryptor = aes.AES(key=k, iv=iv)
+        self.failUnlessEqual(cryptor.tell(), 0)
+        for offset in [0, 1, 15, 16, 17, 500, 999, 33, 0, 32]:
+            for length in [0, 1, 7, 16, 40]:
+                cryptor.seek(offset)
+                self.failUnlessEqual(cryptor.tell(), offset)
+                ct = cryptor.process("\x00"*length)
+                self.failUnlessEqual(ct, keystream[offset:offset+length])
+                self.failUnlessEqual(cryptor.tell(), offset+length)
+
+    def test_tell(self):
+        cryptor = aes.AES(key="k"*16)
+        cryptor.process("a"*5)
+        cryptor.process_into("b"*30, bytearray(30))
+        self.failUnlessEqual(cryptor.tell(), 35)
+
+    def test_seek_far(self):
+        # Seeking a long way is the same as processing that far, including
+        # when the counter carries out of its low-order bytes.
+        k = "k"*16
+        iv = "\x00"*8 + "\xff"*8
+        offset = 2**20 + 3
+        cryptor = aes.AES(key=k, iv=iv)
+        cryptor.process("\x00"*offset)
+        expected = cryptor.process("\x00"*100)
+        cryptor = aes.AES(key=k, iv=iv)
+        cryptor.seek(offset)
+        self.failUnlessEqual(cryptor.process("\x00"*100), expected)
+        cryptor.seek(2**40)
+        self.failUnlessEqual(cryptor.tell(), 2**40)
+
+    def test_seek_negative(self):
+        cryptor = aes.AES(key="k"*16)
+        self.failUnlessRaises(aes.Error, cryptor.seek, -1)
+        self.failUnlessRaises(TypeError, cryptor.seek, "1")
+
+class Rekey(unittest.TestCase):
+    def test_rekey(self):
+        msg = randstr(300)
+        cryptor = aes.AES(key="k"*16, iv="i"*16)
+        cryptor.process(msg[:77])
+        for (key, iv) in [("a"*32, "b"*16), ("c"*24, None), ("k"*16, "i"*16)]:
+            if iv is None:
+                cryptor.rekey(key)
+                expected = aes.AES(key=key).process(msg)
+            else:
+                cryptor.rekey(key, iv=iv)
+                expected = aes.AES(key=key, iv=iv).process(msg)
+            self.failUnlessEqual(cryptor.tell(), 0)
+            self.failUnlessEqual(cryptor.process(msg), expected)
+
+    def test_reset(self):
+        msg = randstr(300)
+        cryptor = aes.AES(key="k"*16, iv="i"*16)
+        cryptor.process(msg[:13])
+        cryptor.reset("j"*16)
+        self.failUnlessEqual(cryptor.tell(), 0)
+        self.failUnlessEqual(cryptor.process(msg), aes.AES(key="k"*16, iv="j"*16).process(msg))
+
+    def test_init_again(self):
+        cryptor = aes.AES(key="k"*16)
+        cryptor.process("x"*10)
+        cryptor.__init__("a"*32, "b"*16)
+        self.failUnlessEqual(cryptor.process("x"*100), aes.AES(key="a"*32, iv="b"*16).process("x"*100))
+
+    def test_rekey_parallel(self):
+        msg = randstr(2**19 + 9)
+        cryptor = aes.AES(key="k"*16, threads=3)
+        cryptor.rekey("a"*32, "b"*16)
+        self.failUnlessEqual(cryptor.process(msg), aes.AES(key="a"*32, iv="b"*16).process(msg))
+
+    def test_preconditions(self):
+        cryptor = aes.AES(key="k"*16, iv="i"*16)
+        expected = aes.AES(key="k"*16, iv="i"*16).process("x"*50)
+        self.failUnlessRaises(aes.Error, cryptor.rekey, "k"*17)
+        self.failUnlessRaises(aes.Error, cryptor.rekey, "k"*16, "i"*15)
+        self.failUnlessRaises(aes.Error, cryptor.reset, "i"*17)
+        self.failUnlessRaises(TypeError, cryptor.reset)
+        # a failed rekey leaves the cipher as it was
+        self.failUnlessEqual(cryptor.process("x"*50), expected)
+
+class State(unittest.TestCase):
+    def test_resume(self):
+        k = randstr(16)
+        iv = randstr(16)
+        msg = randstr(5000)
+        expected = aes.AES(k, iv).process(msg)
+        for n in [0, 1, 15, 16, 17, 4099]:
+            cryptor = aes.AES(k, iv)
+            ct = cryptor.process(msg[:n])
+            state = cryptor.getstate()
+            self.failUnlessEqual(len(state), 25)
+            cryptor2 = aes.AES(k)
+            cryptor2.process("junk")
+            cryptor2.setstate(state)
+            self.failUnlessEqual(cryptor2.tell(), n)
+            self.failUnlessEqual(ct + cryptor2.process(msg[n:]), expected, n)
+            # the first object is unaffected
+            self.failUnlessEqual(ct + cryptor.process(msg[n:]), expected, n)
+
+    def test_seek(self):
+        cryptor = aes.AES("k"*32, "i"*16)
+        cryptor.seek(2**40 + 3)
+        cryptor2 = aes.AES("k"*32)
+        cryptor2.setstate(cryptor.getstate())
+        self.failUnlessEqual(cryptor2.tell(), 2**40 + 3)
+        self.failUnlessEqual(cryptor2.process("x"*100), cryptor.process("x"*100))
+
+    def test_pickle(self):
+        import pickle
+        k = randstr(24)
+        iv = randstr(16)
+        msg = randstr(1000)
+        expected = aes.AES(k, iv).process(msg)
+        cryptor = aes.AES(k, iv, threads=2)
+        ct = cryptor.process(msg[:333])
+        for protocol in [0, 1, 2]:
+            cryptor2 = pickle.loads(pickle.dumps(cryptor, protocol))
+            self.failUnlessEqual(cryptor2.tell(), 333)
+            self.failUnlessEqual(ct + cryptor2.process(msg[333:]), expected, protocol)
+        import copy
+        self.failUnlessEqual(ct + copy.copy(cryptor).process(msg[333:]), expected)
+
+    def test_portable(self):
+        if not aes.has_aesni():
+            raise unittest.SkipTest("AES-NI is not used on this processor")
+        cryptor = aes.AES("k"*16)
+        cryptor.process("x"*21)
+        previous = aes._set_use_aesni(False)
+        try:
+            cryptor2 = aes.AES("k"*16)
+        finally:
+            aes._set_use_aesni(previous)
+        cryptor2.setstate(cryptor.getstate())
+        self.failUnlessEqual(cryptor2.process("x"*50), cryptor.process("x"*50))
+
+    def test_preconditions(self):
+        cryptor = aes.AES("k"*16)
+        state = cryptor.getstate()
+        self.failUnlessRaises(aes.Error, cryptor.setstate, state[:-1])
+        self.failUnlessRaises(aes.Error, cryptor.setstate, state + "x")
+        self.failUnlessRaises(aes.Error, cryptor.setstate, "\x02" + state[1:])
+        self.failUnlessRaises(TypeError, cryptor.setstate)
+
+class CryptFile(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.dir, "src")
+        self.dst = os.path.join(self.dir, "dst")
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def _write(self, path, data):
+        f = open(path, "wb")
+        f.write(data)
+        f.close()
+
+    def _read(self, path):
+        f = open(path, "rb")
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_whole_file(self):
+        k = randstr(16)
+        iv = randstr(16)
+        # more than one window
+        msg = randstr(1000) * 2500 + "tail"
+        self._write(self.src, msg)
+        self.failUnlessEqual(aes.crypt_file(k, iv, self.src, self.dst), len(msg))
+        self.failUnlessEqual(self._read(self.dst), aes.AES(key=k, iv=iv).process(msg))
+        aes.crypt_file(k, iv, self.dst, self.dst)
+        self.failUnlessEqual(self._read(self.dst), msg)
+
+    def test_default_iv(self):
+        k = randstr(32)
+        msg = randstr(100)
+        self._write(self.src, msg)
+        aes.crypt_file(k, None, self.src, self.dst)
+        self.failUnlessEqual(self._read(self.dst), aes.AES(key=k).process(msg))
+
+    def test_offset(self):
+        k = randstr(16)
+        msg = randstr(10000)
+        expected = aes.AES(key=k).process(msg)
+        self._write(self.src, msg)
+        # as though an earlier run had been interrupted part-way through a
+        # block, leaving some junk after it
+        self._write(self.dst, expected[:4099] + "junk")
+        self.failUnlessEqual(aes.crypt_file(k, None, self.src, self.dst, offset=4099), len(msg) - 4099)
+        self.failUnlessEqual(self._read(self.dst), expected)
+
+    def test_portable(self):
+        if not aes.has_aesni():
+            raise unittest.SkipTest("AES-NI is not used on this processor")
+        k = randstr(16)
+        msg = randstr(5000)
+        expected = aes.AES(key=k).process(msg)
+        self._write(self.src, msg)
+        self._write(self.dst, expected[:77])
+        previous = aes._set_use_aesni(False)
+        try:
+            aes.crypt_file(k, None, self.src, self.dst, offset=77)
+        finally:
+            aes._set_use_aesni(previous)
+        self.failUnlessEqual(self._read(self.dst), expected)
+
+    def test_truncates(self):
+        k = randstr(16)
+        self._write(self.src, "short")
+        self._write(self.dst, "much longer than the source")
+        aes.crypt_file(k, None, self.src, self.dst)
+        self.failUnlessEqual(self._read(self.dst), aes.AES(key=k).process("short"))
+
+    def test_errors(self):
+        k = randstr(16)
+        self.failUnlessRaises(IOError, aes.crypt_file, k, None, self.src, self.dst)
+        self._write(self.src, "data")
+        self.failUnlessRaises(IOError, aes.crypt_file, k, None, self.src, os.path.join(self.dir, "no", "dst"))
+        self.failUnlessRaises(aes.Error, aes.crypt_file, k[:15], None, self.src, self.dst)
+        self.failUnlessRaises(aes.Error, aes.crypt_file, k, "i"*15, self.src, self.dst)
+        self.failUnlessRaises(aes.Error, aes.crypt_file, k, None, self.src, self.dst, -1)
+
+class ProcessMany(unittest.TestCase):
+    def _expected(self, keys, ivs, datas):
+        if ivs is None:
+            ivs = ["\x00"*16] * len(datas)
+        return [aes.AES(key=k, iv=iv).process(d) for (k, iv, d) in zip(keys, ivs, datas)]
+
+    def test_lists(self):
+        # short and long messages, of all three key sizes mixed together
+        n = 300
+        keys = [randstr(random.choice([16, 24, 32])) for i in range(n)]
+        ivs = [randstr(16) for i in range(n)]
+        datas = [randstr(random.choice([0, 1, 15, 16, 17, 100, 300, 1023, 1024, 5000])) for i in range(n)]
+        self.failUnlessEqual(aes.process_many(keys, ivs, datas), self._expected(keys, ivs, datas))
+        self.failUnlessEqual(aes.process_many(tuple(keys), None, datas), self._expected(keys, None, datas))
+        self.failUnlessEqual(aes.process_many([], None, []), [])
+
+    def test_counter_carry(self):
+        keys = ["k"*16] * 3
+        ivs = ["\xff"*16, "\x00"*8 + "\xff"*8, "\x01" + "\xff"*15]
+        datas = ["\x00"*100] * 3
+        self.failUnlessEqual(aes.process_many(keys, ivs, datas), self._expected(keys, ivs, datas))
+
+    def test_packed(self):
+        n = 100
+        keys = randstr(32*n)
+        ivs = randstr(16*n)
+        packed = randstr(300*n)
+        split = lambda s, size: [s[i:i+size] for i in range(0, len(s), size)]
+        expected = "".join(self._expected(split(keys, 32), split(ivs, 16), split(packed, 300)))
+        self.failUnlessEqual(aes.process_many(keys, ivs, packed, record_size=300), expected)
+        self.failUnlessEqual(aes.process_many(bytearray(keys), split(ivs, 16), buffer(packed), 300), expected)
+        # packed keys and IVs with a list of messages
+        datas = split(packed, 300)
+        self.failUnlessEqual(aes.process_many(keys, ivs, datas), split(expected, 300))
+
+    def test_portable(self):
+        if not aes.has_aesni():
+            raise unittest.SkipTest("AES-NI is not used on this processor")
+        keys = [randstr(16), randstr(24), randstr(32)] * 20
+        datas = [randstr(random.randrange(0, 2000)) for k in keys]
+        fast = aes.process_many(keys, None, datas)
+        previous = aes._set_use_aesni(False)
+        try:
+            self.failUnlessEqual(aes.process_many(keys, None, datas), fast)
+        finally:
+            aes._set_use_aesni(previous)
+
+    def test_preconditions(self):
+        self.failUnlessRaises(aes.Error, aes.process_many, ["k"*16, "k"*15], None, ["a", "b"])
+        self.failUnlessRaises(aes.Error, aes.process_many, ["k"*16], None, ["a", "b"])
+        self.failUnlessRaises(aes.Error, aes.process_many, ["k"*16] * 2, ["i"*16], ["a", "b"])
+        self.failUnlessRaises(aes.Error, aes.process_many, ["k"*16] * 2, ["i"*16, "i"*15], ["a", "b"])
+        self.failUnlessRaises(aes.Error, aes.process_many, ["k"*16] * 2, None, ["a", u"b"])
+        self.failUnlessRaises(aes.Error, aes.process_many, "k"*32, None, "ab")
+        self.failUnlessRaises(aes.Error, aes.process_many, "k"*33, None, ["a", "b"])
+        self.failUnlessRaises(aes.Error, aes.process_many, "k"*32, "i"*16, "abcd", record_size=2)
+        self.failUnlessRaises(aes.Error, aes.process_many, "k"*32, None, "abc", record_size=2)
+        self.failUnlessRaises(aes.Error, aes.process_many, "k"*32, None, "abcd", record_size=0)
+        self.failUnlessRaises(TypeError, aes.process_many, "k"*32, None, "abcd", record_size="2")
+
 class AES128(unittest.TestCase):
     enc0 = "66e94bd4ef8a2c3b884cfa59ca342b2e"
 
@@ -80,6 +433,7 @@ class AES_from_NIST_KAT(unittest.TestCase):
 
             computedciphertext = fake_ecb_using_ctr(key, plaintext)
             self.failUnlessEqual(computedciphertext, ciphertext, "computedciphertext: %s, ciphertext: %s, key: %s, plaintext: %s" % (b2a_hex(computedciphertext), b2a_hex(ciphertext), b2a_hex(key), b2a_hex(plaintext)))
+            self.failUnlessEqual(aes.encrypt_blocks(key, plaintext), ciphertext)
 
 class AES_from_Niels_Ferguson(unittest.TestCase):
     # http://blogs.msdn.com/si_team/archive/2006/05/19/aes-test-vectors.aspx
@@ -101,6 +455,36 @@ class AES_from_Niels_Ferguson(unittest.TestCase):
     def test_from_Niels_AES256(self):
         return self._test_from_Niels_AES(32, 'c84b0f3a2c76dd9871900b07f09bdd3e')
 
+class EncryptBlocks(unittest.TestCase):
+    def test_same_as_one_at_a_time(self):
+        for keysize in [16, 24, 32]:
+            k = randstr(keysize)
+            blocks = randstr(16*1000)
+            expected = "".join(fake_ecb_using_ctr(k, blocks[i:i+16]) for i in range(0, len(blocks), 16))
+            self.failUnlessEqual(aes.encrypt_blocks(k, blocks), expected)
+            self.failUnlessEqual(aes.encrypt_blocks(key=k, blocks=bytearray(blocks)), expected)
+            self.failUnlessEqual(aes.encrypt_blocks(k, blocks[:16*7]), expected[:16*7])
+            self.failUnlessEqual(aes.encrypt_blocks(k, ""), "")
+
+    def test_portable(self):
+        if not aes.has_aesni():
+            raise unittest.SkipTest("AES-NI is not used on this processor")
+        k = randstr(32)
+        blocks = randstr(16*100)
+        fast = aes.encrypt_blocks(k, blocks)
+        previous = aes._set_use_aesni(False)
+        try:
+            self.failUnlessEqual(aes.encrypt_blocks(k, blocks), fast)
+        finally:
+            aes._set_use_aesni(previous)
+
+    def test_preconditions(self):
+        for keysize in [0, 15, 17, 33]:
+            self.failUnlessRaises(aes.Error, aes.encrypt_blocks, "k"*keysize, "b"*16)
+        for n in [1, 15, 17, 31]:
+            self.failUnlessRaises(aes.Error, aes.encrypt_blocks, "k"*16, "b"*n)
+        self.failUnlessRaises(aes.Error, aes.encrypt_blocks, "k"*16, u"b"*16)
+
 class PartialIV(unittest.TestCase):
     def test_partial(self):
         k = "k"*16
@@ -108,5 +492,142 @@ class PartialIV(unittest.TestCase):
             self.failUnlessRaises(aes.Error,
                                   aes.AES, k, iv="i"*iv_len)
 
+class Parallel(unittest.TestCase):
+    def test_same_as_serial(self):
+        k = randstr(32)
+        iv = randstr(16)
+        msg = randstr(2**20 + 77)
+        expected = aes.AES(key=k, iv=iv).process(msg)
+        for threads in [2, 3, 4, 7, 16]:
+            cryptor = aes.AES(key=k, iv=iv, threads=threads)
+            self.failUnlessEqual(cryptor.process(msg), expected, threads)
+            self.failUnlessEqual(cryptor.tell(), len(msg))
+
+    def test_unaligned_pieces(self):
+        # Start the large piece part-way through a block, and carry on
+        # afterwards to check the serial cipher was left in the right place.
+        k = randstr(16)
+        msg = randstr(3*2**19 + 5)
+        expected = aes.AES(key=k).process(msg)
+        cryptor = aes.AES(key=k, threads=4)
+        ct = cryptor.process(msg[:7])
+        ct += cryptor.process(msg[7:-9])
+        ct += cryptor.process(msg[-9:])
+        self.failUnlessEqual(ct, expected)
+
+        cryptor = aes.AES(key=k, threads=3)
+        cryptor.seek(13)
+        buf = bytearray(msg[13:])
+        cryptor.process_into(buf, buf)
+        self.failUnlessEqual(str(buf), expected[13:])
+
+    def test_threads_precondition(self):
+        self.failUnlessRaises(aes.Error, aes.AES, "k"*16, threads=0)
+        self.failUnlessRaises(TypeError, aes.AES, "k"*16, threads="2")
+
+    def test_speedup(self):
+        N = min(ncpus(), 4)
+        if N < 2:
+            raise unittest.SkipTest("needs more than one CPU")
+        msg = "\x00"*(2**24)
+        check_speedup(self, lambda: aes.AES(key="k"*16).process(msg),
+                      lambda: aes.AES(key="k"*16, threads=N).process(msg))
+
+class AESNI(unittest.TestCase):
+    def setUp(self):
+        if not aes.has_aesni():
+            raise unittest.SkipTest("needs a processor with AES-NI")
+
+    def _both(self, f):
+        """ Return (the result of f() using AES-NI, the result of f() using
+        the portable code). """
+        previous = aes._set_use_aesni(True)
+        try:
+            fast = f()
+            aes._set_use_aesni(False)
+            portable = f()
+        finally:
+            aes._set_use_aesni(previous)
+        return fast, portable
+
+    def test_same_as_portable(self):
+        for keysize in [16, 24, 32]:
+            k = randstr(keysize)
+            iv = randstr(16)
+            msg = randstr(5000)
+            def f():
+                cryptor = aes.AES(key=k, iv=iv)
+                ct = ""
+                i = 0
+                while i < len(msg):
+                    n = random.randrange(0, 300)
+                    ct += cryptor.process(msg[i:i+n])
+                    i += n
+                return ct
+            fast, portable = self._both(f)
+            self.failUnlessEqual(fast, portable, keysize)
+
+    def test_counter_carry(self):
+        # The counter is the whole 16-byte block, carrying from the low half
+        # into the high half and wrapping around at the top.
+        for iv in ["\x00"*7 + "\xff"*9, "\xff"*16, "\x01" + "\xff"*15]:
+            def f():
+                return aes.AES(key="k"*16, iv=iv).process("\x00"*(16*20 + 3))
+            fast, portable = self._both(f)
+            self.failUnlessEqual(fast, portable, b2a_hex(iv))
+
+    def test_seek_and_parallel(self):
+        k = randstr(32)
+        iv = randstr(16)
+        msg = randstr(2**19 + 33)
+        def f():
+            cryptor = aes.AES(key=k, iv=iv, threads=3)
+            cryptor.seek(2**40 + 5)
+            return cryptor.process(msg)
+        fast, portable = self._both(f)
+        self.failUnlessEqual(fast, portable)
+
+    def test_rekey_and_reset(self):
+        def f():
+            cryptor = aes.AES(key="k"*16)
+            ct = cryptor.process("\x00"*40)
+            cryptor.rekey("a"*32, "b"*16)
+            ct += cryptor.process("\x00"*40)
+            cryptor.reset("c"*16)
+            ct += cryptor.process("\x00"*40)
+            return ct
+        fast, portable = self._both(f)
+        self.failUnlessEqual(fast, portable)
+
+class Threads(unittest.TestCase):
+    SIZE = 2**20
+
+    def test_shared_object(self):
+        # Threads sharing one AES object each get a distinct, contiguous
+        # slice of the keystream.
+        N = 8
+        k = randstr(16)
+        results = []
+        cryptor = aes.AES(key=k)
+        def work():
+            results.append(cryptor.process("\x00"*self.SIZE))
+        run_in_threads(work, [()]*N)
+
+        keystream = aes.AES(key=k).process("\x00"*(self.SIZE*N))
+        expected = [ keystream[i*self.SIZE:(i+1)*self.SIZE] for i in range(N) ]
+        self.failUnlessEqual(sorted(results), sorted(expected))
+
+    def test_speedup(self):
+        # With the GIL released, separate AES objects in separate threads
+        # run in parallel.
+        N = min(ncpus(), 4)
+        if N < 2:
+            raise unittest.SkipTest("needs more than one CPU")
+        msg = "\x00"*(self.SIZE*8)
+        def work():
+            aes.AES(key="k"*16).process(msg)
+        check_threads_speedup(self, work, N)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,271 @@
+import random
+
+import unittest
+
+from binascii import a2b_hex
+
+from pycryptopp.cipher import aes, aesgcm
+
+from pycryptopp.test.threadutil import run_staggered
+
+def randstr(n):
+    return ''.join(map(chr, map(random.randrange, [0]*n, [256]*n)))
+
+P = ("d9313225f88406e5a55909c5aff5269a86a7a9531534f7da2e4c303d8a318a72"
+     "1c3c0c95956809532fcf0e2449a6b525b16aedf5aa0de657ba637b391aafd255")
+A = "feedfacedeadbeeffeedfacedeadbeefabaddad2"
+K = "feffe9928665731c6d6a8f9467308308"
+
+# Test cases from "The Galois/Counter Mode of Operation (GCM)" by McGrew and
+# Viega: (key, iv, plaintext, associated data, ciphertext, tag)
+VECTORS = [
+    # 1
+    ("00"*16, "00"*12, "", "", "", "58e2fccefa7e3061367f1d57a4e7455a"),
+    # 2
+    ("00"*16, "00"*12, "00"*16, "",
+     "0388dace60b6a392f328c2b971b2fe78",
+     "ab6e47d42cec13bdf53a67b21257bddf"),
+    # 3
+    (K, "cafebabefacedbaddecaf888", P, "",
+     "42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e"
+     "21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091473f5985",
+     "4d5c2af327cd64a62cf35abd2ba6fab4"),
+    # 4
+    (K, "cafebabefacedbaddecaf888", P[:120], A,
+     "42831ec2217774244b7221b784d0d49ce3aa212f2c02a4e035c17e2329aca12e"
+     "21d514b25466931c7d8f6a5aac84aa051ba30b396a0aac973d58e091",
+     "5bc94fbc3221a5db94fae95ae7121a47"),
+    # 5: a short IV
+    (K, "cafebabefacedbad", P[:120], A,
+     "61353b4c2806934a777ff51fa22a4755699b2a714fcdc6f83766e5f97b6c7423"
+     "73806900e49f24b22b097544d4896b424989b5e1ebac0f07c23f4598",
+     "3612d2e79e3b0785561be14aaca2fccb"),
+    # 6: a long IV
+    (K, "9313225df88406e555909c5aff5269aa6a7a9538534f7da1e4c303d2a318a728"
+     "c3c0c95156809539fcf0e2429a6b525416aedbf5a0de6a57a637b39b", P[:120], A,
+     "8ce24998625615b603a033aca13fb894be9112a5c3a211a8ba262a3cca7e2ca7"
+     "01e4a9a4fba43c90ccdcb281d48c7c6fd62875d2aca417034c34aee5",
+     "619cc5aefffe0bfa462af43c1699d050"),
+    # 13
+    ("00"*32, "00"*12, "", "", "", "530f8afbc74536b9a963b4f1c4cb738b"),
+    # 14
+    ("00"*32, "00"*12, "00"*16, "",
+     "cea7403d4d606b6e074ec5d3baf39d18",
+     "d0d1c8a799996bf0265b98b5d48ab919"),
+    # 15
+    (K*2, "cafebabefacedbaddecaf888", P, "",
+     "522dc1f099567d07f47f37a32a84427d643a8cdcbfe5c0c97598a2bd2555d1aa"
+     "8cb08e48590dbb3da7b08b1056828838c5f61e6393ba7a0abcc9f662898015ad",
+     "b094dac5d93471bdec1a502270e3cc6c"),
+    # 16
+    (K*2, "cafebabefacedbaddecaf888", P[:120], A,
+     "522dc1f099567d07f47f37a32a84427d643a8cdcbfe5c0c97598a2bd2555d1aa"
+     "8cb08e48590dbb3da7b08b1056828838c5f61e6393ba7a0abcc9f662",
+     "76fc6ece0f4e1768cddf8853bb2d551b"),
+    ]
+
+class Vectors(unittest.TestCase):
+    def _test_vectors(self, tablesize):
+        for (key, iv, p, a, c, t) in VECTORS:
+            key, iv, p, a, c, t = map(a2b_hex, (key, iv, p, a, c, t))
+            self.failUnlessEqual(aesgcm.encrypt(key, iv, p, a, tablesize), (c, t))
+            self.failUnlessEqual(aesgcm.decrypt(key, iv, c, t, a, tablesize), p)
+
+    def test_small_tables(self):
+        self._test_vectors(2048)
+
+    def test_large_tables(self):
+        self._test_vectors(65536)
+
+    def test_portable_aes(self):
+        if not aes.has_aesni():
+            raise unittest.SkipTest("AES-NI is not used on this processor")
+        previous = aes._set_use_aesni(False)
+        try:
+            self._test_vectors(2048)
+        finally:
+            aes._set_use_aesni(previous)
+
+class Streaming(unittest.TestCase):
+    def test_pieces(self):
+        key = randstr(16)
+        iv = randstr(12)
+        ad = randstr(100)
+        msg = randstr(5000)
+        ct, tag = aesgcm.encrypt(key, iv, msg, ad)
+        for tablesize in [2048, 65536]:
+            e = aesgcm.Encryptor(key, iv, tablesize=tablesize)
+            d = aesgcm.Decryptor(key, iv, tablesize=tablesize)
+            i = 0
+            while i < len(ad):
+                n = random.randrange(0, 40)
+                e.add_associated_data(ad[i:i+n])
+                d.add_associated_data(buffer(ad, i, n))
+                i += n
+            ct2 = ""
+            pt2 = ""
+            i = 0
+            while i < len(msg):
+                n = random.randrange(0, 300)
+                ct2 += e.update(msg[i:i+n])
+                pt2 += d.update(bytearray(ct[i:i+n]))
+                i += n
+            self.failUnlessEqual(ct2, ct)
+            self.failUnlessEqual(pt2, msg)
+            self.failUnlessEqual(e.finalize(), tag)
+            d.finalize(tag)
+
+    def test_large(self):
+        # large enough to be processed with the GIL released
+        key = randstr(32)
+        iv = randstr(12)
+        msg = randstr(2**20 + 3)
+        ct, tag = aesgcm.encrypt(key, iv, msg)
+        self.failUnlessEqual(aesgcm.decrypt(key, iv, ct, tag), msg)
+        self.failUnlessEqual(aesgcm.encrypt(key, iv, msg, tablesize=65536), (ct, tag))
+
+class Authentication(unittest.TestCase):
+    def setUp(self):
+        self.key = randstr(16)
+        self.iv = randstr(12)
+        self.ad = "header"
+        self.msg = randstr(100)
+        self.ct, self.tag = aesgcm.encrypt(self.key, self.iv, self.msg, self.ad)
+
+    def _fails(self, key=None, iv=None, ct=None, tag=None, ad=None):
+        def f():
+            aesgcm.decrypt(key or self.key, iv or self.iv, ct or self.ct, tag or self.tag,
+                           self.ad if ad is None else ad)
+        self.failUnlessRaises(aesgcm.AuthenticationError, f)
+        self.failUnlessRaises(aesgcm.Error, f)
+
+    def _flip(self, s, i):
+        return s[:i] + chr(ord(s[i]) ^ 1) + s[i+1:]
+
+    def test_tampering(self):
+        self._fails(key=self._flip(self.key, 0))
+        self._fails(iv=self._flip(self.iv, 11))
+        self._fails(ct=self._flip(self.ct, 50))
+        self._fails(ct=self.ct[:-1])
+        self._fails(tag=self._flip(self.tag, 15))
+        self._fails(ad="")
+        self._fails(ad="headers")
+
+    def test_truncated_tag(self):
+        self.failUnlessEqual(aesgcm.decrypt(self.key, self.iv, self.ct, self.tag[:12], self.ad), self.msg)
+        self._fails(tag=self._flip(self.tag, 11)[:12])
+        for n in [0, 4, 8, 11, 17]:
+            self.failUnlessRaises(aesgcm.Error, aesgcm.decrypt, self.key, self.iv, self.ct, (self.tag*2)[:n], self.ad)
+
+class Preconditions(unittest.TestCase):
+    def test_init(self):
+        for keysize in [0, 15, 17, 31, 33]:
+            self.failUnlessRaises(aesgcm.Error, aesgcm.Encryptor, "k"*keysize, "i"*12)
+        self.failUnlessRaises(aesgcm.Error, aesgcm.Encryptor, "k"*16, "")
+        for tablesize in [0, 256, 4096, 65535]:
+            self.failUnlessRaises(aesgcm.Error, aesgcm.Decryptor, "k"*16, "i"*12, tablesize=tablesize)
+
+    def test_order(self):
+        e = aesgcm.Encryptor("k"*16, "i"*12)
+        e.add_associated_data("a")
+        e.update("b")
+        self.failUnlessRaises(aesgcm.Error, e.add_associated_data, "c")
+        e.finalize()
+        self.failUnlessRaises(aesgcm.Error, e.update, "d")
+        self.failUnlessRaises(aesgcm.Error, e.finalize)
+
+    def test_type_check(self):
+        e = aesgcm.Encryptor("k"*16, "i"*12)
+        self.failUnlessRaises(aesgcm.Error, e.update, u"text")
+        self.failUnlessRaises(aesgcm.Error, e.add_associated_data, 3)
+
+class Threads(unittest.TestCase):
+    # Each of these calls waits for the lock of an object that another
+    # thread is using with the GIL released.
+
+    def test_update_while_finalizing(self):
+        # An update() still waiting when finalize() gets the lock is refused,
+        # rather than returning ciphertext that the tag does not cover.
+        key, iv = "k"*16, "i"*12
+        big = bytearray(2**25)
+        e = aesgcm.Encryptor(key, iv)
+        results = []
+        def late():
+            try:
+                results.append(e.update("more"))
+            except aesgcm.Error:
+                results.append(None)
+        tags = []
+        run_staggered([lambda: e.update(big), lambda: tags.append(e.finalize()), late])
+        if results == [None]:
+            expected = aesgcm.encrypt(key, iv, str(big))[1]
+        else:
+            # update() got the lock first
+            expected = aesgcm.encrypt(key, iv, str(big) + "more")[1]
+        self.failUnlessEqual(tags, [expected])
+
+    def test_update_while_checking(self):
+        # Nor is any plaintext returned that finalize() has not checked.
+        key, iv = "k"*16, "i"*12
+        ct, tag = aesgcm.encrypt(key, iv, "\x00"*2**25)
+        ct = bytearray(ct)
+        d = aesgcm.Decryptor(key, iv)
+        results = []
+        def late():
+            try:
+                results.append(d.update("more"))
+            except aesgcm.Error:
+                results.append(None)
+        def check():
+            try:
+                d.finalize(tag)
+                results.append("authentic")
+            except aesgcm.AuthenticationError:
+                results.append("not authentic")
+        run_staggered([lambda: d.update(ct), check, late])
+        # either the late update() was refused, or it got the lock first and
+        # so was checked
+        self.failUnless(results == ["authentic", None] or results[1:] == ["not authentic"], results)
+
+    def test_finalize_twice(self):
+        e = aesgcm.Encryptor("k"*16, "i"*12)
+        big = bytearray(2**25)
+        results = []
+        def finalize():
+            try:
+                results.append(e.finalize())
+            except aesgcm.Error:
+                results.append(None)
+        run_staggered([lambda: e.update(big), finalize, finalize])
+        self.failUnlessEqual(results, [aesgcm.encrypt("k"*16, "i"*12, str(big))[1], None])
+
+    def test_associated_data_after_text(self):
+        # Associated data still waiting when text has been processed is
+        # refused, rather than hashed after the text.
+        key, iv = "k"*16, "i"*12
+        e = aesgcm.Encryptor(key, iv)
+        big = bytearray(2**25)
+        results = []
+        def late():
+            try:
+                e.add_associated_data("header")
+                results.append("added")
+            except aesgcm.Error:
+                results.append("refused")
+        run_staggered([lambda: e.add_associated_data(big), lambda: e.update("text"), late])
+        if results == ["refused"]:
+            expected = aesgcm.encrypt(key, iv, "text", str(big))[1]
+        else:
+            # add_associated_data() got the lock first
+            expected = aesgcm.encrypt(key, iv, "text", str(big) + "header")[1]
+        self.failUnlessEqual(e.finalize(), expected)
+
+    def test_init_while_updating(self):
+        # Re-initializing waits for an update() in progress to finish.
+        e = aesgcm.Encryptor("k"*16, "i"*12)
+        big = bytearray(2**25)
+        results = []
+        run_staggered([lambda: results.append(e.update(big)),
+                       lambda: e.__init__("K"*16, "i"*12, tablesize=65536)])
+        self.failUnlessEqual(results, [aesgcm.Encryptor("k"*16, "i"*12).update(big)])
+        self.failUnlessEqual(e.update("x"), aesgcm.Encryptor("K"*16, "i"*12).update("x"))
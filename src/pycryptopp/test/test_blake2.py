@@ -0,0 +1,114 @@
+import os, threading, time
+import unittest
+
+from binascii import a2b_hex
+
+from pycryptopp.hash import blake2
+
+# from RFC 7693, appendices A and B
+b_abc = a2b_hex("ba80a53f981c4d0d6a2797b69f12f6e94c212f14685ac4b74b12bb6fdbffa2d17d87c5392aab792dc252d5de4533cc9518d38aa8dbf1925ab92386edd4009923")
+s_abc = a2b_hex("508c5e8c327c14e2e1a72ba34eeb452f37458b209ed63a294d999b4c86675982")
+
+# Keyed hashes of the first n bytes of 0, 1, 2, ..., 254 under the key 0, 1,
+# 2, ..., from the keyed test vectors of the BLAKE2 reference code.
+KAT_MSG = ''.join([ chr(c) for c in range(255) ])
+BLAKE2B_KEYED = [
+    (0, "10ebb67700b1868efb4417987acf4690ae9d972fb7a590c2f02871799aaa4786b5e996e8f0f4eb981fc214b005f42d2ff4233499391653df7aefcbc13fc51568"),
+    (1, "961f6dd1e4dd30f63901690c512e78e4b45e4742ed197c3c5e45c549fd25f2e4187b0bc9fe30492b16b0d0bc4ef9b0f34c7003fac09a5ef1532e69430234cebd"),
+    (64, "65676d800617972fbd87e4b9514e1c67402b7a331096d3bfac22f1abb95374abc942f16e9ab0ead33b87c91968a6e509e119ff07787b3ef483e1dcdccf6e3022"),
+    (128, "72065ee4dd91c2d8509fa1fc28a37c7fc9fa7d5b3f8ad3d0d7a25626b57b1b44788d4caf806290425f9890a3a2a35a905ab4b37acfd0da6e4517b2525c9651e4"),
+    (129, "64475dfe7600d7171bea0b394e27c9b00d8e74dd1e416a79473682ad3dfdbb706631558055cfc8a40e07bd015a4540dcdea15883cbbf31412df1de1cd4152b91"),
+    (255, "142709d62e28fcccd0af97fad0f8465b971e82201dc51070faa0372aa43e92484be1c1e73ba10906d5d1853db6a4106e0a7bf9800d373d6dee2d46d62ef2a461"),
+    ]
+BLAKE2S_KEYED = [
+    (0, "48a8997da407876b3d79c0d92325ad3b89cbb754d86ab71aee047ad345fd2c49"),
+    (1, "40d15fee7c328830166ac3f918650f807e7e01e177258cdc0a39b11f598066f1"),
+    (63, "c65382513f07460da39833cb666c5ed82e61b9e998f4b0c4287cee56c3cc9bcd"),
+    (64, "8975b0577fd35566d750b362b0897a26c399136df07bababbde6203ff2954ed4"),
+    (65, "21fe0ceb0052be7fb0f004187cacd7de67fa6eb0938d927677f2398c132317a8"),
+    (255, "3fb735061abc519dfe979e54c1ee5bfad0a9d858b3315bad34bde999efd724dd"),
+    ]
+
+class BLAKE2b(unittest.TestCase):
+    def test_vectors(self):
+        self.failUnlessEqual(blake2.BLAKE2b("abc").digest(), b_abc)
+        self.failUnlessEqual(blake2.BLAKE2b().hexdigest().lower(), "786a02f742015903c6c6fd852552d272912f4740e15847618a86e217f71f5419d25e1031afee585313896444934eb04b903a685b1448b755d56f701afe9be2ce")
+
+    def test_keyed(self):
+        for (n, expected) in BLAKE2B_KEYED:
+            self.failUnlessEqual(blake2.BLAKE2b(KAT_MSG[:n], key=KAT_MSG[:64]).hexdigest().lower(), expected)
+            # and in pieces
+            h = blake2.BLAKE2b(key=KAT_MSG[:64])
+            for i in range(0, n, 50):
+                h.update(KAT_MSG[i:min(i+50, n)])
+            self.failUnlessEqual(h.hexdigest().lower(), expected)
+
+    def test_digest_size(self):
+        self.failUnlessEqual(blake2.BLAKE2b("abc", digest_size=20).hexdigest().lower(), "384264f676f39536840523f284921cdc68b6846b")
+        self.failUnlessEqual(blake2.BLAKE2b("abc", key="key", digest_size=16).hexdigest().lower(), "2cf02ae16ac225ee731f9d359d8a1c38")
+        self.failUnlessEqual(len(blake2.BLAKE2b(digest_size=1).digest()), 1)
+
+    def test_copy(self):
+        h = blake2.BLAKE2b(KAT_MSG[:100], key=KAT_MSG[:64])
+        c = h.copy()
+        h.update(KAT_MSG[100:129])
+        self.failUnlessEqual(h.digest_so_far(), a2b_hex(BLAKE2B_KEYED[4][1]))
+        c.update(KAT_MSG[100:128])
+        self.failUnlessEqual(c.digest(), a2b_hex(BLAKE2B_KEYED[3][1]))
+        self.failUnlessEqual(h.digest(), a2b_hex(BLAKE2B_KEYED[4][1]))
+        self.failUnlessRaises(blake2.Error, h.update, "more")
+        # a copy keeps a short digest size
+        h = blake2.BLAKE2b("a", digest_size=20)
+        h.update("bc")
+        self.failUnlessEqual(h.copy().digest(), blake2.BLAKE2b("abc", digest_size=20).digest())
+
+    def test_preconditions(self):
+        self.failUnlessRaises(blake2.Error, blake2.BLAKE2b, key="k"*65)
+        self.failUnlessRaises(blake2.Error, blake2.BLAKE2b, digest_size=0)
+        self.failUnlessRaises(blake2.Error, blake2.BLAKE2b, digest_size=65)
+        self.failUnlessRaises(TypeError, blake2.BLAKE2b, 5)
+
+    def test_list_changed_meanwhile(self):
+        # as in test_sha256: another thread empties the list while the GIL is
+        # released for one of its items
+        h = blake2.BLAKE2b()
+        h.update(bytearray(4096)) # gives h a lock, so the GIL is released
+        bufs = [ bytearray(os.urandom(1024)) * 1024 for i in range(50) ]
+        expected = blake2.BLAKE2b("\x00"*4096 + "".join(map(str, bufs))).digest()
+        empty = blake2.BLAKE2b("\x00"*4096).digest()
+        lst = list(bufs)
+        def empty_it():
+            time.sleep(0.01)
+            del lst[:]
+        t = threading.Thread(target=empty_it)
+        t.start()
+        h.update(lst)
+        t.join()
+        self.failUnless(h.digest() in (expected, empty))
+
+class BLAKE2s(unittest.TestCase):
+    def test_vectors(self):
+        self.failUnlessEqual(blake2.BLAKE2s("abc").digest(), s_abc)
+        self.failUnlessEqual(blake2.BLAKE2s().hexdigest().lower(), "69217a3079908094e11121d042354a7c1f55b6482ca1a51e1b250dfd1ed0eef9")
+
+    def test_keyed(self):
+        for (n, expected) in BLAKE2S_KEYED:
+            self.failUnlessEqual(blake2.BLAKE2s(KAT_MSG[:n], key=KAT_MSG[:32]).hexdigest().lower(), expected)
+            h = blake2.BLAKE2s(key=KAT_MSG[:32])
+            h.update([ KAT_MSG[i:min(i+30, n)] for i in range(0, n, 30) ])
+            self.failUnlessEqual(h.hexdigest().lower(), expected)
+
+    def test_digest_size(self):
+        self.failUnlessEqual(blake2.BLAKE2s("abc", digest_size=16).hexdigest().lower(), "aa4938119b1dc7b87cbad0ffd200d0ae")
+
+    def test_copy(self):
+        h = blake2.BLAKE2s(KAT_MSG[:60], key=KAT_MSG[:32])
+        c = h.copy()
+        h.update(KAT_MSG[60:65])
+        c.update(KAT_MSG[60:64])
+        self.failUnlessEqual(h.digest(), a2b_hex(BLAKE2S_KEYED[4][1]))
+        self.failUnlessEqual(c.digest(), a2b_hex(BLAKE2S_KEYED[3][1]))
+
+    def test_preconditions(self):
+        self.failUnlessRaises(blake2.Error, blake2.BLAKE2s, key="k"*33)
+        self.failUnlessRaises(blake2.Error, blake2.BLAKE2s, digest_size=33)
@@ -0,0 +1,328 @@
+import random, struct, threading
+
+import unittest
+
+from binascii import a2b_hex
+
+from pycryptopp.cipher import chacha20
+
+def randstr(n):
+    return ''.join(map(chr, map(random.randrange, [0]*n, [256]*n)))
+
+def _rounds(x):
+    def rotl(v, n):
+        return ((v << n) & 0xffffffff) | (v >> (32 - n))
+    def qr(a, b, c, d):
+        x[a] = (x[a] + x[b]) & 0xffffffff; x[d] = rotl(x[d] ^ x[a], 16)
+        x[c] = (x[c] + x[d]) & 0xffffffff; x[b] = rotl(x[b] ^ x[c], 12)
+        x[a] = (x[a] + x[b]) & 0xffffffff; x[d] = rotl(x[d] ^ x[a], 8)
+        x[c] = (x[c] + x[d]) & 0xffffffff; x[b] = rotl(x[b] ^ x[c], 7)
+    for i in range(10):
+        qr(0, 4, 8, 12); qr(1, 5, 9, 13); qr(2, 6, 10, 14); qr(3, 7, 11, 15)
+        qr(0, 5, 10, 15); qr(1, 6, 11, 12); qr(2, 7, 8, 13); qr(3, 4, 9, 14)
+
+def _input(key, words):
+    return list(struct.unpack("<4I", "expand 32-byte k")) + list(struct.unpack("<8I", key)) + words
+
+def chacha20_block(key, iv, counter):
+    """ One block of ChaCha20, straight from its definition. With an 8-byte
+    iv the block counter is 64 bits long, and with a 12-byte one 32 bits. """
+    if len(iv) == 8:
+        words = [counter & 0xffffffff, counter >> 32] + list(struct.unpack("<2I", iv))
+    else:
+        words = [counter] + list(struct.unpack("<3I", iv))
+    j = _input(key, words)
+    x = list(j)
+    _rounds(x)
+    return struct.pack("<16I", *[(a + b) & 0xffffffff for (a, b) in zip(x, j)])
+
+def hchacha20(key, nonce):
+    x = _input(key, list(struct.unpack("<4I", nonce)))
+    _rounds(x)
+    return struct.pack("<8I", *(x[:4] + x[12:]))
+
+def chacha20_stream(key, iv, pos, n):
+    """ n bytes of the keystream, starting pos bytes in """
+    blocks = [chacha20_block(key, iv, b) for b in range(pos // 64, (pos + n + 63) // 64)]
+    return "".join(blocks)[pos % 64:pos % 64 + n]
+
+def xor(a, b):
+    return "".join(chr(ord(x) ^ ord(y)) for (x, y) in zip(a, b))
+
+def widths():
+    return [w for w in [1, 4, 8] if w <= chacha20.simd_width()]
+
+class Vectors(unittest.TestCase):
+    key = a2b_hex("000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f")
+
+    def test_strombergson(self):
+        # draft-strombergson-chacha-test-vectors TC1 to TC3 for 32-byte keys,
+        # as in Crypto++'s TestVectors/chacha.txt
+        for (key, iv, ks) in [
+            ("00"*32, "00"*8, "76b8e0ada0f13d90405d6ae55386bd28bdd219b8a08ded1aa836efcc8b770dc7"
+                              "da41597c5157488d7724e03fb8d84a376a43b8f41518a11cc387b669b2ee6586"),
+            ("01" + "00"*31, "00"*8, "c5d30a7ce1ec119378c84f487d775a8542f13ece238a9455e8229e888de85bbd"
+                                     "29eb63d0a17a5b999b52da22be4023eb07620a54f6fa6ad8737b71eb0464dac0"),
+            ("00"*32, "01" + "00"*7, "ef3fdfd6c61578fbf5cf35bd3dd33b8009631634d21e42ac33960bd138e50d32"
+                                     "111e4caf237ee53ca8ad6426194a88545ddc497a0b466e7d6bbdb0041b2f586b"),
+            ]:
+            key, iv, ks = map(a2b_hex, (key, iv, ks))
+            self.failUnlessEqual(chacha20.ChaCha20(key, iv).process("\x00"*64), ks)
+            self.failUnlessEqual(chacha20_block(key, iv, 0), ks)
+
+    def test_rfc8439_block(self):
+        # RFC 8439 section 2.3.2
+        iv = a2b_hex("000000090000004a00000000")
+        expected = a2b_hex("10f1e7e4d13b5915500fdd1fa32071c4c7d1f4c733c068030422aa9ac3d46c4e"
+                           "d2826446079faa0914c2d705d98b02a2b5129cd1de164eb9cbd083e8a2503c4e")
+        cryptor = chacha20.ChaCha20(self.key, iv)
+        cryptor.seek(64)
+        self.failUnlessEqual(cryptor.process("\x00"*64), expected)
+        self.failUnlessEqual(chacha20_block(self.key, iv, 1), expected)
+
+    def test_rfc8439_encryption(self):
+        # RFC 8439 section 2.4.2
+        iv = a2b_hex("000000000000004a00000000")
+        plaintext = "Ladies and Gentlemen of the class of '99: If I could offer you only one tip for the future, sunscreen would be it."
+        ciphertext = a2b_hex("6e2e359a2568f98041ba0728dd0d6981e97e7aec1d4360c20a27afccfd9fae0b"
+                             "f91b65c5524733ab8f593dabcd62b3571639d624e65152ab8f530c359f0861d8"
+                             "07ca0dbf500d6a6156a38e088a22b65e52bc514d16ccf806818ce91ab7793736"
+                             "5af90bbf74a35be6b40b8eedf2785e42874d")
+        cryptor = chacha20.ChaCha20(self.key, iv)
+        cryptor.seek(64)
+        self.failUnlessEqual(cryptor.process(plaintext), ciphertext)
+        cryptor.seek(64)
+        self.failUnlessEqual(cryptor.process(ciphertext), plaintext)
+
+    def test_hchacha20(self):
+        # draft-irtf-cfrg-xchacha section 2.2.1, checking the reference
+        # implementation above
+        self.failUnlessEqual(hchacha20(self.key, a2b_hex("000000090000004a0000000031415927")),
+                             a2b_hex("82413b4227b27bfed30e42508a877d73a0f9e4d58a74a853c12ec41326d3ecdc"))
+
+    def test_xchacha20(self):
+        # draft-irtf-cfrg-xchacha section A.3.2
+        key = a2b_hex("808182838485868788898a8b8c8d8e8f909192939495969798999a9b9c9d9e9f")
+        iv = a2b_hex("404142434445464748494a4b4c4d4e4f5051525354555658")
+        plaintext = ('The dhole (pronounced "dole") is also known as the Asiatic wild dog, red dog, and '
+                     'whistling dog. It is about the size of a German shepherd but looks more like a '
+                     'long-legged fox. This highly elusive and skilled jumper is classified with wolves, '
+                     'coyotes, jackals, and foxes in the taxonomic family Canidae.')
+        ciphertext = a2b_hex("7d0a2e6b7f7c65a236542630294e063b7ab9b555a5d5149aa21e4ae1e4fbce87"
+                             "ecc8e08a8b5e350abe622b2ffa617b202cfad72032a3037e76ffdcdc4376ee05"
+                             "3a190d7e46ca1de04144850381b9cb29f051915386b8a710b8ac4d027b8b050f"
+                             "7cba5854e028d564e453b8a968824173fc16488b8970cac828f11ae53cabd201"
+                             "12f87107df24ee6183d2274fe4c8b1485534ef2c5fbc1ec24bfc3663efaa08bc"
+                             "047d29d25043532db8391a8a3d776bf4372a6955827ccb0cdd4af403a7ce4c63"
+                             "d595c75a43e045f0cce1f29c8b93bd65afc5974922f214a40b7c402cdb91ae73"
+                             "c0b63615cdad0480680f16515a7ace9d39236464328a37743ffc28f4ddb324f4"
+                             "d0f5bbdc270c65b1749a6efff1fbaa09536175ccd29fb9e6057b307320d31683"
+                             "8a9c71f70b5b5907a66f7ea49aadc409")
+        cryptor = chacha20.XChaCha20(key, iv)
+        cryptor.seek(64)
+        self.failUnlessEqual(cryptor.process(plaintext), ciphertext)
+
+    def test_xchacha20_construction(self):
+        # XChaCha20 is ChaCha20 under the HChaCha20 subkey
+        for i in range(10):
+            key = randstr(32)
+            iv = randstr(24)
+            msg = randstr(random.randrange(1000))
+            self.failUnlessEqual(chacha20.XChaCha20(key, iv).process(msg),
+                                 chacha20.ChaCha20(hchacha20(key, iv[:16]), iv[16:]).process(msg))
+
+class Widths(unittest.TestCase):
+    def _each_width(self, f):
+        results = []
+        for width in widths():
+            previous = chacha20._set_simd_width(width)
+            try:
+                results.append(f())
+            finally:
+                chacha20._set_simd_width(previous)
+        return results
+
+    def test_against_reference(self):
+        # every width, for lengths and offsets that start and end in each
+        # place within a run of 8 blocks
+        key = randstr(32)
+        for iv in [randstr(8), randstr(12)]:
+            expected = chacha20_stream(key, iv, 0, 1600)
+            for width in widths():
+                previous = chacha20._set_simd_width(width)
+                try:
+                    for i in range(40):
+                        pos = random.randrange(600)
+                        n = random.randrange(1000)
+                        cryptor = chacha20.ChaCha20(key, iv)
+                        cryptor.seek(pos)
+                        self.failUnlessEqual(cryptor.process("\x00"*n), expected[pos:pos+n], (width, pos, n))
+                finally:
+                    chacha20._set_simd_width(previous)
+
+    def test_large(self):
+        key = randstr(32)
+        iv = randstr(24)
+        msg = randstr(300000)
+        results = self._each_width(lambda: chacha20.XChaCha20(key, iv).process(msg))
+        self.failUnlessEqual(len(set(results)), 1)
+        self.failUnlessEqual(chacha20.XChaCha20(key, iv).process(results[0]), msg)
+
+    def test_counter_carry(self):
+        # With an 8-byte IV the 64-bit block counter carries into the second
+        # word after 2^32 blocks.
+        key = randstr(32)
+        iv = randstr(8)
+        pos = 2**32 * 64 - 300
+        expected = chacha20_stream(key, iv, pos, 1000)
+        def f():
+            cryptor = chacha20.ChaCha20(key, iv)
+            cryptor.seek(pos)
+            return cryptor.process("\x00"*1000)
+        for result in self._each_width(f):
+            self.failUnlessEqual(result, expected)
+
+    def test_set_simd_width(self):
+        self.failUnless(chacha20.simd_width() in (1, 4, 8))
+        for width in [0, 2, 3, 16, -1]:
+            self.failUnlessRaises(chacha20.Error, chacha20._set_simd_width, width)
+        if chacha20.simd_width() < 8:
+            self.failUnlessRaises(chacha20.Error, chacha20._set_simd_width, 8)
+        previous = chacha20._set_simd_width(1)
+        self.failUnlessEqual(previous, chacha20.simd_width())
+        self.failUnlessEqual(chacha20._set_simd_width(previous), 1)
+
+class Stream(unittest.TestCase):
+    def test_pieces(self):
+        key = randstr(32)
+        for cls, iv in [(chacha20.ChaCha20, randstr(8)), (chacha20.ChaCha20, randstr(12)), (chacha20.XChaCha20, randstr(24))]:
+            msg = randstr(5000)
+            expected = cls(key, iv).process(msg)
+            cryptor = cls(key, iv)
+            pos = 0
+            result = ""
+            while pos < len(msg):
+                n = random.randrange(700)
+                result += cryptor.process(msg[pos:pos+n])
+                pos += n
+                self.failUnlessEqual(cryptor.tell(), min(pos, len(msg)))
+            self.failUnlessEqual(result, expected)
+
+    def test_seek(self):
+        key = randstr(32)
+        iv = randstr(24)
+        stream = chacha20.XChaCha20(key, iv).process("\x00"*3000)
+        cryptor = chacha20.XChaCha20(key, iv)
+        for pos in [2999, 0, 64, 65, 1000, 511, 512, 3]:
+            cryptor.seek(pos)
+            self.failUnlessEqual(cryptor.tell(), pos)
+            self.failUnlessEqual(cryptor.process("\x00"*(3000-pos)), stream[pos:])
+            self.failUnlessEqual(cryptor.tell(), 3000)
+        self.failUnlessRaises(chacha20.Error, cryptor.seek, -1)
+
+    def test_ietf_limit(self):
+        # With a 12-byte IV the keystream is 2^38 bytes long.
+        key = randstr(32)
+        iv = randstr(12)
+        end = 2**38
+        cryptor = chacha20.ChaCha20(key, iv)
+        cryptor.seek(end - 100)
+        self.failUnlessEqual(cryptor.process("\x00"*100), chacha20_stream(key, iv, end - 100, 100))
+        self.failUnlessRaises(chacha20.Error, cryptor.process, "\x00")
+        self.failUnlessEqual(cryptor.tell(), end)
+        cryptor.seek(end - 10)
+        self.failUnlessRaises(chacha20.Error, cryptor.process, "\x00"*11)
+        self.failUnlessRaises(chacha20.Error, cryptor.process_into, "\x00"*11, bytearray(11))
+        self.failUnlessEqual(cryptor.tell(), end - 10)
+        cryptor.seek(end + 5)
+        self.failUnlessRaises(chacha20.Error, cryptor.process, "\x00")
+        # but not with an 8-byte one
+        cryptor = chacha20.ChaCha20(key, iv[:8])
+        cryptor.seek(end - 10)
+        self.failUnlessEqual(len(cryptor.process("\x00"*11)), 11)
+
+    def test_process_into(self):
+        key = randstr(32)
+        iv = randstr(12)
+        msg = randstr(3000)
+        expected = chacha20.ChaCha20(key, iv).process(msg)
+        buf = bytearray(msg)
+        chacha20.ChaCha20(key, iv).process_into(buf, buf)
+        self.failUnlessEqual(str(buf), expected)
+        dst = bytearray(3010)
+        chacha20.ChaCha20(key, iv).process_into(msg, dst)
+        self.failUnlessEqual(str(dst[:3000]), expected)
+        self.failUnlessRaises(chacha20.Error, chacha20.ChaCha20(key, iv).process_into, msg, bytearray(2999))
+
+    def test_rekey_and_reset(self):
+        key1, key2 = randstr(32), randstr(32)
+        for cls, ivsize in [(chacha20.ChaCha20, 8), (chacha20.ChaCha20, 12), (chacha20.XChaCha20, 24)]:
+            iv1, iv2 = randstr(ivsize), randstr(ivsize)
+            msg = randstr(1000)
+            cryptor = cls(key1, iv1)
+            cryptor.process(msg)
+            cryptor.reset(iv2)
+            self.failUnlessEqual(cryptor.tell(), 0)
+            self.failUnlessEqual(cryptor.process(msg), cls(key1, iv2).process(msg))
+            cryptor.rekey(key2, iv1)
+            self.failUnlessEqual(cryptor.process(msg), cls(key2, iv1).process(msg))
+            cryptor.rekey(key1)
+            self.failUnlessEqual(cryptor.process(msg), cls(key1).process(msg))
+            self.failUnlessRaises(chacha20.Error, cryptor.rekey, "k"*16)
+            self.failUnlessEqual(cryptor.tell(), len(msg))
+        # a ChaCha20 object may switch between the two IV sizes
+        cryptor = chacha20.ChaCha20(key1, "\x00"*8)
+        cryptor.reset("\x00"*12)
+        cryptor.seek(2**38)
+        self.failUnlessRaises(chacha20.Error, cryptor.process, "\x00")
+        cryptor.reset("\x00"*8)
+        cryptor.seek(2**38)
+        cryptor.process("\x00")
+
+    def test_types_and_lengths(self):
+        self.failUnlessRaises(TypeError, chacha20.ChaCha20, None)
+        for i in range(70):
+            if i != 32:
+                self.failUnlessRaises(chacha20.Error, chacha20.ChaCha20, "a"*i)
+                self.failUnlessRaises(chacha20.Error, chacha20.XChaCha20, "a"*i)
+        key = "a"*32
+        for i in range(70):
+            if i not in (8, 12):
+                self.failUnlessRaises(chacha20.Error, chacha20.ChaCha20, key, "i"*i)
+                self.failUnlessRaises(chacha20.Error, chacha20.ChaCha20(key).reset, "i"*i)
+            if i != 24:
+                self.failUnlessRaises(chacha20.Error, chacha20.XChaCha20, key, "i"*i)
+                self.failUnlessRaises(chacha20.Error, chacha20.XChaCha20(key).reset, "i"*i)
+        # no IV, or None, means all zeroes
+        msg = randstr(100)
+        self.failUnlessEqual(chacha20.ChaCha20(key).process(msg), chacha20.ChaCha20(key, "\x00"*8).process(msg))
+        self.failUnlessEqual(chacha20.ChaCha20(key, None).process(msg), chacha20.ChaCha20(key, "\x00"*8).process(msg))
+        self.failUnlessEqual(chacha20.XChaCha20(key).process(msg), chacha20.XChaCha20(key, "\x00"*24).process(msg))
+
+    def test_buffers(self):
+        import array
+        key = randstr(32)
+        msg = randstr(1000)
+        expected = chacha20.ChaCha20(key).process(msg)
+        for make in [bytearray, lambda s: memoryview(bytearray(s))[:], lambda s: array.array('B', s)]:
+            self.failUnlessEqual(chacha20.ChaCha20(key).process(make(msg)), expected)
+
+    def test_threads(self):
+        # Threads sharing one object, with the GIL released, must between them
+        # use each part of the keystream exactly once.
+        key = randstr(32)
+        iv = randstr(24)
+        cryptor = chacha20.XChaCha20(key, iv)
+        n = 2**16
+        outputs = []
+        def work():
+            for i in range(10):
+                outputs.append(cryptor.process("\x00"*n))
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failUnlessEqual(cryptor.tell(), 40 * n)
+        stream = chacha20.XChaCha20(key, iv).process("\x00"*(40 * n))
+        self.failUnlessEqual(sorted(outputs), sorted(stream[i:i+n] for i in range(0, 40 * n, n)))
@@ -1,9 +1,11 @@
 
 import unittest
 import time
+import threading
 from binascii import hexlify, unhexlify
 from pycryptopp.publickey import ed25519
 from pycryptopp.publickey.ed25519 import _ed25519 as raw
+from pycryptopp.test.threadutil import ncpus, check_threads_speedup
 
 def flip_bit(s, bit=0, in_byte=-1):
     as_bytes = [ord(b) for b in s]
@@ -143,6 +145,38 @@ class Basic(unittest.TestCase):
         self.failIfEqual(sk2, "not a SigningKey")
         self.failIfEqual(vk2, "not a VerifyingKey")
 
+    def test_threads(self):
+        # signing and verifying release the GIL; make sure concurrent use
+        # still gives the same answers as serial use
+        sk = ed25519.SigningKey("\x01"*32)
+        vk = ed25519.VerifyingKey(sk.get_verifying_key_bytes())
+        msgs = [ "message %d" % i for i in range(16) ]
+        expected = dict([ (msg, sk.sign(msg)) for msg in msgs ])
+        failures = []
+        def work(msg):
+            sig = sk.sign(msg)
+            if sig != expected[msg]:
+                failures.append(msg)
+            vk.verify(sig, msg)
+        threads = [ threading.Thread(target=work, args=(msg,)) for msg in msgs ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failIf(failures, failures)
+
+    def test_speedup(self):
+        # With the GIL released, signing and verifying in separate threads
+        # runs in parallel.
+        N = min(ncpus(), 4)
+        if N < 2:
+            raise unittest.SkipTest("needs more than one CPU")
+        sk = ed25519.SigningKey("\x01"*32)
+        vk = ed25519.VerifyingKey(sk.get_verifying_key_bytes())
+        def work():
+            for i in range(100):
+                vk.verify(sk.sign("message"), "message")
+        check_threads_speedup(self, work, N)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,176 @@
+import hashlib, os
+import unittest
+
+from pycryptopp.hash import merkle, sha256
+
+def netstring(s):
+    return "%d:%s," % (len(s), s)
+
+def roundup_pow2(n):
+    p = 1
+    while p < n:
+        p *= 2
+    return p
+
+def reference_tree(leaves, tag=None, empty_leaf_tag=None, sha256d=False):
+    """ The nodes of the tree, built one node at a time with hashlib, in the
+    same way as Tahoe-LAFS's hashtree.HashTree. """
+    def H(s):
+        h = hashlib.sha256(s).digest()
+        if sha256d:
+            h = hashlib.sha256(h).digest()
+        return h
+    def pair_hash(a, b):
+        if tag is None:
+            return H(a + b)
+        return H(netstring(tag) + netstring(a) + netstring(b))
+    def empty_leaf_hash(i):
+        if empty_leaf_tag is None:
+            return "\x00"*32
+        return H(netstring(empty_leaf_tag) + "%d" % i)
+    end = roundup_pow2(len(leaves))
+    rows = [ list(leaves) + [ empty_leaf_hash(i) for i in range(len(leaves), end) ] ]
+    while len(rows[-1]) != 1:
+        last = rows[-1]
+        rows.append([ pair_hash(last[2*i], last[2*i+1]) for i in range(len(last)//2) ])
+    rows.reverse()
+    return "".join(sum(rows, []))
+
+TAHOE = dict(tag="Merkle tree internal node", empty_leaf_tag="Merkle tree empty leaf", sha256d=True)
+
+def randleaves(n):
+    return [ os.urandom(32) for i in range(n) ]
+
+class Build(unittest.TestCase):
+    def test_plain(self):
+        for n in range(1, 20):
+            leaves = randleaves(n)
+            self.failUnlessEqual(merkle.build(leaves), reference_tree(leaves))
+
+    def test_tahoe(self):
+        for n in range(1, 20):
+            leaves = randleaves(n)
+            self.failUnlessEqual(merkle.build(leaves, **TAHOE), reference_tree(leaves, **TAHOE))
+
+    def test_options(self):
+        leaves = randleaves(5)
+        for kwargs in [ dict(tag="t"), dict(empty_leaf_tag="e"), dict(sha256d=True),
+                        dict(tag="", empty_leaf_tag=""), dict(tag="x"*300, sha256d=1) ]:
+            self.failUnlessEqual(merkle.build(leaves, **kwargs), reference_tree(leaves, **kwargs))
+
+    def test_inputs(self):
+        leaves = randleaves(6)
+        expected = reference_tree(leaves)
+        self.failUnlessEqual(merkle.build(tuple(leaves)), expected)
+        self.failUnlessEqual(merkle.build("".join(leaves)), expected)
+        self.failUnlessEqual(merkle.build(bytearray("".join(leaves))), expected)
+        self.failUnlessEqual(merkle.build([ bytearray(leaf) for leaf in leaves ]), expected)
+
+    def test_large(self):
+        # with the GIL released, and with every width and implementation of
+        # sha256.hash_many()
+        leaves = randleaves(1000)
+        expected = reference_tree(leaves, **TAHOE)
+        for impl in sha256.implementations():
+            previous_impl = sha256._set_implementation(impl)
+            try:
+                for width in [1, 4, 8]:
+                    if width <= sha256.simd_width():
+                        previous = sha256._set_simd_width(width)
+                        try:
+                            self.failUnlessEqual(merkle.build(leaves, **TAHOE), expected)
+                        finally:
+                            sha256._set_simd_width(previous)
+            finally:
+                sha256._set_implementation(previous_impl)
+
+    def test_preconditions(self):
+        self.failUnlessRaises(merkle.Error, merkle.build, [])
+        self.failUnlessRaises(merkle.Error, merkle.build, "")
+        self.failUnlessRaises(merkle.Error, merkle.build, "x"*33)
+        self.failUnlessRaises(merkle.Error, merkle.build, ["x"*32, "x"*31])
+        self.failUnlessRaises(merkle.Error, merkle.build, [u"x"*32])
+
+class Proofs(unittest.TestCase):
+    def test_auth_path(self):
+        leaves = randleaves(5)
+        nodes = merkle.build(leaves)
+        node = lambda i: nodes[32*i:32*(i+1)]
+        # leaf 2 is node 9, whose ancestors are nodes 4, 1 and 0
+        self.failUnlessEqual(merkle.auth_path(nodes, 2), node(10) + node(3) + node(2))
+        self.failUnlessEqual(merkle.auth_path(nodes, 7), node(13) + node(5) + node(1))
+        self.failUnlessEqual(merkle.auth_path(merkle.build(leaves[:1]), 0), "")
+
+    def test_verify(self):
+        for kwargs in [ {}, TAHOE ]:
+            vkwargs = dict(tag=kwargs.get("tag"), sha256d=kwargs.get("sha256d", False))
+            for n in [1, 2, 3, 8, 13]:
+                leaves = randleaves(n)
+                nodes = merkle.build(leaves, **kwargs)
+                root = nodes[:32]
+                leafnums = range(n)
+                paths = [ merkle.auth_path(nodes, i) for i in leafnums ]
+                self.failUnlessEqual(merkle.verify_many(root, leaves, leafnums, paths, **vkwargs), [True]*n)
+                self.failUnlessEqual(merkle.verify_many(root, "".join(leaves), leafnums, "".join(paths), **vkwargs), [True]*n)
+                for i in leafnums:
+                    self.failUnless(merkle.verify(root, leaves[i], i, paths[i], **vkwargs))
+
+    def test_reject(self):
+        leaves = randleaves(8)
+        nodes = merkle.build(leaves, **TAHOE)
+        root = nodes[:32]
+        paths = [ merkle.auth_path(nodes, i) for i in range(8) ]
+        bad_path = paths[3][:40] + chr(ord(paths[3][40]) ^ 1) + paths[3][41:]
+        results = merkle.verify_many(root, [ leaves[0], "\x00"*32, leaves[2], leaves[3], leaves[4], leaves[5] ],
+                                     [ 0, 1, 3, 3, 4, 5 ],
+                                     [ paths[0], paths[1], paths[2], bad_path, paths[4], paths[5] ],
+                                     tag=TAHOE["tag"], sha256d=True)
+        self.failUnlessEqual(results, [True, False, False, False, True, True])
+        # the wrong hashing
+        self.failIf(merkle.verify(root, leaves[0], 0, paths[0]))
+        self.failIf(merkle.verify(root, leaves[0], 0, paths[0], tag=TAHOE["tag"]))
+        self.failIf(merkle.verify(os.urandom(32), leaves[0], 0, paths[0], tag=TAHOE["tag"], sha256d=True))
+
+    def test_many(self):
+        # a level of the tree at a time, with the GIL released
+        leaves = randleaves(1000)
+        nodes = merkle.build(leaves, **TAHOE)
+        leafnums = range(0, 1000, 3) + range(1000, 1024)
+        allleaves = leaves + [ nodes[32*(1023+i):32*(1024+i)] for i in range(1000, 1024) ]
+        paths = [ merkle.auth_path(nodes, i) for i in leafnums ]
+        results = merkle.verify_many(nodes[:32], [ allleaves[i] for i in leafnums ], leafnums, paths, TAHOE["tag"], True)
+        self.failUnlessEqual(results, [True]*len(leafnums))
+        self.failUnlessEqual(merkle.verify_many(nodes[:32], [], [], []), [])
+
+    def test_preconditions(self):
+        leaves = randleaves(4)
+        nodes = merkle.build(leaves)
+        path = merkle.auth_path(nodes, 0)
+        self.failUnlessRaises(merkle.Error, merkle.auth_path, nodes, 4)
+        self.failUnlessRaises(merkle.Error, merkle.auth_path, nodes, -1)
+        self.failUnlessRaises(merkle.Error, merkle.auth_path, nodes[:-32], 0)
+        self.failUnlessRaises(merkle.Error, merkle.auth_path, nodes + "x"*64, 0)
+        self.failUnlessRaises(merkle.Error, merkle.verify_many, nodes[:31], leaves[:1], [0], [path])
+        self.failUnlessRaises(merkle.Error, merkle.verify_many, nodes[:32], leaves[:1], [4], [path])
+        self.failUnlessRaises(merkle.Error, merkle.verify_many, nodes[:32], leaves[:2], [0], [path])
+        self.failUnlessRaises(merkle.Error, merkle.verify_many, nodes[:32], leaves[:2], [0, 1], [path])
+        self.failUnlessRaises(merkle.Error, merkle.verify_many, nodes[:32], leaves[:2], [0, 1], [path, path[:32]])
+        self.failUnlessRaises(merkle.Error, merkle.verify_many, nodes[:32], leaves[:1], [0], [path[:33]])
+        self.failUnlessRaises(TypeError, merkle.verify_many, nodes[:32], leaves[:1], 0, [path])
+
+    def test_leafnums_changed_meanwhile(self):
+        # Converting a leaf number to an integer can run Python code which
+        # empties the list of them; the leaf numbers are used as they were
+        # when verify_many() was called.
+        leaves = randleaves(64)
+        nodes = merkle.build(leaves)
+        paths = [ merkle.auth_path(nodes, i) for i in range(64) ]
+        leafnums = []
+        class Index(object):
+            def __init__(self, i):
+                self.i = i
+            def __index__(self):
+                del leafnums[:]
+                return self.i
+        leafnums.extend([ Index(i) for i in range(64) ])
+        self.failUnlessEqual(merkle.verify_many(nodes[:32], leaves, leafnums, paths), [True]*64)
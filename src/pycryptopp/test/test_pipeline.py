@@ -0,0 +1,159 @@
+import random, threading, time
+
+import unittest
+
+from pycryptopp import pipeline
+from pycryptopp.cipher import aes
+from pycryptopp.hash import sha256
+
+def randstr(n):
+    return ''.join(map(chr, map(random.randrange, [0]*n, [256]*n)))
+
+class EncryptAndHash(unittest.TestCase):
+    def test_same_as_separate(self):
+        k = randstr(16)
+        iv = randstr(16)
+        for n in [0, 1, 100, 8191, 8192, 8193, 100000]:
+            msg = randstr(n)
+            expected = aes.AES(k, iv).process(msg)
+            ct, ph, ch = pipeline.encrypt_and_hash(aes.AES(k, iv), msg)
+            self.failUnlessEqual(ct, expected, n)
+            self.failUnlessEqual(ph.digest(), sha256.SHA256(msg).digest(), n)
+            self.failUnlessEqual(ch.digest(), sha256.SHA256(expected).digest(), n)
+
+    def test_one_hash(self):
+        k = randstr(32)
+        msg = randstr(5000)
+        expected = aes.AES(k).process(msg)
+        ct, ph, ch = pipeline.encrypt_and_hash(aes.AES(k), msg, hash_plaintext=False)
+        self.failUnlessEqual((ct, ph), (expected, None))
+        self.failUnlessEqual(ch.digest(), sha256.SHA256(expected).digest())
+        ct, ph, ch = pipeline.encrypt_and_hash(aes.AES(k), bytearray(msg), hash_ciphertext=None)
+        self.failUnlessEqual((ct, ch), (expected, None))
+        self.failUnlessEqual(ph.digest(), sha256.SHA256(msg).digest())
+        self.failUnlessEqual(pipeline.crypt_and_hash(aes.AES(k), msg), expected)
+
+    def test_segments(self):
+        # The cipher and the hashers carry on from one segment to the next.
+        k = randstr(16)
+        msg = randstr(30000)
+        cryptor = aes.AES(k)
+        ph = sha256.SHA256("prefix")
+        ch = sha256.SHA256()
+        ct = ""
+        for i in range(0, len(msg), 7000):
+            ct += pipeline.encrypt_and_hash(cryptor, buffer(msg, i, 7000), ph, ch)[0]
+        expected = aes.AES(k).process(msg)
+        self.failUnlessEqual(ct, expected)
+        self.failUnlessEqual(cryptor.tell(), len(msg))
+        self.failUnlessEqual(ph.digest(), sha256.SHA256("prefix" + msg).digest())
+        self.failUnlessEqual(ch.digest(), sha256.SHA256(expected).digest())
+
+    def test_portable(self):
+        if not aes.has_aesni():
+            raise unittest.SkipTest("AES-NI is not used on this processor")
+        k = randstr(16)
+        msg = randstr(20000)
+        fast = pipeline.encrypt_and_hash(aes.AES(k), msg)
+        previous = aes._set_use_aesni(False)
+        try:
+            portable = pipeline.encrypt_and_hash(aes.AES(k), msg)
+        finally:
+            aes._set_use_aesni(previous)
+        self.failUnlessEqual(fast[0], portable[0])
+        self.failUnlessEqual(fast[1].digest(), portable[1].digest())
+        self.failUnlessEqual(fast[2].digest(), portable[2].digest())
+
+    def test_threads(self):
+        # Several threads sharing one cipher and one hasher, in opposite
+        # orders, must neither deadlock nor lose any data.
+        k = randstr(16)
+        cryptor = aes.AES(k)
+        h1 = sha256.SHA256()
+        h2 = sha256.SHA256()
+        msg = "\x00" * 2**16
+        def work(a, b):
+            for i in range(20):
+                pipeline.crypt_and_hash(cryptor, msg, a, b)
+        threads = [threading.Thread(target=work, args=args) for args in [(h1, h2), (h2, h1)] * 2]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failUnlessEqual(cryptor.tell(), 80 * len(msg))
+
+    def test_digest_while_waiting(self):
+        # A hasher finalized by another thread while crypt_and_hash() waits
+        # for its lock is refused, rather than updated after its digest.
+        cryptor = aes.AES("k"*16)
+        h = sha256.SHA256("\x00"*4096) # gives h a lock
+        big = "\x00" * 2**25
+        msg = "\x01" * 2**16
+        results = []
+        def hog():
+            h.update(big)
+        def pipe():
+            try:
+                pipeline.crypt_and_hash(cryptor, msg, h)
+            except pipeline.Error:
+                results.append("refused")
+            else:
+                results.append("hashed")
+        digests = []
+        def finalize():
+            digests.append(h.digest())
+        # digest() waits for the lock first, so is likely to get it first,
+        # but crypt_and_hash() is called before it has done so.
+        threads = [ threading.Thread(target=f) for f in [hog, finalize, pipe] ]
+        for t in threads:
+            t.start()
+            time.sleep(0.005)
+        for t in threads:
+            t.join()
+        digest = digests[0]
+        if results == ["hashed"]:
+            # crypt_and_hash() got the lock before digest() did
+            self.failUnlessEqual(digest, sha256.SHA256("\x00"*4096 + big + msg).digest())
+        else:
+            self.failUnlessEqual(results, ["refused"])
+            self.failUnlessEqual(digest, sha256.SHA256("\x00"*4096 + big).digest())
+
+    def test_preconditions(self):
+        cryptor = aes.AES("k"*16)
+        h = sha256.SHA256()
+        self.failUnlessRaises(pipeline.Error, pipeline.crypt_and_hash, "not a cipher", "data")
+        self.failUnlessRaises(pipeline.Error, pipeline.crypt_and_hash, cryptor, "data", "not a hasher")
+        self.failUnlessRaises(pipeline.Error, pipeline.crypt_and_hash, cryptor, "data", h, h)
+        self.failUnlessRaises(pipeline.Error, pipeline.crypt_and_hash, cryptor, u"data")
+        h.digest()
+        self.failUnlessRaises(pipeline.Error, pipeline.encrypt_and_hash, cryptor, "data", h)
+        self.failUnlessEqual(cryptor.tell(), 0)
+
+class DecryptAndVerify(unittest.TestCase):
+    def setUp(self):
+        self.key = randstr(16)
+        self.msg = randstr(20000)
+        self.ct = aes.AES(self.key).process(self.msg)
+        self.pd = sha256.SHA256(self.msg).digest()
+        self.cd = sha256.SHA256(self.ct).digest()
+
+    def test_decrypt_and_hash(self):
+        pt, ph, ch = pipeline.decrypt_and_hash(aes.AES(self.key), self.ct)
+        self.failUnlessEqual(pt, self.msg)
+        self.failUnlessEqual(ph.digest(), self.pd)
+        self.failUnlessEqual(ch.digest(), self.cd)
+
+    def test_verify(self):
+        self.failUnlessEqual(pipeline.decrypt_and_verify(aes.AES(self.key), self.ct, self.cd, self.pd), self.msg)
+        self.failUnlessEqual(pipeline.decrypt_and_verify(aes.AES(self.key), self.ct, ciphertext_digest=self.cd), self.msg)
+        self.failUnlessEqual(pipeline.decrypt_and_verify(aes.AES(self.key), self.ct, plaintext_digest=self.pd), self.msg)
+        self.failUnlessEqual(pipeline.decrypt_and_verify(aes.AES(self.key), self.ct), self.msg)
+
+    def test_corrupt(self):
+        bad = self.ct[:100] + chr(ord(self.ct[100]) ^ 1) + self.ct[101:]
+        for (cd, pd) in [(self.cd, None), (None, self.pd), (self.cd, self.pd)]:
+            self.failUnlessRaises(pipeline.IntegrityError, pipeline.decrypt_and_verify, aes.AES(self.key), bad, cd, pd)
+        self.failUnlessRaises(pipeline.IntegrityError, pipeline.decrypt_and_verify, aes.AES(randstr(16)), self.ct, None, self.pd)
+        # a digest of the wrong length is refused too
+        self.failUnlessRaises(pipeline.IntegrityError, pipeline.decrypt_and_verify, aes.AES(self.key), self.ct, self.cd[:16])
+        self.failUnless(issubclass(pipeline.IntegrityError, pipeline.Error))
@@ -1,4 +1,4 @@
-import random
+import random, threading
 
 import unittest
 
@@ -6,6 +6,7 @@ global VERBOSE
 VERBOSE=False
 
 from pycryptopp.publickey import rsa
+from pycryptopp.test.threadutil import ncpus, check_threads_speedup
 
 from base64 import b32encode
 def ab(x): # debuggery
@@ -130,6 +131,57 @@ class SignAndVerify(unittest.TestCase):
         self._help_test_sign_and_failcheck(newsigner, verifier, "a")
         self._help_test_sign_and_failcheck_random(newsigner, verifier)
 
+class Threads(unittest.TestCase):
+    def test_shared_keys(self):
+        # Many threads signing and verifying with the same key objects at
+        # once all get good signatures.
+        signer = rsa.generate(KEYSIZE)
+        verifier = signer.get_verifying_key()
+        failures = []
+        def work(msg):
+            for i in range(5):
+                sig = signer.sign(msg)
+                if not verifier.verify(msg, sig):
+                    failures.append(msg)
+        threads = [ threading.Thread(target=work, args=(randstr(100),)) for i in range(8) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failIf(failures, failures)
+
+    def test_generate_in_threads(self):
+        keys = []
+        def work():
+            keys.append(rsa.generate(KEYSIZE).serialize())
+        threads = [ threading.Thread(target=work) for i in range(4) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failUnlessEqual(len(set(keys)), 4)
+
+    def test_sign_speedup(self):
+        # With the GIL released, signing in separate threads runs in
+        # parallel.
+        N = min(ncpus(), 4)
+        if N < 2:
+            raise unittest.SkipTest("needs more than one CPU")
+        signer = rsa.generate(2048)
+        def work():
+            for i in range(100):
+                signer.sign("message")
+        check_threads_speedup(self, work, N)
+
+    def test_generate_speedup(self):
+        N = min(ncpus(), 4)
+        if N < 2:
+            raise unittest.SkipTest("needs more than one CPU")
+        def work():
+            # several keys each, to even out the luck of the prime search
+            for i in range(3):
+                rsa.generate(2048)
+        check_threads_speedup(self, work, N)
 
 if __name__ == "__main__":
     unittest.main()
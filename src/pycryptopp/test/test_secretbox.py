@@ -0,0 +1,195 @@
+import random
+
+import unittest
+
+from binascii import a2b_hex
+
+from pycryptopp.cipher import secretbox, xsalsa20
+
+from pycryptopp.test.threadutil import run_staggered
+
+def randstr(n):
+    return ''.join(map(chr, map(random.randrange, [0]*n, [256]*n)))
+
+def poly1305(key, msg):
+    """ The Poly1305 authenticator, straight from its definition. """
+    def le(s):
+        return sum(ord(c) << (8*i) for (i, c) in enumerate(s))
+    r = le(key[:16]) & 0x0ffffffc0ffffffc0ffffffc0fffffff
+    s = le(key[16:])
+    p = 2**130 - 5
+    h = 0
+    for i in range(0, len(msg), 16):
+        block = msg[i:i+16] + "\x01"
+        h = ((h + le(block)) * r) % p
+    h = (h + s) % 2**128
+    return "".join(chr((h >> (8*i)) & 0xff) for i in range(16))
+
+# from the tests of NaCl's crypto_secretbox
+KEY = "1b27556473e985d462cd51197a9a46c76009549eac6474f206c4ee0844f68389"
+NONCE = "69696ee955b62b73cd62bda875fc73d68219e0036b7a0b37"
+MESSAGE = ("be075fc53c81f2d5cf141316ebeb0c7b5228c52a4c62cbd44b66849b64244ffc"
+           "e5ecbaaf33bd751a1ac728d45e6c61296cdc3c01233561f41db66cce314adb31"
+           "0e3be8250c46f06dceea3a7fa1348057e2f6556ad6b1318a024a838f21af1fde"
+           "048977eb48f59ffd4924ca1c60902e52f0a089bc76897040e082f93776384864"
+           "5e0705")
+BOX = ("f3ffc7703f9400e52a7dfb4b3d3305d98e993b9f48681273c29650ba32fc76ce"
+       "48332ea7164d96a4476fb8c531a1186ac0dfc17c98dce87b4da7f011ec48c972"
+       "71d2c20f9b928fe2270d6fb863d51738b48eeee314a7cc8ab932164548e526ae"
+       "90224368517acfeabd6bb3732bc0e9da99832b61ca01b6de56244a9e88d5f9b3"
+       "7973f622a43d14a6599b1f654cb45a74e355a5")
+
+class Vectors(unittest.TestCase):
+    def test_nacl(self):
+        key, nonce, message, box = map(a2b_hex, (KEY, NONCE, MESSAGE, BOX))
+        self.failUnlessEqual(secretbox.secretbox(key, nonce, message), box)
+        self.failUnlessEqual(secretbox.secretbox_open(key, nonce, box), message)
+
+    def test_rfc8439_poly1305(self):
+        # RFC 8439 section 2.5.2, checking the reference implementation above
+        key = a2b_hex("85d6be7857556d337f4452fe42d506a80103808afb0db2fd4abff6af4149f51b")
+        self.failUnlessEqual(poly1305(key, "Cryptographic Forum Research Group"),
+                             a2b_hex("a8061dc1305136c6c22b8baf0c0127a9"))
+
+    def test_construction(self):
+        # every length up to a few blocks, against XSalsa20 and the reference
+        # Poly1305
+        key = randstr(32)
+        nonce = randstr(24)
+        for n in range(0, 200) + [1000, 4095, 4096, 4097, 10000]:
+            msg = randstr(n)
+            stream = xsalsa20.XSalsa20(key, nonce).process("\x00"*32 + msg)
+            ct = stream[32:]
+            box = secretbox.secretbox(key, nonce, msg)
+            self.failUnlessEqual(box, poly1305(stream[:32], ct) + ct, n)
+            self.failUnlessEqual(secretbox.secretbox_open(key, nonce, box), msg, n)
+
+    def test_large(self):
+        # large enough to be processed with the GIL released
+        key = randstr(32)
+        nonce = randstr(24)
+        msg = randstr(2**20 + 3)
+        box = secretbox.secretbox(key, nonce, bytearray(msg))
+        self.failUnlessEqual(secretbox.secretbox_open(key, nonce, box), msg)
+        self.failUnlessEqual(secretbox.secretbox_open(key, nonce, buffer(box)), msg)
+
+class Streaming(unittest.TestCase):
+    def test_pieces(self):
+        key = randstr(32)
+        nonce = randstr(24)
+        msg = randstr(5000)
+        box = secretbox.secretbox(key, nonce, msg)
+        e = secretbox.Encryptor(key, nonce)
+        d = secretbox.Decryptor(key, nonce)
+        ct = ""
+        pt = ""
+        i = 0
+        while i < len(msg):
+            n = random.randrange(0, 300)
+            ct += e.update(msg[i:i+n])
+            pt += d.update(buffer(box, 16+i, n))
+            i += n
+        self.failUnlessEqual(e.finalize() + ct, box)
+        self.failUnlessEqual(pt, msg)
+        d.finalize(box[:16])
+
+    def test_tampering(self):
+        d = secretbox.Decryptor("k"*32, "n"*24)
+        d.update("x"*100)
+        self.failUnlessRaises(secretbox.AuthenticationError, d.finalize, "t"*16)
+
+    def test_order(self):
+        e = secretbox.Encryptor("k"*32, "n"*24)
+        e.update("a")
+        e.finalize()
+        self.failUnlessRaises(secretbox.Error, e.update, "b")
+        self.failUnlessRaises(secretbox.Error, e.finalize)
+        d = secretbox.Decryptor("k"*32, "n"*24)
+        self.failUnlessRaises(secretbox.Error, d.finalize, "t"*15)
+
+class Authentication(unittest.TestCase):
+    def setUp(self):
+        self.key = randstr(32)
+        self.nonce = randstr(24)
+        self.msg = randstr(100)
+        self.box = secretbox.secretbox(self.key, self.nonce, self.msg)
+
+    def _flip(self, s, i):
+        return s[:i] + chr(ord(s[i]) ^ 1) + s[i+1:]
+
+    def _fails(self, key=None, nonce=None, box=None):
+        self.failUnlessRaises(secretbox.AuthenticationError, secretbox.secretbox_open,
+                              key or self.key, nonce or self.nonce, self.box if box is None else box)
+
+    def test_tampering(self):
+        self._fails(key=self._flip(self.key, 0))
+        self._fails(nonce=self._flip(self.nonce, 23))
+        for i in [0, 15, 16, 50, 115]:
+            self._fails(box=self._flip(self.box, i))
+        self._fails(box=self.box[:-1])
+        self._fails(box=self.box + "x")
+        self._fails(box=self.box[:15])
+        self._fails(box="")
+        self.failUnless(issubclass(secretbox.AuthenticationError, secretbox.Error))
+
+    def test_empty(self):
+        box = secretbox.secretbox(self.key, self.nonce, "")
+        self.failUnlessEqual(len(box), secretbox.MACBYTES)
+        self.failUnlessEqual(secretbox.secretbox_open(self.key, self.nonce, box), "")
+
+class Preconditions(unittest.TestCase):
+    def test_sizes(self):
+        for (k, n) in [(31, 24), (33, 24), (32, 23), (32, 25), (16, 8)]:
+            self.failUnlessRaises(secretbox.Error, secretbox.secretbox, "k"*k, "n"*n, "m")
+            self.failUnlessRaises(secretbox.Error, secretbox.secretbox_open, "k"*k, "n"*n, "b"*20)
+            self.failUnlessRaises(secretbox.Error, secretbox.Encryptor, "k"*k, "n"*n)
+            self.failUnlessRaises(secretbox.Error, secretbox.Decryptor, "k"*k, "n"*n)
+        self.failUnlessEqual((secretbox.KEYBYTES, secretbox.NONCEBYTES), (32, 24))
+
+    def test_type_check(self):
+        self.failUnlessRaises(secretbox.Error, secretbox.secretbox, "k"*32, "n"*24, u"text")
+        e = secretbox.Encryptor("k"*32, "n"*24)
+        self.failUnlessRaises(secretbox.Error, e.update, 3)
+
+class Threads(unittest.TestCase):
+    # Each of these calls waits for the lock of an object that another
+    # thread is using with the GIL released.
+
+    def test_update_while_finalizing(self):
+        # An update() still waiting when finalize() gets the lock is refused,
+        # rather than returning ciphertext that the tag does not cover.
+        key, nonce = "k"*32, "n"*24
+        big = bytearray(2**25)
+        e = secretbox.Encryptor(key, nonce)
+        results = []
+        def late():
+            try:
+                results.append(e.update("more"))
+            except secretbox.Error:
+                results.append(None)
+        tags = []
+        run_staggered([lambda: e.update(big), lambda: tags.append(e.finalize()), late])
+        if results == [None]:
+            expected = secretbox.secretbox(key, nonce, big)[:16]
+        else:
+            # update() got the lock first
+            expected = secretbox.secretbox(key, nonce, str(big) + "more")[:16]
+        self.failUnlessEqual(tags, [expected])
+
+    def test_finalize_twice(self):
+        key, nonce = "k"*32, "n"*24
+        big = bytearray(2**25)
+        box = secretbox.secretbox(key, nonce, big)
+        ct = bytearray(box[16:])
+        d = secretbox.Decryptor(key, nonce)
+        results = []
+        def finalize():
+            try:
+                d.finalize(box[:16])
+                results.append("authentic")
+            except secretbox.AuthenticationError:
+                results.append("not authentic")
+            except secretbox.Error:
+                results.append("refused")
+        run_staggered([lambda: d.update(ct), finalize, finalize])
+        self.failUnlessEqual(results, ["authentic", "refused"])
@@ -1,4 +1,4 @@
-import random, re
+import array, os, random, re, threading, time
 
 import unittest
 
@@ -8,6 +8,7 @@ global VERBOSE
 VERBOSE=False
 
 from pycryptopp.hash import sha256
+from pycryptopp.test.threadutil import run_in_threads, run_staggered, ncpus, check_threads_speedup
 
 from pkg_resources import resource_string
 
@@ -32,6 +33,18 @@ h0 = a2b_hex("e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855")
 h_bd = a2b_hex("68325720aabd7c82f30f554b313d0570c95accbb7dc4b5aae11204c08ffe732b")
 h_5fd4 = a2b_hex("7c4fbf484498d21b487b9d61de8914b2eadaf2698712936d47c3ada2558f6788")
 
+def each_implementation(f):
+    """ Return the results of f() with each of sha256.implementations() in
+    turn. """
+    results = []
+    for impl in sha256.implementations():
+        previous = sha256._set_implementation(impl)
+        try:
+            results.append(f())
+        finally:
+            sha256._set_implementation(previous)
+    return results
+
 class SHA256(unittest.TestCase):
     def test_digest(self):
         empty_digest = sha256.SHA256().digest()
@@ -67,6 +80,26 @@ class SHA256(unittest.TestCase):
         h = sha256.SHA256()
         self.failUnlessRaises(TypeError, h.update, None)
 
+    def test_buffers(self):
+        import array
+        msg = "\x5f\xd4"
+        for make in [bytearray, memoryview, buffer,
+                     lambda s: array.array('B', s)]:
+            self.failUnlessEqual(sha256.SHA256(make(msg)).digest(), h_5fd4)
+            h = sha256.SHA256()
+            h.update(make(msg))
+            self.failUnlessEqual(h.digest(), h_5fd4)
+
+    def test_update_list(self):
+        h = sha256.SHA256()
+        h.update(["\x5f", bytearray("\xd4")])
+        self.failUnlessEqual(h.digest(), h_5fd4)
+        h = sha256.SHA256(("\x5f", "", memoryview("\xd4")))
+        self.failUnlessEqual(h.digest(), h_5fd4)
+        self.failUnlessEqual(sha256.SHA256([]).digest(), h0)
+        h = sha256.SHA256()
+        self.failUnlessRaises(TypeError, h.update, ["a", None])
+
     def test_digest_twice(self):
         h = sha256.SHA256()
         d1 = h.digest()
@@ -82,6 +115,45 @@ class SHA256(unittest.TestCase):
         except sha256.Error, le:
             self.failUnless("digest() has been called" in str(le), le)
 
+    def test_copy(self):
+        prefix = randstr(100)
+        h = sha256.SHA256(prefix)
+        c = h.copy()
+        self.failUnless(isinstance(c, sha256.SHA256))
+        c.update("a")
+        h.update("b")
+        self.failUnlessEqual(c.digest(), sha256.SHA256(prefix + "a").digest())
+        self.failUnlessEqual(h.digest(), sha256.SHA256(prefix + "b").digest())
+        # the copy of a finalized object is finalized too
+        c = h.copy()
+        self.failUnlessEqual(c.digest(), h.digest())
+        self.failUnlessRaises(sha256.Error, c.update, "oops")
+
+    def test_copy_many(self):
+        # one hashed prefix shared by many messages, of every length across
+        # a block boundary
+        prefix = randstr(37)
+        h = sha256.SHA256(prefix)
+        for i in range(130):
+            s = randstr(i)
+            c = h.copy()
+            c.update(s)
+            self.failUnlessEqual(c.digest(), sha256.SHA256(prefix + s).digest())
+        self.failUnlessEqual(h.digest(), sha256.SHA256(prefix).digest())
+
+    def test_digest_so_far(self):
+        h = sha256.SHA256()
+        self.failUnlessEqual(h.digest_so_far(), h0)
+        msg = ""
+        for i in range(70):
+            s = randstr(i)
+            h.update(s)
+            msg += s
+            self.failUnlessEqual(h.digest_so_far(), sha256.SHA256(msg).digest())
+        h.update("end")
+        self.failUnlessEqual(h.digest(), sha256.SHA256(msg + "end").digest())
+        self.failUnlessEqual(h.digest_so_far(), h.digest())
+
     def test_chunksize(self):
         # hashes can be computed on arbitrarily-sized chunks
         problems = False
@@ -118,6 +190,303 @@ class SHA256(unittest.TestCase):
         self.failUnlessEqual(hx.hexdigest().lower(), '5191c7841dd4e16aa454d40af924585dffc67157ffdbfd0236acddd07901629d')
 
 
+def each_width(f):
+    """ Return the results of f() with hash_many() hashing 1, 4 and 8
+    messages at a time, as far as this processor allows, and with each
+    implementation of the compression function. """
+    def widths():
+        results = []
+        for width in [1, 4, 8]:
+            if width <= sha256.simd_width():
+                previous = sha256._set_simd_width(width)
+                try:
+                    results.append(f())
+                finally:
+                    sha256._set_simd_width(previous)
+        return results
+    return sum(each_implementation(widths), [])
+
+class HashMany(unittest.TestCase):
+    _each_width = staticmethod(each_width)
+
+    def _expected(self, msgs):
+        return "".join([ sha256.SHA256(msg).digest() for msg in msgs ])
+
+    def test_lengths(self):
+        # every length across the padding boundaries of the first three
+        # blocks, in groups of messages of different lengths
+        msgs = [ randstr(i) for i in range(200) ]
+        expected = self._expected(msgs)
+        for result in self._each_width(lambda: sha256.hash_many(msgs)):
+            self.failUnlessEqual(result, expected)
+        random.shuffle(msgs)
+        expected = self._expected(msgs)
+        for result in self._each_width(lambda: sha256.hash_many(tuple(msgs))):
+            self.failUnlessEqual(result, expected)
+
+    def test_counts(self):
+        # every number of messages around the group sizes
+        for n in range(20):
+            msgs = [ randstr(64) for i in range(n) ]
+            expected = self._expected(msgs)
+            for result in self._each_width(lambda: sha256.hash_many(msgs)):
+                self.failUnlessEqual(result, expected)
+
+    def test_vectors(self):
+        self.failUnlessEqual(sha256.hash_many(["", "\xbd", "\x5f\xd4"]), h0 + h_bd + h_5fd4)
+        self.failUnlessEqual(sha256.hash_many([]), "")
+
+    def test_packed(self):
+        for size in [1, 32, 55, 56, 64, 1000]:
+            packed = randstr(size * 13)
+            msgs = [ packed[i:i+size] for i in range(0, len(packed), size) ]
+            expected = self._expected(msgs)
+            for result in self._each_width(lambda: sha256.hash_many(packed, size)):
+                self.failUnlessEqual(result, expected)
+            self.failUnlessEqual(sha256.hash_many(bytearray(packed), record_size=size), expected)
+        self.failUnlessEqual(sha256.hash_many("", 32), "")
+
+    def test_large(self):
+        # with the GIL released, and long messages of different lengths
+        msgs = [ randstr(10000 + 1000*i) for i in range(9) ]
+        expected = self._expected(msgs)
+        for result in self._each_width(lambda: sha256.hash_many(msgs)):
+            self.failUnlessEqual(result, expected)
+
+    def test_buffers(self):
+        msgs = [ "abc", bytearray("defg"), memoryview("hijkl"), array.array("c", "mnopqr") ]
+        self.failUnlessEqual(sha256.hash_many(msgs), self._expected(["abc", "defg", "hijkl", "mnopqr"]))
+
+    def test_preconditions(self):
+        self.failUnlessRaises(sha256.Error, sha256.hash_many, "abc")
+        self.failUnlessRaises(TypeError, sha256.hash_many, ["abc", 5])
+        self.failUnlessRaises(TypeError, sha256.hash_many, [u"abc"])
+        self.failUnlessRaises(sha256.Error, sha256.hash_many, "abcd", 3)
+        self.failUnlessRaises(sha256.Error, sha256.hash_many, "abcd", 0)
+
+    def test_set_simd_width(self):
+        width = sha256.simd_width()
+        self.failUnless(width in (1, 4, 8), width)
+        self.failUnlessRaises(sha256.Error, sha256._set_simd_width, 2)
+        if width < 8:
+            self.failUnlessRaises(sha256.Error, sha256._set_simd_width, 8)
+        self.failUnlessEqual(sha256._set_simd_width(1), width)
+        self.failUnlessEqual(sha256._set_simd_width(width), 1)
+
+def netstring(s):
+    return "%d:%s," % (len(s), s)
+
+class TaggedHasher(unittest.TestCase):
+    def test_hash(self):
+        h = sha256.TaggedHasher("tag")
+        self.failUnlessEqual(h.hash("data"), sha256.SHA256("3:tag,data").digest())
+        self.failUnlessEqual(sha256.TaggedHasher("").hash(""), sha256.SHA256("0:,").digest())
+        self.failUnlessEqual(h.hash(bytearray("data")), h.hash(buffer("data")))
+        # large enough to be hashed with the GIL released
+        data = randstr(100000)
+        self.failUnlessEqual(h.hash(data), sha256.SHA256("3:tag," + data).digest())
+
+    def test_sha256d(self):
+        h = sha256.TaggedHasher("allmydata_uri_extension_v1", sha256d=True)
+        for data in ["", "data", randstr(1000)]:
+            inner = sha256.SHA256(netstring("allmydata_uri_extension_v1") + data).digest()
+            self.failUnlessEqual(h.hash(data), sha256.SHA256(inner).digest())
+        msgs = [ randstr(i) for i in range(20) ]
+        self.failUnlessEqual(h.hash_many(msgs), "".join(map(h.hash, msgs)))
+
+    def test_tag_lengths(self):
+        # tags filling none, some or all of the blocks they start, with
+        # messages finishing and overflowing those blocks
+        msgs = [ randstr(i) for i in range(0, 140, 3) ]
+        for taglen in range(0, 140, 5):
+            tag = randstr(taglen)
+            h = sha256.TaggedHasher(tag)
+            expected = "".join([ sha256.SHA256(netstring(tag) + msg).digest() for msg in msgs ])
+            self.failUnlessEqual("".join(map(h.hash, msgs)), expected)
+            for result in each_width(lambda: h.hash_many(msgs)):
+                self.failUnlessEqual(result, expected)
+
+    def test_packed(self):
+        h = sha256.TaggedHasher("leaf", sha256d=True)
+        packed = randstr(32 * 100)
+        msgs = [ packed[i:i+32] for i in range(0, len(packed), 32) ]
+        self.failUnlessEqual(h.hash_many(packed, 32), h.hash_many(msgs))
+        self.failUnlessEqual(h.hash_many(packed, record_size=32), "".join(map(h.hash, msgs)))
+        self.failUnlessEqual(h.hash_many([]), "")
+
+    def test_preconditions(self):
+        self.failUnlessRaises(TypeError, sha256.TaggedHasher, 5)
+        h = sha256.TaggedHasher("tag")
+        self.failUnlessRaises(TypeError, h.hash, 5)
+        self.failUnlessRaises(sha256.Error, h.hash_many, "abc")
+        self.failUnlessRaises(sha256.Error, h.hash_many, "abcd", 3)
+
+class HashFile(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "file")
+        # a little over three of the windows the file is read in
+        self.data = os.urandom(3*2**20 + 1001)
+        f = open(self.path, "wb")
+        f.write(self.data)
+        f.close()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def _digest(self, data):
+        return sha256.SHA256(data).digest()
+
+    def test_hash_file(self):
+        self.failUnlessEqual(sha256.hash_file(self.path), self._digest(self.data))
+        self.failUnlessEqual(sha256.hash_file(unicode(self.path)), self._digest(self.data))
+        self.failUnlessEqual(sha256.hash_file(self.path, 1001), self._digest(self.data[1001:]))
+        self.failUnlessEqual(sha256.hash_file(self.path, 1001, 2**20 + 3), self._digest(self.data[1001:1001 + 2**20 + 3]))
+        self.failUnlessEqual(sha256.hash_file(self.path, offset=len(self.data)), self._digest(""))
+        self.failUnlessEqual(sha256.hash_file(self.path, length=0), self._digest(""))
+
+    def test_fd(self):
+        fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            os.lseek(fd, 7, 0)
+            self.failUnlessEqual(sha256.hash_file(fd, 5, 100), self._digest(self.data[5:105]))
+            self.failUnlessEqual(sha256.hash_file(fd), self._digest(self.data))
+            if os.name != "nt":
+                self.failUnlessEqual(os.lseek(fd, 0, 1), 7)
+        finally:
+            os.close(fd)
+
+    def test_block_digests(self):
+        for (offset, length, block_size) in [ (0, None, 2**17), (3, 10**6, 1000), (0, 100, 100), (0, 0, 64) ]:
+            if length is None:
+                data = self.data[offset:]
+            else:
+                data = self.data[offset:offset+length]
+            blocks = [ data[i:i+block_size] for i in range(0, len(data), block_size) ] or [""]
+            (digest, block_digests) = sha256.hash_file(self.path, offset, length, block_size)
+            self.failUnlessEqual(digest, self._digest(data))
+            self.failUnlessEqual(block_digests, sha256.hash_many(blocks))
+
+    def test_errors(self):
+        self.failUnlessRaises(IOError, sha256.hash_file, os.path.join(self.dir, "missing"))
+        self.failUnlessRaises(sha256.Error, sha256.hash_file, self.path, -1)
+        self.failUnlessRaises(sha256.Error, sha256.hash_file, self.path, 0, -1)
+        self.failUnlessRaises(sha256.Error, sha256.hash_file, self.path, 0, None, 0)
+        self.failUnlessRaises(sha256.Error, sha256.hash_file, -1)
+        # descriptors too large for a C int are refused, not truncated
+        for fd in [ 2**31, 2**32, 2**32 + 1, 2**64 + 1, -2**64 ]:
+            self.failUnlessRaises(sha256.Error, sha256.hash_file, fd)
+        # the file is too short for length
+        self.failUnlessRaises(sha256.Error, sha256.hash_file, self.path, 1, len(self.data))
+
+class Implementations(unittest.TestCase):
+    def test_implementations(self):
+        impls = sha256.implementations()
+        self.failUnlessEqual(impls[-1], "portable")
+        for impl in impls:
+            self.failUnless(impl in ("sha-ni", "avx2", "portable"), impl)
+        self.failUnlessRaises(sha256.Error, sha256._set_implementation, "bogus")
+        self.failUnlessEqual(sha256._set_implementation("portable"), impls[0])
+        self.failUnlessEqual(sha256._set_implementation(impls[0]), "portable")
+
+    def test_vectors(self):
+        vects = resource_string('pycryptopp', 'testvectors/SHA256ShortMsg.txt') + resource_string('pycryptopp', 'testvectors/SHA256LongMsg.txt')
+        tests = []
+        for mo in VECTS_RE.finditer(vects):
+            msglen = int(mo.group(1)) / 8
+            tests.append((a2b_hex(mo.group(2))[:msglen], a2b_hex(mo.group(3))))
+        self.failUnless(tests)
+        for results in each_implementation(lambda: [ sha256.SHA256(msg).digest() for (msg, md) in tests ]):
+            self.failUnlessEqual(results, [ md for (msg, md) in tests ])
+
+    def test_chunks(self):
+        # runs of whole blocks of every length, odd and even, from every
+        # offset into the buffered block
+        msg = randstr(1000)
+        def chunked():
+            results = []
+            for a in range(0, 130, 7):
+                for b in range(a, len(msg), 61):
+                    h = sha256.SHA256(msg[:a])
+                    h.update(msg[a:b])
+                    h.update(msg[b:])
+                    results.append(h.digest())
+            return results
+        results = each_implementation(chunked)
+        self.failUnlessEqual(results[0][0], sha256.SHA256(msg).digest())
+        for result in results:
+            self.failUnlessEqual(result, [results[0][0]] * len(results[0]))
+
+class Threads(unittest.TestCase):
+    SIZE = 2**20
+
+    def test_shared_object(self):
+        # Concurrent updates of one hash object are serialized, so hashing N
+        # identical chunks from N threads gives the hash of their
+        # concatenation.
+        N = 8
+        chunk = randstr(64) * (self.SIZE / 64)
+        h = sha256.SHA256()
+        def work():
+            h.update(chunk)
+        run_in_threads(work, [()]*N)
+        self.failUnlessEqual(h.digest(), sha256.SHA256(chunk*N).digest())
+
+    def test_list_changed_meanwhile(self):
+        # update() with a list of large buffers releases the GIL for each of
+        # them, during which another thread empties the list. The list is
+        # hashed as it was when update() was called, or after it was
+        # emptied, and the interpreter does not crash.
+        h = sha256.SHA256()
+        h.update(bytearray(4096)) # gives h a lock, so the GIL is released
+        bufs = [ bytearray(os.urandom(1024)) * 1024 for i in range(50) ]
+        expected = sha256.SHA256("\x00"*4096 + "".join(map(str, bufs))).digest()
+        empty = sha256.SHA256("\x00"*4096).digest()
+        lst = list(bufs)
+        def empty_it():
+            time.sleep(0.01)
+            del lst[:]
+        t = threading.Thread(target=empty_it)
+        t.start()
+        h.update(lst)
+        t.join()
+        self.failUnless(h.digest() in (expected, empty))
+
+    def test_update_while_digesting(self):
+        # An update() still waiting when digest() gets the lock is refused,
+        # rather than hashed into the finished state and lost.
+        h = sha256.SHA256()
+        big = bytearray(2**26)
+        results = []
+        def late():
+            try:
+                h.update("more")
+                results.append("hashed")
+            except sha256.Error:
+                results.append("refused")
+        digests = []
+        run_staggered([lambda: h.update(big), lambda: digests.append(h.digest()), late])
+        if results == ["refused"]:
+            expected = sha256.SHA256(big).digest()
+        else:
+            # update() got the lock first
+            expected = sha256.SHA256(str(big) + "more").digest()
+        self.failUnlessEqual(digests, [expected])
+
+    def test_speedup(self):
+        # With the GIL released, separate hash objects in separate threads
+        # run in parallel.
+        N = min(ncpus(), 4)
+        if N < 2:
+            raise unittest.SkipTest("needs more than one CPU")
+        msg = "\x00"*(self.SIZE*8)
+        def work():
+            sha256.SHA256(msg).digest()
+        check_threads_speedup(self, work, N)
+
+
 VECTS_RE=re.compile("\nLen = ([0-9]+)\nMsg = ([0-9a-f]+)\nMD = ([0-9a-f]+)")
 
 # split_on_newlines() copied from pyutil.strutil
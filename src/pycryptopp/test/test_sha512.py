@@ -0,0 +1,91 @@
+import random, threading
+import unittest
+
+from binascii import a2b_hex
+
+from pycryptopp.hash import sha512
+
+from pycryptopp.test.threadutil import run_staggered
+
+def randstr(n):
+    return ''.join(map(chr, map(random.randrange, [0]*n, [256]*n)))
+
+# from FIPS 180-2, appendix C
+h_abc = a2b_hex("ddaf35a193617abacc417349ae20413112e6fa4e89a97ea20a9eeee64b55d39a2192992a274fc1a836ba3c23a3feebbd454d4423643ce80e2a9ac94fa54ca49f")
+msg_2blocks = "abcdefghbcdefghicdefghijdefghijkefghijklfghijklmghijklmnhijklmnoijklmnopjklmnopqklmnopqrlmnopqrsmnopqrstnopqrstu"
+h_2blocks = a2b_hex("8e959b75dae313da8cf4f72814fc143f8f7779c6eb9f7fa17299aeadb6889018501d289e4900f7e4331b99dec4b5433ac7d329eeb6dd26545e96e55b874be909")
+h_million_a = a2b_hex("e718483d0ce769644e2e42c7bc15b4638e1f98b13b2044285632a803afa973ebde0ff244877ea60a4cb0432ce577c31beb009c5c2c49aa2e4eadb217ad8cc09b")
+h0 = a2b_hex("cf83e1357eefb8bdf1542850d66d8007d620e4050b5715dc83f4a921d36ce9ce47d0d13c5d85f2b0ff8318d2877eec2f63b931bd47417a81a538327af927da3e")
+
+class SHA512(unittest.TestCase):
+    def test_vectors(self):
+        self.failUnlessEqual(sha512.SHA512().digest(), h0)
+        self.failUnlessEqual(sha512.SHA512("abc").digest(), h_abc)
+        self.failUnlessEqual(sha512.SHA512(msg_2blocks).digest(), h_2blocks)
+        # large enough to be hashed with the GIL released
+        self.failUnlessEqual(sha512.SHA512("a"*1000000).digest(), h_million_a)
+
+    def test_hexdigest(self):
+        self.failUnlessEqual(sha512.SHA512("abc").hexdigest().lower(), h_abc.encode("hex"))
+
+    def test_update(self):
+        h = sha512.SHA512(msg_2blocks[:7])
+        h.update(msg_2blocks[7:100])
+        h.update([bytearray(msg_2blocks[100:110]), buffer(msg_2blocks[110:])])
+        self.failUnlessEqual(h.digest(), h_2blocks)
+
+    def test_digest_then_update_fail(self):
+        h = sha512.SHA512("abc")
+        h.digest()
+        self.failUnlessRaises(sha512.Error, h.update, "def")
+        self.failUnlessEqual(h.digest(), h_abc)
+
+    def test_copy(self):
+        msg = randstr(300)
+        h = sha512.SHA512(msg[:150])
+        c = h.copy()
+        self.failUnlessEqual(h.digest_so_far(), sha512.SHA512(msg[:150]).digest())
+        h.update(msg[150:])
+        c.update("other")
+        self.failUnlessEqual(h.digest(), sha512.SHA512(msg).digest())
+        self.failUnlessEqual(c.digest(), sha512.SHA512(msg[:150] + "other").digest())
+        self.failUnlessEqual(h.copy().digest(), h.digest())
+
+    def test_type_check(self):
+        self.failUnlessRaises(TypeError, sha512.SHA512, None)
+        self.failUnlessRaises(TypeError, sha512.SHA512().update, 5)
+
+    def test_shared_object(self):
+        # concurrent large updates of one object are serialized
+        chunk = randstr(2**16)
+        h = sha512.SHA512()
+        def work():
+            for i in range(8):
+                h.update(chunk)
+        threads = [ threading.Thread(target=work) for i in range(4) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failUnlessEqual(h.digest(), sha512.SHA512(chunk * 32).digest())
+
+    def test_update_while_digesting(self):
+        # An update() still waiting when digest() gets the lock is refused,
+        # rather than hashed into the restarted state and lost.
+        h = sha512.SHA512()
+        big = bytearray(2**25)
+        results = []
+        def late():
+            try:
+                h.update("more")
+                results.append("hashed")
+            except sha512.Error:
+                results.append("refused")
+        digests = []
+        run_staggered([lambda: h.update(big), lambda: digests.append(h.digest()), late])
+        if results == ["refused"]:
+            expected = sha512.SHA512(big).digest()
+        else:
+            # update() got the lock first
+            expected = sha512.SHA512(str(big) + "more").digest()
+        self.failUnlessEqual(digests, [expected])
@@ -0,0 +1,131 @@
+import mmap, os
+import unittest
+
+from pycryptopp.hash import treehash, sha256
+
+from pycryptopp.test.test_sha256 import each_implementation
+
+C = treehash.CHUNK_SIZE
+
+def pattern(n):
+    """ n bytes of 0, 1, ..., 250, 0, 1, ... """
+    block = "".join([ chr(i) for i in range(251) ])
+    return (block * (n // len(block) + 1))[:n]
+
+# Tree hashes of fixed inputs, which will never change: the chunk size and
+# tags are part of the definition of the hash.
+VECTORS = [
+    ("", "ed38b432e636991f342566d8acc04df38978fad8ed7e829697891e8e361fdbe4"),
+    ("abc", "13a9eab5281b7e8787b633dcf3b45408d1283f3a0af9b273d709ae9e1a27ae22"),
+    ("a"*C, "82378b4d296331cfac9a8774c04f86629ea0e819afedc07d5b407aa493e37283"),
+    ("a"*(C+1), "822138c4819793db80921885f284cf8a3eda276c504b20b0fc0834ea35938187"),
+    (pattern(5*C+7), "3b222c9e3db809152da11dc22a580982781b2467512690a08e6725215a15e780"),
+    ]
+
+THREADS = [1, 2, 3, 8]
+
+class Definition(unittest.TestCase):
+    def test_constants(self):
+        self.failUnlessEqual(C, 2**20)
+        self.failUnlessEqual(treehash.LEAF_TAG, "pycryptopp_tree_hash_leaf_v1")
+        self.failUnlessEqual(treehash.NODE_TAG, "pycryptopp_tree_hash_node_v1")
+        self.failUnlessEqual(treehash.ROOT_TAG, "pycryptopp_tree_hash_root_v1")
+
+    def test_reference_vectors(self):
+        for (data, expected) in VECTORS:
+            self.failUnlessEqual(treehash.reference_hash(data).encode("hex"), expected)
+
+    def test_one_chunk(self):
+        # spelled out: a single leaf is the top of the tree
+        def H(*parts):
+            return sha256.SHA256("".join(parts)).digest()
+        leaf = H("28:pycryptopp_tree_hash_leaf_v1,", "abc")
+        root = H("28:pycryptopp_tree_hash_root_v1,", leaf, "\x00"*7 + "\x03")
+        self.failUnlessEqual(treehash.hash("abc"), root)
+
+    def test_not_sha256(self):
+        self.failIfEqual(treehash.hash("abc"), sha256.SHA256("abc").digest())
+
+class Hash(unittest.TestCase):
+    def test_vectors(self):
+        for (data, expected) in VECTORS:
+            for threads in THREADS:
+                self.failUnlessEqual(treehash.hash(data, threads).encode("hex"), expected)
+
+    def test_implementations(self):
+        (data, expected) = VECTORS[-1]
+        for digest in each_implementation(lambda: treehash.hash(data, threads=3)):
+            self.failUnlessEqual(digest.encode("hex"), expected)
+
+    def test_reference(self):
+        # around the chunk boundaries, with odd nodes at various levels
+        for n in [ 0, 1, C-1, C, C+1, 2*C, 3*C-1, 4*C+5, 7*C ]:
+            data = os.urandom(n)
+            expected = treehash.reference_hash(data)
+            for threads in THREADS:
+                self.failUnlessEqual(treehash.hash(data, threads=threads), expected, (n, threads))
+
+    def test_buffers(self):
+        data = os.urandom(2*C + 17)
+        expected = treehash.reference_hash(data)
+        for obj in [ bytearray(data), memoryview(data), buffer(data) ]:
+            self.failUnlessEqual(treehash.hash(obj, 2), expected)
+        m = mmap.mmap(-1, len(data))
+        try:
+            m.write(data)
+            self.failUnlessEqual(treehash.hash(m, 2), expected)
+        finally:
+            m.close()
+
+    def test_errors(self):
+        self.failUnlessRaises(TypeError, treehash.hash, u"abc")
+        self.failUnlessRaises(treehash.Error, treehash.hash, "abc", 0)
+        self.failUnlessRaises(treehash.Error, treehash.hash, "abc", threads=-1)
+
+class HashFile(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "file")
+        # more chunks than are read for one thread at a time
+        self.data = os.urandom(3*C + 1001)
+        f = open(self.path, "wb")
+        f.write(self.data)
+        f.close()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def test_hash_file(self):
+        expected = treehash.reference_hash(self.data)
+        for threads in THREADS:
+            self.failUnlessEqual(treehash.hash_file(self.path, threads=threads), expected)
+        self.failUnlessEqual(treehash.hash_file(unicode(self.path)), expected)
+        self.failUnlessEqual(treehash.hash_file(self.path, 1001), treehash.hash(self.data[1001:]))
+        self.failUnlessEqual(treehash.hash_file(self.path, 1001, 2*C, threads=2), treehash.hash(self.data[1001:1001 + 2*C]))
+        self.failUnlessEqual(treehash.hash_file(self.path, offset=len(self.data)), treehash.hash(""))
+        self.failUnlessEqual(treehash.hash_file(self.path, length=0), treehash.hash(""))
+
+    def test_fd(self):
+        fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            os.lseek(fd, 7, 0)
+            self.failUnlessEqual(treehash.hash_file(fd, 5, 100), treehash.hash(self.data[5:105]))
+            self.failUnlessEqual(treehash.hash_file(fd, threads=4), treehash.hash(self.data))
+            if os.name != "nt":
+                self.failUnlessEqual(os.lseek(fd, 0, 1), 7)
+        finally:
+            os.close(fd)
+
+    def test_errors(self):
+        self.failUnlessRaises(IOError, treehash.hash_file, os.path.join(self.dir, "missing"))
+        self.failUnlessRaises(treehash.Error, treehash.hash_file, self.path, -1)
+        self.failUnlessRaises(treehash.Error, treehash.hash_file, self.path, 0, -1)
+        self.failUnlessRaises(treehash.Error, treehash.hash_file, self.path, threads=0)
+        self.failUnlessRaises(treehash.Error, treehash.hash_file, -1)
+        # descriptors too large for a C int are refused, not truncated
+        for fd in [ 2**31, 2**32, 2**32 + 1, 2**64 + 1, -2**64 ]:
+            self.failUnlessRaises(treehash.Error, treehash.hash_file, fd)
+        # the file is too short for length
+        self.failUnlessRaises(treehash.Error, treehash.hash_file, self.path, 1, len(self.data))
@@ -1,10 +1,11 @@
-import random, re
+import os, random, re
 import unittest
 
 from binascii import a2b_hex, b2a_hex
 from pkg_resources import resource_string
 
 from pycryptopp.cipher import xsalsa20
+from pycryptopp.test.threadutil import run_in_threads, ncpus, check_threads_speedup
 TEST_XSALSA_RE=re.compile("\nCOUNT=([0-9]+)\nKEY=([0-9a-f]+)\nIV=([0-9a-f]+)\nPLAINTEXT=([0-9a-f]+)\nCIPHERTEXT=([0-9a-f]+)")
 
 class XSalsa20Test(unittest.TestCase):
@@ -129,6 +130,336 @@ class XSalsa20Test(unittest.TestCase):
                              "25f725c202f3781869a40b8a2c856b55"
                              "8178b6af9576a15799c445c30aeced66")
 
+class Buffers(unittest.TestCase):
+    key = "k"*32
+    iv = "i"*24
+
+    def _check_buffer(self, make):
+        msg = "a"*1000
+        expected = xsalsa20.XSalsa20(self.key, self.iv).process(msg)
+        computed = xsalsa20.XSalsa20(self.key, self.iv).process(make(msg))
+        self.failUnlessEqual(computed, expected)
+
+    def test_bytearray(self):
+        self._check_buffer(bytearray)
+
+    def test_memoryview(self):
+        self._check_buffer(lambda s: memoryview(bytearray(s))[:])
+
+    def test_array(self):
+        import array
+        self._check_buffer(lambda s: array.array('B', s))
+
+    def test_type_check(self):
+        cryptor = xsalsa20.XSalsa20(self.key)
+        self.failUnlessRaises(xsalsa20.Error, cryptor.process, None)
+        self.failUnlessRaises(xsalsa20.Error, cryptor.process, u"unicode")
+
+    def test_process_into(self):
+        msg = "".join([ chr(i%256) for i in range(1000) ])
+        expected = xsalsa20.XSalsa20(self.key, self.iv).process(msg)
+        cryptor = xsalsa20.XSalsa20(self.key, self.iv)
+        dst = bytearray(len(msg))
+        cryptor.process_into(msg[:333], dst)
+        cryptor.process_into(msg[333:], memoryview(dst)[333:])
+        self.failUnlessEqual(str(dst), expected)
+
+        buf = bytearray(msg)
+        xsalsa20.XSalsa20(self.key, self.iv).process_into(buf, buf)
+        self.failUnlessEqual(str(buf), expected)
+
+    def test_process_into_preconditions(self):
+        cryptor = xsalsa20.XSalsa20(self.key)
+        self.failUnlessRaises(xsalsa20.Error, cryptor.process_into, "abc", bytearray(2))
+        self.failUnlessRaises(xsalsa20.Error, cryptor.process_into, "abc", "xyz")
+
+class Rekey(unittest.TestCase):
+    def test_rekey(self):
+        msg = "".join([ chr(i%256) for i in range(300) ])
+        cryptor = xsalsa20.XSalsa20("k"*32, "i"*24)
+        cryptor.process(msg[:77])
+        for (key, iv) in [("a"*32, "b"*24), ("c"*32, None), ("k"*32, "i"*24)]:
+            if iv is None:
+                cryptor.rekey(key)
+                expected = xsalsa20.XSalsa20(key).process(msg)
+            else:
+                cryptor.rekey(key, iv=iv)
+                expected = xsalsa20.XSalsa20(key, iv).process(msg)
+            self.failUnlessEqual(cryptor.process(msg), expected)
+
+    def test_reset(self):
+        msg = "".join([ chr(i%256) for i in range(300) ])
+        cryptor = xsalsa20.XSalsa20("k"*32, "i"*24)
+        cryptor.process(msg[:13])
+        cryptor.reset("j"*24)
+        self.failUnlessEqual(cryptor.process(msg), xsalsa20.XSalsa20("k"*32, "j"*24).process(msg))
+
+    def test_init_again(self):
+        cryptor = xsalsa20.XSalsa20("k"*32)
+        cryptor.process("x"*10)
+        cryptor.__init__("a"*32, "b"*24)
+        self.failUnlessEqual(cryptor.process("x"*100), xsalsa20.XSalsa20("a"*32, "b"*24).process("x"*100))
+
+    def test_preconditions(self):
+        cryptor = xsalsa20.XSalsa20("k"*32, "i"*24)
+        expected = xsalsa20.XSalsa20("k"*32, "i"*24).process("x"*50)
+        self.failUnlessRaises(xsalsa20.Error, cryptor.rekey, "k"*16)
+        self.failUnlessRaises(xsalsa20.Error, cryptor.rekey, "k"*32, "i"*16)
+        self.failUnlessRaises(xsalsa20.Error, cryptor.reset, "i"*23)
+        self.failUnlessRaises(TypeError, cryptor.reset)
+        # a failed rekey leaves the cipher as it was
+        self.failUnlessEqual(cryptor.process("x"*50), expected)
+
+class Seek(unittest.TestCase):
+    def test_seek(self):
+        key = "k"*32
+        iv = "i"*24
+        msg = "".join([ chr(i%251) for i in range(1000) ])
+        expected = xsalsa20.XSalsa20(key, iv).process(msg)
+        cryptor = xsalsa20.XSalsa20(key, iv)
+        self.failUnlessEqual(cryptor.tell(), 0)
+        for offset in [0, 1, 63, 64, 65, 500, 999, 1000, 3, 0]:
+            cryptor.seek(offset)
+            self.failUnlessEqual(cryptor.tell(), offset)
+            self.failUnlessEqual(cryptor.process(msg[offset:offset+100]), expected[offset:offset+100], offset)
+            self.failUnlessEqual(cryptor.tell(), min(offset+100, 1000))
+
+    def test_far(self):
+        # a partial block after a block counter that does not fit in 32 bits
+        key = "k"*32
+        a = xsalsa20.XSalsa20(key)
+        a.seek(64 * (2**33 + 1))
+        expected = a.process("\x00"*200)
+        b = xsalsa20.XSalsa20(key)
+        b.seek(64 * (2**33 + 1) + 77)
+        self.failUnlessEqual(b.process("\x00"*123), expected[77:])
+
+    def test_tell(self):
+        cryptor = xsalsa20.XSalsa20("k"*32)
+        cryptor.process("x"*70)
+        buf = bytearray(30)
+        cryptor.process_into(buf, buf)
+        self.failUnlessEqual(cryptor.tell(), 100)
+        cryptor.reset("j"*24)
+        self.failUnlessEqual(cryptor.tell(), 0)
+        cryptor.seek(5)
+        cryptor.rekey("a"*32)
+        self.failUnlessEqual(cryptor.tell(), 0)
+
+    def test_preconditions(self):
+        cryptor = xsalsa20.XSalsa20("k"*32)
+        self.failUnlessRaises(xsalsa20.Error, cryptor.seek, -1)
+        self.failUnlessRaises(TypeError, cryptor.seek, "1")
+
+class CryptFile(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.dir, "src")
+        self.dst = os.path.join(self.dir, "dst")
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.dir)
+
+    def _write(self, path, data):
+        f = open(path, "wb")
+        f.write(data)
+        f.close()
+
+    def _read(self, path):
+        f = open(path, "rb")
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_crypt_file(self):
+        key = "k"*32
+        iv = "i"*24
+        msg = "".join([ chr(i%251) for i in range(3*2**20 + 5) ])
+        expected = xsalsa20.XSalsa20(key, iv).process(msg)
+        self._write(self.src, msg)
+        self.failUnlessEqual(xsalsa20.crypt_file(key, iv, self.src, self.dst), len(msg))
+        self.failUnlessEqual(self._read(self.dst), expected)
+
+        self._write(self.dst, expected[:1001])
+        xsalsa20.crypt_file(key, iv, self.src, self.dst, offset=1001)
+        self.failUnlessEqual(self._read(self.dst), expected)
+
+        xsalsa20.crypt_file(key, None, self.src, self.src)
+        self.failUnlessEqual(self._read(self.src), xsalsa20.XSalsa20(key).process(msg))
+
+    def test_errors(self):
+        self.failUnlessRaises(IOError, xsalsa20.crypt_file, "k"*32, None, self.src, self.dst)
+        self._write(self.src, "data")
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.crypt_file, "k"*16, None, self.src, self.dst)
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.crypt_file, "k"*32, "i"*16, self.src, self.dst)
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.crypt_file, "k"*32, None, self.src, self.dst, -5)
+
+class ProcessMany(unittest.TestCase):
+    def test_process_many(self):
+        keys = [ chr(i)*32 for i in range(50) ]
+        ivs = [ chr(i)*24 for i in range(50) ]
+        datas = [ "x"*(i*37) for i in range(50) ]
+        expected = [ xsalsa20.XSalsa20(k, iv).process(d) for (k, iv, d) in zip(keys, ivs, datas) ]
+        self.failUnlessEqual(xsalsa20.process_many(keys, ivs, datas), expected)
+        self.failUnlessEqual(xsalsa20.process_many("".join(keys), "".join(ivs), datas), expected)
+        expected = [ xsalsa20.XSalsa20(k).process(d) for (k, d) in zip(keys, datas) ]
+        self.failUnlessEqual(xsalsa20.process_many(keys, None, datas), expected)
+
+    def test_packed(self):
+        keys = [ chr(i)*32 for i in range(20) ]
+        packed = "".join([ chr(i)*100 for i in range(20) ])
+        expected = "".join([ xsalsa20.XSalsa20(k).process(packed[i*100:(i+1)*100]) for (i, k) in enumerate(keys) ])
+        self.failUnlessEqual(xsalsa20.process_many(keys, None, packed, record_size=100), expected)
+        self.failUnlessEqual(xsalsa20.process_many(bytearray("".join(keys)), None, bytearray(packed), 100), expected)
+
+    def test_preconditions(self):
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.process_many, ["k"*32, "k"*16], None, ["a", "b"])
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.process_many, ["k"*32] * 2, ["i"*24, "i"*16], ["a", "b"])
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.process_many, ["k"*32] * 2, None, ["a"])
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.process_many, "k"*64, None, "abc", record_size=2)
+
+class Context(unittest.TestCase):
+    def test_process(self):
+        key = os.urandom(32)
+        ctx = xsalsa20.Context(key)
+        for size in [0, 1, 63, 64, 65, 1000, 5000]:
+            nonce = os.urandom(24)
+            data = os.urandom(size)
+            self.failUnlessEqual(ctx.process(nonce, data), xsalsa20.XSalsa20(key, nonce).process(data))
+            self.failUnlessEqual(ctx.process(nonce, bytearray(data)), xsalsa20.XSalsa20(key, nonce).process(data))
+
+    def test_vectors(self):
+        vects = list(TEST_XSALSA_RE.finditer(resource_string("pycryptopp", "testvectors/xsalsa20.txt")))
+        self.failUnless(vects)
+        for mo in vects:
+            ctx = xsalsa20.Context(a2b_hex(mo.group(2)))
+            ct = ctx.process(a2b_hex(mo.group(3)), a2b_hex(mo.group(4)))
+            self.failUnlessEqual(b2a_hex(ct), mo.group(5))
+
+    def test_preconditions(self):
+        self.failUnlessRaises(xsalsa20.Error, xsalsa20.Context, "k"*16)
+        self.failUnlessRaises(TypeError, xsalsa20.Context)
+        ctx = xsalsa20.Context("k"*32)
+        self.failUnlessRaises(xsalsa20.Error, ctx.process, "i"*16, "data")
+        self.failUnlessRaises(TypeError, ctx.process, "i"*24)
+
+class SIMD(unittest.TestCase):
+    def _each_width(self, f):
+        """ Return the results of f() with the keystream computed 1, 4 and
+        8 blocks at a time, for the widths this processor can do. """
+        results = []
+        for width in [1, 4, 8]:
+            if width <= xsalsa20.simd_width():
+                previous = xsalsa20._set_simd_width(width)
+                try:
+                    results.append(f())
+                finally:
+                    xsalsa20._set_simd_width(previous)
+        return results
+
+    def test_vectors(self):
+        s = resource_string("pycryptopp", "testvectors/xsalsa20.txt")
+        self._each_width(lambda: XSalsa20Test("test_XSalsa")._test_XSalsa(s))
+
+    def test_large(self):
+        key = os.urandom(32)
+        iv = os.urandom(24)
+        msg = os.urandom(300000)
+        results = self._each_width(lambda: xsalsa20.XSalsa20(key, iv).process(msg))
+        self.failUnlessEqual(len(set(results)), 1)
+
+    def test_partial_blocks(self):
+        # lengths and offsets that start and end in each place within a run
+        # of 8 blocks
+        key = os.urandom(32)
+        iv = os.urandom(24)
+        cases = [(random.randrange(600), random.randrange(1200)) for i in range(50)]
+        def f():
+            cryptor = xsalsa20.XSalsa20(key, iv)
+            out = []
+            for (pos, n) in cases:
+                cryptor.seek(pos)
+                out.append(cryptor.process("\x00"*n))
+            return out
+        results = self._each_width(f)
+        for result in results[1:]:
+            self.failUnlessEqual(result, results[0])
+
+    def test_counter_carry(self):
+        # across the block counter's carry from 32 to 33 bits
+        def f():
+            cryptor = xsalsa20.XSalsa20("k"*32)
+            cryptor.seek(64 * 2**32 - 300)
+            return cryptor.process("\x00"*1000)
+        results = self._each_width(f)
+        self.failUnlessEqual(len(set(results)), 1)
+
+    def test_same_as_cryptopp(self):
+        # secretbox still encrypts with Crypto++'s XSalsa20, starting 32 bytes
+        # into the keystream.
+        from pycryptopp.cipher import secretbox
+        key = os.urandom(32)
+        nonce = os.urandom(24)
+        msg = os.urandom(100000)
+        box = secretbox.secretbox(key, nonce, msg)
+        def f():
+            cryptor = xsalsa20.XSalsa20(key, nonce)
+            cryptor.seek(32)
+            return cryptor.process(msg)
+        for result in self._each_width(f):
+            self.failUnlessEqual(result, box[16:])
+
+    def test_process_many(self):
+        keys = [os.urandom(32) for i in range(20)]
+        ivs = [os.urandom(24) for i in range(20)]
+        datas = [os.urandom(random.randrange(2000)) for i in range(20)]
+        expected = [xsalsa20.XSalsa20(k, iv).process(d) for (k, iv, d) in zip(keys, ivs, datas)]
+        for result in self._each_width(lambda: xsalsa20.process_many(keys, ivs, datas)):
+            self.failUnlessEqual(result, expected)
+
+    def test_set_simd_width(self):
+        self.failUnless(xsalsa20.simd_width() in (1, 4, 8))
+        for width in [0, 2, 3, 16, -1]:
+            self.failUnlessRaises(xsalsa20.Error, xsalsa20._set_simd_width, width)
+        if xsalsa20.simd_width() < 8:
+            self.failUnlessRaises(xsalsa20.Error, xsalsa20._set_simd_width, 8)
+        previous = xsalsa20._set_simd_width(1)
+        self.failUnlessEqual(previous, xsalsa20.simd_width())
+        self.failUnlessEqual(xsalsa20._set_simd_width(previous), 1)
+
+class Threads(unittest.TestCase):
+    SIZE = 2**20
+
+    def test_shared_object(self):
+        # Threads sharing one XSalsa20 object each get a distinct, contiguous
+        # slice of the keystream.
+        N = 8
+        key = "k"*32
+        iv = "i"*24
+        results = []
+        cryptor = xsalsa20.XSalsa20(key, iv)
+        def work():
+            results.append(cryptor.process("\x00"*self.SIZE))
+        run_in_threads(work, [()]*N)
+
+        keystream = xsalsa20.XSalsa20(key, iv).process("\x00"*(self.SIZE*N))
+        expected = [ keystream[i*self.SIZE:(i+1)*self.SIZE] for i in range(N) ]
+        self.failUnlessEqual(sorted(results), sorted(expected))
+
+    def test_speedup(self):
+        # With the GIL released, separate XSalsa20 objects in separate
+        # threads run in parallel.
+        N = min(ncpus(), 4)
+        if N < 2:
+            raise unittest.SkipTest("needs more than one CPU")
+        msg = "\x00"*(self.SIZE*8)
+        def work():
+            xsalsa20.XSalsa20("k"*32).process(msg)
+        check_threads_speedup(self, work, N)
+
 
 if __name__ == "__main__":
     unittest.main()
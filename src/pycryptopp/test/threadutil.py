@@ -0,0 +1,61 @@
+"""
+Helpers for the tests of work done with the GIL released: running a
+function on several threads at once, and checking that doing so is faster
+than running it on one.
+"""
+
+import threading, time
+
+def run_in_threads(func, args_list):
+    """ Call func(*args) for each args in args_list, each on its own thread,
+    all at once, and return when they have all finished. """
+    threads = [ threading.Thread(target=func, args=args) for args in args_list ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def ncpus():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+def _elapsed(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+def check_speedup(testcase, serial, parallel, ratio=0.8, attempts=3):
+    """ Check that parallel() takes less than ratio times as long as
+    serial(), which do the same work on one thread and on several. A busy
+    machine can hold up any one measurement, so this passes as soon as one
+    of up to attempts measurements shows the speedup. """
+    timings = []
+    for i in range(attempts):
+        timings.append((_elapsed(parallel), _elapsed(serial)))
+        if timings[-1][0] < timings[-1][1] * ratio:
+            return
+    testcase.fail("no speedup: (parallel, serial) times were %r" % (timings,))
+
+def check_threads_speedup(testcase, work, n):
+    """ Check that calling work() on n threads at once is faster than
+    calling it n times in a row. """
+    def serial():
+        for i in range(n):
+            work()
+    def parallel():
+        run_in_threads(work, [()]*n)
+    check_speedup(testcase, serial, parallel)
+
+def run_staggered(funcs, delay=0.02):
+    """ Call each of funcs on its own thread, starting them delay seconds
+    apart so that each is likely to be waiting for whatever the ones before
+    it hold, and return when they have all finished. """
+    threads = [ threading.Thread(target=func) for func in funcs ]
+    for t in threads:
+        t.start()
+        time.sleep(delay)
+    for t in threads:
+        t.join()